@@ -155,6 +155,34 @@ class Indexer:
     @abstractmethod
     def index(self, collection: Union[List[dict], str], *args, **kwargs):
         pass
+
+    def add(self, collection: Union[List[dict], str], *args, **kwargs):
+        """
+        Index the documents of the collection which are not indexed yet, without rebuilding the index.
+
+        Raises:
+            NotImplementedError: if the indexer does not support incremental updates
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} does not support incremental updates"
+        )
+
+    def delete(self, document_ids: List[str], *args, **kwargs):
+        """
+        Remove documents from the index, without rebuilding the index.
+
+        Raises:
+            NotImplementedError: if the indexer does not support incremental updates
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} does not support incremental updates"
+        )
+
+    def compact(self, *args, **kwargs):
+        """
+        Reclaim the space of deleted documents. A no-op unless the indexer defers it.
+        """
+        pass
     
 @dataclass(init=False, repr=False, eq=False)
 class Reranker(Component):
@@ -5,6 +5,10 @@ import json
 from primeqa.components.base import Indexer as BaseIndexer
 from primeqa.ir.dense.colbert_top.colbert.infra.config import ColBERTConfig
 from primeqa.ir.dense.colbert_top.colbert.indexer import Indexer
+from primeqa.ir.dense.colbert_top.colbert.indexing.index_updater import (
+    IndexUpdater,
+    iterate_collection,
+)
 
 
 @dataclass
@@ -142,3 +146,29 @@ class ColBERTIndexer(BaseIndexer):
             collection,
             overwrite="overwrite" in kwargs and kwargs["overwrite"],
         )
+
+    def add(self, collection: Union[List[dict], str], *args, **kwargs):
+        """
+        Index the documents of `documents.tsv` which follow the already indexed ones, e.g. after
+        documents were appended to it, with the existing centroids.
+        """
+        if not isinstance(collection, str):
+            raise TypeError(
+                "ColBERT indexer expects path to `documents.tsv` as value for `collection` argument."
+            )
+        updater = IndexUpdater(self._config.index_path, checkpoint=self.checkpoint)
+        return updater.add(
+            passage
+            for _, passage in iterate_collection(
+                collection, start_pid=updater.num_passages
+            )
+        )
+
+    def delete(self, document_ids: List[str], *args, **kwargs):
+        # Passage ids are the row numbers in `documents.tsv`, which are the document ids
+        return IndexUpdater(self._config.index_path, checkpoint=self.checkpoint).delete(
+            int(document_id) for document_id in document_ids
+        )
+
+    def compact(self, *args, **kwargs):
+        IndexUpdater(self._config.index_path, checkpoint=self.checkpoint).compact()
@@ -3,7 +3,7 @@ from dataclasses import dataclass, field
 import json
 
 from primeqa.components.base import Indexer as BaseIndexer
-from primeqa.ir.sparse.indexer import PyseriniIndexer
+from primeqa.ir.sparse.native_bm25 import NativeBM25Indexer
 
 
 @dataclass
@@ -11,6 +11,8 @@ class BM25Indexer(BaseIndexer):
     """_summary_
 
     Args:
+        engine (str, optional): "pyserini" to build a Lucene index, "native" for the in-process index which needs no JVM. Defaults to "pyserini".
+        docstore (bool, optional): Write a side docstore of titles and texts next to the Lucene index. Defaults to False.
 
     Important:
     1. Each field has metadata property which can carry additional information for other downstream usages.
@@ -34,6 +36,22 @@ class BM25Indexer(BaseIndexer):
         },
     )
 
+    engine: str = field(
+        default="pyserini",
+        metadata={
+            "name": "Engine",
+            "options": ["pyserini", "native"],
+        },
+    )
+
+    docstore: bool = field(
+        default=False,
+        metadata={
+            "name": "Side docstore",
+            "options": [True, False],
+        },
+    )
+
     def __post_init__(self):
         self._indexer = None
 
@@ -44,7 +62,12 @@ class BM25Indexer(BaseIndexer):
 
     def load(self, *args, **kwargs):
         self._index_path = f"{self.index_root}/{self.index_name}"
-        self._indexer = PyseriniIndexer()
+        if self.engine == "native":
+            self._indexer = NativeBM25Indexer()
+        else:
+            from primeqa.ir.sparse.indexer import PyseriniIndexer
+
+            self._indexer = PyseriniIndexer()
 
     def get_engine_type(self) -> str:
         return "BM25"
@@ -55,6 +78,16 @@ class BM25Indexer(BaseIndexer):
                 "Pyserini indexer expects path to `documents.tsv` as value for `collection` argument."
             )
 
+        if self.engine == "native":
+            self._indexer.index_collection(
+                collection=collection,
+                index_path=self._index_path,
+                fieldnames=None,
+                overwrite="overwrite" in kwargs and kwargs["overwrite"],
+                threads=kwargs["num_workers"] if "num_workers" in kwargs else 1,
+            )
+            return
+
         self._indexer.index_collection(
             collection=collection,
             index_path=self._index_path,
@@ -64,4 +97,5 @@ class BM25Indexer(BaseIndexer):
             additional_index_cmd_args=kwargs["additional_index_args"]
             if "additional_index_args" in kwargs
             else "--storePositions --storeDocvectors --storeRaw",
+            docstore=kwargs["docstore"] if "docstore" in kwargs else self.docstore,
         )
@@ -2,27 +2,151 @@ import requests
 import time
 import json
 import logging
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
 # adapted from: https://github.ibm.com/hendrik-strobelt/bloom_service
 
 import urllib3
+from requests.adapters import HTTPAdapter
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 logger = logging.getLogger(__name__)
 
+
+class TokenBucket:
+    """
+    Limits callers of acquire() to `rate` requests per second, in bursts of up to `capacity`
+    requests (rate 0 means unlimited). pause() blocks all callers, e.g. for as long as the server
+    says we are rate limited.
+    """
+    def __init__(self, rate: float = 0, capacity: int = 1):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            # start refilling once the pause is over, instead of bursting right after it
+            self._tokens = 0.0
+            self._updated = self._paused_until
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self.rate <= 0:
+                        return
+                    self._tokens = min(self.capacity, self._tokens + max(0.0, now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def backoff_delay(attempt: int, backoff_factor: float, max_delay: float = 60) -> float:
+    """Exponential backoff with jitter, so concurrent requests do not retry in lockstep"""
+    return min(max_delay, backoff_factor * 2 ** attempt) * random.uniform(0.5, 1)
+
+
+def call_with_retries(call: Callable, is_retryable: Callable[[Exception], bool], max_retries: int = 5,
+                      backoff_factor: float = 1, rate_limiter: TokenBucket = None):
+    """Call `call()`, retrying with backoff on exceptions for which is_retryable(exception) is true"""
+    for attempt in range(max_retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            return call()
+        except Exception as ex:
+            if attempt == max_retries or not is_retryable(ex):
+                raise
+            delay = backoff_delay(attempt, backoff_factor)
+            logger.info(f"Retrying in {delay:.1f} seconds after: {ex}")
+            time.sleep(delay)
+
+
 class LLMService:
     """
-    This class provides connectivity to the BAM service
+    This class provides connectivity to the BAM service.
+
+    Requests share a pool of `max_concurrency` connections, are retried with backoff on connection
+    errors and server errors, and on a 429 all requests wait for the `expires_in_ms` the server
+    reports before retrying.
     """
-    def __init__(self, token: str, base_url='https://bam-api.res.ibm.com/v0/generate', model_id="bigscience/bloom"):
+    def __init__(self, token: str, base_url='https://bam-api.res.ibm.com/v0/generate', model_id="bigscience/bloom",
+                 max_concurrency=4, max_retries=5, backoff_factor=1, requests_per_second=0, batch_size=8):
         """_summary_
 
         Args:
             token (str): api key
             base_url (str, optional): Defaults to 'https://bam-api.res.ibm.com/v0/generate'.
             model_id (str, optional): Defaults to "bigscience/bloom".
+            max_concurrency (int, optional): maximum number of requests in flight. Defaults to 4.
+            max_retries (int, optional): retries of a failed request. Defaults to 5.
+            backoff_factor (int, optional): seconds to wait before the first retry, doubled for each further retry. Defaults to 1.
+            requests_per_second (int, optional): client side rate limit, 0 for none. Defaults to 0.
+            batch_size (int, optional): number of prompts sent in one request by generate_many. Defaults to 8.
         """
         self.token = token
         self.base_url = base_url
         self.model_id = model_id
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.batch_size = batch_size
+        self.rate_limiter = TokenBucket(rate=requests_per_second, capacity=max_concurrency)
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+
+    def _post(self, json_data: dict):
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {self.token}'
+        }
+
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                response = self._session.post(self.base_url, headers=headers, json=json_data, verify=False)
+            except (requests.ConnectionError, requests.Timeout) as ex:
+                if attempt == self.max_retries:
+                    return {"error": str(ex), "status": None}
+                delay = backoff_delay(attempt, self.backoff_factor)
+                logger.info(f"Retrying in {delay:.1f} seconds after: {ex}")
+                time.sleep(delay)
+                continue
+
+            if response.status_code == 201 or response.status_code == 200:
+                r = response.json()
+                r["request"] = json_data
+                return r
+            elif response.status_code == 429 and attempt < self.max_retries:
+                logger.info(str(response.content))
+                try:
+                    delay = json.loads(response.content)['extensions']['state']['expires_in_ms'] * .001
+                except (ValueError, KeyError, TypeError):
+                    delay = backoff_delay(attempt, self.backoff_factor)
+                logger.info("Rate limited for: " + str(delay) + " seconds")
+                # hold back all requests, not just this one, until the rate limit expires
+                self.rate_limiter.pause(delay)
+            elif response.status_code >= 500 and attempt < self.max_retries:
+                delay = backoff_delay(attempt, self.backoff_factor)
+                logger.info(f"Retrying in {delay:.1f} seconds after status {response.status_code}")
+                time.sleep(delay)
+            else:
+                logger.info(str(response.content))
+                return {"error": response.reason, "status": response.status_code}
 
     def generate(self, inputs: list,
                  max_new_tokens=3,
@@ -41,7 +165,7 @@ class LLMService:
             top_p (int, optional): Defaults to 1.
 
         Returns:
-            _type_: generated data
+            _type_: generated data, or a dictionary with the "error" and "status" once retries are exhausted
         """
 
         parameters = {
@@ -51,28 +175,38 @@ class LLMService:
             'top_k':top_k,
             'top_p':top_p
         }
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {self.token}'
-        }
 
         json_data = {
             'model_id': self.model_id,
             'inputs': inputs,
             "parameters": parameters
         }
-        response = requests.post(self.base_url,
-                                 headers=headers, json=json_data, verify=False)
-
-        if response.status_code == 201 or response.status_code == 200:
-            r = response.json()
-            r["request"] = json_data
-            return r
-        elif response.status_code == 429:
-            logger.info(str(response.content))
-            dict_error = json.loads(response.content)
-            logger.info("Rate limited for: " + str(dict_error['extensions']['state']['expires_in_ms'] * .001) + " seconds")
-            time.sleep(dict_error['extensions']['state']['expires_in_ms'] * .001)
-        else:
-            logger.info(str(response.content))
-            return {"error": response.reason, "status": response.status_code}
\ No newline at end of file
+        return self._post(json_data)
+
+    def generate_many(self, inputs: List[str], *args, batch_size: int = None, **kwargs) -> List[dict]:
+        """Generate text for many prompts, sending batches of prompts as concurrent requests
+
+        Args:
+            inputs (List[str]): the prompts
+            batch_size (int, optional): prompts per request. Defaults to self.batch_size.
+            args, kwargs: generation parameters, see generate
+
+        Returns:
+            List[dict]: one result per prompt, with the "generated_text", or the "error" and "status" of its request
+        """
+        batch_size = batch_size or self.batch_size
+        batches = [inputs[start:start + batch_size] for start in range(0, len(inputs), batch_size)]
+        if not batches:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as executor:
+            responses = list(executor.map(lambda batch: self.generate(batch, *args, **kwargs), batches))
+
+        results = []
+        for batch, response in zip(batches, responses):
+            if "results" in response and len(response["results"]) == len(batch):
+                results.extend(response["results"])
+            else:
+                error = {"error": response.get("error", "unexpected response"), "status": response.get("status")}
+                results.extend(dict(error) for _ in batch)
+        return results
@@ -2,16 +2,14 @@ from typing import List, Dict
 from dataclasses import dataclass, field
 import json
 
-from transformers import AutoConfig, AutoTokenizer, DataCollatorWithPadding
-from datasets import Dataset
+from transformers import AutoConfig, AutoTokenizer
 
 from primeqa.components.base import Reader as BaseReader
+from primeqa.components.reader.extractive_engine import ExtractiveInferenceEngine
 from primeqa.mrc.models.heads.extractive import EXTRACTIVE_HEAD
 from primeqa.mrc.models.task_model import ModelForDownstreamTasks
 from primeqa.mrc.processors.preprocessors.base import BasePreProcessor
-from primeqa.mrc.processors.postprocessors.extractive import ExtractivePostProcessor
 from primeqa.mrc.processors.postprocessors.scorers import SupportedSpanScorers
-from primeqa.mrc.trainers.mrc import MRCTrainer
 
 
 @dataclass
@@ -28,6 +26,7 @@ class ExtractiveReader(BaseReader):
         max_answer_length (int, optional): Maximum answer length. Defaults to 32.
         scorer_type (str, optional): Scoring algorithm. Defaults to "weighted_sum_target_type_and_score_diff".
         min_score_threshold: (float, optional): Minimum score threshold. Defaults to None.
+        batch_size (int, optional): Maximum number of features per forward pass. Defaults to 8.
 
     Important:
         1. Each field has metadata property which can carry additional information for other downstream usages.
@@ -112,6 +111,15 @@ class ExtractiveReader(BaseReader):
             "exclude_from_hash": True,
         },
     )
+    batch_size: int = field(
+        default=8,
+        metadata={
+            "name": "Batch size",
+            "description": "Maximum number of features per forward pass",
+            "api_support": False,
+            "exclude_from_hash": True,
+        },
+    )
 
     def __post_init__(self):
         # Placeholder variables
@@ -119,7 +127,7 @@ class ExtractiveReader(BaseReader):
         self._tokenizer = None
         self._preprocessor = None
         self._scorer_type_as_enum = None
-        self._data_collector = None
+        self._engine = None
 
     def __hash__(self) -> int:
         # Step 1: Identify all fields to be included in the hash
@@ -185,8 +193,15 @@ class ExtractiveReader(BaseReader):
         else:
             raise ValueError(f"Unsupported scorer type: {self.scorer_type}")
 
-        # Configure data collector
-        self._data_collector = DataCollatorWithPadding(self._tokenizer)
+        # Initialize inference engine, reused by all predict calls
+        self._engine = ExtractiveInferenceEngine(
+            model=self._loaded_model,
+            tokenizer=self._tokenizer,
+            preprocessor=self._preprocessor,
+            n_best_size=self.n_best_size,
+            scorer_type=self._scorer_type_as_enum,
+            batch_size=self.batch_size,
+        )
 
     def predict(
         self,
@@ -215,23 +230,7 @@ class ExtractiveReader(BaseReader):
             else self.min_score_threshold
         )
 
-        # Step 2: Initialize post processor
-        postprocessor = ExtractivePostProcessor(
-            k=max_num_answers,
-            n_best_size=self.n_best_size,
-            max_answer_length=max_answer_length,
-            scorer_type=self._scorer_type_as_enum,
-        )
-
-        # Step 3: Load trainer
-        trainer = MRCTrainer(
-            model=self._loaded_model,
-            tokenizer=self._tokenizer,
-            data_collator=self._data_collector,
-            post_process_function=postprocessor.process,
-        )
-
-        # Step 4: Prepare dataset from input texts and contexts
+        # Step 2: Validate inputs
         assert len(questions) == len(contexts)
 
         if example_ids is None:
@@ -239,18 +238,14 @@ class ExtractiveReader(BaseReader):
 
         assert len(example_ids) == len(questions)
 
-        examples_dict = dict(
-            question=questions, context=contexts, example_id=example_ids
-        )
-
-        eval_examples, eval_dataset = self._preprocessor.process_eval(
-            Dataset.from_dict(examples_dict)
-        )
-
-        # Step 5: Run predict
+        # Step 3: Run predict
         predictions = {}
-        for example_id, raw_predictions in trainer.predict(
-            eval_dataset=eval_dataset, eval_examples=eval_examples
+        for example_id, raw_predictions in self._engine.predict(
+            questions=questions,
+            contexts=contexts,
+            example_ids=example_ids,
+            max_num_answers=max_num_answers,
+            max_answer_length=max_answer_length,
         ).items():
             predictions[example_id] = []
             for raw_prediction in raw_predictions:
@@ -0,0 +1,159 @@
+from typing import List, Dict, Tuple
+
+import numpy as np
+import torch
+from transformers import PreTrainedTokenizerBase
+
+from primeqa.mrc.models.task_model import ModelForDownstreamTasks
+from primeqa.mrc.processors.preprocessors.base import BasePreProcessor
+from primeqa.mrc.processors.postprocessors.extractive import ExtractivePostProcessor
+from primeqa.mrc.processors.postprocessors.scorers import SupportedSpanScorers
+
+# Logit value of padding positions, as in the `Trainer` evaluation loop
+PADDING_LOGIT = -100.0
+
+
+class ExtractiveInferenceEngine:
+    """
+    Runs extractive question answering on plain Python inputs, without the `Trainer` and `Dataset`
+    machinery used for training and evaluation.
+
+    Features are tokenized directly by the preprocessor, run through the model under
+    `torch.inference_mode` in batches of similar length, and post-processed by the same
+    `ExtractivePostProcessor`, so predictions are the same as those of `MRCTrainer.predict`.
+    The model, tokenizer, preprocessor and post processors are created once and reused across calls.
+    """
+
+    def __init__(
+        self,
+        model: ModelForDownstreamTasks,
+        tokenizer: PreTrainedTokenizerBase,
+        preprocessor: BasePreProcessor,
+        n_best_size: int,
+        scorer_type: SupportedSpanScorers,
+        batch_size: int = 8,
+        device: str = None,
+    ):
+        """
+        Args:
+            model: Model with an extractive QA task head.
+            tokenizer: Tokenizer of the model.
+            preprocessor: Preprocessor splitting question and context pairs into features.
+            n_best_size: Max number of start/end logits to consider (max values).
+            scorer_type: Scoring algorithm to use.
+            batch_size: Max number of features per forward pass.
+            device: Device to run the model on, defaults to the first GPU if available.
+        """
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+
+        self.model = model.to(device).eval()
+        self.tokenizer = tokenizer
+        self.preprocessor = preprocessor
+        self.n_best_size = n_best_size
+        self.scorer_type = scorer_type
+        self.batch_size = batch_size
+        self.device = device
+        self._postprocessors = {}
+
+    def _get_postprocessor(
+        self, max_num_answers: int, max_answer_length: int
+    ) -> ExtractivePostProcessor:
+        key = (max_num_answers, max_answer_length)
+        if key not in self._postprocessors:
+            self._postprocessors[key] = ExtractivePostProcessor(
+                k=max_num_answers,
+                n_best_size=self.n_best_size,
+                max_answer_length=max_answer_length,
+                scorer_type=self.scorer_type,
+            )
+        return self._postprocessors[key]
+
+    def _run_model(self, features) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        num_features = len(features["input_ids"])
+        lengths = [len(input_ids) for input_ids in features["input_ids"]]
+        model_input_names = [
+            name for name in self.tokenizer.model_input_names if name in features
+        ]
+
+        all_start_logits = np.full(
+            (num_features, max(lengths)), PADDING_LOGIT, dtype=np.float32
+        )
+        all_end_logits = np.full_like(all_start_logits, PADDING_LOGIT)
+        all_targettype_logits = None
+
+        # Batch features of similar length together, so that little padding is needed
+        order = np.argsort(lengths, kind="stable")
+        with torch.inference_mode():
+            for start in range(0, num_features, self.batch_size):
+                batch = order[start : start + self.batch_size]
+                inputs = self.tokenizer.pad(
+                    {
+                        name: [features[name][idx] for idx in batch]
+                        for name in model_input_names
+                    },
+                    return_tensors="pt",
+                )
+                outputs = self.model(
+                    **{name: tensor.to(self.device) for name, tensor in inputs.items()},
+                    return_dict=True,
+                )
+
+                width = outputs.start_logits.shape[1]
+                all_start_logits[batch, :width] = outputs.start_logits.float().cpu().numpy()
+                all_end_logits[batch, :width] = outputs.end_logits.float().cpu().numpy()
+                targettype_logits = outputs.target_type_logits.float().cpu().numpy()
+                if all_targettype_logits is None:
+                    all_targettype_logits = np.zeros(
+                        (num_features, targettype_logits.shape[1]), dtype=np.float32
+                    )
+                all_targettype_logits[batch] = targettype_logits
+
+        return all_start_logits, all_end_logits, all_targettype_logits
+
+    def predict(
+        self,
+        questions: List[str],
+        contexts: List[List[str]],
+        example_ids: List[str],
+        max_num_answers: int,
+        max_answer_length: int,
+    ) -> Dict[str, List[Dict]]:
+        """
+        Args:
+            questions: Questions.
+            contexts: Contexts of each question.
+            example_ids: Unique id of each question.
+            max_num_answers: Max number of answers per question.
+            max_answer_length: Max answer length (in word pieces/bpes).
+
+        Returns:
+            Predictions of `ExtractivePostProcessor.process` per example id.
+        """
+        if not questions:
+            return {}
+
+        # Step 1: Tokenize into features
+        examples = dict(question=questions, context=contexts, example_id=example_ids)
+        features = self.preprocessor.process_eval_batch(examples)
+
+        # Step 2: Run model
+        predictions = self._run_model(features)
+
+        # Step 3: Post-process
+        return self._get_postprocessor(max_num_answers, max_answer_length).process(
+            [
+                {"context": context, "example_id": example_id}
+                for context, example_id in zip(contexts, example_ids)
+            ],
+            [
+                {
+                    "example_idx": features["example_idx"][idx],
+                    "example_id": features["example_id"][idx],
+                    "offset_mapping": features["offset_mapping"][idx],
+                    "context_idx": features["context_idx"][idx],
+                }
+                for idx in range(len(features["input_ids"]))
+            ],
+            predictions,
+        )
@@ -3,16 +3,26 @@ from dataclasses import dataclass, field
 import sys
 import logging
 import json
+from concurrent.futures import ThreadPoolExecutor
 
 import openai
 import torch
 from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
 
 from primeqa.components.base import Reader as BaseReader
-from primeqa.components.reader.LLMService import LLMService
+from primeqa.components.reader.LLMService import LLMService, call_with_retries
 
 logger = logging.getLogger(__name__)
 
+# Errors after which an OpenAI request is worth retrying
+RETRYABLE_OPENAI_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.APIConnectionError,
+    openai.error.Timeout,
+    openai.error.ServiceUnavailableError,
+    openai.error.TryAgain,
+)
+
 
 @dataclass
 class PromptReader(BaseReader):
@@ -32,6 +42,22 @@ class PromptReader(BaseReader):
             "exclude_from_hash": True,
         },
     )
+    max_concurrency: int = field(
+        default=4,
+        metadata={
+            "name": "Maximum number of concurrent requests to the generation service",
+            "api_support": False,
+            "exclude_from_hash": True,
+        },
+    )
+    max_retries: int = field(
+        default=5,
+        metadata={
+            "name": "Maximum number of retries of a failed request to the generation service",
+            "api_support": False,
+            "exclude_from_hash": True,
+        },
+    )
 
     def __hash__(self) -> int:
         # Step 1: Identify all fields to be included in the hash
@@ -151,42 +177,33 @@ class PromptGPTReader(PromptReader):
         example_ids: List[str] = None,
         **kwargs,
     ):
-        predictions = {}
+        prompts = []
         for i, q in enumerate(questions):
             passages = None
             if contexts:
                 passages = contexts[i]
-            prompt = self.create_prompt(q, passages, **kwargs)
+            prompts.append(self.create_prompt(q, passages, **kwargs))
+
+        # Requests are sent concurrently and retried with backoff, e.g. when rate limited
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(self.max_concurrency, len(prompts)))
+        ) as executor:
+            texts = list(
+                executor.map(
+                    lambda prompt: call_with_retries(
+                        lambda: self._complete(prompt),
+                        is_retryable=lambda ex: isinstance(ex, RETRYABLE_OPENAI_ERRORS),
+                        max_retries=self.max_retries,
+                    ),
+                    prompts,
+                )
+            )
 
+        predictions = {}
+        for i, text in enumerate(texts):
             if self.model_name in self._chat_models:
-                response = openai.ChatCompletion.create(
-                    model=self.model_name,
-                    messages=[{"role": "user", "content": prompt}],
-                    # temperature=self.temperature,
-                    # max_tokens=self.max_new_tokens,
-                    # top_p=self.top_p,
-                    # frequency_penalty=self.frequency_penalty,
-                    # presence_penalty=self.presence_penalty,
-                )
-                if "choices" in response and response["choices"]:
-                    text = response.choices[0]["message"]["content"]
-                else:
-                    text = "Something went wrong with the GPT service"
                 predictions[i] = {"text": text}
             else:
-                response = openai.Completion.create(
-                    model=self.model_name,
-                    prompt=prompt,
-                    temperature=self.temperature,
-                    max_tokens=self.max_new_tokens,
-                    top_p=self.top_p,
-                    frequency_penalty=self.frequency_penalty,
-                    presence_penalty=self.presence_penalty,
-                )
-                if "choices" in response and response["choices"]:
-                    text = response.choices[0]["text"]
-                else:
-                    text = "Something went wrong with the GPT service"
                 processed_prediction = {}
                 processed_prediction["example_id"] = i
                 processed_prediction["span_answer_text"] = text
@@ -194,6 +211,33 @@ class PromptGPTReader(PromptReader):
                 predictions[i] = [processed_prediction]
         return predictions
 
+    def _complete(self, prompt: str) -> str:
+        if self.model_name in self._chat_models:
+            response = openai.ChatCompletion.create(
+                model=self.model_name,
+                messages=[{"role": "user", "content": prompt}],
+                # temperature=self.temperature,
+                # max_tokens=self.max_new_tokens,
+                # top_p=self.top_p,
+                # frequency_penalty=self.frequency_penalty,
+                # presence_penalty=self.presence_penalty,
+            )
+            if "choices" in response and response["choices"]:
+                return response.choices[0]["message"]["content"]
+        else:
+            response = openai.Completion.create(
+                model=self.model_name,
+                prompt=prompt,
+                temperature=self.temperature,
+                max_tokens=self.max_new_tokens,
+                top_p=self.top_p,
+                frequency_penalty=self.frequency_penalty,
+                presence_penalty=self.presence_penalty,
+            )
+            if "choices" in response and response["choices"]:
+                return response.choices[0]["text"]
+        return "Something went wrong with the GPT service"
+
 
 @dataclass
 class PromptFLANT5Reader(PromptReader):
@@ -235,6 +279,15 @@ class PromptFLANT5Reader(PromptReader):
     use_bam: bool = field(
         default=False, metadata={"name": "if true, use bam to run FLAN-T5"}
     )
+    max_batch_size: int = field(
+        default=8,
+        metadata={
+            "name": "Maximum batch size",
+            "description": "Maximum number of prompts generated together by the local model",
+            "api_support": False,
+            "exclude_from_hash": True,
+        },
+    )
 
     def __post_init__(self):
         # Placeholder variables
@@ -258,7 +311,12 @@ class PromptFLANT5Reader(PromptReader):
 
     def load(self, *args, **kwargs):
         if self.use_bam:
-            self._model = LLMService(token=self.api_key, model_id=self.model_name)
+            self._model = LLMService(
+                token=self.api_key,
+                model_id=self.model_name,
+                max_concurrency=self.max_concurrency,
+                max_retries=self.max_retries,
+            )
         else:
             self._device = "cuda:0" if torch.cuda.is_available() else "cpu"
             self._model = AutoModelForSeq2SeqLM.from_pretrained(self.model_name)
@@ -271,6 +329,44 @@ class PromptFLANT5Reader(PromptReader):
     def eval(self, *args, **kwargs):
         pass
 
+    def _generate(self, prompts: List[str]) -> List[str]:
+        # Identical prompts, e.g. a repeated question over the same passages, are generated once
+        unique_prompts = list(dict.fromkeys(prompts))
+        encodings = self._tokenizer(unique_prompts)
+
+        # Batch prompts of similar length together, so that little padding is needed
+        order = sorted(
+            range(len(unique_prompts)),
+            key=lambda idx: len(encodings["input_ids"][idx]),
+            reverse=True,
+        )
+        span_answer_texts = {}
+        for start in range(0, len(order), self.max_batch_size):
+            batch = order[start : start + self.max_batch_size]
+            inputs = self._tokenizer.pad(
+                {
+                    "input_ids": [encodings["input_ids"][idx] for idx in batch],
+                    "attention_mask": [
+                        encodings["attention_mask"][idx] for idx in batch
+                    ],
+                },
+                return_tensors="pt",
+            ).to(self._device)
+            with torch.no_grad():
+                outputs = self._model.generate(
+                    **inputs,
+                    max_new_tokens=self.max_new_tokens,
+                    min_length=self.min_new_tokens,
+                    temperature=self.temperature,
+                    top_p=self.top_p,
+                )
+            for idx, span_answer_text in zip(
+                batch, self._tokenizer.batch_decode(outputs, skip_special_tokens=True)
+            ):
+                span_answer_texts[unique_prompts[idx]] = span_answer_text
+
+        return [span_answer_texts[prompt] for prompt in prompts]
+
     def predict(
         self,
         questions: List[str],
@@ -279,32 +375,29 @@ class PromptFLANT5Reader(PromptReader):
         example_ids: List[str] = None,
         **kwargs,
     ) -> Dict[str, List[Dict]]:
-        predictions = {}
-
+        prompts = []
         for question_idx, question in enumerate(questions):
             passages = None
             if contexts:
                 passages = contexts[question_idx]
+            prompts.append(self.create_prompt(question, passages, **kwargs))
 
-            prompt = self.create_prompt(question, passages, **kwargs)
-            inputs = self._tokenizer(prompt, return_tensors="pt").to(self._device)
-            span_answer_text = ""
-            if self.use_bam:
-                resp = self._model.generate(
-                    [prompt], self.max_new_tokens, self.min_new_tokens
-                )
-                span_answer_text = resp["results"][0]["generated_text"]
-            else:
-                outputs = self._model.generate(
-                    **inputs,
-                    max_new_tokens=self.max_new_tokens,
-                    min_length=self.min_new_tokens,
-                    temperature=self.temperature,
-                    top_p=self.top_p,
-                )
-                span_answer_text = self._tokenizer.batch_decode(
-                    outputs, skip_special_tokens=True
-                )[0]
+        if self.use_bam:
+            # Prompts are sent to BAM in batches of concurrent requests
+            results = self._model.generate_many(
+                prompts, self.max_new_tokens, self.min_new_tokens
+            )
+            errors = [result for result in results if "error" in result]
+            if errors:
+                logger.error("Error running BAM service: ")
+                logger.error(errors[0])
+                return None
+            span_answer_texts = [result["generated_text"] for result in results]
+        else:
+            span_answer_texts = self._generate(prompts)
+
+        predictions = {}
+        for question_idx, span_answer_text in enumerate(span_answer_texts):
             processed_prediction = {}
             processed_prediction["example_id"] = question_idx
             processed_prediction["span_answer_text"] = span_answer_text
@@ -367,7 +460,12 @@ class BAMReader(PromptReader):
         )
 
     def load(self, *args, **kwargs):
-        self._model = LLMService(token=self.api_key, model_id=self.model_name)
+        self._model = LLMService(
+            token=self.api_key,
+            model_id=self.model_name,
+            max_concurrency=self.max_concurrency,
+            max_retries=self.max_retries,
+        )
         self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
 
     def train(self, *args, **kwargs):
@@ -384,9 +482,9 @@ class BAMReader(PromptReader):
         example_ids: List[str] = None,
         **kwargs,
     ):
-        predictions = {}
         max_sequence_length = 1024
 
+        prompts = []
         for question_idx, question in enumerate(questions):
             prompt = self.create_prompt(
                 question=question, context=contexts[question_idx], **kwargs
@@ -406,24 +504,28 @@ class BAMReader(PromptReader):
                     )
                     + kwargs["suffix"]
                 )
+            prompts.append(prompt)
+
+        # Prompts are sent to BAM in batches of concurrent requests
+        results = self._model.generate_many(
+            prompts,
+            max_new_tokens=self.max_new_tokens,
+            min_new_tokens=self.min_new_tokens,
+            temperature=self.temperature,
+            top_k=self.top_k,
+            top_p=self.top_p,
+        )
+        errors = [result for result in results if "error" in result]
+        if errors:
+            logger.error("Error running BAM service: ")
+            logger.error(errors[0])
+            return None
 
-            resp = self._model.generate(
-                [prompt],
-                max_new_tokens=self.max_new_tokens,
-                min_new_tokens=self.min_new_tokens,
-                temperature=self.temperature,
-                top_k=self.top_k,
-                top_p=self.top_p,
-            )
-            if "error" in resp:
-                logger.error("Error running BAM service: ")
-                logger.error(resp)
-                return None
+        predictions = {}
+        for question_idx, result in enumerate(results):
             processed_prediction = {}
             processed_prediction["example_id"] = question_idx
-            processed_prediction["span_answer_text"] = resp["results"][0][
-                "generated_text"
-            ]
+            processed_prediction["span_answer_text"] = result["generated_text"]
             processed_prediction["confidence_score"] = 1
             predictions[question_idx] = [processed_prediction]
 
@@ -23,6 +23,8 @@ class ColBERTRetriever(BaseRetriever):
         ncells (int, optional): Number of cells. Defaults to None.
         centroid_score_threshold (float, optional): Centroid score threshold. Defaults to None.
         ndocs (int, optional): Number of documents in PLAID Stage 1. Defaults to None.
+        load_index_with_mmap (bool, optional): Memory-map the index files instead of loading them into RAM. Defaults to False.
+        query_encoder_backend (str, optional): Query encoder backend on CPU: "torch", "int8" or "onnx". Defaults to "torch".
 
     Important:
     1. Each field has metadata property which can carry additional information for other downstream usages.
@@ -76,6 +78,21 @@ class ColBERTRetriever(BaseRetriever):
             "name": "Number of documents in PLAID Stage 1",
         },
     )
+    load_index_with_mmap: bool = field(
+        default=False,
+        metadata={
+            "name": "Load index with mmap",
+            "description": "Memory-map the index files instead of loading them into RAM",
+        },
+    )
+    query_encoder_backend: str = field(
+        default="torch",
+        metadata={
+            "name": "Query encoder backend",
+            "options": ["torch", "int8", "onnx"],
+            "description": "Run the query encoder as is (torch) or quantized to int8 with TorchScript (int8) or ONNX Runtime (onnx), on CPU only",
+        },
+    )
 
     def __post_init__(self):
         self._config = ColBERTConfig(
@@ -85,6 +102,8 @@ class ColBERTRetriever(BaseRetriever):
             ncells=self.ncells,
             centroid_score_threshold=self.centroid_score_threshold,
             ndocs=self.ndocs,
+            load_index_with_mmap=self.load_index_with_mmap,
+            query_encoder_backend=self.query_encoder_backend,
         )
 
         # Placeholder variables
@@ -159,6 +178,7 @@ class DPRRetriever(BaseRetriever):
         checkpoint (str, optional): Model to load. Defaults to checkpoint in index configuration.
         collection (str, optional): collection to load. Defaults to collection in index configuration.
         max_num_documents (int, optional): Maximum number of retrieved document. Defaults to 5.
+        query_encoder_backend (str, optional): Query encoder backend on CPU: "torch", "int8" or "onnx". Defaults to "torch".
 
     Important:
     1. Each field has metadata property which can carry additional information for other downstream usages.
@@ -194,11 +214,20 @@ class DPRRetriever(BaseRetriever):
             "exclude_from_hash": True,
         },
     )
+    query_encoder_backend: str = field(
+        default="torch",
+        metadata={
+            "name": "Query encoder backend",
+            "options": ["torch", "int8", "onnx"],
+            "description": "Run the query encoder as is (torch) or quantized to int8 with TorchScript (int8) or ONNX Runtime (onnx), on CPU only",
+        },
+    )
 
     def __post_init__(self):
         self._config = DPRSearchArguments(
             index_location=os.path.join(self.index_root, self.index_name),
             model_name_or_path=self.checkpoint,
+            query_encoder_backend=self.query_encoder_backend,
         )
 
         # Placeholder variables
@@ -0,0 +1,247 @@
+from typing import List, Any
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+import json
+
+from primeqa.components.base import Retriever as BaseRetriever
+from primeqa.components.retriever.dense import ColBERTRetriever, DPRRetriever
+from primeqa.components.retriever.sparse import BM25Retriever
+from primeqa.ir.util.fusion import reciprocal_rank_fusion, linear_fusion
+
+DENSE_RETRIEVERS = {
+    ColBERTRetriever.get_engine_type(): ColBERTRetriever,
+    DPRRetriever.get_engine_type(): DPRRetriever,
+}
+
+
+@dataclass
+class HybridRetriever(BaseRetriever):
+    """_summary_
+
+    Args:
+        index_root: str, root directory of the BM25 index
+        index_name: str, name of the BM25 index
+        dense_index_root (str): Root directory of the dense index.
+        dense_index_name (str): Name of the dense index.
+        dense_engine_type (str, optional): Engine type of the dense index, "ColBERT" or "DPR". Defaults to "ColBERT".
+        dense_index_id (str, optional): Id of the dense index, resolved to the fields above by the services. Defaults to None.
+        checkpoint (str, optional): Model of the dense retriever. Defaults to checkpoint in index configuration.
+        max_num_documents (int, optional): Maximum number of retrieved document. Defaults to 5.
+        num_candidates (int, optional): Number of documents retrieved by each retriever before fusion. Defaults to 100.
+        fusion (str, optional): "rrf" for reciprocal rank fusion, "linear" for linear fusion of min-max normalized scores. Defaults to "rrf".
+        rrf_k (int, optional): Constant of reciprocal rank fusion. Defaults to 60.
+        sparse_weight (float, optional): Weight of the BM25 ranking, the dense ranking gets 1 - sparse_weight. Defaults to 0.5.
+
+    Both indexes must be generated from the same collection, with the same documents in the same order:
+    the rankings are fused on document ids, and the documents of the fused hits are looked up in the
+    BM25 index's collection. The services reject dense indexes whose documents differ.
+
+    Important:
+    1. Each field has metadata property which can carry additional information for other downstream usages.
+    2. Two special keys (api_support and exclude_from_hash) are defined in "metadata" property.
+        a. api_support (bool, optional): If set to True, that parameter is exposed via service layer. Defaults to False.
+        b. exclude_from_hash (bool,optional): If set to True, that parameter is not considered while building the hash representation for the object. Defaults to False.
+
+    Returns:
+        _type_: _description_
+
+    """
+
+    dense_index_root: str = field(
+        default=None,
+        metadata={
+            "name": "Dense index root",
+            "description": "Path to root directory where the dense index is stored",
+        },
+    )
+    dense_index_name: str = field(
+        default=None,
+        metadata={
+            "name": "Dense index name",
+        },
+    )
+    dense_engine_type: str = field(
+        default="ColBERT",
+        metadata={
+            "name": "Dense engine type",
+            "options": list(DENSE_RETRIEVERS.keys()),
+        },
+    )
+    dense_index_id: str = field(
+        default=None,
+        metadata={
+            "name": "Dense index id",
+            "description": "Id of the dense index searched together with the BM25 index",
+            "api_support": True,
+        },
+    )
+    checkpoint: str = field(
+        default=None,
+        metadata={
+            "name": "Checkpoint",
+            "description": "Path to checkpoint",
+        },
+    )
+    max_num_documents: int = field(
+        default=5,
+        metadata={
+            "name": "Maximum number of retrieved documents",
+            "range": [1, 100, 1],
+            "api_support": True,
+            "exclude_from_hash": True,
+        },
+    )
+    num_candidates: int = field(
+        default=100,
+        metadata={
+            "name": "Number of documents retrieved by each retriever before fusion",
+            "range": [1, 1000, 1],
+            "api_support": True,
+            "exclude_from_hash": True,
+        },
+    )
+    fusion: str = field(
+        default="rrf",
+        metadata={
+            "name": "Fusion",
+            "options": ["rrf", "linear"],
+            "api_support": True,
+            "exclude_from_hash": True,
+        },
+    )
+    rrf_k: int = field(
+        default=60,
+        metadata={
+            "name": "Reciprocal rank fusion constant",
+            "range": [1, 1000, 1],
+            "api_support": True,
+            "exclude_from_hash": True,
+        },
+    )
+    sparse_weight: float = field(
+        default=0.5,
+        metadata={
+            "name": "Weight of the BM25 ranking",
+            "range": [0.0, 1.0, 0.1],
+            "api_support": True,
+            "exclude_from_hash": True,
+        },
+    )
+
+    def __post_init__(self):
+        if self.dense_engine_type not in DENSE_RETRIEVERS:
+            raise ValueError(
+                f"Unsupported dense engine type: {self.dense_engine_type}. Please select one of: {', '.join(DENSE_RETRIEVERS.keys())}"
+            )
+
+        # Placeholder variables
+        self._sparse_retriever = None
+        self._dense_retriever = None
+        self._executor = None
+
+    def __hash__(self) -> int:
+        # Step 1: Identify all fields to be included in the hash
+        hashable_fields = [
+            k
+            for k, v in self.__class__.__dataclass_fields__.items()
+            if not "exclude_from_hash" in v.metadata
+            or not v.metadata["exclude_from_hash"]
+        ]
+
+        # Step 2: Run
+        return hash(
+            f"{self.__class__.__name__}::{json.dumps({k: v for k, v in vars(self).items() if k in hashable_fields}, sort_keys=True)}"
+        )
+
+    def load(self, *args, **kwargs):
+        self._sparse_retriever = BM25Retriever(
+            index_root=self.index_root,
+            index_name=self.index_name,
+            collection=self.collection,
+        )
+        self._dense_retriever = DENSE_RETRIEVERS[self.dense_engine_type](
+            index_root=self.dense_index_root,
+            index_name=self.dense_index_name,
+            collection=self.collection,
+            checkpoint=self.checkpoint,
+        )
+        self._sparse_retriever.load(*args, **kwargs)
+        self._dense_retriever.load(*args, **kwargs)
+
+        # Both retrievers are queried concurrently
+        self._executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix=self.__class__.__name__
+        )
+
+    @classmethod
+    def get_engine_type(cls):
+        # The index queried through the services is the BM25 index, the dense index is `dense_index_id`
+        return BM25Retriever.get_engine_type()
+
+    def train(self, *args, **kwargs):
+        pass
+
+    def eval(self, *args, **kwargs):
+        pass
+
+    def predict(self, input_texts: List[str], *args, **kwargs) -> Any:
+        """Retrieves relevant documents based on input_texts, fusing the BM25 and dense rankings
+
+        Args:
+            input_texts (List[str]): search queries
+
+        Returns:
+            Any: List of tuples. Each tuple contains a document indetifier and fused relevancy score
+        """
+        # Step 1: Locally update object variable values, if provided
+        max_num_documents = (
+            kwargs["max_num_documents"]
+            if "max_num_documents" in kwargs
+            else self.max_num_documents
+        )
+        num_candidates = max(
+            kwargs["num_candidates"]
+            if "num_candidates" in kwargs
+            else self.num_candidates,
+            max_num_documents,
+        )
+        fusion = kwargs["fusion"] if "fusion" in kwargs else self.fusion
+        rrf_k = kwargs["rrf_k"] if "rrf_k" in kwargs else self.rrf_k
+        sparse_weight = (
+            kwargs["sparse_weight"] if "sparse_weight" in kwargs else self.sparse_weight
+        )
+
+        # Step 2: Run both retrievers concurrently
+        sparse_future = self._executor.submit(
+            self._sparse_retriever.predict,
+            input_texts,
+            max_num_documents=num_candidates,
+        )
+        dense_future = self._executor.submit(
+            self._dense_retriever.predict,
+            input_texts,
+            max_num_documents=num_candidates,
+        )
+        sparse_results, dense_results = sparse_future.result(), dense_future.result()
+
+        # Step 3: Fuse rankings per query, deduplicating documents by id
+        weights = [sparse_weight, 1.0 - sparse_weight]
+        if fusion == "linear":
+            return [
+                linear_fusion(
+                    [sparse_ranking, dense_ranking],
+                    weights=weights,
+                    max_num_documents=max_num_documents,
+                )
+                for sparse_ranking, dense_ranking in zip(sparse_results, dense_results)
+            ]
+
+        return [
+            reciprocal_rank_fusion(
+                [sparse_ranking, dense_ranking],
+                k=rrf_k,
+                weights=weights,
+                max_num_documents=max_num_documents,
+            )
+            for sparse_ranking, dense_ranking in zip(sparse_results, dense_results)
+        ]
@@ -3,7 +3,7 @@ from dataclasses import dataclass, field
 import json
 
 from primeqa.components.base import Retriever as BaseRetriever
-from primeqa.ir.sparse.retriever import PyseriniRetriever
+from primeqa.ir.sparse.native_bm25 import NativeBM25Retriever, native_index_exists
 
 
 @dataclass
@@ -76,7 +76,13 @@ class BM25Retriever(BaseRetriever):
         )
 
     def load(self, *args, **kwargs):
-        self._searcher = PyseriniRetriever(self._index_path)
+        # indexes written by the native engine are searched in process, without a JVM
+        if native_index_exists(self._index_path):
+            self._searcher = NativeBM25Retriever(self._index_path)
+        else:
+            from primeqa.ir.sparse.retriever import PyseriniRetriever
+
+            self._searcher = PyseriniRetriever(self._index_path)
 
     @classmethod
     def get_engine_type(cls):
@@ -98,7 +104,7 @@ class BM25Retriever(BaseRetriever):
 
         qids = [str(idx) for idx, query in enumerate(input_texts)]
         hits = self._searcher.batch_retrieve(
-            input_texts, qids, topK=max_num_documents, threads=self.num_workers
+            input_texts, qids, topK=max_num_documents, threads=self.num_workers, hydrate=False
         )
         return [
             [(result["doc_id"], result["score"]) for result in results_per_query]
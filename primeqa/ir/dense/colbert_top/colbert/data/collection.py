@@ -1,39 +1,131 @@
-
 # Could be .tsv or .json. The latter always allows more customization via optional parameters.
 # I think it could be worth doing some kind of parallel reads too, if the file exceeds 1 GiBs.
 # Just need to use a datastructure that shares things across processes without too much pickling.
 # I think multiprocessing.Manager can do that!
 
 import os
+import csv
 import itertools
+from array import array
+
+import numpy as np
 
-from primeqa.ir.dense.colbert_top.colbert.evaluation.loaders import load_collection
 from primeqa.ir.dense.colbert_top.colbert.infra.run import Run
 
 
+def _format_row(row):
+    # Same formatting as `load_collection`
+    pid = row["pid"]
+    passage = row["passage"]
+    if row["title"] is not None:
+        passage = row["title"] + ' | ' + passage
+
+    return pid, passage
+
+
+def _read_tsv_rows(f, offsets=None):
+    """
+        Parse the rows of a collection TSV opened in binary mode, exactly as `load_collection` does.
+        If `offsets` is given (a list or an array), the byte offset of the end of each row is appended to it.
+    """
+    position = f.tell()
+
+    def lines():
+        nonlocal position
+        for line in f:
+            position += len(line)
+            yield line.decode('utf-8')
+
+    csv_reader = csv.DictReader(lines(), fieldnames=["pid", "passage", "title"], delimiter="\t")
+    for row in csv_reader:
+        # The reader only pulls the lines of the current row, so `position` is the end of the row
+        if offsets is not None:
+            offsets.append(position)
+
+        yield _format_row(row)
+
+
 class Collection:
+    """
+        A collection of passages, either in memory (`data`) or backed by a TSV file (`path`).
+
+        A file-backed collection is never loaded as a whole: iterating streams the file, and random
+        access seeks to the row through an index of the rows' byte offsets, built on first use.
+    """
+
     def __init__(self, path=None, data=None):
         self.path = path
-        self.data = data or self._load_file(path)
+        self._data = data
+        self._offsets = None
+
+        if data is None:
+            assert path is not None, "A collection needs a path or data."
+            if not path.endswith('.tsv'):
+                self._load_jsonl(path)
+
+    @property
+    def data(self):
+        # Materializes a file-backed collection, prefer iterating or indexing it
+        if self._data is None:
+            self._data = list(self)
+
+        return self._data
+
+    @property
+    def offsets(self):
+        if self._offsets is None:
+            offsets = array('q', [0])
+            with open(self.path, 'rb') as f:
+                for line_idx, (pid, _) in enumerate(_read_tsv_rows(f, offsets)):
+                    assert pid == 'id' or int(pid) == line_idx
+
+            self._offsets = np.frombuffer(offsets, dtype=np.int64)
+
+        return self._offsets
 
     def __iter__(self):
-        # TODO: If __data isn't there, stream from disk!
-        return self.data.__iter__()
+        if self._data is not None:
+            return self._data.__iter__()
+
+        return self._stream()
+
+    def _stream(self):
+        with open(self.path, 'rb') as f:
+            for line_idx, (pid, passage) in enumerate(_read_tsv_rows(f)):
+                assert pid == 'id' or int(pid) == line_idx
+                yield passage
 
     def __getitem__(self, item):
-        # TODO: Load from disk the first time this is called. Unless self.data is already not None.
-        return self.data[item]
+        if self._data is not None:
+            return self._data[item]
 
-    def __len__(self):
-        # TODO: Load here too. Basically, let's make data a property function and, on first call, either load or get __data.
-        return len(self.data)
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step == 1:
+                return self._read_rows(start, stop)
+            return [self[idx] for idx in range(start, stop, step)]
 
-    def _load_file(self, path):
-        self.path = path
-        return self._load_tsv(path) if path.endswith('.tsv') else self._load_jsonl(path)
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError(f"passage index {item} is out of range")
+
+        return self._read_rows(item, item + 1)[0]
+
+    def _read_rows(self, start, end):
+        if start >= end:
+            return []
+
+        offsets = self.offsets
+        with open(self.path, 'rb') as f:
+            f.seek(int(offsets[start]))
+            return [passage for _, passage in itertools.islice(_read_tsv_rows(f), end - start)]
+
+    def __len__(self):
+        if self._data is not None:
+            return len(self._data)
 
-    def _load_tsv(self, path):
-        return load_collection(path)
+        return len(self.offsets) - 1
 
     def _load_jsonl(self, path):
         raise NotImplementedError()
@@ -50,7 +142,7 @@ class Collection:
 
         with Run().open(new_path, 'w') as f:
             # TODO: expects content to always be a string here; no separate title!
-            for pid, content in enumerate(self.data):
+            for pid, content in enumerate(self):
                 content = f'{pid}\t{content}\n'
                 f.write(content)
             
@@ -15,6 +15,7 @@ from primeqa.ir.dense.colbert_top.colbert.infra.launcher import Launcher
 from primeqa.ir.dense.colbert_top.colbert.utils.utils import create_directory, print_message
 
 from primeqa.ir.dense.colbert_top.colbert.indexing.collection_indexer import encode
+from primeqa.ir.dense.colbert_top.colbert.indexing.index_updater import IndexUpdater
 
 
 class Indexer:
@@ -94,6 +95,33 @@ class Indexer:
 
         return self.index_path
 
+    def __updater(self, name=None):
+        if name is not None:
+            self.configure(index_name=name)
+            self.index_path = self.config.index_path_
+
+        if self.index_path is None:
+            self.index_path = self.config.index_path_
+
+        assert os.path.exists(os.path.join(self.index_path, 'metadata.json')), self.index_path
+
+        return IndexUpdater(self.index_path, checkpoint=self.checkpoint, config=self.config)
+
+    def add(self, passages, name=None):
+        """
+            Index `passages` after the already indexed ones, with the existing centroids. Returns their passage ids.
+        """
+        return self.__updater(name).add(passages)
+
+    def delete(self, pids, name=None):
+        """
+            Stop retrieving the passages `pids`. Their embeddings are dropped by `compact`.
+        """
+        return self.__updater(name).delete(pids)
+
+    def compact(self, name=None):
+        return self.__updater(name).compact()
+
     def __launch(self, collection):
         manager = mp.Manager()
         shared_lists = [manager.list() for _ in range(self.config.nranks)]
@@ -8,6 +8,7 @@ import random
 
 import numpy as np
 import torch.multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait, as_completed
 from primeqa.ir.dense.colbert_top.colbert.infra.config.config import ColBERTConfig
 
 import primeqa.ir.dense.colbert_top.colbert.utils.distributed as distributed
@@ -19,7 +20,7 @@ from primeqa.ir.dense.colbert_top.colbert.data.collection import Collection
 
 from primeqa.ir.dense.colbert_top.colbert.indexing.collection_encoder import CollectionEncoder
 from primeqa.ir.dense.colbert_top.colbert.indexing.index_saver import IndexSaver
-from primeqa.ir.dense.colbert_top.colbert.indexing.utils import optimize_ivf
+from primeqa.ir.dense.colbert_top.colbert.indexing.utils import build_pid_ivf
 from primeqa.ir.dense.colbert_top.colbert.utils.utils import flatten, print_message
 
 from primeqa.ir.dense.colbert_top.colbert.indexing.codecs.residual import ResidualCodec
@@ -286,6 +287,10 @@ class CollectionIndexer():
         # sample_avg_residual = (sample - sample_reconstruct).mean(dim=0)
 
     def index(self):
+        if self.config.num_encoder_workers > 1 and not torch.cuda.is_available():
+            self._index_with_workers()
+            return
+
         with self.saver.thread():
             batches = self.collection.enumerate_batches(rank=self.rank)
             for chunk_idx, offset, passages in tqdm.tqdm(batches, disable=self.rank > 0):
@@ -302,6 +307,40 @@ class CollectionIndexer():
                 self.saver.save_chunk(chunk_idx, offset, embs, doclens)
                 del embs, doclens
 
+    def _index_with_workers(self):
+        """
+            Encode and compress the chunks in CPU worker processes, each with its own copy of the checkpoint.
+            At most two chunks per worker are in flight, so the passages are still read one chunk at a time.
+        """
+        num_workers = self.config.num_encoder_workers
+        num_threads = self.config.threads_per_encoder_worker or max(1, (os.cpu_count() or 1) // num_workers)
+        print_message(f"#> Encoding with {num_workers} worker processes of {num_threads} threads each..")
+
+        def save(future):
+            chunk_idx, offset, compressed_embs, doclens = future.result()
+
+            Run().print_main(f"#> Saving chunk {chunk_idx}: \t {len(doclens):,} passages "
+                             f"and {len(compressed_embs):,} embeddings. From #{offset:,} onward.")
+
+            self.saver.save_compressed_chunk(chunk_idx, offset, compressed_embs, doclens)
+
+        with self.saver.thread(), ProcessPoolExecutor(max_workers=num_workers, mp_context=mp.get_context('spawn'),
+                                                      initializer=_init_encoder_worker,
+                                                      initargs=(self.config, num_threads)) as executor:
+            pending = set()
+            batches = self.collection.enumerate_batches(rank=self.rank)
+            for chunk_idx, offset, passages in tqdm.tqdm(batches, disable=self.rank > 0):
+                if len(pending) >= 2 * num_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        save(future)
+
+                pending.add(executor.submit(_encode_chunk, chunk_idx, offset, passages))
+                del passages
+
+            for future in as_completed(pending):
+                save(future)
+
     def finalize(self):
         if self.rank > 0:
             return
@@ -344,50 +383,20 @@ class CollectionIndexer():
         assert len(self.embedding_offsets) == self.num_chunks, len(self.embedding_offsets)
 
     def _build_ivf(self):
-        # Maybe we should several small IVFs? Every 250M embeddings, so that's every 1 GB.
-        # It would save *memory* here and *disk space* regarding the int64.
-        # But we'd have to decide how many IVFs to use during retrieval: many (loop) or one?
-        # A loop seems nice if we can find a size that's large enough for speed yet small enough to fit on GPU!
-        # Then it would help nicely for batching later: 1GB.
-
-        codes = torch.empty(self.num_embeddings,)
-        print_memory_stats(f'RANK:{self.rank}')
-
-        for chunk_idx in range(self.num_chunks):
-            offset = self.embedding_offsets[chunk_idx]
-            chunk_codes = ResidualCodec.Embeddings.load_codes(self.config.index_path_, chunk_idx)
-
-            codes[offset:offset+chunk_codes.size(0)] = chunk_codes
-
-        print_message(f"offset: {offset}")
-        print_message(f"chunk codes size(0): {chunk_codes.size(0)}")
-        print_message(f"codes size(0): {codes.size(0)}")
-        print_message(f"codes size(): {codes.size()}")
-
-
-        assert offset+chunk_codes.size(0) == codes.size(0), (offset, chunk_codes.size(0), codes.size())
-
-
+        # Streams the chunks' codes twice (count, then scatter) instead of sorting all codes at once,
+        # and writes the pid-level IVF directly instead of an embedding-level `ivf.pt` for `optimize_ivf`.
         print_memory_stats(f'RANK:{self.rank}')
 
-        codes = codes.sort()
-        ivf, values = codes.indices, codes.values
-
-        print_memory_stats(f'RANK:{self.rank}')
+        ivf_lengths = build_pid_ivf(self.config.index_path_, self.num_chunks, self.num_partitions)
 
-        partitions, ivf_lengths = values.unique_consecutive(return_counts=True)
-
-
-        print_message(f">>>>partition.size(0): {partitions.size(0)}")
+        print_message(f">>>>non-empty partitions: {(ivf_lengths > 0).sum().item()}")
         print_message(f">>>>num_partition: {self.num_partitions}")
 
-        # All partitions should be non-empty. (We can use torch.histc otherwise.)
-        assert partitions.size(0) == self.num_partitions, (partitions.size(), self.num_partitions)
+        # All partitions should be non-empty.
+        assert (ivf_lengths > 0).all(), ((ivf_lengths > 0).sum().item(), self.num_partitions)
 
         print_memory_stats(f'RANK:{self.rank}')
 
-        _, _ = optimize_ivf(ivf, ivf_lengths, self.config.index_path_)
-
     def _update_metadata(self):
         config = self.config
         self.metadata_path = os.path.join(config.index_path_, 'metadata.json')
@@ -403,6 +412,28 @@ class CollectionIndexer():
             f.write(ujson.dumps(d, indent=4) + '\n')
 
 
+_encoder_worker = None
+
+
+def _init_encoder_worker(config, num_threads):
+    global _encoder_worker
+
+    torch.set_num_threads(num_threads)
+
+    checkpoint = Checkpoint(config.checkpoint, colbert_config=config).cpu()
+    _encoder_worker = CollectionEncoder(config, checkpoint), ResidualCodec.load(index_path=config.index_path_)
+
+
+def _encode_chunk(chunk_idx, offset, passages):
+    encoder, codec = _encoder_worker
+
+    with torch.inference_mode():
+        embs, doclens = encoder.encode_passages(passages)
+        compressed_embs = codec.compress(embs.half())
+
+    return chunk_idx, offset, compressed_embs, doclens
+
+
 def compute_faiss_kmeans(dim, num_partitions, kmeans_niters, shared_lists, return_value_queue=None):
     kmeans = faiss.Kmeans(dim, num_partitions, niter=kmeans_niters, gpu=torch.cuda.is_available(), verbose=True, seed=123)
 
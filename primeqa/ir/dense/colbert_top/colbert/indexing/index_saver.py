@@ -41,6 +41,9 @@ class IndexSaver():
     def save_chunk(self, chunk_idx, offset, embs, doclens):
         compressed_embs = self.codec.compress(embs)
 
+        self.save_compressed_chunk(chunk_idx, offset, compressed_embs, doclens)
+
+    def save_compressed_chunk(self, chunk_idx, offset, compressed_embs, doclens):
         self.saver_queue.put((chunk_idx, offset, compressed_embs, doclens))
 
     def _saver_thread(self):
@@ -0,0 +1,360 @@
+"""
+Incremental updates of a PLAID index, without rebuilding it.
+
+New passages are encoded and compressed with the index's existing centroids and buckets, written
+as new chunks and merged into `ivf.pid.pt`. Deleted passages are recorded as tombstones in
+`tombstones.pt`, which the searcher filters out, until `compact` drops their embeddings from the
+chunks and the IVF. Passage ids are never reused or shifted: a compacted passage keeps its id,
+with a doclen of 0.
+
+Updates must not run concurrently with each other. Searchers which already loaded the index keep
+searching the previous version of it until they are reloaded.
+"""
+
+import os
+import csv
+import itertools
+
+import torch
+import ujson
+
+from primeqa.ir.dense.colbert_top.colbert.infra.config import ColBERTConfig
+from primeqa.ir.dense.colbert_top.colbert.modeling.checkpoint import Checkpoint
+from primeqa.ir.dense.colbert_top.colbert.indexing.collection_encoder import CollectionEncoder
+from primeqa.ir.dense.colbert_top.colbert.indexing.index_saver import IndexSaver
+from primeqa.ir.dense.colbert_top.colbert.indexing.codecs.residual_embeddings import ResidualEmbeddings
+from primeqa.ir.dense.colbert_top.colbert.indexing.utils import optimize_ivf, centroid_pid_pairs
+from primeqa.ir.dense.colbert_top.colbert.indexing.mmap_index import MMAP_METADATA_FILENAME, CODES_FILENAME, \
+    RESIDUALS_FILENAME, DOCLENS_FILENAME, IVF_FILENAME, IVF_LENGTHS_FILENAME
+from primeqa.ir.dense.colbert_top.colbert.utils.utils import print_message
+
+TOMBSTONES_FILENAME = 'tombstones.pt'
+
+# Same as the chunk size of `Collection.get_chunksize`
+MAX_CHUNKSIZE = 25_000
+
+
+def load_tombstones(index_path):
+    """
+        Sorted int64 ids of the deleted passages of an index, which have not been compacted yet.
+    """
+    tombstones_path = os.path.join(index_path, TOMBSTONES_FILENAME)
+    if not os.path.exists(tombstones_path):
+        return torch.zeros(0, dtype=torch.int64)
+
+    return torch.load(tombstones_path, map_location='cpu')
+
+
+def iterate_collection(collection_path, start_pid=0):
+    """
+        Yield the (pid, passage) pairs of a collection TSV from `start_pid` on, formatted as by `load_collection`.
+    """
+    with open(collection_path) as f:
+        csv_reader = csv.DictReader(f, fieldnames=["pid", "passage", "title"], delimiter="\t")
+        for line_idx, row in enumerate(itertools.islice(csv_reader, start_pid, None), start=start_pid):
+            pid = row["pid"]
+            assert pid == 'id' or int(pid) == line_idx
+
+            passage = row["passage"]
+            if row["title"] is not None:
+                passage = row["title"] + ' | ' + passage
+
+            yield line_idx, passage
+
+
+def _save_json(data, path):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(ujson.dumps(data, indent=4) + '\n')
+    os.replace(tmp_path, path)
+
+
+def _save_tensors(data, path):
+    tmp_path = f'{path}.tmp'
+    torch.save(data, tmp_path)
+    os.replace(tmp_path, path)
+
+
+class IndexUpdater:
+    def __init__(self, index_path, checkpoint=None, config=None):
+        """
+            The index's own configuration takes precedence over `config`, so that new passages are
+            encoded and compressed the same way as the indexed ones.
+        """
+        self.index_path = index_path
+
+        self.config = ColBERTConfig.from_existing(config, ColBERTConfig.load_from_index(index_path))
+        self.config.configure(index_path=index_path)
+        if checkpoint is not None:
+            self.config.configure(checkpoint=checkpoint)
+
+        self.encoder = None
+
+    def _get_encoder(self):
+        if self.encoder is None:
+            checkpoint = Checkpoint(self.config.checkpoint, colbert_config=self.config)
+            checkpoint = checkpoint.cuda() if torch.cuda.is_available() else checkpoint.cpu()
+            self.encoder = CollectionEncoder(self.config, checkpoint)
+
+        return self.encoder
+
+    @property
+    def metadata(self):
+        with open(os.path.join(self.index_path, 'metadata.json')) as f:
+            return ujson.load(f)
+
+    def _chunk_metadata_path(self, chunk_idx):
+        return os.path.join(self.index_path, f'{chunk_idx}.metadata.json')
+
+    def _load_chunk_metadata(self, chunk_idx):
+        with open(self._chunk_metadata_path(chunk_idx)) as f:
+            return ujson.load(f)
+
+    def _chunk_paths(self, chunk_idx):
+        return [os.path.join(self.index_path, filename) for filename in
+                [f'{chunk_idx}.codes.pt', f'{chunk_idx}.residuals.pt', f'doclens.{chunk_idx}.json',
+                 f'{chunk_idx}.metadata.json']]
+
+    @property
+    def num_passages(self):
+        num_chunks = self.metadata['num_chunks']
+        if num_chunks == 0:
+            return 0
+
+        chunk_metadata = self._load_chunk_metadata(num_chunks - 1)
+        return chunk_metadata['passage_offset'] + chunk_metadata['num_passages']
+
+    def _load_ivf(self):
+        if os.path.exists(os.path.join(self.index_path, 'ivf.pid.pt')):
+            return torch.load(os.path.join(self.index_path, 'ivf.pid.pt'), map_location='cpu')
+
+        ivf, ivf_lengths = torch.load(os.path.join(self.index_path, 'ivf.pt'), map_location='cpu')
+        return optimize_ivf(ivf, ivf_lengths, self.index_path)
+
+    def _save_ivf(self, ivf, ivf_lengths):
+        _save_tensors((ivf, ivf_lengths), os.path.join(self.index_path, 'ivf.pid.pt'))
+
+    def _update_metadata(self, num_chunks, num_embeddings, num_passages):
+        metadata = self.metadata
+        metadata['num_chunks'] = num_chunks
+        metadata['num_embeddings'] = num_embeddings
+        metadata['avg_doclen'] = num_embeddings / max(1, num_passages)
+
+        _save_json(metadata, os.path.join(self.index_path, 'metadata.json'))
+
+    def _remove_mmap_files(self):
+        # Called once the update is committed, files converted meanwhile are from a previous version.
+        # Unlinked, not overwritten: processes which mapped the files keep their pages.
+        # The memory-mapped index is converted again when it is next loaded.
+        for filename in [MMAP_METADATA_FILENAME, CODES_FILENAME, RESIDUALS_FILENAME, DOCLENS_FILENAME,
+                         IVF_FILENAME, IVF_LENGTHS_FILENAME]:
+            path = os.path.join(self.index_path, filename)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def add(self, passages, chunksize=MAX_CHUNKSIZE):
+        """
+            Encode and index `passages` (any iterable of strings), appended after the passages already in the index.
+            Returns the ids of the added passages.
+        """
+        metadata = self.metadata
+        num_chunks, num_embeddings = metadata['num_chunks'], metadata['num_embeddings']
+        start_pid = self.num_passages
+
+        # Step 1: Encode and save the new passages as new chunks, compressed with the existing codec
+        encoder = self._get_encoder()
+        saver = IndexSaver(self.config)
+
+        chunk_idx, pid_offset = num_chunks, start_pid
+        passages = iter(passages)
+        with torch.inference_mode(), saver.thread():
+            while True:
+                chunk_passages = list(itertools.islice(passages, chunksize))
+                if not chunk_passages:
+                    break
+
+                embs, doclens = encoder.encode_passages(chunk_passages)
+                embs = embs.half()
+
+                print_message(f"#> Saving chunk {chunk_idx}: \t {len(chunk_passages):,} passages "
+                              f"and {embs.size(0):,} embeddings. From #{pid_offset:,} onward.")
+
+                saver.save_chunk(chunk_idx, pid_offset, embs, doclens)
+                chunk_idx += 1
+                pid_offset += len(chunk_passages)
+                del embs
+
+        new_chunk_idxs = range(num_chunks, chunk_idx)
+        if len(new_chunk_idxs) == 0:
+            return []
+
+        # Step 2: Record the embedding offsets of the new chunks
+        all_codes, all_doclens = [], []
+        for new_chunk_idx in new_chunk_idxs:
+            chunk_metadata = self._load_chunk_metadata(new_chunk_idx)
+            chunk_metadata['embedding_offset'] = num_embeddings
+            _save_json(chunk_metadata, self._chunk_metadata_path(new_chunk_idx))
+            num_embeddings += chunk_metadata['num_embeddings']
+
+            all_codes.append(ResidualEmbeddings.load_codes(self.index_path, new_chunk_idx))
+            with open(os.path.join(self.index_path, f'doclens.{new_chunk_idx}.json')) as f:
+                all_doclens.extend(ujson.load(f))
+
+        # Step 3: Update the metadata before the IVF, so that the index is consistent at any time:
+        # until the IVF is saved, the new passages are just not retrieved yet
+        self._update_metadata(chunk_idx, num_embeddings, pid_offset)
+
+        # Step 4: Merge the new passages into the IVF
+        self._merge_into_ivf(torch.cat(all_codes), torch.tensor(all_doclens), start_pid)
+        self._remove_mmap_files()
+
+        print_message(f"#> Added {pid_offset - start_pid:,} passages to {self.index_path}")
+
+        return list(range(start_pid, pid_offset))
+
+    def _merge_into_ivf(self, codes, doclens, start_pid):
+        ivf, ivf_lengths = self._load_ivf()
+
+        # One entry per (centroid, passage) pair, sorted by centroid and then by passage
+        centroids, pids = centroid_pid_pairs(codes, doclens, start_pid)
+        pids = pids.to(ivf.dtype)
+        new_ivf_lengths = torch.bincount(centroids, minlength=ivf_lengths.size(0))
+
+        # The new passage ids are larger than all the indexed ones, appending them keeps each list sorted
+        ivf = torch.cat([
+            centroid_pids
+            for lists in zip(ivf.split(ivf_lengths.tolist()), pids.split(new_ivf_lengths.tolist()))
+            for centroid_pids in lists
+        ])
+        ivf_lengths = ivf_lengths + new_ivf_lengths
+
+        self._save_ivf(ivf, ivf_lengths)
+
+    def delete(self, pids):
+        """
+            Mark passages as deleted, they are no longer retrieved. Returns the number of newly deleted passages.
+        """
+        pids = torch.as_tensor(list(pids), dtype=torch.int64)
+        num_passages = self.num_passages
+        if pids.numel() and (pids.min() < 0 or pids.max() >= num_passages):
+            raise ValueError(f"Passage ids must be in [0, {num_passages}), got {pids.tolist()}")
+
+        tombstones = load_tombstones(self.index_path)
+        new_tombstones = torch.cat([tombstones, pids]).unique()
+        _save_tensors(new_tombstones, os.path.join(self.index_path, TOMBSTONES_FILENAME))
+
+        print_message(f"#> Deleted {new_tombstones.size(0) - tombstones.size(0):,} passages from {self.index_path}")
+
+        return new_tombstones.size(0) - tombstones.size(0)
+
+    def compact(self, chunksize=MAX_CHUNKSIZE):
+        """
+            Drop the embeddings of deleted passages from the chunks and the IVF, and merge consecutive chunks of
+            up to `chunksize` passages in total, e.g. those written by `add`.
+
+            Chunks are rewritten in place: the index must not be searched while it is compacted.
+        """
+        tombstones = load_tombstones(self.index_path)
+        num_chunks = self.metadata['num_chunks']
+        chunks = [self._load_chunk_metadata(chunk_idx) for chunk_idx in range(num_chunks)]
+
+        # Step 1: Group consecutive chunks
+        groups = []
+        for chunk_idx, chunk_metadata in enumerate(chunks):
+            if groups and sum(chunks[idx]['num_passages'] for idx in groups[-1]) \
+                    + chunk_metadata['num_passages'] <= chunksize:
+                groups[-1].append(chunk_idx)
+            else:
+                groups.append([chunk_idx])
+
+        # Step 2: Rewrite the groups of chunks as one chunk each, in order. A group is never written to
+        # a chunk index greater than its first chunk's, so chunks are read before they are overwritten.
+        num_embeddings = 0
+        for new_chunk_idx, group in enumerate(groups):
+            passage_offset = chunks[group[0]]['passage_offset']
+            num_passages = sum(chunks[chunk_idx]['num_passages'] for chunk_idx in group)
+            deleted = tombstones[(tombstones >= passage_offset) & (tombstones < passage_offset + num_passages)]
+
+            if len(group) == 1 and deleted.numel() == 0:
+                if group[0] != new_chunk_idx:
+                    for path, new_path in zip(self._chunk_paths(group[0]), self._chunk_paths(new_chunk_idx)):
+                        os.replace(path, new_path)
+
+                chunk_metadata = chunks[group[0]]
+            else:
+                codes, residuals, doclens = [], [], []
+                for chunk_idx in group:
+                    chunk = ResidualEmbeddings.load(self.index_path, chunk_idx)
+                    codes.append(chunk.codes)
+                    residuals.append(chunk.residuals)
+                    with open(os.path.join(self.index_path, f'doclens.{chunk_idx}.json')) as f:
+                        doclens.extend(ujson.load(f))
+
+                doclens = torch.tensor(doclens)
+                keep_passages = torch.ones(num_passages, dtype=torch.bool)
+                keep_passages[deleted - passage_offset] = False
+                keep = torch.repeat_interleave(keep_passages, doclens)
+                doclens[~keep_passages] = 0
+
+                chunk = ResidualEmbeddings(torch.cat(codes)[keep], torch.cat(residuals)[keep])
+                chunk.save(os.path.join(self.index_path, str(new_chunk_idx)))
+                with open(os.path.join(self.index_path, f'doclens.{new_chunk_idx}.json'), 'w') as f:
+                    ujson.dump(doclens.tolist(), f)
+
+                chunk_metadata = {'passage_offset': passage_offset, 'num_passages': num_passages,
+                                  'num_embeddings': len(chunk)}
+
+            chunk_metadata['embedding_offset'] = num_embeddings
+            _save_json(chunk_metadata, self._chunk_metadata_path(new_chunk_idx))
+            num_embeddings += chunk_metadata['num_embeddings']
+
+        for chunk_idx in range(len(groups), num_chunks):
+            for path in self._chunk_paths(chunk_idx):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        # Step 3: Drop the deleted passages from the IVF
+        ivf, ivf_lengths = self._load_ivf()
+        keep = ~torch.isin(ivf, tombstones.to(ivf.dtype))
+        kept = torch.cat([torch.zeros(1, dtype=torch.int64), keep.cumsum(0)])
+        ivf_offsets = torch.cat([torch.zeros(1, dtype=torch.int64), ivf_lengths.cumsum(0)])
+        self._save_ivf(ivf[keep], kept[ivf_offsets[1:]] - kept[ivf_offsets[:-1]])
+
+        num_passages = chunks[-1]['passage_offset'] + chunks[-1]['num_passages'] if chunks else 0
+        self._update_metadata(len(groups), num_embeddings, num_passages)
+
+        tombstones_path = os.path.join(self.index_path, TOMBSTONES_FILENAME)
+        if os.path.exists(tombstones_path):
+            os.remove(tombstones_path)
+
+        self._remove_mmap_files()
+
+        print_message(f"#> Compacted {self.index_path}: {num_chunks} chunks into {len(groups)}, "
+                      f"dropped {tombstones.size(0):,} deleted passages")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Update a PLAID index in place.')
+    parser.add_argument('--index_path', required=True, type=str)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    add_parser = subparsers.add_parser('add', help='index the passages of the collection which are not indexed yet')
+    add_parser.add_argument('--collection', required=True, type=str)
+    add_parser.add_argument('--checkpoint', type=str, default=None)
+
+    delete_parser = subparsers.add_parser('delete', help='mark passages as deleted')
+    delete_parser.add_argument('pids', nargs='+', type=int)
+
+    subparsers.add_parser('compact', help='drop deleted passages and merge small chunks')
+
+    args = parser.parse_args()
+    updater = IndexUpdater(args.index_path, checkpoint=getattr(args, 'checkpoint', None))
+
+    if args.command == 'add':
+        updater.add(passage for _, passage in iterate_collection(args.collection, start_pid=updater.num_passages))
+    elif args.command == 'delete':
+        updater.delete(args.pids)
+    else:
+        updater.compact()
@@ -0,0 +1,222 @@
+"""
+Memory-mapped layout of a PLAID index.
+
+All arrays live in flat binary files next to the regular (chunked) index files, so that the
+loader can map them straight from disk. Pages are faulted in on demand and, since the files
+are mapped copy-on-write, clean pages are shared through the page cache by every process
+serving the same index.
+
+    codes.mmap          int32   (num_embeddings + padding,)
+    residuals.mmap      uint8   (num_embeddings + padding, dim // 8 * nbits)
+    doclens.mmap        int64   (num_passages,)
+    ivf.pid.mmap        int32   (ivf_size + ivf_padding,)
+    ivf.lengths.mmap    int64   (num_partitions,)
+
+The padding lets StridedTensor build its strided views without copying the packed tensors.
+
+The metadata records which version of the index the files were converted from, so that they are
+converted again once the index is updated. A file lock in the index directory lets a single process
+convert the index while the others wait for it.
+"""
+
+import os
+import ujson
+import torch
+import numpy as np
+from filelock import FileLock
+
+from primeqa.ir.dense.colbert_top.colbert.indexing.codecs.residual_embeddings import ResidualEmbeddings, get_dim_and_nbits
+from primeqa.ir.dense.colbert_top.colbert.indexing.utils import optimize_ivf
+from primeqa.ir.dense.colbert_top.colbert.utils.utils import print_message
+
+MMAP_METADATA_FILENAME = 'mmap.metadata.json'
+MMAP_LOCK_FILENAME = 'mmap.lock'
+
+CODES_FILENAME = 'codes.mmap'
+RESIDUALS_FILENAME = 'residuals.mmap'
+DOCLENS_FILENAME = 'doclens.mmap'
+IVF_FILENAME = 'ivf.pid.mmap'
+IVF_LENGTHS_FILENAME = 'ivf.lengths.mmap'
+
+
+def index_fingerprint(index_path):
+    """
+        Identifies the version of an index: its number of chunks and embeddings, and when its IVF was saved.
+    """
+    with open(os.path.join(index_path, 'metadata.json')) as f:
+        metadata = ujson.load(f)
+
+    return {
+        'num_chunks': metadata['num_chunks'],
+        'num_embeddings': metadata['num_embeddings'],
+        'ivf_mtime_ns': os.stat(os.path.join(index_path, 'ivf.pid.pt')).st_mtime_ns,
+    }
+
+
+def mmap_index_exists(index_path):
+    """
+        Whether the memory-mapped files exist and were converted from the current version of the index.
+    """
+    if not os.path.exists(os.path.join(index_path, MMAP_METADATA_FILENAME)):
+        return False
+    if not os.path.exists(os.path.join(index_path, 'ivf.pid.pt')):
+        return False
+
+    return load_mmap_metadata(index_path).get('index') == index_fingerprint(index_path)
+
+
+def load_mmap_metadata(index_path):
+    with open(os.path.join(index_path, MMAP_METADATA_FILENAME)) as f:
+        return ujson.load(f)
+
+
+def ensure_mmap_index(index_path):
+    """
+        Convert the index to the memory-mapped format unless its current version was already converted.
+        Processes loading the same index wait for the one converting it and then map its files.
+    """
+    if mmap_index_exists(index_path):
+        return
+
+    with FileLock(os.path.join(index_path, MMAP_LOCK_FILENAME)):
+        if not mmap_index_exists(index_path):
+            _convert_index_to_mmap(index_path)
+
+
+def convert_index_to_mmap(index_path):
+    """
+        Write the memory-mapped files for an existing index, one chunk at a time.
+    """
+    with FileLock(os.path.join(index_path, MMAP_LOCK_FILENAME)):
+        return _convert_index_to_mmap(index_path)
+
+
+def _temporary_path(index_path, filename):
+    return os.path.join(index_path, filename + '.tmp')
+
+
+def _convert_index_to_mmap(index_path):
+    # Every file is written under a temporary name and then moved into place, the metadata file last.
+    # Files mapped by other processes are replaced rather than truncated, and a partially converted
+    # index is never picked up.
+    print_message(f"#> Converting the index at {index_path} to the memory-mapped format..")
+
+    with open(os.path.join(index_path, 'metadata.json')) as f:
+        metadata = ujson.load(f)
+
+    num_chunks, num_embeddings = metadata['num_chunks'], metadata['num_embeddings']
+    dim, nbits = get_dim_and_nbits(index_path)
+
+    doclens = []
+    for chunk_idx in range(num_chunks):
+        with open(os.path.join(index_path, f'doclens.{chunk_idx}.json')) as f:
+            doclens.extend(ujson.load(f))
+
+    doclens = np.array(doclens, dtype=np.int64)
+    assert doclens.sum() == num_embeddings, (doclens.sum(), num_embeddings)
+    doclens.tofile(_temporary_path(index_path, DOCLENS_FILENAME))
+
+    padding = int(doclens.max()) if len(doclens) > 0 else 0
+
+    codes = np.memmap(_temporary_path(index_path, CODES_FILENAME), dtype=np.int32, mode='w+',
+                      shape=(num_embeddings + padding,))
+    residuals = np.memmap(_temporary_path(index_path, RESIDUALS_FILENAME), dtype=np.uint8, mode='w+',
+                          shape=(num_embeddings + padding, dim // 8 * nbits))
+
+    offset = 0
+    for chunk_idx in range(num_chunks):
+        chunk = ResidualEmbeddings.load(index_path, chunk_idx)
+        endpos = offset + len(chunk)
+
+        codes[offset:endpos] = chunk.codes.numpy()
+        residuals[offset:endpos] = chunk.residuals.numpy()
+
+        offset = endpos
+        del chunk
+
+    assert offset == num_embeddings, (offset, num_embeddings)
+
+    codes.flush()
+    residuals.flush()
+    del codes, residuals
+
+    # Taken before the IVF is read, so that an IVF saved meanwhile is not recorded as converted
+    if os.path.exists(os.path.join(index_path, "ivf.pid.pt")):
+        fingerprint = index_fingerprint(index_path)
+        ivf, ivf_lengths = torch.load(os.path.join(index_path, "ivf.pid.pt"), map_location='cpu')
+    else:
+        assert os.path.exists(os.path.join(index_path, "ivf.pt")), f"ivf.pt not found in {index_path}"
+        ivf, ivf_lengths = torch.load(os.path.join(index_path, "ivf.pt"), map_location='cpu')
+        ivf, ivf_lengths = optimize_ivf(ivf, ivf_lengths, index_path)
+        fingerprint = index_fingerprint(index_path)
+
+    if fingerprint['num_chunks'] != num_chunks or fingerprint['num_embeddings'] != num_embeddings:
+        # The index was updated meanwhile, the files are recorded as converted from the previous version
+        fingerprint = {'num_chunks': num_chunks, 'num_embeddings': num_embeddings, 'ivf_mtime_ns': None}
+
+    ivf_padding = int(ivf_lengths.max().item()) if ivf_lengths.size(0) > 0 else 0
+    ivf = np.concatenate((ivf.numpy().astype(np.int32), np.zeros(ivf_padding, dtype=np.int32)))
+    ivf.tofile(_temporary_path(index_path, IVF_FILENAME))
+    ivf_lengths.numpy().astype(np.int64).tofile(_temporary_path(index_path, IVF_LENGTHS_FILENAME))
+
+    mmap_metadata = {
+        'num_embeddings': num_embeddings,
+        'num_passages': len(doclens),
+        'padding': padding,
+        'packed_dim': dim // 8 * nbits,
+        'ivf_size': ivf.shape[0],
+        'num_partitions': ivf_lengths.size(0),
+        'index': fingerprint,
+    }
+
+    with open(_temporary_path(index_path, MMAP_METADATA_FILENAME), 'w') as f:
+        f.write(ujson.dumps(mmap_metadata, indent=4) + '\n')
+
+    for filename in [CODES_FILENAME, RESIDUALS_FILENAME, DOCLENS_FILENAME, IVF_FILENAME, IVF_LENGTHS_FILENAME,
+                     MMAP_METADATA_FILENAME]:
+        os.replace(_temporary_path(index_path, filename), os.path.join(index_path, filename))
+
+    print_message(f"#> Saved the memory-mapped index to {index_path}")
+
+    return mmap_metadata
+
+
+def _load_mmap_tensor(path, dtype, shape):
+    # Copy-on-write keeps the mapping shareable while giving torch a writable buffer.
+    return torch.from_numpy(np.memmap(path, dtype=dtype, mode='c', shape=shape))
+
+
+def load_mmap_embeddings(index_path):
+    metadata = load_mmap_metadata(index_path)
+    num_rows = metadata['num_embeddings'] + metadata['padding']
+
+    codes = _load_mmap_tensor(os.path.join(index_path, CODES_FILENAME), np.int32, (num_rows,))
+    residuals = _load_mmap_tensor(os.path.join(index_path, RESIDUALS_FILENAME), np.uint8,
+                                  (num_rows, metadata['packed_dim']))
+
+    return ResidualEmbeddings(codes, residuals)
+
+
+def load_mmap_doclens(index_path):
+    metadata = load_mmap_metadata(index_path)
+    return _load_mmap_tensor(os.path.join(index_path, DOCLENS_FILENAME), np.int64, (metadata['num_passages'],))
+
+
+def load_mmap_ivf(index_path):
+    metadata = load_mmap_metadata(index_path)
+
+    ivf = _load_mmap_tensor(os.path.join(index_path, IVF_FILENAME), np.int32, (metadata['ivf_size'],))
+    ivf_lengths = _load_mmap_tensor(os.path.join(index_path, IVF_LENGTHS_FILENAME), np.int64,
+                                    (metadata['num_partitions'],))
+
+    return ivf, ivf_lengths
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Convert a PLAID index to the memory-mapped format.')
+    parser.add_argument('--index_path', required=True, type=str)
+    args = parser.parse_args()
+
+    convert_index_to_mmap(args.index_path)
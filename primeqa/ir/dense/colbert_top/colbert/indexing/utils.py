@@ -1,8 +1,11 @@
 import os
 import torch
 import tqdm
+import ujson
+import numpy as np
 
 from primeqa.ir.dense.colbert_top.colbert.indexing.loaders import load_doclens
+from primeqa.ir.dense.colbert_top.colbert.indexing.codecs.residual_embeddings import ResidualEmbeddings
 from primeqa.ir.dense.colbert_top.colbert.utils.utils import print_message, flatten
 
 def optimize_ivf(orig_ivf, orig_ivf_lengths, index_path):
@@ -51,3 +54,74 @@ def optimize_ivf(orig_ivf, orig_ivf_lengths, index_path):
     return ivf, ivf_lengths
 
 
+
+
+def centroid_pid_pairs(codes, doclens, pid_offset=0):
+    """
+        The distinct (centroid, pid) pairs of consecutive passages, sorted by centroid and then by pid.
+        `codes` are the centroid ids of the passages' embeddings and `doclens` their numbers of embeddings.
+    """
+    num_passages = max(1, len(doclens))
+    pids = torch.repeat_interleave(torch.arange(len(doclens)), torch.as_tensor(doclens, dtype=torch.long))
+    pairs = torch.unique(codes.long() * num_passages + pids)
+
+    return pairs // num_passages, pairs % num_passages + pid_offset
+
+
+def build_pid_ivf(index_path, num_chunks, num_partitions):
+    """
+        Build the pid-level IVF (`ivf.pid.pt`, as `optimize_ivf` does) from the saved chunks, one chunk at a time.
+
+        A first pass counts the passages of each centroid, a second pass scatters the pids into a preallocated
+        memory-mapped array. Each chunk holds larger pids than the previous ones, so every centroid's list ends
+        up sorted. Memory use depends on the chunk size, not on the size of the collection.
+    """
+    print_message("#> Building the IVF of centroids to lists of pids, chunk by chunk..")
+
+    def load_chunk(chunk_idx):
+        with open(os.path.join(index_path, f'{chunk_idx}.metadata.json')) as f:
+            passage_offset = ujson.load(f)['passage_offset']
+        with open(os.path.join(index_path, f'doclens.{chunk_idx}.json')) as f:
+            doclens = ujson.load(f)
+
+        codes = ResidualEmbeddings.load_codes(index_path, chunk_idx)
+        assert codes.size(0) == sum(doclens), (chunk_idx, codes.size(0), sum(doclens))
+
+        return centroid_pid_pairs(codes, doclens, passage_offset)
+
+    # Pass 1: count the pids of each centroid
+    ivf_lengths = torch.zeros(num_partitions, dtype=torch.long)
+    for chunk_idx in tqdm.tqdm(range(num_chunks)):
+        centroids, _ = load_chunk(chunk_idx)
+        ivf_lengths += torch.bincount(centroids, minlength=num_partitions)
+
+    ivf_size = int(ivf_lengths.sum().item())
+    print_message(f"#> The IVF has {ivf_size:,} entries")
+
+    # Pass 2: scatter the pids of each chunk after the pids of the previous chunks
+    tmp_ivf_path = os.path.join(index_path, 'ivf.pid.tmp')
+    ivf = np.memmap(tmp_ivf_path, dtype=np.int32, mode='w+', shape=(max(1, ivf_size),))
+
+    ivf_positions = torch.cumsum(ivf_lengths, dim=0) - ivf_lengths
+    for chunk_idx in tqdm.tqdm(range(num_chunks)):
+        centroids, pids = load_chunk(chunk_idx)
+        chunk_lengths = torch.bincount(centroids, minlength=num_partitions)
+
+        # Position of each pair within its centroid's run of the (centroid-sorted) pairs
+        run_starts = torch.cumsum(chunk_lengths, dim=0) - chunk_lengths
+        ranks = torch.arange(centroids.size(0)) - run_starts[centroids]
+
+        ivf[(ivf_positions[centroids] + ranks).numpy()] = pids.numpy()
+        ivf_positions += chunk_lengths
+
+    ivf.flush()
+    ivf = torch.from_numpy(ivf[:ivf_size])
+
+    optimized_ivf_path = os.path.join(index_path, 'ivf.pid.pt')
+    torch.save((ivf, ivf_lengths), optimized_ivf_path)
+    print_message(f"#> Saved optimized IVF to {optimized_ivf_path}")
+
+    del ivf
+    os.remove(tmp_ivf_path)
+
+    return ivf_lengths
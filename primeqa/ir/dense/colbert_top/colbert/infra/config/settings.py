@@ -111,6 +111,9 @@ class QuerySettings:
     query_maxlen: int = DefaultVal(32)
     attend_to_mask_tokens : bool = DefaultVal(False)
     interaction: str = DefaultVal('colbert')
+    query_encoder_backend: str = DefaultVal('torch')
+    query_encoder_tolerance: float = DefaultVal(0.98)
+    query_cache_size: int = DefaultVal(4096)
 
 
 @dataclass
@@ -182,6 +185,11 @@ class IndexingSettings:
     kmeans_niters: int = DefaultVal(20)
 
     num_partitions_max: int = DefaultVal(10000000)
+
+    num_encoder_workers: int = DefaultVal(0)
+
+    threads_per_encoder_worker: int = DefaultVal(0)
+
     @property
     def index_path_(self):
         return self.index_path or os.path.join(self.index_root_, self.index_name)
@@ -191,3 +199,5 @@ class SearchSettings:
     ncells: int = DefaultVal(None)
     centroid_score_threshold: float = DefaultVal(None)
     ndocs: int = DefaultVal(None)
+    search_bsize: int = DefaultVal(32)
+    load_index_with_mmap: bool = DefaultVal(False)
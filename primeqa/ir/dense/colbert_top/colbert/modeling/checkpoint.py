@@ -9,6 +9,21 @@ from primeqa.ir.dense.colbert_top.colbert.modeling.colbert import ColBERT
 from primeqa.ir.dense.colbert_top.colbert.utils.utils import torch_load_dnn
 from primeqa.ir.dense.colbert_top.colbert.modeling.factory import get_query_tokenizer, get_doc_tokenizer
 from primeqa.ir.dense.colbert_top.colbert.utils.utils import print_message
+from primeqa.ir.util.query_encoder import QueryEncoder
+
+class _QueryEncoderModule(torch.nn.Module):
+    """
+        The layers of ColBERT.query which can be exported: BERT and the linear projection.
+    """
+
+    def __init__(self, bert, linear):
+        super().__init__()
+        self.bert = bert
+        self.linear = linear
+
+    def forward(self, input_ids, attention_mask):
+        return self.linear(self.bert(input_ids, attention_mask=attention_mask)[0])
+
 
 class Checkpoint(ColBERT):
     """
@@ -36,12 +51,31 @@ class Checkpoint(ColBERT):
 
         self.docFromText_used = False
 
+        self.query_encoder = QueryEncoder(_QueryEncoderModule(self.bert, self.linear), name,
+                                          backend=colbert_config.query_encoder_backend,
+                                          tokenize=lambda queries: self.query_tokenizer.tensorize(queries),
+                                          tolerance=colbert_config.query_encoder_tolerance,
+                                          device='cuda' if self.use_gpu else 'cpu')
+
     def query(self, *args, to_cpu=False, **kw_args):
         with torch.no_grad():
+            if self.query_encoder.backend != 'torch':
+                Q = self._query_with_encoder(*args, **kw_args)
+                return Q.cpu() if to_cpu else Q
+
             with self.amp_manager.context():
                 Q = super().query(*args, **kw_args)
                 return Q.cpu() if to_cpu else Q
 
+    def _query_with_encoder(self, input_ids, attention_mask):
+        # Same as ColBERT.query, with the BERT and linear layers run by the exported query encoder
+        Q = self.query_encoder(input_ids, attention_mask)
+
+        mask = torch.tensor(self.mask(input_ids, skiplist=[]), device=Q.device).unsqueeze(2).float()
+        Q = Q * mask
+
+        return torch.nn.functional.normalize(Q, p=2, dim=2)
+
     def doc(self, *args, to_cpu=False, **kw_args):
         with torch.no_grad():
             with self.amp_manager.context():
@@ -61,3 +61,52 @@ class CandidateGeneration:
             pids, pids_counts = pids.cuda(), pids_counts.cuda()
 
         return pids, centroid_scores
+
+    def generate_candidates_batch(self, config, Q):
+        """
+            Batched counterpart of `generate_candidates` for Q = (nqueries, qlen, dim).
+
+            Centroid scores for the whole batch come from a single matmul, and the IVF is
+            probed once for the union of cells selected by any query. Returns a list with
+            the sorted candidate pids of each query and the centroid scores, viewed as
+            (ncentroids, nqueries, qlen).
+        """
+        ncells = config.ncells
+
+        assert isinstance(self.ivf, StridedTensor)
+        assert Q.dim() == 3
+
+        if self.use_gpu:
+            Q = Q.cuda().half()
+
+        nqueries, qlen = Q.size(0), Q.size(1)
+
+        scores = (self.codec.centroids @ Q.flatten(0, 1).T)  # (ncentroids, nqueries * qlen)
+        if ncells == 1:
+            cells = scores.argmax(dim=0, keepdim=True)
+        else:
+            cells = scores.topk(ncells, dim=0, sorted=False).indices  # (ncells, nqueries * qlen)
+        cells = cells.view(ncells, nqueries, qlen).permute(1, 0, 2).reshape(nqueries, -1)
+
+        unique_cells, cells_inverse = cells.unique(return_inverse=True)
+        pids_packed, cell_lengths = self.ivf.lookup(unique_cells)
+        cell_offsets = torch.cumsum(cell_lengths, dim=0) - cell_lengths
+
+        all_pids = []
+        for query_idx in range(nqueries):
+            query_cells = cells_inverse[query_idx].unique()
+            positions = _segments_positions(cell_offsets[query_cells], cell_lengths[query_cells])
+            pids = pids_packed[positions].unique(sorted=True)
+            if self.use_gpu:
+                pids = pids.cuda()
+            all_pids.append(pids)
+
+        return all_pids, scores.view(-1, nqueries, qlen)
+
+
+def _segments_positions(offsets, lengths):
+    """
+        Concatenation of arange(offsets[i], offsets[i] + lengths[i]) over all i, without a Python loop.
+    """
+    starts = offsets - (torch.cumsum(lengths, dim=0) - lengths)
+    return torch.repeat_interleave(starts, lengths) + torch.arange(lengths.sum().item(), device=lengths.device)
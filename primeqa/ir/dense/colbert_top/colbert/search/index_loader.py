@@ -6,19 +6,27 @@ import numpy as np
 from primeqa.ir.dense.colbert_top.colbert.utils.utils import lengths2offsets, print_message, dotdict, flatten
 from primeqa.ir.dense.colbert_top.colbert.indexing.codecs.residual import ResidualCodec
 from primeqa.ir.dense.colbert_top.colbert.indexing.utils import optimize_ivf
+from primeqa.ir.dense.colbert_top.colbert.indexing.index_updater import load_tombstones
+from primeqa.ir.dense.colbert_top.colbert.indexing.mmap_index import ensure_mmap_index, \
+    load_mmap_embeddings, load_mmap_doclens, load_mmap_ivf
 from primeqa.ir.dense.colbert_top.colbert.search.strided_tensor import StridedTensor
 
 
 class IndexLoader:
-    def __init__(self, index_path, use_gpu=torch.cuda.is_available()):
+    def __init__(self, index_path, use_gpu=torch.cuda.is_available(), load_index_with_mmap=False):
         self.index_path = index_path
         self.use_gpu = use_gpu
+        self.load_index_with_mmap = load_index_with_mmap
+
+        if self.load_index_with_mmap:
+            ensure_mmap_index(self.index_path)
 
         self._load_codec()
         self._load_ivf()
 
         self._load_doclens()
         self._load_embeddings()
+        self._load_tombstones()
 
     def _load_codec(self):
         print_message(f"#> Loading codec...")
@@ -27,7 +35,9 @@ class IndexLoader:
     def _load_ivf(self):
         print_message(f"#> Loading IVF...")
 
-        if os.path.exists(os.path.join(self.index_path, "ivf.pid.pt")):
+        if self.load_index_with_mmap:
+            ivf, ivf_lengths = load_mmap_ivf(self.index_path)
+        elif os.path.exists(os.path.join(self.index_path, "ivf.pid.pt")):
             ivf, ivf_lengths = torch.load(os.path.join(self.index_path, "ivf.pid.pt"), map_location='cpu')
         else:
             assert os.path.exists(os.path.join(self.index_path, "ivf.pt")), f"ivf.pt not found in {self.index_path}"
@@ -39,6 +49,10 @@ class IndexLoader:
         self.ivf = ivf
 
     def _load_doclens(self):
+        if self.load_index_with_mmap:
+            self.doclens = load_mmap_doclens(self.index_path)
+            return
+
         doclens = []
 
         for chunk_idx in range(self.num_chunks):
@@ -49,9 +63,19 @@ class IndexLoader:
         self.doclens = torch.tensor(doclens)
 
     def _load_embeddings(self):
+        if self.load_index_with_mmap:
+            self.embeddings = load_mmap_embeddings(self.index_path)
+            return
+
         self.embeddings = ResidualCodec.Embeddings.load_chunks(self.index_path, range(self.num_chunks),
                                                                self.num_embeddings)
 
+    def _load_tombstones(self):
+        self.tombstones = load_tombstones(self.index_path)
+
+        if self.use_gpu:
+            self.tombstones = self.tombstones.cuda()
+
     @property
     def metadata(self):
         try:
@@ -20,8 +20,8 @@ from torch.utils.cpp_extension import load
 import sys
 
 class IndexScorer(IndexLoader, CandidateGeneration):
-    def __init__(self, index_path, use_gpu):
-        super().__init__(index_path, use_gpu=use_gpu)
+    def __init__(self, index_path, use_gpu, load_index_with_mmap=False):
+        super().__init__(index_path, use_gpu=use_gpu, load_index_with_mmap=load_index_with_mmap)
 
         IndexScorer.try_load_torch_extensions(use_gpu)
 
@@ -103,6 +103,47 @@ class IndexScorer(IndexLoader, CandidateGeneration):
 
             return pids, scores
 
+    def rank_batch(self, config, Q, k):
+        """
+            Batched counterpart of `rank` for Q = (nqueries, *, dim).
+
+            Candidate generation is shared across the batch (see `generate_candidates_batch`), and the
+            union of the filtered pids of all queries is decompressed once. Returns one (pids, scores)
+            pair per query, sorted by descending score.
+        """
+        with torch.inference_mode():
+            all_pids, centroid_scores = self.generate_candidates_batch(config, Q[:, :config.query_maxlen])
+
+            all_pids = [self.filter_pids_by_centroids(config, self.remove_deleted_pids(pids),
+                                                      centroid_scores[:, query_idx].contiguous())
+                        for query_idx, pids in enumerate(all_pids)]
+
+            if sum(pids.size(0) for pids in all_pids) == 0:
+                return [([], []) for _ in all_pids]
+
+            union_pids, positions = torch.cat(all_pids).unique(return_inverse=True)
+            D_packed, D_lengths = self.decompress_pids(union_pids)
+            D_strided = StridedTensor(D_packed, D_lengths, use_gpu=self.use_gpu)
+
+            results = []
+            offset = 0
+
+            for query_idx, pids in enumerate(all_pids):
+                positions_ = positions[offset:offset + pids.size(0)]
+                offset += pids.size(0)
+
+                if pids.size(0) == 0:
+                    results.append(([], []))
+                    continue
+
+                D_packed_, D_lengths_ = D_strided.lookup(positions_)
+                scores = colbert_score_packed(Q[query_idx:query_idx+1], D_packed_, D_lengths_, config)
+
+                scores_sorter = scores.sort(descending=True)
+                results.append((pids[scores_sorter.indices].tolist(), scores_sorter.values.tolist()))
+
+            return results
+
     def score_pids(self, config, Q, pids, centroid_scores):
         """
             Always supply a flat list or tensor for `pids`.
@@ -112,6 +153,34 @@ class IndexScorer(IndexLoader, CandidateGeneration):
             Otherwise, each query matrix will be compared against the *aligned* passage.
         """
 
+        pids = self.filter_pids_by_centroids(config, self.remove_deleted_pids(pids), centroid_scores)
+
+        # Rank final list of docs using full approximate embeddings (including residuals)
+        D_packed, D_mask = self.decompress_pids(pids)
+
+        if Q.size(0) == 1:
+            return colbert_score_packed(Q, D_packed, D_mask, config), pids
+
+        D_strided = StridedTensor(D_packed, D_mask, use_gpu=self.use_gpu)
+        D_padded, D_lengths = D_strided.as_padded_tensor()
+
+        return colbert_score(Q, D_padded, D_lengths, config), pids
+
+    def remove_deleted_pids(self, pids):
+        """
+            Drop the passages deleted since the index was last compacted (see `IndexUpdater.delete`).
+        """
+        if self.tombstones.numel() == 0:
+            return pids
+
+        return pids[~torch.isin(pids, self.tombstones.to(pids.dtype))]
+
+    def filter_pids_by_centroids(self, config, pids, centroid_scores):
+        """
+            PLAID stages 2 and 3: prune the candidate `pids` of a single query using
+            its (ncentroids, qlen) `centroid_scores`, keeping at most `config.ndocs` passages.
+        """
+
         # TODO: Remove batching?
         batch_size = 2 ** 20
 
@@ -158,31 +227,30 @@ class IndexScorer(IndexLoader, CandidateGeneration):
                     self.embeddings_strided.codes_strided.offsets, idx, config.ndocs
                 )
 
-        # Rank final list of docs using full approximate embeddings (including residuals)
-        if self.use_gpu:
-            D_packed, D_mask = self.lookup_pids(pids)
-        else:
-            D_packed = IndexScorer.decompress_residuals(
-                    pids,
-                    self.doclens,
-                    self.embeddings_strided.codes_strided.offsets,
-                    self.codec.bucket_weights,
-                    self.codec.reversed_bit_map,
-                    self.codec.decompression_lookup_table,
-                    self.embeddings.residuals,
-                    self.embeddings.codes,
-                    self.codec.centroids,
-                    self.codec.dim,
-                    self.codec.nbits
-                )
-            D_packed = torch.nn.functional.normalize(D_packed.to(torch.float32), p=2, dim=-1)
-            D_mask = self.doclens[pids.long()]
-
-        if Q.size(0) == 1:
-            return colbert_score_packed(Q, D_packed, D_mask, config), pids
-
-        D_strided = StridedTensor(D_packed, D_mask, use_gpu=self.use_gpu)
-        D_padded, D_lengths = D_strided.as_padded_tensor()
+        return pids
 
-        return colbert_score(Q, D_padded, D_lengths, config), pids
+    def decompress_pids(self, pids):
+        """
+            Decompress the full approximate embeddings (including residuals) of `pids`.
+            Returns the packed, normalized embeddings and the per-passage lengths.
+        """
+        if self.use_gpu:
+            return self.lookup_pids(pids)
+
+        D_packed = IndexScorer.decompress_residuals(
+                pids,
+                self.doclens,
+                self.embeddings_strided.codes_strided.offsets,
+                self.codec.bucket_weights,
+                self.codec.reversed_bit_map,
+                self.codec.decompression_lookup_table,
+                self.embeddings.residuals,
+                self.embeddings.codes,
+                self.codec.centroids,
+                self.codec.dim,
+                self.codec.nbits
+            )
+        D_packed = torch.nn.functional.normalize(D_packed.to(torch.float32), p=2, dim=-1)
+        D_mask = self.doclens[pids.long()]
 
+        return D_packed, D_mask
@@ -14,6 +14,7 @@ from primeqa.ir.dense.colbert_top.colbert.infra.provenance import Provenance
 from primeqa.ir.dense.colbert_top.colbert.infra.run import Run
 from primeqa.ir.dense.colbert_top.colbert.infra.config import ColBERTConfig
 from primeqa.ir.dense.colbert_top.colbert.infra.launcher import print_memory_stats
+from primeqa.ir.util.query_embedding_cache import QUERY_EMBEDDING_CACHE
 
 TextQueries = Union[str, List[str], Dict[int, str], Queries]
 TextDocuments = Union[List[str]]
@@ -30,11 +31,13 @@ class Searcher:
             self.checkpoint_config = ColBERTConfig.load_from_checkpoint(self.checkpoint)
             self.config = ColBERTConfig.from_existing(self.checkpoint_config, None, initial_config)
 
+            self.checkpoint_name = self.checkpoint
             self.checkpoint = Checkpoint(self.checkpoint, colbert_config=self.config)
             use_gpu = torch.cuda.is_available()
             if use_gpu:
                 self.checkpoint = self.checkpoint.cuda()
 
+            self._configure_query_cache()
             return
 
         if initial_config.index_location is not None:
@@ -59,20 +62,37 @@ class Searcher:
         self.collection = None
         self.configure(checkpoint=self.checkpoint, collection=self.collection)
 
+        self.checkpoint_name = self.checkpoint
         self.checkpoint = Checkpoint(self.checkpoint, colbert_config=self.config)
         use_gpu = torch.cuda.is_available()
         if use_gpu:
             self.checkpoint = self.checkpoint.cuda()
 
-        self.ranker = IndexScorer(self.index, use_gpu)
+        self._configure_query_cache()
+        self.ranker = IndexScorer(self.index, use_gpu, load_index_with_mmap=self.config.load_index_with_mmap)
 
         print_memory_stats()
 
     def configure(self, **kw_args):
         self.config.configure(**kw_args)
 
+    def _configure_query_cache(self):
+        # Query embeddings are shared with the other searchers of the process, e.g. a reranker's
+        self.query_cache = QUERY_EMBEDDING_CACHE if self.config.query_cache_size > 0 else None
+        if self.query_cache is not None:
+            self.query_cache.reserve(self.config.query_cache_size)
+
     def encode(self, text: TextQueries):
         queries = text if isinstance(text, list) else [text]
+
+        if self.query_cache is None:
+            return self._encode(queries)
+
+        # The quantized query encoders' embeddings differ slightly from the fp32 encoder's, they are cached apart
+        encoder_key = (self.checkpoint_name, self.config.query_maxlen, self.checkpoint.query_encoder.backend)
+        return self.query_cache.encode(encoder_key, queries, self._encode)
+
+    def _encode(self, queries):
         bsize = 128 if len(queries) > 128 else None
 
         self.checkpoint.query_tokenizer.query_maxlen = self.config.query_maxlen
@@ -111,8 +131,13 @@ class Searcher:
         return self._search_all_Q(queries, Q, k)
 
     def _search_all_Q(self, queries, Q, k):
-        all_scored_pids = [list(zip(*self.dense_search(Q[query_idx:query_idx+1], k=k)))
-                           for query_idx in tqdm(range(Q.size(0)))]
+        self.configure_search_defaults(k)
+
+        all_scored_pids = []
+        for offset in tqdm(range(0, Q.size(0), self.config.search_bsize)):
+            Q_batch = Q[offset:offset+self.config.search_bsize]
+            for pids, scores in self.ranker.rank_batch(self.config, Q_batch, k):
+                all_scored_pids.append(list(zip(pids[:k], range(1, k+1), scores[:k])))
 
         data = {qid: val for qid, val in zip(queries.keys(), all_scored_pids)}
 
@@ -125,6 +150,13 @@ class Searcher:
         return Ranking(data=data, provenance=provenance)
 
     def dense_search(self, Q: torch.Tensor, k=10):
+        self.configure_search_defaults(k)
+
+        pids, scores = self.ranker.rank(self.config, Q, k)
+
+        return pids[:k], list(range(1, k+1)), scores[:k]
+
+    def configure_search_defaults(self, k):
         if k <= 10:
             if self.config.ncells is None:
                 self.configure(ncells=1)
@@ -146,7 +178,3 @@ class Searcher:
                 self.configure(centroid_score_threshold=0.4)
             if self.config.ndocs is None:
                 self.configure(ndocs=max(k * 4, 4096))
-
-        pids, scores = self.ranker.rank(self.config, Q, k)
-
-        return pids[:k], list(range(1, k+1)), scores[:k]
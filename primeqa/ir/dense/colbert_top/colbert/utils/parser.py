@@ -120,6 +120,10 @@ class Arguments():
         self.add_argument('--nbits', dest='nbits', choices=[1, 2, 4], type=int, default=1)
         self.add_argument('--kmeans_niters', type=int, default=4)
         self.add_argument('--num_partitions_max', type=int, default=10000000)
+        self.add_argument('--num_encoder_workers', type=int, default=0,
+                          help='without a GPU, encode and compress chunks with this many worker processes')
+        self.add_argument('--threads_per_encoder_worker', type=int, default=0,
+                          help='torch threads per encoder worker, 0 splits the cores between the workers')
 
     def add_index_use_input(self):
         self.add_argument('--index_root', dest='index_root', default=None)
@@ -133,6 +137,8 @@ class Arguments():
         self.add_argument('--ncells', dest='ncells', default=None, type=int)
         self.add_argument('--centroid_score_threshold', dest='centroid_score_threshold', default=None, type=float)
         self.add_argument('--ndocs', dest='ndocs', default=None, type=int)
+        self.add_argument('--search_bsize', dest='search_bsize', default=None, type=int)
+        self.add_argument('--load_index_with_mmap', dest='load_index_with_mmap', default=False, action='store_true')
 
     def add_argument(self, *args, **kw_args):
         return self.parser.add_argument(*args, **kw_args)
@@ -0,0 +1,206 @@
+import os
+import mmap
+import logging
+import numpy as np
+
+from primeqa.ir.dense.dpr_top.dpr.simple_mmap_dataset import Corpus, PidIndex, pid_hash
+from primeqa.ir.dense.dpr_top.util.args_help import fill_from_args
+from primeqa.ir.dense.dpr_top.util.reporting import Reporting
+
+logger = logging.getLogger(__name__)
+
+# The columnar store for passagesX.json.gz.records is the directory passagesX.columnar holding
+#   vectors.npy                        float16 matrix (num_passages x dim), memory mapped
+#   <field>.bin / <field>.offsets.npy  UTF-8 blob and int64 offsets (num_passages + 1) for pid, title and text
+#   pid_index.npy                      PidIndex over the pid column
+RECORDS_SUFFIX = '.json.gz.records'
+COLUMNAR_SUFFIX = '.columnar'
+STRING_FIELDS = ('pid', 'title', 'text')
+
+
+class StringColumn:
+    def __init__(self, dir, name):
+        self.offsets = np.load(os.path.join(dir, f'{name}.offsets.npy'), mmap_mode='r')
+        self.file = open(os.path.join(dir, f'{name}.bin'), "rb")
+        # mmap cannot map an empty file, e.g. a corpus without titles
+        if os.fstat(self.file.fileno()).st_size > 0:
+            self.mm = mmap.mmap(self.file.fileno(), 0, prot=mmap.PROT_READ)
+        else:
+            self.mm = b''
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.mm[self.offsets[index]:self.offsets[index + 1]].decode('utf-8')
+
+    def close(self):
+        if isinstance(self.mm, mmap.mmap):
+            self.mm.close()
+        self.file.close()
+
+
+class ColumnarShard:
+    def __init__(self, dir):
+        self.vectors = np.load(os.path.join(dir, 'vectors.npy'), mmap_mode='r')
+        self.columns = {name: StringColumn(dir, name) for name in STRING_FIELDS}
+        assert all(len(column) == len(self.vectors) for column in self.columns.values())
+        self.pid_index = PidIndex.load(os.path.join(dir, 'pid_index.npy'))
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def close(self):
+        for column in self.columns.values():
+            column.close()
+
+
+class ColumnarCorpus:
+    """
+    Drop-in replacement for Corpus over the columnar store written by convert_to_columnar.
+    Passage fields are decoded individually, so callers that only need pid/title/text never touch the vectors,
+    and the vectors can be read in bulk from the memory mapped matrix.
+    """
+    def __init__(self, dir):
+        # either pass a dir or a specific passagesX.columnar dir
+        base_dir, dirname = os.path.split(dir.rstrip(os.sep))
+        if dirname.startswith('passages') and dirname.endswith(COLUMNAR_SUFFIX):
+            shard_dirs = [dir]
+        else:
+            shard_dirs = sorted(os.path.join(dir, name) for name in os.listdir(dir)
+                                if name.startswith('passages') and name.endswith(COLUMNAR_SUFFIX))
+        if len(shard_dirs) == 0:
+            raise ValueError(f'no columnar passages in {dir}!')
+        self.shards = [ColumnarShard(shard_dir) for shard_dir in shard_dirs]
+        # self.starts[i] is the index of the first passage of shard i
+        self.starts = np.cumsum([0] + [len(shard) for shard in self.shards])
+        self.dim = self.shards[0].vectors.shape[1]
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    def _locate(self, index):
+        if index < 0 or index >= len(self):
+            raise IndexError
+        shard_ndx = int(np.searchsorted(self.starts, index, side='right')) - 1
+        return self.shards[shard_ndx], index - self.starts[shard_ndx]
+
+    def __getitem__(self, index):
+        jobj = self.get_passage(index)
+        jobj['vector'] = self.get_vector(index)
+        return jobj
+
+    def get_field(self, index, name):
+        shard, local_ndx = self._locate(index)
+        return shard.columns[name][local_ndx]
+
+    def get_passage(self, index):
+        shard, local_ndx = self._locate(index)
+        return {name: column[local_ndx] for name, column in shard.columns.items()}
+
+    def get_vector(self, index):
+        shard, local_ndx = self._locate(index)
+        return np.array(shard.vectors[local_ndx])
+
+    def iter_vector_blocks(self, block_size):
+        for shard in self.shards:
+            for start in range(0, len(shard), block_size):
+                yield np.asarray(shard.vectors[start:start + block_size], dtype=np.float32)
+
+    def find_pid(self, pid):
+        # lock-free lookup through the pid index of each shard, None if the pid is not in the corpus
+        for start, shard in zip(self.starts, self.shards):
+            pids = shard.columns['pid']
+            for ndx in shard.pid_index.candidates(pid):
+                if pids[ndx] == pid:
+                    return int(start + ndx)
+        return None
+
+    def get_by_pid(self, pid):
+        ndx = self.find_pid(pid)
+        return self[ndx] if ndx is not None else None
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+
+def columnar_dir_for(records_file):
+    assert records_file.endswith(RECORDS_SUFFIX)
+    return records_file[:-len(RECORDS_SUFFIX)] + COLUMNAR_SUFFIX
+
+
+def open_corpus(path):
+    """
+    Open a passages directory or a single passagesX.json.gz.records file,
+    using the columnar store in place of the records wherever it has been built.
+    """
+    if path.endswith(RECORDS_SUFFIX):
+        if os.path.isdir(columnar_dir_for(path)):
+            return ColumnarCorpus(columnar_dir_for(path))
+        return Corpus(path)
+    if path.rstrip(os.sep).endswith(COLUMNAR_SUFFIX):
+        return ColumnarCorpus(path)
+    if any(name.startswith('passages') and name.endswith(COLUMNAR_SUFFIX) for name in os.listdir(path)):
+        return ColumnarCorpus(path)
+    return Corpus(path)
+
+
+def convert_to_columnar(records_file, output_dir=None):
+    """
+    Write the columnar store for a passagesX.json.gz.records file (with its offsetsX.npy).
+    The records are read once, in order; only the offsets and pid hashes are kept in memory.
+    """
+    output_dir = output_dir if output_dir is not None else columnar_dir_for(records_file)
+    os.makedirs(output_dir, exist_ok=True)
+    corpus = Corpus(records_file)
+    report = Reporting()
+
+    vectors = None
+    blobs = {name: open(os.path.join(output_dir, f'{name}.bin'), 'wb') for name in STRING_FIELDS}
+    offsets = {name: np.zeros(len(corpus) + 1, dtype=np.int64) for name in STRING_FIELDS}
+    pid_hashes = np.zeros(len(corpus), dtype=np.uint64)
+    for ndx in range(len(corpus)):
+        jobj = corpus[ndx]
+        if vectors is None:
+            vectors = np.lib.format.open_memmap(os.path.join(output_dir, 'vectors.npy'), mode='w+',
+                                                dtype=np.float16, shape=(len(corpus), len(jobj['vector'])))
+        vectors[ndx] = jobj['vector']
+        for name in STRING_FIELDS:
+            value = jobj[name] if jobj.get(name) is not None else ''
+            encoded = str(value).encode('utf-8')
+            blobs[name].write(encoded)
+            offsets[name][ndx + 1] = offsets[name][ndx] + len(encoded)
+        pid_hashes[ndx] = pid_hash(jobj['pid'])
+        if report.is_time():
+            logger.info(f'converted {ndx} passages, {report.check_count/report.elapsed_seconds()} per second')
+    if vectors is None:
+        np.save(os.path.join(output_dir, 'vectors.npy'), np.zeros((0, 0), dtype=np.float16))
+    else:
+        vectors.flush()
+        del vectors
+    for name in STRING_FIELDS:
+        blobs[name].close()
+        np.save(os.path.join(output_dir, f'{name}.offsets.npy'), offsets[name], allow_pickle=False)
+    PidIndex.build(pid_hashes).save(os.path.join(output_dir, 'pid_index.npy'))
+    corpus.close()
+    logger.info(f'wrote {len(corpus)} passages to {output_dir} in {report.elapsed_time_str()}')
+    return output_dir
+
+
+if __name__ == "__main__":
+    class CmdOptions:
+        def __init__(self):
+            self.collection = ''  # can be a directory with passages*.json.gz.records or a single such file
+            self.__required_args__ = ['collection']
+
+    opts = CmdOptions()
+    fill_from_args(opts)
+
+    if os.path.isdir(opts.collection):
+        records_files = sorted(os.path.join(opts.collection, name) for name in os.listdir(opts.collection)
+                               if name.startswith('passages') and name.endswith(RECORDS_SUFFIX))
+    else:
+        records_files = [opts.collection]
+    for records_file in records_files:
+        convert_to_columnar(records_file)
@@ -157,6 +157,34 @@ class DPRIndexingArguments:
         default=True, metadata={"help": "Use sharded index"}
     )
 
+    columnar_corpus: bool = field(
+        default=False,
+        metadata={
+            "help": "Also write the passages as a columnar store, used for faster index building and search"
+        },
+    )
+
+    length_bucket_batches: int = field(
+        default=8,
+        metadata={
+            "help": "Number of batches of passages sorted by length before embedding, to reduce padding (1 disables)"
+        },
+    )
+
+    num_workers: int = field(
+        default=0,
+        metadata={
+            "help": "Embed the collection with this many CPU worker processes, each writing its own embed shard"
+        },
+    )
+
+    threads_per_worker: int = field(
+        default=0,
+        metadata={
+            "help": "Torch threads for each worker process, 0 splits the available cores between the workers"
+        },
+    )
+
 
 @dataclass
 class DPRSearchArguments:
@@ -195,3 +223,33 @@ class DPRSearchArguments:
     top_k: int = field(
         default=10, metadata={"help": "Number of hits to return"}
     )
+
+    search_threads: int = field(
+        default=0,
+        metadata={
+            "help": "Number of threads used to search index shards in parallel, 0 for one thread per shard"
+        },
+    )
+
+    query_encoder_backend: str = field(
+        default="torch",
+        metadata={
+            "help": "Query encoder backend on CPU: torch, int8 (quantized TorchScript) or onnx (quantized ONNX Runtime)"
+        },
+    )
+
+    query_encoder_tolerance: float = field(
+        default=0.98,
+        metadata={
+            "help": "Minimum cosine similarity of the quantized query encoder's vectors with the fp32 ones, "
+                    "below it the fp32 query encoder is used"
+        },
+    )
+
+    query_cache_size: int = field(
+        default=4096,
+        metadata={
+            "help": "Number of query vectors kept in the query embedding cache shared by the searchers of the process, "
+                    "0 to encode every query"
+        },
+    )
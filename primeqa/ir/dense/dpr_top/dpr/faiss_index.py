@@ -1,11 +1,14 @@
 import numpy as np
-from primeqa.ir.dense.dpr_top.dpr.simple_mmap_dataset import Corpus
+from primeqa.ir.dense.dpr_top.dpr.columnar_corpus import open_corpus
 from primeqa.ir.dense.dpr_top.util.args_help import fill_from_args
 import faiss
 from primeqa.ir.dense.dpr_top.util.reporting import Reporting
 import os
 import time
 import math
+import queue
+import threading
+import ujson as json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -28,6 +31,63 @@ def l2_convert_query_vectors(vectors: np.ndarray):
     return converted_vectors
 
 
+def vector_stats_file(records_file):
+    # the norm statistics sidecar written by DPRIndexer for passagesX.json.gz.records is vector_statsX.json
+    base_dir, filename = os.path.split(records_file)
+    assert filename.startswith('passages') and filename.endswith('.json.gz.records')
+    return os.path.join(base_dir, f'vector_stats{filename[len("passages"):-len(".json.gz.records")]}.json')
+
+
+def load_vector_stats(corpus_dir):
+    """
+    Combine the sidecar statistics of every passages file in corpus_dir (or of the single passages file).
+    :return: (max_norm, num_vectors), or None if any passages file has no sidecar
+    """
+    if os.path.isdir(corpus_dir):
+        records_files = [os.path.join(corpus_dir, filename) for filename in os.listdir(corpus_dir)
+                         if filename.startswith('passages') and filename.endswith('.json.gz.records')]
+    else:
+        records_files = [corpus_dir]
+    stats_files = [vector_stats_file(records_file) for records_file in records_files]
+    if len(stats_files) == 0 or not all(os.path.exists(stats_file) for stats_file in stats_files):
+        return None
+    max_norm, num_vectors = 0, 0
+    for stats_file in stats_files:
+        with open(stats_file) as f:
+            stats = json.load(f)
+        max_norm = max(max_norm, stats['max_norm'])
+        num_vectors += stats['num_vectors']
+    return max_norm, num_vectors
+
+
+def background_iter(iterator, max_prefetch=2):
+    """
+    Run the iterator on a background thread, keeping up to max_prefetch items ready.
+    Lets the corpus reading overlap with FAISS training/adding, which releases the GIL.
+    """
+    items = queue.Queue(maxsize=max_prefetch)
+    done = object()
+
+    def produce():
+        try:
+            for item in iterator:
+                items.put((item, None))
+        except Exception as e:
+            items.put((None, e))
+        items.put((done, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    while True:
+        item, error = items.get()
+        if error is not None:
+            raise error
+        if item is done:
+            break
+        yield item
+    thread.join()
+
+
 class ANNIndex:
     def __init__(self, index_file):
         self.index = faiss.read_index(index_file)
@@ -68,18 +128,22 @@ class IndexOptions():
 
 def build_index(corpus_dir, output_file, opts: IndexOptions):
     logger.info(f'building index, reading data from {corpus_dir}, writing to {output_file}')
-    corpus = Corpus(corpus_dir)
+    corpus = open_corpus(corpus_dir)
     if opts.is_l2:
         print(f'Using L2 distance conversion')
 
+    if (opts.num_vectors <= 0 and opts.product_quantizer_m > 0) or (opts.max_norm <= 0 and opts.is_l2):
+        vector_stats = load_vector_stats(corpus_dir)
+        if vector_stats is not None:
+            opts.max_norm, opts.num_vectors = vector_stats
+            print(f'using max norm = {opts.max_norm} over {opts.num_vectors} vectors from the vector stats')
     if (opts.num_vectors <= 0 and opts.product_quantizer_m > 0) or (opts.max_norm <= 0 and opts.is_l2):
         max_norm = 0
         num_vectors = 0
         start_time = time.time()
-        for psg in corpus:
-            vector = psg['vector']
-            max_norm = max(max_norm, np.linalg.norm(vector))
-            num_vectors += 1
+        for vectors in corpus.iter_vector_blocks(opts.index_batch_size):
+            max_norm = max(max_norm, float(np.linalg.norm(vectors, axis=1).max()))
+            num_vectors += len(vectors)
         print(f'found max norm = {max_norm} over {num_vectors} vectors in {(time.time()-start_time)/60} min.')
         opts.max_norm = max_norm
         opts.num_vectors = num_vectors
@@ -117,9 +181,6 @@ def build_index(corpus_dir, output_file, opts: IndexOptions):
         index.hnsw.efConstruction = opts.ef_construction
         opts.is_trained = True  # doesn't need training
 
-    vectors = np.zeros((opts.index_batch_size, opts.d), dtype=np.float32)
-    vector_ndx = 0
-
     def add_to_index(vectors):
         if opts.is_l2:
             to_index = l2_convert_indexed_vectors(vectors, max_norm_sqrd)
@@ -133,20 +194,11 @@ def build_index(corpus_dir, output_file, opts: IndexOptions):
 
     report = Reporting()
 
-    for pndx, psg in enumerate(corpus):
-        if (pndx % 100000) == 0:
-            logger.info(f'processed {pndx} passages')
-        if report.is_time():
-            print(report.progress_str(instance_name='vector'))
-        vector = psg['vector']
-        vectors[vector_ndx] = vector
-        vector_ndx += 1
-        if vector_ndx == opts.index_batch_size:
-            logger.info(f'processed {pndx} passages')
-            add_to_index(vectors)
-            vector_ndx = 0
-    if vector_ndx > 0:
-        add_to_index(vectors[:vector_ndx])
+    num_added = 0
+    for vectors in background_iter(corpus.iter_vector_blocks(opts.index_batch_size)):
+        add_to_index(vectors)
+        num_added += len(vectors)
+        logger.info(f'processed {num_added} passages')
     logger.info(f'processed {len(corpus)} passages')
     logger.info(f'finished building index, writing index file to {output_file}')
     #print(f'finished building index, writing index file to {output_file}')
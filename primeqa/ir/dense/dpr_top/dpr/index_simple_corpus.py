@@ -7,9 +7,13 @@ import torch
 from typing import List
 import numpy as np
 import re
+import copy
+from array import array
+import torch.multiprocessing as mp
 
-from primeqa.ir.dense.dpr_top.dpr.simple_mmap_dataset import gzip_str
-from primeqa.ir.dense.dpr_top.dpr.faiss_index import build_index, IndexOptions
+from primeqa.ir.dense.dpr_top.dpr.simple_mmap_dataset import gzip_str, pid_hash, PidIndex
+from primeqa.ir.dense.dpr_top.dpr.faiss_index import build_index, IndexOptions, vector_stats_file
+from primeqa.ir.dense.dpr_top.dpr.columnar_corpus import convert_to_columnar
 
 from primeqa.ir.dense.dpr_top.util.reporting import Reporting
 from primeqa.ir.util.corpus_reader import corpus_reader, Passage
@@ -29,9 +33,13 @@ class Options(IndexOptions):
         self.ctx_encoder_name_or_path = 'facebook/dpr-ctx_encoder-multiset-base'
         self.embed = '1of1'
         self.sharded_index = True
+        self.columnar_corpus = False
         self.collection = ''
         self.output_dir = ''  # the output_dir will have the passages dataset and the hnsw_index.faiss
         self.bsize = 16
+        self.length_bucket_batches = 8  # sort this many batches of passages by length before embedding, 1 disables
+        self.num_workers = 0  # > 1 to embed the collection with that many worker processes, one embed shard each
+        self.threads_per_worker = 0  # torch threads per worker, 0 splits the available cores between the workers
         self.__required_args__ = ['output_dir']
         self.max_doc_length=128 # to match dataloader_biencoder.make_batch : self.ctx_tokenizer(ctx_titles, ctx_texts
 
@@ -48,41 +56,91 @@ class DPRIndexer():
         assert 1 <= self.embed_num <= self.embed_count
 
         self.opts.ctx_encoder_name_or_path = re.sub('\/config\.json$', '', self.opts.ctx_encoder_name_or_path)
+        if self.opts.num_workers > 1:
+            # the launcher only starts the workers, each of them loads its own encoder
+            assert self.embed_count == 1, 'embed shards are assigned to the workers when num_workers > 1'
+            return
         self.ctx_encoder = DPRContextEncoder.from_pretrained(self.opts.ctx_encoder_name_or_path).to(device=self.device)
         self.ctx_encoder.eval()
         self.ctx_tokenizer = DPRContextEncoderTokenizerFast.from_pretrained(self.opts.ctx_encoder_name_or_path)
 
 
     def embed(self, doc_batch: List[Passage], ctx_encoder: DPRContextEncoder, ctx_tokenizer: DPRContextEncoderTokenizerFast) -> np.ndarray:
-        documents = {"title": [doci.title if doci.title is not None else "" for doci in doc_batch], 'text': [doci.text for doci in doc_batch]}
         """Compute the DPR embeddings of document passages"""
-        input_ids = ctx_tokenizer(
+        documents = {"title": [doci.title if doci.title is not None else "" for doci in doc_batch], 'text': [doci.text for doci in doc_batch]}
+        inputs = ctx_tokenizer(
             documents["title"], documents["text"], truncation=True, padding="longest", return_tensors="pt", max_length=self.opts.max_doc_length
-        )["input_ids"]
-        embeddings = ctx_encoder(input_ids.to(device=self.device), return_dict=True).pooler_output
+        )
+        # mask the padding (as in training), so the embedding of a passage does not depend on the batch it is in.
+        # indexes built before the mask was passed have slightly different embeddings, rebuild rather than extend them
+        embeddings = ctx_encoder(inputs["input_ids"].to(device=self.device), attention_mask=inputs["attention_mask"].to(device=self.device),
+                                 return_dict=True).pooler_output
         return embeddings.detach().cpu().to(dtype=torch.float16).numpy()
 
 
+    def embed_window(self, doc_window: List[Passage]) -> np.ndarray:
+        """
+        Embed the passages in batches of similar length, to cut the padding in each batch.
+        The embeddings are returned in the order of doc_window.
+        """
+        order = sorted(range(len(doc_window)), key=lambda ndx: len(doc_window[ndx].text) + len(doc_window[ndx].title or ''))
+        embeddings = None
+        for start in range(0, len(order), self.opts.bsize):
+            batch_ndxs = order[start:start + self.opts.bsize]
+            batch_embeddings = self.embed([doc_window[ndx] for ndx in batch_ndxs], self.ctx_encoder, self.ctx_tokenizer)
+            if embeddings is None:
+                embeddings = np.zeros((len(doc_window), batch_embeddings.shape[1]), dtype=batch_embeddings.dtype)
+            embeddings[batch_ndxs] = batch_embeddings
+        return embeddings
+
+
     def write(self, cur_offset, offsets, passage_file, doc_batch: List[Passage], embeddings):
         assert len(doc_batch) == embeddings.shape[0]
         assert len(embeddings.shape) == 2
+        # the max norm is taken over the fp16 vectors as stored, which build_index adds to the index
+        vectors = embeddings.astype(np.float16)
+        if len(doc_batch) > 0:
+            self.max_norm = max(self.max_norm, float(np.linalg.norm(vectors.astype(np.float32), axis=1).max()))
         for di, doc in enumerate(doc_batch):
             doc = doc.to_dict()
-            doc['vector'] = base64.b64encode(embeddings[di].astype(np.float16)).decode('ascii')
+            doc['vector'] = base64.b64encode(vectors[di]).decode('ascii')
             jstr_gz = gzip_str(json.dumps(doc))
             offsets.append(cur_offset)
+            self.pid_hashes.append(pid_hash(doc['pid']))
             passage_file.write(jstr_gz)
             cur_offset += len(jstr_gz)
         return cur_offset
 
 
+    def shard_done_file(self):
+        # written once everything for the embed shard is on disk, so a restarted run can skip the shard
+        return os.path.join(self.opts.output_dir, f'shard_{self.embed_num}_of_{self.embed_count}.done')
+
+
     def index(self):
+        if self.opts.num_workers > 1:
+            self.index_parallel()
+            return
+
+        if os.path.exists(self.shard_done_file()):
+            logger.info(f'passages_{self.embed_num}_of_{self.embed_count}.json.gz.records is already complete, skipping')
+        else:
+            self.index_shard()
+
+        if not self.opts.sharded_index and self.embed_count == 1:
+            build_index(self.opts.output_dir, os.path.join(self.opts.output_dir, 'index.faiss'), self.opts)
+
+
+    def index_shard(self):
         offsets = []
         cur_offset = 0
+        self.pid_hashes = array('Q')
+        self.max_norm = 0.0
         passages = write_open(os.path.join(self.opts.output_dir, f'passages_{self.embed_num}_of_{self.embed_count}.json.gz.records'), binary=True)
 
         report = Reporting()
-        doc_batch = []
+        window_size = self.opts.bsize * max(1, self.opts.length_bucket_batches)
+        doc_window = []
         for pndx, passage in enumerate(corpus_reader(self.opts.collection, fieldnames = ('id', 'text', 'title'))):
             if pndx == 0 and (passage.pid == 'id' or passage.pid == 'pid') and (passage.text == 'text' or passage.text == 'contents') and passage.title == 'title':
                 continue
@@ -90,23 +148,73 @@ class DPRIndexer():
                 continue
             if report.is_time():
                 logger.info(f'on instance {report.check_count}, {report.check_count/report.elapsed_seconds()} instances per second')
-            doc_batch.append(passage)
-            if len(doc_batch) == self.opts.bsize:
-                embeddings = self.embed(doc_batch, self.ctx_encoder, self.ctx_tokenizer)
-                cur_offset = self.write(cur_offset, offsets, passages, doc_batch, embeddings)
-                doc_batch = []
-        if len(doc_batch) > 0:
-            embeddings = self.embed(doc_batch, self.ctx_encoder, self.ctx_tokenizer)
-            cur_offset = self.write(cur_offset, offsets, passages, doc_batch, embeddings)
+            doc_window.append(passage)
+            if len(doc_window) == window_size:
+                cur_offset = self.write(cur_offset, offsets, passages, doc_window, self.embed_window(doc_window))
+                doc_window = []
+        if len(doc_window) > 0:
+            cur_offset = self.write(cur_offset, offsets, passages, doc_window, self.embed_window(doc_window))
         offsets.append(cur_offset)  # just the length of the file
         passages.close()
         with write_open(os.path.join(self.opts.output_dir, f'offsets_{self.embed_num}_of_{self.embed_count}.npy'), binary=True) as f:
             np.save(f, np.array(offsets, dtype=np.int64), allow_pickle=False)
+        # persistent pid -> passage index, so that Corpus.get_by_pid does not need to scan the passages
+        PidIndex.build(np.frombuffer(self.pid_hashes, dtype=np.uint64)).save(
+            os.path.join(self.opts.output_dir, f'pid_index_{self.embed_num}_of_{self.embed_count}.npy'))
+        # norm statistics, so that build_index does not need a first pass over the passages
+        with open(vector_stats_file(os.path.join(self.opts.output_dir, f'passages_{self.embed_num}_of_{self.embed_count}.json.gz.records')), 'w') as f:
+            json.dump({'num_vectors': len(self.pid_hashes), 'max_norm': self.max_norm}, f)
         logger.info(f'wrote passages_{self.embed_num}_of_{self.embed_count}.json.gz.records in {report.elapsed_time_str()}')
         #print(f'Wrote passages_{self.embed_num}_of_{self.embed_count}.json.gz.records in {report.elapsed_time_str()}')
 
+        if self.opts.columnar_corpus:
+            convert_to_columnar(os.path.join(self.opts.output_dir, f'passages_{self.embed_num}_of_{self.embed_count}.json.gz.records'))
+
         if self.opts.sharded_index:
             build_index(os.path.join(self.opts.output_dir, f'passages_{self.embed_num}_of_{self.embed_count}.json.gz.records'),
                         os.path.join(self.opts.output_dir, f'index_{self.embed_num}_of_{self.embed_count}.faiss'), self.opts)
-        elif self.embed_count == 1:
+
+        with open(self.shard_done_file(), 'w') as f:
+            json.dump({'num_passages': len(self.pid_hashes), 'seconds': report.elapsed_seconds()}, f)
+
+
+    def index_parallel(self):
+        """
+        Embed the collection on CPU with num_workers processes. Worker i owns the embed shard 'iofN' and
+        is pinned to its own threads_per_worker cores. Shards completed by an earlier run are skipped.
+        """
+        num_workers = self.opts.num_workers
+        if hasattr(os, 'sched_getaffinity'):
+            cpus = sorted(os.sched_getaffinity(0))
+        else:
+            cpus = list(range(os.cpu_count()))
+        threads = self.opts.threads_per_worker if self.opts.threads_per_worker > 0 else max(1, len(cpus) // num_workers)
+
+        ctx = mp.get_context('spawn')
+        workers = []
+        for worker_ndx in range(num_workers):
+            worker_opts = copy.copy(self.opts)
+            worker_opts.embed = f'{worker_ndx+1}of{num_workers}'
+            worker_opts.num_workers = 0
+            worker_cpus = cpus[worker_ndx * threads:(worker_ndx + 1) * threads]
+            if len(worker_cpus) < threads:
+                worker_cpus = None  # more threads than cores, let the OS schedule them
+            worker = ctx.Process(target=_embed_worker, args=(worker_opts, threads, worker_cpus))
+            worker.start()
+            workers.append(worker)
+
+        for worker in workers:
+            worker.join()
+        failed = [worker_ndx+1 for worker_ndx, worker in enumerate(workers) if worker.exitcode != 0]
+        if failed:
+            raise RuntimeError(f'embedding failed for shards {failed} of {num_workers}, run again to resume them')
+
+        if not self.opts.sharded_index:
             build_index(self.opts.output_dir, os.path.join(self.opts.output_dir, 'index.faiss'), self.opts)
+
+
+def _embed_worker(opts, num_threads, cpus):
+    if cpus is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    torch.set_num_threads(num_threads)
+    DPRIndexer(opts).index()
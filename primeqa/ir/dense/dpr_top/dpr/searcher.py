@@ -6,14 +6,18 @@ import os
 import numpy as np
 import ujson as json
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from transformers import (DPRQuestionEncoder, DPRQuestionEncoderTokenizer, DPRQuestionEncoderTokenizerFast)
 
 from primeqa.ir.dense.dpr_top.util.line_corpus import read_lines, write_open
 from primeqa.ir.dense.dpr_top.util.reporting import Reporting
-from primeqa.ir.dense.dpr_top.dpr.dpr_util import DPROptions, queries_to_vectors
+from primeqa.ir.dense.dpr_top.dpr.dpr_util import DPROptions, tokenize_queries
+from primeqa.ir.util.query_encoder import QueryEncoder
+from primeqa.ir.util.query_embedding_cache import QUERY_EMBEDDING_CACHE
 from primeqa.ir.dense.dpr_top.util.args_help import fill_from_config
-from primeqa.ir.dense.dpr_top.dpr.simple_mmap_dataset import Corpus
+from primeqa.ir.dense.dpr_top.dpr.columnar_corpus import open_corpus, RECORDS_SUFFIX, COLUMNAR_SUFFIX
 from primeqa.ir.dense.dpr_top.dpr.faiss_index import ANNIndex
 from primeqa.ir.dense.dpr_top.dpr.config import DPRSearchArguments
 
@@ -39,6 +43,34 @@ class Options(DPROptions):
         self.query_file_type = 'id_text'
         self.__required_args__ = ['index_location', 'output_dir']
         self.output_json = False
+        self.search_threads = 0
+        self.query_encoder_backend = 'torch'  # 'int8' (TorchScript) or 'onnx' (ONNX Runtime) to run a quantized query encoder on CPU
+        self.query_encoder_tolerance = 0.98  # minimum cosine similarity of the quantized query encoder with the fp32 one
+        self.query_cache_size = 4096  # query vectors kept in the cache shared by the searchers of the process, 0 to disable
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Column indices of the k highest scores in each row, best first.
+    Uses argpartition so that only the selected k columns are sorted.
+    """
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class _QueryEncoderModule(torch.nn.Module):
+    # The question encoder's pooled output, as returned by queries_to_vectors
+    def __init__(self, qencoder):
+        super().__init__()
+        self.qencoder = qencoder
+
+    def forward(self, input_ids, attention_mask):
+        return self.qencoder(input_ids, attention_mask=attention_mask, return_dict=True)[0]
+
 
 class DPRSearcher():
     def __init__(self, config: DPRSearchArguments):
@@ -61,11 +93,19 @@ class DPRSearcher():
         self.qencoder = self.qencoder.to(self.device)
         self.qencoder.eval()
         self.tokenizer = DPRQuestionEncoderTokenizer.from_pretrained(self.opts.qry_encoder_name_or_path)
+        self.query_encoder = QueryEncoder(_QueryEncoderModule(self.qencoder), self.opts.qry_encoder_name_or_path,
+                                          backend=self.opts.query_encoder_backend,
+                                          tokenize=lambda queries: self._tokenize(queries),
+                                          tolerance=self.opts.query_encoder_tolerance, device=self.device)
+        # Query vectors are shared with the other searchers of the process
+        self.query_cache = QUERY_EMBEDDING_CACHE if self.opts.query_cache_size > 0 else None
+        if self.query_cache is not None:
+            self.query_cache.reserve(self.opts.query_cache_size)
 
         # from corpus_server_direct.run
         # we either have a single index.faiss or we have an index for each offsets/passages
         if os.path.exists(os.path.join(self.opts.index_location, "index.faiss")):
-            self.passages = Corpus(os.path.join(self.opts.index_location))
+            self.passages = open_corpus(os.path.join(self.opts.index_location))
             self.index = ANNIndex(os.path.join(self.opts.index_location, "index.faiss"))
             self.shards = None
             self.dim = self.index.dim()
@@ -75,34 +115,72 @@ class DPRSearcher():
             # so we have a list of (index, passages)
             # we search each index, then take the top-k results overall
             logger.info(f'Using sharded faiss, reading shards from {self.opts.index_location}')
+            # a shard's passages are either records or, once converted, a columnar store
+            names = set()
             for filename in os.listdir(self.opts.index_location):
-                if filename.startswith('passages') and filename.endswith('.json.gz.records'):
-                    name = filename[len("passages"):-len(".json.gz.records")]
-                    logger.info(f'Reading {filename}')
-                    self.shards.append((ANNIndex(os.path.join(self.opts.index_location, f'index{name}.faiss')),
-                                   Corpus(os.path.join(self.opts.index_location, f'passages{name}.json.gz.records'))))
+                for suffix in [RECORDS_SUFFIX, COLUMNAR_SUFFIX]:
+                    if filename.startswith('passages') and filename.endswith(suffix):
+                        names.add(filename[len("passages"):-len(suffix)])
+            for name in sorted(names):
+                logger.info(f'Reading passages{name}')
+                self.shards.append((ANNIndex(os.path.join(self.opts.index_location, f'index{name}.faiss')),
+                               open_corpus(os.path.join(self.opts.index_location, f'passages{name}{RECORDS_SUFFIX}'))))
             self.dim = self.shards[0][0].dim()
             assert all([self.dim == shard[0].dim() for shard in self.shards])
             logger.info(f'Using sharded faiss with {len(self.shards)} shards.')
+            # FAISS releases the GIL during search, so the shards can be searched concurrently
+            self.shard_executor = None
+            self.shard_executor_pid = None
+            self.shard_executor_lock = threading.Lock()
         self.dummy_doc = {'pid': 'N/A', 'title': '', 'text': '', 'vector': np.zeros(self.dim, dtype=np.float32)}
 
-    def merge_results(self, query_vectors, k): # from corpus_server_direct.merge_results
+    def encode(self, queries):
+        if self.query_cache is None:
+            return self.query_encoder(*self._tokenize(queries))
+
+        # queries are tokenized without a maximum length, see _tokenize, and the quantized query encoders'
+        # vectors differ slightly from the fp32 encoder's, so they are cached apart
+        encoder_key = (self.opts.qry_encoder_name_or_path, None, self.query_encoder.backend)
+        return self.query_cache.encode(encoder_key, queries,
+                                       lambda missing: self.query_encoder(*self._tokenize(missing)))
+
+    def _tokenize(self, queries):
+        input_dict = tokenize_queries(self.tokenizer, queries, max_length=None)
+        return input_dict['input_ids'], input_dict['attention_mask']
+
+    def get_doc(self, passages, ndx, with_vectors=False):
+        # FAISS pads the results with index -1 when an index holds fewer than k vectors
+        if ndx < 0:
+            return self.dummy_doc
+        return passages[ndx] if with_vectors else passages.get_passage(ndx)
+
+    def get_shard_executor(self):
+        # threads do not survive a fork, a process forked after the searcher was loaded starts its own
+        if self.shard_executor_pid != os.getpid():
+            # concurrent requests must not each create an executor, the lock is only taken until one exists
+            with self.shard_executor_lock:
+                if self.shard_executor_pid != os.getpid():
+                    num_threads = self.opts.search_threads if self.opts.search_threads > 0 else len(self.shards)
+                    self.shard_executor = ThreadPoolExecutor(max_workers=num_threads)
+                    self.shard_executor_pid = os.getpid()
+        return self.shard_executor
+
+    def merge_results(self, query_vectors, k, with_vectors=False): # from corpus_server_direct.merge_results
             # CONSIDER: consider ResultHeap (https://github.com/matsui528/faiss_tips)
-            all_scores = np.zeros((query_vectors.shape[0], k * len(self.shards)), dtype=np.float32)
-            all_indices = np.zeros((query_vectors.shape[0], k * len(self.shards)), dtype=np.int64)
-            for si, shard in enumerate(self.shards):
-                index_i, passages_i = shard
-                scores, indexes = index_i.search(query_vectors, k)
+            shard_results = list(self.get_shard_executor().map(lambda shard: shard[0].search(query_vectors, k), self.shards))
+            for scores, indexes in shard_results:
                 assert len(scores.shape) == 2
                 assert scores.shape[1] == k
                 assert scores.shape == indexes.shape
                 assert scores.dtype == np.float32
                 assert indexes.dtype == np.int64
-                all_scores[:, si * k: (si + 1) * k] = scores
-                all_indices[:, si * k: (si + 1) * k] = indexes
-            kbest = all_scores.argsort()[:, -k:][:, ::-1]
-            docs = [[self.shards[ndx // k][1][all_indices[bi, ndx]] for ndx in ndxs] for bi, ndxs in enumerate(kbest)]
-            return docs, np.sort(all_scores)[:, ::-1][:, 0:k]
+            all_scores = np.concatenate([scores for scores, _ in shard_results], axis=1)
+            all_indices = np.concatenate([indexes for _, indexes in shard_results], axis=1)
+            kbest = top_k_indices(all_scores, k)
+            # only the passages of the merged top-k are fetched from the corpus, by default without their vectors
+            docs = [[self.get_doc(self.shards[ndx // k][1], all_indices[bi, ndx], with_vectors) for ndx in ndxs]
+                    for bi, ndxs in enumerate(kbest)]
+            return docs, np.take_along_axis(all_scores, kbest, axis=1)
 
 
     def init_title_to_title(self):
@@ -110,9 +188,9 @@ class DPRSearcher():
 
         def update_passages_of_titles(passages):
             for pos in range(len(passages)):
-                title = passages[pos]['title']
+                title = passages.get_field(pos, 'title')
                 if not title in self.passages_of_titles:
-                    self.passages_of_titles[passages[pos]['title']] = passages[pos]
+                    self.passages_of_titles[title] = passages[pos]
 
         if self.shards is None:
             update_passages_of_titles(self.passages)
@@ -125,9 +203,9 @@ class DPRSearcher():
         vectors = np.expand_dims(self.passages_of_titles[title]['vector'].astype(np.float32), 0)
         if self.shards is None:
             _, indexes = self.index.search(vectors, self.opts.top_k)
-            docs = [[self.passages[ndx] for ndx in ndxs] for ndxs in indexes]
+            docs = [[self.get_doc(self.passages, ndx, with_vectors=True) for ndx in ndxs] for ndxs in indexes]
         else:
-            docs, _ = self.merge_results(vectors, self.opts.top_k)
+            docs, _ = self.merge_results(vectors, self.opts.top_k, with_vectors=True)
 
         return docs # first and only query
 
@@ -155,7 +233,7 @@ class DPRSearcher():
         # from dpr_apply
         def retrieve(queries):
             with torch.no_grad():
-                query_vectors_tensor = queries_to_vectors(self.tokenizer, self.qencoder, queries)
+                query_vectors_tensor = self.encode(queries)
 
                 # from from corpus_server_direct.retrieve_docs
                 query_vectors = query_vectors_tensor.detach().cpu().numpy().astype(np.float32)
@@ -164,7 +242,7 @@ class DPRSearcher():
 
                 if self.shards is None:
                     doc_scores, indexes = self.index.search(query_vectors, self.opts.top_k)
-                    docs = [[self.passages[ndx] for ndx in ndxs] for ndxs in indexes]
+                    docs = [[self.get_doc(self.passages, ndx) for ndx in ndxs] for ndxs in indexes]
                 else:
                     docs, doc_scores = self.merge_results(query_vectors, self.opts.top_k)
 
@@ -4,6 +4,7 @@ import numpy as np
 import os
 import mmap
 import codecs
+import hashlib
 import threading
 
 
@@ -17,6 +18,47 @@ def gunzip_str(bytes):
     # return gzip.decompress(bytes).decode('utf-8')
 
 
+def pid_hash(pid):
+    # stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(str(pid).encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class PidIndex:
+    """
+    Persistent pid -> passage index lookup table: (hash, ndx) pairs sorted by the 64-bit hash of the pid.
+    It is memory mapped and read-only, so lookups are O(log n) binary searches that need no lock.
+    Hash collisions are possible, so callers verify the pid of each candidate.
+    """
+    dtype = np.dtype([('hash', np.uint64), ('ndx', np.int64)])
+
+    def __init__(self, table):
+        self.table = table
+        self.hashes = table['hash']
+        self.ndxs = table['ndx']
+
+    @classmethod
+    def build(cls, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        table = np.zeros(len(hashes), dtype=cls.dtype)
+        table['hash'] = hashes
+        table['ndx'] = np.arange(len(hashes), dtype=np.int64)
+        table.sort(order='hash', kind='stable')
+        return cls(table)
+
+    @classmethod
+    def load(cls, path):
+        return cls(np.load(path, mmap_mode='r'))
+
+    def save(self, path):
+        np.save(path, self.table, allow_pickle=False)
+
+    def candidates(self, pid):
+        h = np.uint64(pid_hash(pid))
+        start = np.searchsorted(self.hashes, h, side='left')
+        end = np.searchsorted(self.hashes, h, side='right')
+        return self.ndxs[start:end]
+
+
 class Corpus:
     def __init__(self, dir):
         # either pass a dir or a specific passagesX.json.gz.records file
@@ -38,6 +80,13 @@ class Corpus:
                     files.append((filename, offset_fname))
         files.sort(key=lambda x: x[0])  # we sort the offsets files, that is our order
 
+        # the pid index files written at indexing time, only used if every file has one
+        pid_index_fnames = [f'pid_index{file_pair[0][len("passages"):-len(".json.gz.records")]}.npy' for file_pair in files]
+        if all(os.path.exists(os.path.join(dir, fname)) for fname in pid_index_fnames):
+            self.pid_indexes = [PidIndex.load(os.path.join(dir, fname)) for fname in pid_index_fnames]
+        else:
+            self.pid_indexes = None
+
         # build offsets table
         # self.offsets will be nx3 self.offsets[i] == file_ndx, start_offset, end_offset
         per_file_offsets = []
@@ -46,9 +95,11 @@ class Corpus:
             per_file_offsets.append(np.load(os.path.join(dir, file_pair[1])))
             total_passage_count += len(per_file_offsets[-1]) - 1
         self.offsets = np.zeros((total_passage_count, 3), dtype=np.int64)
+        self.file_starts = []
         total_passage_count = 0
         for file_ndx, file_offsets in enumerate(per_file_offsets):
             passage_count = len(file_offsets)-1
+            self.file_starts.append(total_passage_count)
             self.offsets[total_passage_count:total_passage_count + passage_count, 0] = file_ndx
             self.offsets[total_passage_count:total_passage_count + passage_count, 1] = file_offsets[:-1]
             self.offsets[total_passage_count:total_passage_count + passage_count, 2] = file_offsets[1:]
@@ -75,11 +126,47 @@ class Corpus:
         jobj['vector'] = np.frombuffer(base64.decodebytes(jobj['vector'].encode('ascii')), dtype=np.float16)
         return jobj
 
+    def get_passage(self, index):
+        # the passage without its vector, skipping the base64 decoding
+        if index >= len(self.offsets):
+            raise IndexError
+        jobj = json.loads(gunzip_str(self.get_raw(index)))
+        del jobj['vector']
+        return jobj
+
+    def get_field(self, index, name):
+        return self.get_passage(index)[name]
+
+    def get_vector(self, index):
+        return self[index]['vector']
+
+    def iter_vector_blocks(self, block_size):
+        block = []
+        for index in range(len(self.offsets)):
+            block.append(self[index]['vector'])
+            if len(block) == block_size:
+                yield np.stack(block).astype(np.float32)
+                block = []
+        if len(block) > 0:
+            yield np.stack(block).astype(np.float32)
+
     def get_raw(self, index):
         file_ndx, start_offset, end_offset = self.offsets[index]
         return self.mms[file_ndx][start_offset:end_offset]
 
+    def find_pid(self, pid):
+        # lock-free lookup through the pid index files, None if the pid is not in the corpus
+        for start, pid_index in zip(self.file_starts, self.pid_indexes):
+            for ndx in pid_index.candidates(pid):
+                if self.get_field(start + int(ndx), 'pid') == pid:
+                    return start + int(ndx)
+        return None
+
     def get_by_pid(self, pid):
+        if self.pid_indexes is not None:
+            ndx = self.find_pid(pid)
+            return self[ndx] if ndx is not None else None
+        # no pid index on disk: build the mapping once, by reading every record
         with self.lock:
             if len(self.pid2ndx) == 0:
                 for ndx in range(len(self.offsets)):
@@ -1,8 +1,7 @@
 import os
 import logging
 
-from primeqa.ir.sparse.retriever import PyseriniRetriever
-from primeqa.ir.sparse.indexer import PyseriniIndexer
+from primeqa.ir.sparse.native_bm25 import NativeBM25Indexer, NativeBM25Retriever, native_index_exists
 from primeqa.ir.sparse.utils import load_queries, write_colbert_ranking_tsv
 from primeqa.ir.sparse.config import BM25Config
 
@@ -16,10 +15,18 @@ class BM25Engine:
         
     def do_index(self):
         logger.info("Running BM25 indexing")
+        if self.config.engine == 'native':
+            indexer = NativeBM25Indexer()
+            num_docs = indexer.index_collection(self.config.collection, self.config.index_location,
+                        self.config.fieldnames, self.config.overwrite, self.config.threads)
+            logger.info(f"BM25 Indexing finished, indexed {num_docs} documents")
+            return
+        # Pyserini starts a JVM when it is imported, so it is only imported when it is used
+        from primeqa.ir.sparse.indexer import PyseriniIndexer
         indexer = PyseriniIndexer()
         rc = indexer.index_collection(self.config.collection, self.config.index_location, 
                     self.config.fieldnames, self.config.overwrite, 
-                    self.config.threads, self.config.additional_indexing_args )
+                    self.config.threads, self.config.additional_indexing_args, self.config.docstore )
         logger.info(f"BM25 Indexing finished with rc: {rc}")
 
     def do_search(self):
@@ -27,10 +34,14 @@ class BM25Engine:
             queries = load_queries(self.config.queries)
             logger.info(f"Loaded queries num {len(queries)}")
             logger.info(f"Loaded index from {self.config.index_location}")
-            searcher = PyseriniRetriever(self.config.index_location,use_bm25=self.config.use_bm25,k1=self.config.k1,b=self.config.b)
+            if native_index_exists(self.config.index_location):
+                searcher = NativeBM25Retriever(self.config.index_location,use_bm25=self.config.use_bm25,k1=self.config.k1,b=self.config.b)
+            else:
+                from primeqa.ir.sparse.retriever import PyseriniRetriever
+                searcher = PyseriniRetriever(self.config.index_location,use_bm25=self.config.use_bm25,k1=self.config.k1,b=self.config.b)
             logger.info(f"Running search num queries: {len(queries)} topK: {self.config.topK} threads: {self.config.threads}")
             search_results = searcher.batch_retrieve(list(queries.values()),list(queries.keys()),
-                        topK=self.config.topK,threads=self.config.threads)
+                        topK=self.config.topK,threads=self.config.threads,hydrate=False)
 
             if self.config.output_dir != None:
                 logger.info(f"Writing ranked results to {self.config.output_dir}")
@@ -17,6 +17,10 @@ class IndexingArguments():
 
     threads: int = field(default=1, metadata={"help":'num threads'})
 
+    docstore: bool = field(default=False, metadata={"help":"Also write a side docstore of titles and texts, so pyserini search results do not need to parse the raw documents"})
+
+    engine: str = field(default='pyserini', metadata={"help":"BM25 index to build: 'pyserini' (Lucene) or 'native' (in-process NumPy index, no JVM); search detects the index type"})
+
 
 @dataclass
 class SearchArguments():
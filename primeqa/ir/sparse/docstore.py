@@ -0,0 +1,116 @@
+"""
+Side store of the title and text of the documents of a BM25 index, so hits can be returned as
+ids and scores and their text looked up later, only for the hits that need it.
+
+The docstore directory holds, for each of the fields docids, titles and texts, a UTF-8 blob
+<field>.bin with int64 offsets <field>.offsets.npy (num_docs + 1), and docid_index.npy, the
+(hash, row) pairs of the docids sorted by hash. Everything is memory mapped.
+"""
+
+import os
+import hashlib
+import logging
+from array import array
+from typing import List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DOCSTORE_DIRNAME = 'docstore'
+FIELDS = ('docids', 'titles', 'texts')
+DOCID_INDEX_DTYPE = np.dtype([('hash', np.uint64), ('row', np.int64)])
+
+
+def docid_hash(docid: str) -> int:
+    return int.from_bytes(hashlib.blake2b(docid.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def docstore_path(index_location: str) -> str:
+    return os.path.join(index_location, DOCSTORE_DIRNAME)
+
+
+def docstore_exists(index_location: str) -> bool:
+    return os.path.exists(os.path.join(docstore_path(index_location), 'docid_index.npy'))
+
+
+class StringColumn:
+    def __init__(self, dir, name):
+        self.offsets = np.load(os.path.join(dir, f'{name}.offsets.npy'), mmap_mode='r')
+        # np.memmap cannot map an empty file, e.g. a corpus without titles
+        self.data = np.memmap(os.path.join(dir, f'{name}.bin'), dtype=np.uint8, mode='r') \
+            if self.offsets[-1] > 0 else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.data[self.offsets[index]:self.offsets[index + 1]].tobytes().decode('utf-8')
+
+
+class DocStoreWriter:
+    """
+        Writes the docstore one document at a time, keeping only the offsets and docid hashes in memory.
+        The docid index is written last, so a partially written docstore is never picked up.
+    """
+    def __init__(self, dir):
+        self.dir = dir
+        os.makedirs(dir, exist_ok=True)
+        self.files = {name: open(os.path.join(dir, f'{name}.bin'), 'wb') for name in FIELDS}
+        self.offsets = {name: array('q', [0]) for name in FIELDS}
+        self.hashes = array('Q')
+
+    def add(self, docid: str, title: str, text: str):
+        for name, value in zip(FIELDS, (docid, title, text)):
+            encoded = value.encode('utf-8')
+            self.files[name].write(encoded)
+            self.offsets[name].append(self.offsets[name][-1] + len(encoded))
+        self.hashes.append(docid_hash(docid))
+
+    def close(self):
+        for name in FIELDS:
+            self.files[name].close()
+            np.save(os.path.join(self.dir, f'{name}.offsets.npy'), np.frombuffer(self.offsets[name], dtype=np.int64), allow_pickle=False)
+        hashes = np.frombuffer(self.hashes, dtype=np.uint64)
+        docid_index = np.zeros(len(hashes), dtype=DOCID_INDEX_DTYPE)
+        order = np.argsort(hashes, kind='stable')
+        docid_index['hash'] = hashes[order]
+        docid_index['row'] = order
+        np.save(os.path.join(self.dir, 'docid_index.npy'), docid_index, allow_pickle=False)
+        logger.info(f'Wrote docstore of {len(hashes)} documents to {self.dir}')
+        return len(hashes)
+
+
+class DocStore:
+    def __init__(self, dir):
+        self.columns = {name: StringColumn(dir, name) for name in FIELDS}
+        self.docid_index = np.load(os.path.join(dir, 'docid_index.npy'), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.columns['docids'])
+
+    def docid(self, row):
+        return self.columns['docids'][row]
+
+    def title(self, row):
+        return self.columns['titles'][row]
+
+    def text(self, row):
+        return self.columns['texts'][row]
+
+    def rows(self, docids: List[str]) -> np.ndarray:
+        """The rows of the docids, -1 for docids that are not in the store"""
+        rows = np.full(len(docids), -1, dtype=np.int64)
+        if len(docids) == 0 or len(self.docid_index) == 0:
+            return rows
+        hashes = np.array([docid_hash(docid) for docid in docids], dtype=np.uint64)
+        index_hashes = self.docid_index['hash']
+        starts = np.searchsorted(index_hashes, hashes, side='left')
+        ends = np.searchsorted(index_hashes, hashes, side='right')
+        for ndx, (start, end) in enumerate(zip(starts, ends)):
+            # hash collisions are resolved by comparing the stored docid
+            for row in self.docid_index['row'][start:end]:
+                if self.docid(row) == docids[ndx]:
+                    rows[ndx] = row
+                    break
+        return rows
@@ -9,6 +9,7 @@ from tqdm import tqdm
 import json
 from pyserini.search import LuceneSearcher
 import subprocess
+from primeqa.ir.sparse.docstore import DocStoreWriter, docstore_path
 
 logger = logging.getLogger(__name__)
 
@@ -29,7 +30,7 @@ class PyseriniIndexer:
         rc = process.wait()
         return rc
 
-    def _preprocess_corpus(self, collection, tmpdirname, fieldnames=None):
+    def _preprocess_corpus(self, collection, tmpdirname, fieldnames=None, docstore=None):
         reader = corpus_reader(collection, fieldnames=fieldnames)
         outf = open( os.path.join(tmpdirname,"corpus_pyserini_fmt.jsonl"), 'w' )
         num_docs = 0
@@ -39,7 +40,12 @@ class PyseriniIndexer:
                 'contents': f'{self._clean_text(passage.title)}\t{self._clean_text(passage.text)}'
             })
             outf.write(f'{json_string}\n')
+            if docstore is not None:
+                docstore.add(str(passage.pid), self._clean_text(passage.title), self._clean_text(passage.text))
             num_docs += 1
+        outf.close()
+        if docstore is not None:
+            docstore.close()
         return num_docs
 
     """
@@ -47,6 +53,8 @@ class PyseriniIndexer:
         Index the corpus of documents.
         - First convert the input corpus to the json format requiered by Pyserini 'DefaultLuceneDocumentGenerator'. 
         - This will write to a temporary directory within the directory specified by the 'index_path' argument
+        - With docstore=True, also write the title and text of each document to a side docstore in 'index_path',
+        so that the retriever can return hits without parsing the raw Lucene documents
         - Second run the indexing command.  This launches a subprocess and runs  'python -m pyserini.index.lucene <args>'
         - Validate the index is usable by opening the index and checking the the number of documents 
         is equal to the intput corpus.
@@ -59,13 +67,14 @@ class PyseriniIndexer:
             overwrite (bool, Optional): overwrite an existing directory, defaults to false
             threads (int): num threads to be used when indexing
             additional_index_cmd_args (str, Optional): indexing arguments, defaults to '--storePositions --storeDocvectors --storeRaw'
+            docstore (bool, Optional): write the side docstore, defaults to false
 
         Returns:
 
 
         """
     def index_collection(self, collection: str, index_path: str, fieldnames=None, overwrite=False, 
-            threads=1, additional_index_cmd_args='--storePositions --storeDocvectors --storeRaw' ):
+            threads=1, additional_index_cmd_args='--storePositions --storeDocvectors --storeRaw', docstore=False ):
         if not overwrite and os.path.exists(index_path) and os.listdir(index_path) :
             raise ValueError(f"Index path not empty '{index_path}' and overwrite not specified")
         if not os.path.exists(index_path):
@@ -73,7 +82,8 @@ class PyseriniIndexer:
         # create temporary subdirectory for the corpus
         with tempfile.TemporaryDirectory(prefix='tmp',dir=index_path) as tmpdirname:
             # convert corpus documents to pyserini jsonl
-            num_docs = self._preprocess_corpus(collection, tmpdirname, fieldnames=fieldnames)
+            num_docs = self._preprocess_corpus(collection, tmpdirname, fieldnames=fieldnames,
+                docstore=DocStoreWriter(docstore_path(index_path)) if docstore else None)
             # build index command
             cmd1 = f'python -m pyserini.index.lucene -collection JsonCollection ' + \
                 f'-generator DefaultLuceneDocumentGenerator ' + \
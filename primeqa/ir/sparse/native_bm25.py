@@ -0,0 +1,456 @@
+"""
+In-process BM25 index, an alternative to the Pyserini (Lucene) index that needs no JVM.
+
+The postings of each term are split into blocks of BLOCK_SIZE documents. Within a block the
+document ids are stored as gaps from the first document of the block, and both the gaps and the
+term frequencies are variable-byte coded. For every block the index keeps the first and last
+document id, the maximum term frequency and the minimum document length, which bound the score
+any document of the block can get for the term (block-max). All arrays are .npy files that are
+memory mapped at search time.
+"""
+
+import os
+import re
+import json
+import shutil
+import logging
+from array import array
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from multiprocessing import Pool
+from typing import Optional, List
+
+import numpy as np
+from nltk.stem.porter import PorterStemmer
+from tqdm import tqdm
+
+from primeqa.ir.util.corpus_reader import corpus_reader
+from primeqa.ir.sparse.docstore import DocStore, DocStoreWriter, docstore_path
+
+logger = logging.getLogger(__name__)
+
+METADATA_FILENAME = 'bm25.metadata.json'
+VOCAB_FILENAME = 'vocab.json'
+BLOCK_SIZE = 128
+
+# the stop words of Lucene's EnglishAnalyzer, which Pyserini uses by default
+STOP_WORDS = frozenset([
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "if", "in", "into", "is", "it",
+    "no", "not", "of", "on", "or", "such", "that", "the", "their", "then", "there", "these",
+    "they", "this", "to", "was", "will", "with"
+])
+
+_token_re = re.compile(r"\w+(?:['’]s\b)?")
+_stemmer = PorterStemmer(mode=PorterStemmer.ORIGINAL_ALGORITHM)
+
+
+@lru_cache(maxsize=1 << 20)
+def _stem(token: str):
+    return _stemmer.stem(token, to_lowercase=False)
+
+
+def analyze(text: str) -> List[str]:
+    """
+    Approximates Lucene's EnglishAnalyzer: word tokens, possessives removed,
+    lower cased, stop words removed and Porter stemmed.
+    """
+    tokens = []
+    for token in _token_re.findall(text.lower()):
+        if token.endswith("'s") or token.endswith("’s"):
+            token = token[:-2]
+        if token and token not in STOP_WORDS:
+            tokens.append(_stem(token))
+    return tokens
+
+
+def varbyte_lengths(values: np.ndarray) -> np.ndarray:
+    values = np.asarray(values, dtype=np.uint64)
+    nbytes = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        nbytes += values >= (1 << shift)
+    return nbytes
+
+
+def varbyte_encode(values: np.ndarray) -> np.ndarray:
+    """Variable-byte code non-negative integers, 7 bits per byte, low bits first, high bit set on all but the last byte"""
+    values = np.asarray(values, dtype=np.uint64)
+    nbytes = varbyte_lengths(values)
+    ends = np.cumsum(nbytes)
+    starts = ends - nbytes
+    encoded = np.zeros(int(ends[-1]) if len(values) > 0 else 0, dtype=np.uint8)
+    for byte_ndx in range(int(nbytes.max()) if len(values) > 0 else 0):
+        mask = nbytes > byte_ndx
+        byte = (values[mask] >> np.uint64(7 * byte_ndx)) & np.uint64(0x7f)
+        byte |= np.where(nbytes[mask] - 1 > byte_ndx, np.uint64(0x80), np.uint64(0))
+        encoded[starts[mask] + byte_ndx] = byte
+    return encoded
+
+
+def varbyte_decode(encoded: np.ndarray) -> np.ndarray:
+    encoded = np.asarray(encoded, dtype=np.uint8)
+    if len(encoded) == 0:
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero((encoded & 0x80) == 0)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    positions = np.arange(len(encoded)) - np.repeat(starts, ends - starts + 1)
+    parts = (encoded & 0x7f).astype(np.int64) << (7 * positions)
+    return np.add.reduceat(parts, starts)
+
+
+def native_index_exists(index_location: str) -> bool:
+    return os.path.exists(os.path.join(index_location, METADATA_FILENAME))
+
+
+def _analyze_passage(title_text):
+    return Counter(analyze(f'{title_text[0]}\t{title_text[1]}'))
+
+
+class NativeBM25Indexer:
+    """
+        Index a collection of documents for NativeBM25Retriever, in process and without a JVM
+    """
+
+    def __init__(self):
+        pass
+
+    def _clean_text(self, text: str):
+        return text.replace('\t', ' ') if text is not None else ''
+
+    """
+
+        Index the corpus of documents.
+        - Read and analyze the corpus, keeping one (term, document, frequency) posting per distinct term of a document
+        - Sort the postings by term, split them into blocks and write the compressed blocks as .npy files
+        - The metadata file is written last, so a partially written index is never picked up
+
+        Args:
+            collection (str) : path to file or directory of documents in tsv or jsonl format.
+            index_path (str) : output directory path where the index is written
+            fieldnames ( List, Optional): column headers to be assigned to tsv without headers
+            overwrite (bool, Optional): overwrite an existing directory, defaults to false
+            threads (int): num processes used to analyze the documents
+
+        Returns:
+            number of documents indexed
+
+        """
+    def index_collection(self, collection: str, index_path: str, fieldnames=None, overwrite=False, threads=1):
+        if not overwrite and os.path.exists(index_path) and os.listdir(index_path):
+            raise ValueError(f"Index path not empty '{index_path}' and overwrite not specified")
+        if os.path.exists(index_path):
+            shutil.rmtree(index_path)
+        os.makedirs(index_path)
+
+        # the documents are written to the docstore as they are read, rows are the internal document ids
+        docstore = DocStoreWriter(docstore_path(index_path))
+
+        def title_texts():
+            for passage in corpus_reader(collection, fieldnames=fieldnames):
+                title, text = self._clean_text(passage.title), self._clean_text(passage.text)
+                docstore.add(str(passage.pid), title, text)
+                yield title, text
+
+        vocab = {}
+        term_ids, doc_ids, tfs = array('I'), array('I'), array('I')
+        doclens = array('I')
+        pool = Pool(threads) if threads > 1 else None
+        counts_iter = pool.imap(_analyze_passage, title_texts(), chunksize=256) if pool is not None \
+            else map(_analyze_passage, title_texts())
+        for doc_ndx, counts in enumerate(tqdm(counts_iter)):
+            for term, tf in counts.items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(doc_ndx)
+                tfs.append(tf)
+            doclens.append(sum(counts.values()))
+        if pool is not None:
+            pool.close()
+            pool.join()
+        num_docs = docstore.close()
+        doclens = np.frombuffer(doclens, dtype=np.uint32)
+
+        term_ids = np.frombuffer(term_ids, dtype=np.uint32)
+        doc_ids = np.frombuffer(doc_ids, dtype=np.uint32)
+        tfs = np.frombuffer(tfs, dtype=np.uint32)
+        # documents were added in order, so a stable sort by term keeps each posting list sorted by document
+        order = np.argsort(term_ids, kind='stable')
+        term_ids, doc_ids, tfs = term_ids[order], doc_ids[order], tfs[order]
+
+        df = np.bincount(term_ids, minlength=len(vocab)).astype(np.uint32)
+        term_starts = np.concatenate(([0], np.cumsum(df, dtype=np.int64)))
+        # blocks never span two terms
+        blocks_per_term = (df.astype(np.int64) + BLOCK_SIZE - 1) // BLOCK_SIZE
+        term_blocks = np.concatenate(([0], np.cumsum(blocks_per_term)))
+        block_ranks = np.arange(term_blocks[-1]) - np.repeat(term_blocks[:-1], blocks_per_term)
+        block_starts = np.repeat(term_starts[:-1], blocks_per_term) + block_ranks * BLOCK_SIZE
+        block_ends = np.minimum(block_starts + BLOCK_SIZE, np.repeat(term_starts[1:], blocks_per_term))
+
+        block_first = doc_ids[block_starts]
+        block_last = doc_ids[block_ends - 1]
+        block_max_tf = np.maximum.reduceat(tfs, block_starts) if len(block_starts) > 0 else np.zeros(0, dtype=np.uint32)
+        block_min_dl = np.minimum.reduceat(doclens[doc_ids], block_starts) if len(block_starts) > 0 else np.zeros(0, dtype=np.uint32)
+
+        gaps = doc_ids.astype(np.int64) - np.repeat(block_first.astype(np.int64), block_ends - block_starts)
+        gap_bytes = varbyte_encode(gaps)
+        tf_bytes = varbyte_encode(tfs)
+        # byte offsets of each block in the gap and tf streams
+        gap_nbytes = np.concatenate(([0], np.cumsum(varbyte_lengths(gaps))))
+        tf_nbytes = np.concatenate(([0], np.cumsum(varbyte_lengths(tfs))))
+        block_bounds = np.concatenate((block_starts, [len(doc_ids)]))
+
+        arrays = {
+            'term_df': df,
+            'term_blocks': term_blocks.astype(np.int64),
+            'block_first': block_first,
+            'block_last': block_last,
+            'block_max_tf': block_max_tf.astype(np.uint32),
+            'block_min_dl': block_min_dl.astype(np.uint32),
+            'block_gap_offsets': gap_nbytes[block_bounds].astype(np.int64),
+            'block_tf_offsets': tf_nbytes[block_bounds].astype(np.int64),
+            'postings_gaps': gap_bytes,
+            'postings_tfs': tf_bytes,
+            'doclens': doclens,
+        }
+        for name, values in arrays.items():
+            np.save(os.path.join(index_path, f'{name}.npy'), values, allow_pickle=False)
+        with open(os.path.join(index_path, VOCAB_FILENAME), 'w') as f:
+            json.dump(vocab, f)
+
+        metadata = {
+            'num_docs': num_docs,
+            'num_terms': len(vocab),
+            'num_postings': len(doc_ids),
+            'avg_doclen': float(doclens.mean()) if num_docs > 0 else 0.0,
+            'block_size': BLOCK_SIZE,
+        }
+        with open(os.path.join(index_path, METADATA_FILENAME), 'w') as f:
+            json.dump(metadata, f, indent=4)
+        logger.info(f"Index {index_path} contains {num_docs} documents, {len(vocab)} terms, {len(doc_ids)} postings")
+        return num_docs
+
+
+def _range_max_table(values):
+    # sparse table: table[level][i] is the max of values[i:i + 2**level]
+    table = [values]
+    while (1 << len(table)) <= len(values):
+        prev, width = table[-1], 1 << (len(table) - 1)
+        table.append(np.maximum(prev[:-width], prev[width:]))
+    return table
+
+
+def _range_max(table, lo, hi):
+    # max of values[lo:hi] for each pair, 0 where the range is empty
+    result = np.zeros(len(lo), dtype=table[0].dtype)
+    nonempty = hi > lo
+    lo, hi = lo[nonempty], hi[nonempty]
+    if len(lo) > 0:
+        level = np.floor(np.log2(hi - lo)).astype(np.int64)
+        for lvl in np.unique(level):
+            sel = level == lvl
+            result_ndx = np.flatnonzero(nonempty)[sel]
+            result[result_ndx] = np.maximum(table[lvl][lo[sel]], table[lvl][hi[sel] - (1 << lvl)])
+    return result
+
+
+class NativeBM25Retriever:
+    def __init__(self, index_location: str, use_bm25: bool = True, k1: float = float(0.9), b: float = float(0.4)):
+        """
+        Initialize the native BM25 retriever, a drop-in replacement for PyseriniRetriever
+
+        Args:
+            index_location (str): Path to an index written by NativeBM25Indexer
+            use_bm25 (bool, optional): set BM25 as the scoring function. Defaults to True.
+            k1 (float, optional): bm25 parameter to tune impact of term frequency Defaults to float(0.9).
+            b (float, optional): bm25 constant to fine tune the effect of document length   Defaults to float(0.4).
+        """
+        self.index_location = index_location
+        with open(os.path.join(index_location, METADATA_FILENAME)) as f:
+            self.metadata = json.load(f)
+        with open(os.path.join(index_location, VOCAB_FILENAME)) as f:
+            self.vocab = json.load(f)
+        for name in ['term_df', 'term_blocks', 'block_first', 'block_last', 'block_max_tf', 'block_min_dl',
+                     'block_gap_offsets', 'block_tf_offsets', 'postings_gaps', 'postings_tfs', 'doclens']:
+            setattr(self, name, np.load(os.path.join(index_location, f'{name}.npy'), mmap_mode='r'))
+        self.docstore = DocStore(docstore_path(index_location))
+
+        self.num_docs = self.metadata['num_docs']
+        self.avg_doclen = self.metadata['avg_doclen']
+        # Pyserini sets BM25 with its defaults when use_bm25 is False
+        self.k1, self.b = (k1, b) if use_bm25 else (0.9, 0.4)
+        self.topK = 10
+        logger.info(f'Initialized NativeBM25Retriever index_dir: {index_location}  num_docs: {self.num_docs} use_bm25: {use_bm25} k1: {self.k1} b: {self.b}')
+
+    def _idf(self, df):
+        # Lucene's BM25 idf
+        return np.log(1.0 + (self.num_docs - df + 0.5) / (df + 0.5))
+
+    def _length_norm(self, doclens):
+        return self.k1 * (1.0 - self.b + self.b * np.asarray(doclens, dtype=np.float64) / self.avg_doclen)
+
+    def _decode_block(self, block):
+        gaps = varbyte_decode(self.postings_gaps[self.block_gap_offsets[block]:self.block_gap_offsets[block + 1]])
+        tfs = varbyte_decode(self.postings_tfs[self.block_tf_offsets[block]:self.block_tf_offsets[block + 1]])
+        return int(self.block_first[block]) + gaps, tfs
+
+    def _score_blocks(self, blocks, weights):
+        """Decode the blocks and score their postings, returning the documents and their summed scores"""
+        if len(blocks) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        docs, contributions = [], []
+        for block, weight in zip(blocks, weights):
+            block_docs, tfs = self._decode_block(block)
+            docs.append(block_docs)
+            contributions.append(weight * tfs / (tfs + self._length_norm(self.doclens[block_docs])))
+        docs, contributions = np.concatenate(docs), np.concatenate(contributions)
+        unique_docs, inverse = np.unique(docs, return_inverse=True)
+        return unique_docs, np.bincount(inverse, weights=contributions)
+
+    def _search(self, query: str, topK: int):
+        query_terms = Counter(term for term in analyze(query) if term in self.vocab)
+        if len(query_terms) == 0 or topK <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+
+        # per term: its blocks and their score upper bounds; a repeated query term counts once per occurrence
+        term_blocks, term_bounds, term_weights = [], [], []
+        for term, count in query_terms.items():
+            term_id = self.vocab[term]
+            blocks = np.arange(self.term_blocks[term_id], self.term_blocks[term_id + 1])
+            weight = count * self._idf(float(self.term_df[term_id]))
+            max_tf = self.block_max_tf[blocks].astype(np.float64)
+            term_blocks.append(blocks)
+            term_bounds.append(weight * max_tf / (max_tf + self._length_norm(self.block_min_dl[blocks])))
+            term_weights.append(weight)
+
+        # block-max bound: a document in block j of term t scores at most the bound of j plus,
+        # for every other term, the largest bound of that term's blocks overlapping the documents of j
+        tables = [_range_max_table(bounds) for bounds in term_bounds]
+        all_blocks, all_bounds, all_weights = [], [], []
+        for t, blocks in enumerate(term_blocks):
+            bound = term_bounds[t].copy()
+            for u, other_blocks in enumerate(term_blocks):
+                if u == t:
+                    continue
+                lo = np.searchsorted(self.block_last[other_blocks], self.block_first[blocks], side='left')
+                hi = np.searchsorted(self.block_first[other_blocks], self.block_last[blocks], side='right')
+                bound += _range_max(tables[u], lo, hi)
+            all_blocks.append(blocks)
+            all_bounds.append(bound)
+            all_weights.append(np.full(len(blocks), term_weights[t]))
+        all_blocks, all_bounds, all_weights = np.concatenate(all_blocks), np.concatenate(all_bounds), np.concatenate(all_weights)
+
+        # threshold: the k-th best exact score among the documents of the most promising blocks
+        by_bound = np.argsort(-all_bounds, kind='stable')
+        seed_docs, num_seed = [], 0
+        for ndx in by_bound:
+            block = all_blocks[ndx]
+            seed_docs.append(self._decode_block(block)[0])
+            num_seed += len(seed_docs[-1])
+            if num_seed >= topK:
+                break
+        seed_docs = np.unique(np.concatenate(seed_docs))
+        threshold = 0.0
+        if len(seed_docs) >= topK:
+            seed_scores = self._exact_scores(seed_docs, term_blocks, term_weights)
+            threshold = np.partition(seed_scores, len(seed_scores) - topK)[len(seed_scores) - topK]
+
+        # only blocks that can hold a document scoring at least the threshold are decoded;
+        # documents of the skipped blocks can not reach the top-k
+        # (with some slack for the rounding of the summed bounds)
+        keep = all_bounds >= threshold * (1 - 1e-6)
+        docs, scores = self._score_blocks(all_blocks[keep], all_weights[keep])
+        if len(docs) > topK:
+            top = np.argpartition(-scores, topK - 1)[:topK]
+            docs, scores = docs[top], scores[top]
+        # ties broken by document order, as Lucene does
+        order = np.lexsort((docs, -scores))
+        return docs[order], scores[order]
+
+    def _exact_scores(self, docs, term_blocks, term_weights):
+        scores = np.zeros(len(docs), dtype=np.float64)
+        length_norm = self._length_norm(self.doclens[docs])
+        for blocks, weight in zip(term_blocks, term_weights):
+            # the only block of the term that can hold each document
+            candidates = np.searchsorted(self.block_last[blocks], docs, side='left')
+            for candidate in np.unique(candidates[candidates < len(blocks)]):
+                block_docs, tfs = self._decode_block(blocks[candidate])
+                sel = np.flatnonzero(candidates == candidate)
+                pos = np.searchsorted(block_docs, docs[sel])
+                pos = np.minimum(pos, len(block_docs) - 1)
+                found = block_docs[pos] == docs[sel]
+                tf = tfs[pos[found]]
+                scores[sel[found]] += weight * tf / (tf + length_norm[sel[found]])
+        return scores
+
+    def retrieve(self, query: str, topK: Optional[int] = 10, hydrate: bool = True):
+        """
+
+        Run queries against the index to retrieve ranked list of documents
+        Return documents that are most relevant to the query.
+
+        Args:
+             query: search
+             top_k: number of hits to return, defaults to 10
+             hydrate: add the title and text to the hits, defaults to True
+
+
+        Returns:
+             List of hits, each hit is a dict containing (title and text only when hydrated):
+             {
+                "rank": i,
+                "score": hit.score,
+                "doc_id": docid,
+                "title": title,
+                "text": text
+            }
+
+
+        """
+        docs, scores = self._search(query, topK)
+        return self._collect_hits(docs, scores, hydrate=hydrate)
+
+    def batch_retrieve(self, queries: List[str], qids: List[str], topK: int = 10, threads: int = 1, hydrate: bool = True):
+
+        """
+           Run a batch of queries
+
+           Args:
+                queries:  list of query strings
+                qids:     list of qid strings corresponding to queries
+                top_k:    number of hits to return, defaults to 10
+                threads:  maximum number of threads to use
+                hydrate:  add the title and text to the hits, defaults to True
+
+            Returns:
+                Dict of qid to hits
+
+
+        """
+
+        with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+            hits = list(executor.map(lambda query: self.retrieve(query, topK, hydrate=hydrate), queries))
+        return dict(zip(qids, hits))
+
+    def hydrate(self, hits: List[dict]):
+        """Add the title and text to hits retrieved with hydrate=False"""
+        rows = self.docstore.rows([hit['doc_id'] for hit in hits])
+        for hit, row in zip(hits, rows):
+            self._hydrate_hit(hit, row)
+        return hits
+
+    def _hydrate_hit(self, hit, row):
+        hit["title"] = self.docstore.title(row).replace('\n', ' ')
+        hit["text"] = self.docstore.text(row).replace('\n', ' ')
+
+    def _collect_hits(self, docs, scores, hydrate=True):
+        search_results = []
+        for i, (doc, score) in enumerate(zip(docs, scores)):
+            search_result = {
+                "rank": i,
+                "score": float(score),
+                "doc_id": self.docstore.docid(doc),
+            }
+            if hydrate:
+                # the internal document ids are the docstore rows
+                self._hydrate_hit(search_result, doc)
+            search_results.append(search_result)
+        return search_results
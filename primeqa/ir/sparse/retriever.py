@@ -3,6 +3,7 @@ from typing import Optional, List
 import logging
 import json
 from abc import ABCMeta, abstractmethod
+from primeqa.ir.sparse.docstore import DocStore, docstore_exists, docstore_path
 
 logger = logging.getLogger(__name__)
 
@@ -23,9 +24,11 @@ class PyseriniRetriever:
         if use_bm25:
             self.searcher.set_bm25(k1=k1,b=b)
         self.topK = 10
-        logger.info(f'Initialized LuceneSearcher index_dir: {self.searcher.index_dir}  num_docs: {self.searcher.num_docs} use_bm25: {use_bm25} k1: {k1} b: {b}')
+        # the side docstore written by PyseriniIndexer(docstore=True), used in place of the raw documents
+        self.docstore = DocStore(docstore_path(index_location)) if docstore_exists(index_location) else None
+        logger.info(f'Initialized LuceneSearcher index_dir: {self.searcher.index_dir}  num_docs: {self.searcher.num_docs} use_bm25: {use_bm25} k1: {k1} b: {b} docstore: {self.docstore is not None}')
 
-    def retrieve(self, query: str, topK: Optional[int] = 10):
+    def retrieve(self, query: str, topK: Optional[int] = 10, hydrate: bool = True):
         """
 
         Run queries against the index to retrieve ranked list of documents
@@ -34,10 +37,11 @@ class PyseriniRetriever:
         Args:
              query: search
              top_k: number of hits to return, defaults to 10
+             hydrate: add the title and text to the hits, defaults to True
 
 
         Returns:
-             List of hits, each hit is a dict containing :
+             List of hits, each hit is a dict containing (title and text only when hydrated):
              {
                 "rank": i,
                 "score": hit.score,
@@ -50,11 +54,11 @@ class PyseriniRetriever:
         """
 
         hits = self.searcher.search(query, topK)
-        search_results = self._collect_hits(hits)
+        search_results = self._collect_hits(hits, hydrate=hydrate)
         return search_results
 
 
-    def batch_retrieve(self,  queries: List[str], qids: List[str], topK: int = 10, threads: int = 1):
+    def batch_retrieve(self,  queries: List[str], qids: List[str], topK: int = 10, threads: int = 1, hydrate: bool = True):
 
         """
            Run a batch of queries 
@@ -64,6 +68,7 @@ class PyseriniRetriever:
                 qids:     list of qid strings corresponding to queries
                 top_k:    number of hits to return, defaults to 10
                 threads:  maximum number of threads to use
+                hydrate:  add the title and text to the hits, defaults to True
                 
             Returns:
                 Dict of qid to hits
@@ -74,25 +79,46 @@ class PyseriniRetriever:
         hits = self.searcher.batch_search(queries, qids, k=topK, threads=threads)
         query_to_hits = {}
         for q, hits in hits.items():
-            query_to_hits[q] = self._collect_hits(hits)
+            query_to_hits[q] = self._collect_hits(hits, hydrate=hydrate)
         return query_to_hits
 
 
-    def _collect_hits(self, hits: List):
+    def hydrate(self, hits: List[dict]):
+        """
+           Add the title and text to hits retrieved with hydrate=False, e.g. only to the hits kept after reranking
+
+           Args:
+                hits: list of hits returned by retrieve or batch_retrieve
+
+           Returns:
+                the hits, updated in place
+        """
+        rows = self.docstore.rows([hit['doc_id'] for hit in hits]) if self.docstore is not None else [-1] * len(hits)
+        for hit, row in zip(hits, rows):
+            if row >= 0:
+                hit["title"] = self.docstore.title(row).replace('\n',' ')
+                hit["text"] = self.docstore.text(row).replace('\n',' ')
+            else:
+                self._hydrate_from_raw(hit, self.searcher.doc(hit["doc_id"]).raw())
+        return hits
+
+    def _hydrate_from_raw(self, search_result: dict, raw: str):
+        title, text = json.loads(raw)['contents'].split("\t")
+        search_result["title"] = title.replace('\n',' ')
+        search_result["text"] = text.replace('\n',' ')
+
+    def _collect_hits(self, hits: List, hydrate: bool = True):
         search_results = []
         for i, hit in enumerate(hits):
-            title, text = json.loads(hit.raw)['contents'].split("\t")
-            title = title.replace('\n',' ')
-            text = text.replace('\n',' ')
-            docid = hit.docid
             search_result = {
                 "rank": i,
                 "score": hit.score,
-                "doc_id": docid,
-                "title": title,
-                "text": text 
+                "doc_id": hit.docid
             }
+            if hydrate and self.docstore is None:
+                self._hydrate_from_raw(search_result, hit.raw)
             search_results.append(search_result)
+        if hydrate and self.docstore is not None:
+            self.hydrate(search_results)
         return search_results
 
-
@@ -0,0 +1,75 @@
+"""
+Fusion of the rankings returned by several retrievers for the same query.
+A ranking is a list of (doc_id, score) tuples, best first. Documents are matched across rankings
+by str(doc_id), so integer and string ids of the same document are merged, and a document that
+appears more than once in a ranking only counts with its best rank.
+"""
+
+from typing import List, Tuple, Any
+
+
+def _dedupe(ranking: List[Tuple[Any, float]]):
+    seen = set()
+    deduped = []
+    for doc_id, score in ranking:
+        key = str(doc_id)
+        if key not in seen:
+            seen.add(key)
+            deduped.append((key, score))
+    return deduped
+
+
+def _sorted_by_fused_score(fused: dict, max_num_documents: int = None):
+    # dicts keep insertion order, so ties are broken by the rankings the documents first appeared in
+    ranked = sorted(fused.items(), key=lambda item: -item[1])
+    return ranked[:max_num_documents] if max_num_documents is not None else ranked
+
+
+def reciprocal_rank_fusion(rankings: List[List[Tuple[Any, float]]], k: int = 60, weights: List[float] = None,
+                           max_num_documents: int = None) -> List[Tuple[str, float]]:
+    """
+    Reciprocal rank fusion: a document scores sum_i weights[i] / (k + rank_i), with ranks starting at 1.
+
+    Args:
+        rankings: one ranking of (doc_id, score) per retriever
+        k: smoothing constant, defaults to 60
+        weights: weight of each ranking, defaults to 1 for all
+        max_num_documents: number of fused documents to return, defaults to all
+
+    Returns:
+        List of (doc_id, fused score), best first
+    """
+    weights = weights if weights is not None else [1.0] * len(rankings)
+    fused = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, (doc_id, _) in enumerate(_dedupe(ranking), start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight / (k + rank)
+    return _sorted_by_fused_score(fused, max_num_documents)
+
+
+def linear_fusion(rankings: List[List[Tuple[Any, float]]], weights: List[float] = None,
+                  max_num_documents: int = None) -> List[Tuple[str, float]]:
+    """
+    Normalized linear fusion: the scores of each ranking are min-max normalized to [0, 1] and
+    a document scores sum_i weights[i] * normalized score_i, with 0 for the rankings it is missing from.
+
+    Args:
+        rankings: one ranking of (doc_id, score) per retriever
+        weights: weight of each ranking, defaults to 1 / len(rankings) for all
+        max_num_documents: number of fused documents to return, defaults to all
+
+    Returns:
+        List of (doc_id, fused score), best first
+    """
+    weights = weights if weights is not None else [1.0 / len(rankings)] * len(rankings)
+    fused = {}
+    for ranking, weight in zip(rankings, weights):
+        ranking = _dedupe(ranking)
+        if not ranking:
+            continue
+        scores = [float(score) for _, score in ranking]
+        low, high = min(scores), max(scores)
+        for (doc_id, _), score in zip(ranking, scores):
+            normalized = (score - low) / (high - low) if high > low else 1.0
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight * normalized
+    return _sorted_by_fused_score(fused, max_num_documents)
@@ -0,0 +1,115 @@
+"""
+Cache of query embeddings shared by the dense searchers of a process.
+
+Serving traffic repeats queries, and a reranker encodes the query that was just used for retrieval
+once more, so the searchers look up the embedding of each query here before running the encoder.
+Entries are keyed by the encoder (e.g. the checkpoint, query_maxlen and query encoder backend) and
+the query text with whitespace normalized; case is kept since not every tokenizer lowercases.
+Embeddings are stored as fp16 CPU tensors and the least recently used ones are evicted once the
+cache is full.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, List
+
+import torch
+
+DEFAULT_QUERY_CACHE_SIZE = 4096
+
+
+def normalize_query(text: str) -> str:
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class QueryEmbeddingCache:
+    def __init__(self, max_size: int = DEFAULT_QUERY_CACHE_SIZE):
+        """
+        Args:
+            max_size: maximum number of cached query embeddings
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        with self._lock:
+            return self._hit_rate()
+
+    def _hit_rate(self) -> float:
+        # must hold self._lock, so that hits and misses are read from the same lookups
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'size': len(self._entries), 'max_size': self.max_size, 'hits': self.hits,
+                    'misses': self.misses, 'hit_rate': self._hit_rate()}
+
+    def reserve(self, max_size: int):
+        """
+        Grows the cache to hold at least max_size embeddings. The cache is shared, so it is never shrunk
+        on behalf of one searcher.
+        """
+        with self._lock:
+            self.max_size = max(self.max_size, max_size)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def encode(self, encoder_key: Hashable, queries: List[str],
+               encode_fn: Callable[[List[str]], torch.Tensor]) -> torch.Tensor:
+        """
+        Embeddings of the queries, as a float32 CPU tensor stacked along the first dimension like the output
+        of encode_fn. Only the queries which are not cached are passed to encode_fn, in a single call.
+
+        Args:
+            encoder_key: identifies the encoder, embeddings of the same text by different encoders are cached apart
+            queries: query texts
+            encode_fn: maps a list of queries to a tensor with one embedding per query along the first dimension
+        """
+        keys = [(encoder_key, normalize_query(query)) for query in queries]
+        embeddings = [None] * len(queries)
+        missing = OrderedDict()
+
+        with self._lock:
+            for idx, key in enumerate(keys):
+                embedding = self._entries.get(key)
+                if embedding is not None:
+                    self._entries.move_to_end(key)
+                    embeddings[idx] = embedding
+                    self.hits += 1
+                else:
+                    # a query repeated within the batch is encoded once
+                    missing.setdefault(key, []).append(idx)
+                    self.misses += 1
+
+        if missing:
+            encoded = encode_fn([queries[indices[0]] for indices in missing.values()])
+            encoded = encoded.detach().to(device='cpu', dtype=torch.float16)
+
+            with self._lock:
+                for (key, indices), embedding in zip(missing.items(), encoded):
+                    # clone, so that the cache does not keep the whole batch alive through a view
+                    embedding = embedding.clone()
+                    self._entries[key] = embedding
+                    self._entries.move_to_end(key)
+                    for idx in indices:
+                        embeddings[idx] = embedding
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+
+        return torch.stack(embeddings).float()
+
+
+QUERY_EMBEDDING_CACHE = QueryEmbeddingCache()
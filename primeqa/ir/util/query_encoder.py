@@ -0,0 +1,212 @@
+"""
+Query encoder backends for CPU serving.
+
+A query encoder maps (input_ids, attention_mask) to the encoder's output tensor. Besides running the
+fp32 PyTorch module as is ('torch'), it can be exported once to a dynamically int8-quantized model,
+either TorchScript ('int8') or ONNX Runtime ('onnx'). The exported model is cached next to the
+checkpoint and reused by later processes, unless the checkpoint's weights are newer. If the model
+cannot be exported, e.g. to a read-only checkpoint directory, the fp32 module is used.
+
+Before an exported model is used, its outputs on a fixed set of queries are compared with the fp32
+module's: if the cosine similarity of any output vector is below the tolerance, the fp32 module is
+used instead, so a lossy export degrades latency rather than recall.
+"""
+
+import os
+import re
+import glob
+import logging
+import tempfile
+from typing import Callable, List, Tuple
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+QUERY_ENCODER_BACKENDS = ['torch', 'int8', 'onnx']
+
+_EXTENSIONS = {'int8': '.int8.pt', 'onnx': '.int8.onnx'}
+
+# Weight files of a checkpoint directory, including sharded checkpoints
+WEIGHTS_PATTERNS = ['pytorch_model*.bin', 'model*.safetensors', '*.dnn', '*.model']
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'primeqa', 'query_encoders')
+
+# Queries of various lengths, to compare the exported encoder with the fp32 one
+VALIDATION_QUERIES = [
+    'who wrote the declaration of independence',
+    'when did the first man land on the moon',
+    'what is the capital of australia',
+    'how many bones are there in the adult human body and how many at birth',
+    'which element has the chemical symbol fe',
+    'why is the sky blue during the day but red at sunset',
+    'population of tokyo',
+    'what are the side effects of taking ibuprofen every day for a long period of time',
+]
+
+
+def query_encoder_cache_path(name_or_path: str, backend: str, cache_dir: str = None) -> str:
+    """
+    Where the exported query encoder of a checkpoint is cached: in the checkpoint's directory, next to a
+    checkpoint file, or under `cache_dir` for a model hub name.
+    """
+    filename = 'query_encoder' + _EXTENSIONS[backend]
+    if os.path.isdir(name_or_path):
+        return os.path.join(name_or_path, filename)
+    if os.path.isfile(name_or_path):
+        return f'{name_or_path}.{filename}'
+    return os.path.join(cache_dir or DEFAULT_CACHE_DIR, re.sub(r'[^\w.-]', '_', name_or_path), filename)
+
+
+def checkpoint_mtime(name_or_path: str) -> float:
+    """
+    Last modification time of a checkpoint's weights, None for a model hub name. For a directory, only
+    the weight files count: the directory itself is modified when the exported model is cached in it.
+    """
+    if os.path.isfile(name_or_path):
+        return os.path.getmtime(name_or_path)
+    if not os.path.isdir(name_or_path):
+        return None
+
+    paths = [path for pattern in WEIGHTS_PATTERNS for path in glob.glob(os.path.join(name_or_path, pattern))]
+    return max(os.path.getmtime(path) for path in paths) if paths else None
+
+
+def min_cosine_similarity(outputs: torch.Tensor, expected: torch.Tensor) -> float:
+    """
+    Smallest cosine similarity between corresponding vectors (along the last dimension) of two outputs,
+    ignoring the zero vectors of `expected`.
+    """
+    outputs = outputs.float().reshape(-1, outputs.size(-1))
+    expected = expected.float().reshape(-1, expected.size(-1))
+    nonzero = expected.norm(dim=-1) > 0
+    if not nonzero.any():
+        return 1.0
+    return torch.nn.functional.cosine_similarity(outputs[nonzero], expected[nonzero], dim=-1).min().item()
+
+
+class QueryEncoder:
+    def __init__(self, module: torch.nn.Module, name_or_path: str, backend: str = 'torch',
+                 tokenize: Callable[[List[str]], Tuple[torch.Tensor, torch.Tensor]] = None,
+                 tolerance: float = 0.98, device: str = 'cpu', cache_dir: str = None):
+        """
+        Args:
+            module: fp32 encoder, called as module(input_ids, attention_mask) and returning a tensor
+            name_or_path: checkpoint the module was loaded from, to cache the exported model next to it
+            backend: one of QUERY_ENCODER_BACKENDS, only 'torch' is used on GPU
+            tokenize: maps a list of queries to (input_ids, attention_mask), required to export
+            tolerance: minimum cosine similarity of the exported encoder's outputs with the fp32 ones
+            device: device of the module
+            cache_dir: where to cache exported models of checkpoints which are not local paths
+        """
+        if backend not in QUERY_ENCODER_BACKENDS:
+            raise ValueError(f'Unknown query encoder backend {backend}, expected one of {QUERY_ENCODER_BACKENDS}')
+
+        self.module = module
+        self.device = device
+        self.backend = 'torch'
+        self._run = self._run_module
+
+        if backend == 'torch':
+            return
+        if device != 'cpu':
+            logger.warning(f'The {backend} query encoder backend only runs on CPU, using the torch backend')
+            return
+
+        assert tokenize is not None, 'tokenize is needed to export the query encoder'
+        input_ids, attention_mask = tokenize(VALIDATION_QUERIES)
+        cache_path = query_encoder_cache_path(name_or_path, backend, cache_dir)
+
+        try:
+            run = self._load(backend, cache_path, name_or_path, input_ids, attention_mask)
+        except Exception:
+            logger.warning(f'Failed to export or load the {backend} query encoder at {cache_path}, '
+                           f'using the torch backend', exc_info=True)
+            return
+
+        with torch.no_grad():
+            similarity = min_cosine_similarity(run(input_ids, attention_mask),
+                                               self._run_module(input_ids, attention_mask))
+        if similarity < tolerance:
+            logger.warning(f'The {backend} query encoder at {cache_path} differs from the fp32 encoder '
+                           f'(cosine similarity {similarity:.4f} < {tolerance}), using the torch backend')
+            return
+
+        logger.info(f'Using the {backend} query encoder at {cache_path} (cosine similarity {similarity:.4f})')
+        self.backend = backend
+        self._run = run
+
+    def __call__(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            return self._run(input_ids, attention_mask)
+
+    def _run_module(self, input_ids, attention_mask):
+        return self.module(input_ids.to(self.device), attention_mask.to(self.device))
+
+    def _load(self, backend, cache_path, name_or_path, input_ids, attention_mask):
+        weights_mtime = checkpoint_mtime(name_or_path)
+        is_stale = weights_mtime is not None and os.path.exists(cache_path) \
+            and os.path.getmtime(cache_path) < weights_mtime
+
+        if not os.path.exists(cache_path) or is_stale:
+            logger.info(f'Exporting the {backend} query encoder to {cache_path}')
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            # Exported to a temporary file first, so that other processes never load a partial export
+            tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+            try:
+                if backend == 'int8':
+                    self._export_int8(tmp_path, input_ids, attention_mask)
+                else:
+                    self._export_onnx(tmp_path, input_ids, attention_mask)
+                os.replace(tmp_path, cache_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        if backend == 'int8':
+            return _load_int8(cache_path)
+        return _load_onnx(cache_path)
+
+    def _export_int8(self, path, input_ids, attention_mask):
+        quantized = torch.quantization.quantize_dynamic(self.module, {torch.nn.Linear}, dtype=torch.qint8)
+        with torch.no_grad():
+            traced = torch.jit.trace(quantized, (input_ids, attention_mask), strict=False)
+        torch.jit.save(traced, path)
+
+    def _export_onnx(self, path, input_ids, attention_mask):
+        try:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+        except ImportError as err:
+            raise ImportError('The onnx query encoder backend requires onnxruntime: pip install primeqa[onnx]') from err
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fp32_path = os.path.join(tmp_dir, 'query_encoder.onnx')
+            with torch.no_grad():
+                torch.onnx.export(self.module, (input_ids, attention_mask), fp32_path,
+                                  input_names=['input_ids', 'attention_mask'], output_names=['output'],
+                                  dynamic_axes={'input_ids': {0: 'batch', 1: 'sequence'},
+                                                'attention_mask': {0: 'batch', 1: 'sequence'},
+                                                'output': {0: 'batch'}},
+                                  opset_version=14)
+            quantize_dynamic(fp32_path, path, weight_type=QuantType.QInt8)
+
+
+def _load_int8(path):
+    module = torch.jit.load(path, map_location='cpu')
+    module.eval()
+    return lambda input_ids, attention_mask: module(input_ids.cpu(), attention_mask.cpu())
+
+
+def _load_onnx(path):
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = torch.get_num_threads()
+    session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+    def run(input_ids, attention_mask):
+        output, = session.run(['output'], {'input_ids': input_ids.cpu().numpy().astype('int64'),
+                                           'attention_mask': attention_mask.cpu().numpy().astype('int64')})
+        return torch.from_numpy(output)
+
+    return run
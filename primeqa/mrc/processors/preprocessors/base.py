@@ -77,6 +77,19 @@ class BasePreProcessor(AbstractPreProcessor):
     def process_eval(self, examples: Dataset) -> Tuple[Dataset, Dataset]:
         return self._process(examples, is_train=False)
 
+    def process_eval_batch(self, examples: Dict[str, list]) -> BatchEncoding:
+        """
+        Process eval examples into features in memory, without building `Dataset`s, for inference.
+
+        Unlike `process_eval`, the examples are not passed through `adapt_dataset`, so they must already
+        follow the schema above including 'example_id'. This is all `adapt_dataset` of this class ensures
+        besides imputing 'language', which eval features do not use. Preprocessors overriding
+        `adapt_dataset` to reformat their data are not supported.
+        """
+        if type(self).adapt_dataset is not BasePreProcessor.adapt_dataset:
+            raise NotImplementedError(f"{type(self).__name__} adapts its datasets, use process_eval instead")
+        return self._process_batch(examples, indices=list(range(len(examples['question']))), is_train=False)
+
     def _process(self, examples: Dataset, is_train: bool) -> Tuple[Dataset, Dataset]:
         """
         Provides implementation for public processing methods.
@@ -0,0 +1,88 @@
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+OFFSETS_SUFFIX = ".offsets.npy"
+CHUNK_SIZE = 64 * 2**20
+
+
+def build_line_offsets(path: str) -> np.ndarray:
+    """
+    Byte offsets of the lines of a file, num_lines + 1 int64 values, scanning it in chunks.
+    """
+    offsets = [np.zeros(1, dtype=np.int64)]
+    position = 0
+    with open(path, "rb") as infile:
+        while True:
+            chunk = infile.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            newlines = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == ord("\n"))
+            offsets.append(newlines.astype(np.int64) + position + 1)
+            position += len(chunk)
+    offsets = np.concatenate(offsets)
+    # the last line need not end with a newline
+    if offsets[-1] != position:
+        offsets = np.append(offsets, np.int64(position))
+    return offsets
+
+
+class PassageStore:
+    """
+    Read-only, memory mapped view of a collection TSV (id, text, title per line), looked up by line
+    number. Only the line offsets are held in memory; they are cached next to the collection in
+    `<collection>.offsets.npy` when its directory is writable, so later loads skip the scan.
+    """
+
+    def __init__(self, collection: str):
+        self.collection = collection
+        self.offsets = self._load_offsets(collection)
+        # np.memmap cannot map an empty file
+        self.data = (
+            np.memmap(collection, dtype=np.uint8, mode="r")
+            if self.offsets[-1] > 0
+            else np.zeros(0, dtype=np.uint8)
+        )
+
+    @staticmethod
+    def _load_offsets(collection: str) -> np.ndarray:
+        offsets_path = collection + OFFSETS_SUFFIX
+        stat = os.stat(collection)
+        if (
+            os.path.exists(offsets_path)
+            and os.stat(offsets_path).st_mtime_ns >= stat.st_mtime_ns
+        ):
+            offsets = np.load(offsets_path, mmap_mode="r")
+            if len(offsets) > 0 and offsets[-1] == stat.st_size:
+                return offsets
+
+        logger.info(f"Indexing the lines of {collection}")
+        offsets = build_line_offsets(collection)
+        try:
+            tmp_path = f"{offsets_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as outfile:
+                np.save(outfile, offsets, allow_pickle=False)
+            os.replace(tmp_path, offsets_path)
+        except OSError:
+            logger.info(f"Could not cache the line offsets of {collection}")
+        return offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def line(self, index: int) -> str:
+        return (
+            self.data[self.offsets[index] : self.offsets[index + 1]]
+            .tobytes()
+            .decode("utf-8")
+            .rstrip("\r\n")
+        )
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0 or index >= len(self):
+            raise IndexError(f"passage {index} out of range")
+        id, text, title = self.line(index).split("\t")
+        return title + " " + text
@@ -1,36 +1,91 @@
-from typing import List
-from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List
 
 from primeqa.components.base import Reader, Retriever
+from primeqa.pipelines.passage_store import PassageStore
 
 
 class QAPipeline:
     def __init__(self, retriever: Retriever, reader: Reader) -> None:
         self.retriever = retriever
         self.reader = reader
-        self.corpus_passages = []
-        with open(self.retriever.collection, "r") as infile:
-            for line in tqdm(infile):
-                id, text, title = line.split("\t")
-                self.corpus_passages.append(title + " " + text)
+        # Memory mapped, passages are read from the collection as hits need them
+        self.corpus_passages = PassageStore(self.retriever.collection)
 
-    def run(self, input_texts: List[str], prefix="", suffix="", use_retriever=True):
-        contexts = []
-        if use_retriever:
-            search_results = self.retriever.predict(input_texts=input_texts)
-            for result in search_results:
-                context = [self.corpus_passages[int(p[0])] for p in result]
-                contexts.append(context)
-
-        reader_answers = self.reader.predict(
-            input_texts, contexts, prefix=prefix, suffix=suffix
-        )
+    def _retrieve(self, input_texts: List[str]) -> List[List[str]]:
+        search_results = self.retriever.predict(input_texts=input_texts)
+        return [[self.corpus_passages[int(p[0])] for p in result] for result in search_results]
+
+    def _read(
+        self, input_texts: List[str], contexts: List[List[str]], offset: int, **kwargs
+    ) -> Dict:
+        reader_answers = self.reader.predict(input_texts, contexts, **kwargs)
         result = {}
         for i, answers_i in reader_answers.items():
             i_result = {}
             i_result["answers"] = answers_i
-            if use_retriever:
+            if contexts:
                 i_result["passages"] = contexts[int(i)]
-            result[i] = i_result
+            # number questions across batches
+            result[type(i)(int(i) + offset)] = i_result
 
         return result
+
+    def run(self, input_texts: List[str], prefix="", suffix="", use_retriever=True):
+        result = {}
+        for batch_result in self.run_batches(
+            input_texts,
+            batch_size=max(1, len(input_texts)),
+            prefix=prefix,
+            suffix=suffix,
+            use_retriever=use_retriever,
+        ):
+            result.update(batch_result)
+        return result
+
+    def run_batches(
+        self,
+        input_texts: Iterable[str],
+        batch_size: int = 32,
+        prefix="",
+        suffix="",
+        use_retriever=True,
+    ) -> Iterator[Dict]:
+        """
+        Answer a stream of questions batch by batch, e.g. the lines of a large query file, yielding the
+        results of each batch as they are ready, keyed by the question's position in the stream.
+
+        Retrieval and reading overlap: the next batch is retrieved in a background thread while the
+        current batch is read, only two batches are held in memory at a time.
+        """
+        input_texts = iter(input_texts)
+
+        def next_batch() -> List[str]:
+            batch = []
+            for input_text in input_texts:
+                batch.append(input_text)
+                if len(batch) == batch_size:
+                    break
+            return batch
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+
+            def submit(batch: List[str]):
+                if not batch or not use_retriever:
+                    return None
+                return executor.submit(self._retrieve, batch)
+
+            offset = 0
+            batch = next_batch()
+            contexts_future = submit(batch)
+            while batch:
+                next_input_texts = next_batch()
+                next_contexts_future = submit(next_input_texts)
+
+                contexts = contexts_future.result() if contexts_future else []
+                yield self._read(
+                    batch, contexts, offset, prefix=prefix, suffix=suffix
+                )
+
+                offset += len(batch)
+                batch, contexts_future = next_input_texts, next_contexts_future
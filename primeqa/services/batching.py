@@ -0,0 +1,254 @@
+import json
+import logging
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+
+class _Request:
+    __slots__ = "columns", "num_rows", "enqueued_at", "event", "result", "error", "promoted"
+
+    def __init__(self, columns: Tuple[List, ...]):
+        self.columns = columns
+        self.num_rows = len(columns[0])
+        self.enqueued_at = time.monotonic()
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.promoted = False
+
+
+class _Queue:
+    # Requests waiting to be batched for one (predict, keyword arguments) combination
+    def __init__(self):
+        self.pending = []
+        self.has_leader = False
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent predict calls on one component instance into batched calls.
+
+    Requests are rows in parallel columns, e.g. (queries,) or (queries, documents), and predict maps the
+    columns of a batch to one result per row. Only requests with the same operation name and predict
+    keyword arguments are batched together.
+
+    There is no scheduler thread: the first caller to find no batch being collected becomes the leader,
+    waits up to `max_wait_ms` for `max_batch_size` rows to accumulate, runs the batch and hands each
+    caller its rows' results. Left over requests are handed to a new leader, so a batch is collected
+    while the previous one runs.
+    """
+
+    def __init__(self, max_batch_size: int, max_wait_ms: int):
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._condition = threading.Condition()
+        self._queues = {}
+
+    def run(
+        self,
+        name: str,
+        predict: Callable[..., List],
+        columns: Tuple[List, ...],
+        kwargs: dict,
+    ) -> List:
+        """
+        Run predict over the rows of columns, batched with concurrent calls.
+
+        Parameters
+        ----------
+        name: str
+            name of the predict operation, only calls with the same name are batched together
+        predict: Callable[..., List]
+            called as predict(*columns, **kwargs), returns one result per row
+        columns: Tuple[List, ...]
+            parallel input lists of equal length
+        kwargs: dict
+            keyword arguments of predict
+
+        Returns
+        -------
+        List:
+            one result per row of columns.
+
+        """
+        if not columns[0]:
+            return predict(*columns, **kwargs)
+
+        key = (name, json.dumps(kwargs, sort_keys=True, default=str))
+        request = _Request(columns)
+
+        with self._condition:
+            queue = self._queues.setdefault(key, _Queue())
+            queue.pending.append(request)
+            is_leader = not queue.has_leader
+            queue.has_leader = True
+            self._condition.notify_all()
+
+        if not is_leader:
+            request.event.wait()
+            if not request.promoted:
+                if request.error is not None:
+                    raise request.error
+                return request.result
+
+        # Step 1: Wait for the batch to fill up
+        deadline = request.enqueued_at + self.max_wait_ms / 1000
+        with self._condition:
+            while (
+                sum(pending.num_rows for pending in queue.pending) < self.max_batch_size
+                and time.monotonic() < deadline
+            ):
+                self._condition.wait(timeout=max(0.0, deadline - time.monotonic()))
+
+            # Step 2: Take requests in arrival order, the leader's own request is always the first
+            batch, num_rows = [], 0
+            while queue.pending and (
+                not batch or num_rows + queue.pending[0].num_rows <= self.max_batch_size
+            ):
+                num_rows += queue.pending[0].num_rows
+                batch.append(queue.pending.pop(0))
+
+            # Step 3: Hand the remaining requests to a new leader
+            if queue.pending:
+                queue.pending[0].promoted = True
+                queue.pending[0].event.set()
+            else:
+                queue.has_leader = False
+                del self._queues[key]
+
+        # Step 4: Run batch and scatter results
+        try:
+            merged_columns = tuple(
+                [value for batched in batch for value in batched.columns[column]]
+                for column in range(len(columns))
+            )
+            results = predict(*merged_columns, **kwargs)
+            offset = 0
+            for batched in batch:
+                batched.result = results[offset : offset + batched.num_rows]
+                offset += batched.num_rows
+        except Exception as err:
+            for batched in batch:
+                batched.error = err
+
+        for batched in batch[1:]:
+            batched.promoted = False
+            batched.event.set()
+
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+
+class MicroBatcherRegistry:
+    """
+    One MicroBatcher per component instance, created on first use. Batching is disabled, and
+    predict is called directly, while `max_wait_ms` is 0 or `max_batch_size` is at most 1.
+    """
+
+    def __init__(self, max_batch_size: int = 1, max_wait_ms: int = 0, logger: logging.Logger = None):
+        if logger is None:
+            self._logger = logging.getLogger(self.__class__.__name__)
+        else:
+            self._logger = logger
+
+        self._lock = threading.Lock()
+        self._batchers = {}
+        self.configure(max_batch_size, max_wait_ms)
+
+    def configure(self, max_batch_size: int = 1, max_wait_ms: int = 0) -> None:
+        with self._lock:
+            self.max_batch_size = max_batch_size
+            self.max_wait_ms = max_wait_ms
+            self._batchers.clear()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_batch_size > 1 and self.max_wait_ms > 0
+
+    def get(self, instance: Any) -> MicroBatcher:
+        with self._lock:
+            batcher = self._batchers.get(id(instance))
+            if batcher is None:
+                batcher = MicroBatcher(self.max_batch_size, self.max_wait_ms)
+                self._batchers[id(instance)] = batcher
+                # Drop the batcher with the instance, e.g. once it is evicted from the instance cache
+                weakref.finalize(instance, self._batchers.pop, id(instance), None)
+            return batcher
+
+
+BATCHERS = MicroBatcherRegistry()
+
+
+def retrieve(instance: Any, input_texts: List[str], **kwargs) -> List:
+    """
+    Retriever.predict, batched with concurrent calls on the same instance.
+    """
+    if not BATCHERS.enabled:
+        return instance.predict(input_texts=input_texts, **kwargs)
+
+    return BATCHERS.get(instance).run(
+        "retrieve",
+        lambda input_texts, **kwargs: instance.predict(input_texts=input_texts, **kwargs),
+        (list(input_texts),),
+        kwargs,
+    )
+
+
+def rerank(instance: Any, queries: List[str], documents: List[List[Dict]], **kwargs) -> List:
+    """
+    Reranker.predict, batched with concurrent calls on the same instance.
+    """
+    if not BATCHERS.enabled:
+        return instance.predict(queries=queries, documents=documents, **kwargs)
+
+    return BATCHERS.get(instance).run(
+        "rerank",
+        lambda queries, documents, **kwargs: instance.predict(
+            queries=queries, documents=documents, **kwargs
+        ),
+        (list(queries), list(documents)),
+        kwargs,
+    )
+
+
+def extractive_read(
+    instance: Any,
+    questions: List[str],
+    contexts: List[List[str]],
+    example_ids: Sequence[str],
+    **kwargs,
+) -> Dict[str, List[Dict]]:
+    """
+    ExtractiveReader.predict, batched with concurrent calls on the same instance.
+    """
+    if not BATCHERS.enabled:
+        return instance.predict(
+            questions=questions, contexts=contexts, example_ids=example_ids, **kwargs
+        )
+
+    def predict(questions, contexts, example_ids, **kwargs):
+        # Example ids are only unique within a request, number the rows of the batch instead
+        predictions = instance.predict(
+            questions=questions,
+            contexts=contexts,
+            example_ids=[str(row) for row in range(len(questions))],
+            **kwargs,
+        )
+        results = []
+        for row, example_id in enumerate(example_ids):
+            predictions_for_row = predictions.get(str(row), [])
+            for prediction in predictions_for_row:
+                prediction["example_id"] = example_id
+            results.append((example_id, predictions_for_row))
+        return results
+
+    results = BATCHERS.get(instance).run(
+        "extractive_read",
+        predict,
+        (list(questions), list(contexts), list(example_ids)),
+        kwargs,
+    )
+    return {example_id: predictions for example_id, predictions in results}
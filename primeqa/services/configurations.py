@@ -46,6 +46,19 @@ def positive_integer_type(value):
     return ivalue
 
 
+def non_negative_integer_type(value):
+    try:
+        ivalue = int(value)
+    except ValueError as ex:
+        raise ArgumentTypeError(
+            f"{value} is an invalid non-negative int value: {ex}"
+        ) from ex
+
+    if ivalue < 0:
+        raise ArgumentTypeError(f"{value} is an invalid non-negative int value")
+    return ivalue
+
+
 def float_type_between_zero_and_one(value):
     try:
         fvalue = float(value)
@@ -217,6 +230,50 @@ class Settings(object):
     def num_rest_server_workers(self):
         pass
 
+    @config_value(property_type=set)
+    def preload_index_ids(self):
+        pass
+
+    @config_value(property_type=positive_integer_type)
+    def num_indexing_workers(self):
+        pass
+
+    @config_value(property_type=positive_integer_type)
+    def micro_batching_max_batch_size(self):
+        pass
+
+    @config_value(property_type=non_negative_integer_type)
+    def micro_batching_max_wait_ms(self):
+        pass
+
+    @config_value(property_type=non_negative_integer_type)
+    def result_cache_max_memory_mb(self):
+        pass
+
+    @config_value(property_type=positive_integer_type)
+    def result_cache_ttl_secs(self):
+        pass
+
+    @config_value(property_type=str)
+    def result_cache_dir(self):
+        pass
+
+    @config_value(property_type=non_negative_integer_type)
+    def result_cache_max_disk_entries(self):
+        pass
+
+    @config_value(property_type=non_negative_integer_type)
+    def max_cached_instances(self):
+        pass
+
+    @config_value(property_type=non_negative_integer_type)
+    def max_cached_instances_memory_mb(self):
+        pass
+
+    @config_value(property_type=non_negative_integer_type)
+    def max_process_rss_mb(self):
+        pass
+
     def _get_config_dict(self):
         config_dict = {}
         for property_name in dir(self):
@@ -6,6 +6,12 @@ ATTR_METADATA = "metadata"
 ATTR_CONFIGURATION = "configuration"
 ATTR_ENGINE_TYPE = "engine_type"
 ATTR_CHECKPOINT = "checkpoint"
+ATTR_DENSE_INDEX_ID = "dense_index_id"
+ATTR_PROGRESS = "progress"
+ATTR_VERSION = "version"
+ATTR_INDEXER = "indexer"
+ATTR_INDEXER_ID = "indexer_id"
+ATTR_PARAMETERS = "parameters"
 
 
 class IndexStatus(str, Enum):
@@ -29,6 +29,7 @@ class ErrorMessages(str, Enum):
     INVALID_RETRIEVER = "E5001: Invalid retriever: {}. Please select one of the following pre-defined retrievers: {}"
     INDEX_UNAVAILABLE_FOR_QUERYING = 'E5002: Cannot query index with "{}" status. Please make sure index has "READY" status before querying.'
     MISMATCHED_ENGINE_TYPE = 'E5003: Cannot query index with "{}" engine_type with {} retriever of "{}" engine type.'
+    MISMATCHED_INDEX_DOCUMENTS = "E5004: Index with id {} and dense index with id {} were generated from different documents. Please generate both indexes from the same documents."
 
     # INDEXER
     INVALID_INDEXER = "E6001: Invalid indexer: {}. Please select one of the following pre-defined indexers: {}"
@@ -36,6 +37,9 @@ class ErrorMessages(str, Enum):
     FAILED_TO_LOCATE_INDEX_INFORMATION = (
         "E6003: Index information for index with id {} doesn't exist."
     )
+    INDEX_GENERATION_IN_PROGRESS = "E6004: Index with id {} is being generated. Please wait for it to finish before regenerating it."
+    INDEX_UPDATE_NOT_SUPPORTED = "E6005: Index with id {} cannot be updated. Please regenerate it instead."
+    FAILED_TO_LOCATE_DOCUMENT = "E6006: Document with id {} doesn't exist in index with id {}."
     
     # RETRANKER
     INVALID_RETRANKER = "E5001: Invalid reranker: {}. Please select one of the following pre-defined rerankers: {}"
@@ -1,6 +1,7 @@
 import logging
 import time
 import json
+from typing import Hashable, Tuple
 
 from dataclasses import MISSING
 
@@ -17,6 +18,7 @@ from primeqa.components.reader.prompt import PromptReader, PromptFLANT5Reader
 
 from primeqa.components.retriever.dense import ColBERTRetriever, DPRRetriever
 from primeqa.components.retriever.sparse import BM25Retriever
+from primeqa.components.retriever.hybrid import HybridRetriever
 
 from primeqa.components.indexer.dense import ColBERTIndexer
 from primeqa.components.indexer.sparse import BM25Indexer
@@ -24,6 +26,8 @@ from primeqa.components.indexer.sparse import BM25Indexer
 from primeqa.components.reranker.seq_classification_reranker import SeqClassificationReranker
 from primeqa.components.reranker.colbert_reranker import ColBERTReranker
 
+from primeqa.services.instance_manager import INSTANCE_MANAGER
+
 
 READERS_REGISTRY = {
     ExtractiveReader.__name__: ExtractiveReader,
@@ -35,6 +39,7 @@ RETRIEVERS_REGISTRY = {
     ColBERTRetriever.__name__: ColBERTRetriever,
     DPRRetriever.__name__: DPRRetriever,
     BM25Retriever.__name__: BM25Retriever,
+    HybridRetriever.__name__: HybridRetriever,
 }
 
 INDEXERS_REGISTRY = {
@@ -60,8 +65,6 @@ def validate(fields: dict):
 
 
 class ReaderFactory:
-    _instances = {}
-    _loading = []
     _logger = logging.getLogger("ReaderFactory")
 
     @classmethod
@@ -86,18 +89,8 @@ class ReaderFactory:
         # Step 3: Create hash based unique instance id
         instance_id = hash(instance)
 
-        # Step 4: Load and persist instance
-        if instance_id not in cls._instances:
-            # Step 4.a: Check if class is currently loading
-            if instance_id in cls._loading:
-                raise ValueError(
-                    f"{reader.__name__} is currently being loading. Please try again in a short while."
-                )
-
-            # Step 4.b: Add to loading
-            cls._loading.append(instance_id)
-
-            # Step 4.d: Start loading
+        # Step 4: Load instance, unless it is cached. Concurrent requests for the same instance wait for a single load
+        def load():
             try:
                 cls._logger.info(
                     "Loading '%s' reader with parameters = %s",
@@ -112,33 +105,23 @@ class ReaderFactory:
                     time.time() - start_t,
                 )
             except OSError as err:
-                # Step 3.d.i: Log exception
+                # Step 4.a: Log exception
                 cls._logger.warning(
                     "Failed to load %s with arguments: %s",
                     reader.__name__,
                     reader_kwargs,
                 )
 
-                # Step 3.d.ii: Remove reader from loading
-                cls._loading.remove(instance_id)
-
-                # Step 3.d.iii: Raise exception
+                # Step 4.b: Raise exception
                 raise ValueError(err.args[0]) from err
+            return instance
 
-            # Step 4.e: Remove from loading and add to available instances
-            cls._instances[instance_id] = instance
-            cls._loading.remove(instance_id)
-
-        else:
-            # Step 4.a: Instance with same instance_id already exists, clean up newly created instance
-            del instance
-
-        return cls._instances[instance_id]
+        return INSTANCE_MANAGER.get(
+            (cls.__name__, instance_id), load, name=reader.__name__
+        )
 
 
 class RetrieverFactory:
-    _instances = {}
-    _loading = []
     _logger = logging.getLogger("RetrieverFactory")
 
     @classmethod
@@ -147,6 +130,8 @@ class RetrieverFactory:
         retriever: Retriever,
         retriever_kwargs: dict,
         *load_args,
+        index_ids: Tuple[str, ...] = (),
+        index_version: Hashable = None,
         **load_kwargs,
     ):
         # Step 1: Validate all required fields are specified
@@ -166,21 +151,11 @@ class RetrieverFactory:
             # Step 2.b: Raise exception
             raise err
 
-        # Step 3: Create hash based unique instance id
+        # Step 3: Create hash based unique instance id. An updated index is reloaded under its new version
         instance_id = hash(instance)
 
-        # Step 4: Load and persist instance
-        if instance_id not in cls._instances:
-            # Step 4.a: Check if class is currently loading
-            if instance_id in cls._loading:
-                raise ValueError(
-                    f"{retriever.__name__} is currently being loading. Please try again in a short while."
-                )
-
-            # Step 4.b: Add to loading
-            cls._loading.append(instance_id)
-
-            # Step 4.d: Start loading
+        # Step 4: Load instance, unless it is cached. Concurrent requests for the same instance wait for a single load
+        def load():
             try:
                 cls._logger.info(
                     "Loading '%s' retriever with parameters = %s",
@@ -195,33 +170,25 @@ class RetrieverFactory:
                     time.time() - start_t,
                 )
             except OSError as err:
-                # Step 3.d.i: Log exception
+                # Step 4.a: Log exception
                 cls._logger.warning(
                     "Failed to load %s with arguments: %s",
                     retriever.__name__,
                     retriever_kwargs,
                 )
 
-                # Step 3.d.ii: Remove reader from loading
-                cls._loading.remove(instance_id)
-
-                # Step 3.d.iii: Raise exception
+                # Step 4.b: Raise exception
                 raise ValueError(err.args[0]) from err
+            return instance
 
-            # Step 4.e: Remove from loading and add to available instances
-            cls._instances[instance_id] = instance
-            cls._loading.remove(instance_id)
-
-        else:
-            # Step 4.a: Instance with same instance_id already exists, clean up newly created instance
-            del instance
-
-        return cls._instances[instance_id]
+        return INSTANCE_MANAGER.get(
+            (cls.__name__, instance_id, tuple(index_ids), index_version),
+            load,
+            name=retriever.__name__,
+        )
 
 
 class IndexerFactory:
-    _instances = {}
-    _loading = []
     _logger = logging.getLogger("IndexerFactory")
 
     @classmethod
@@ -240,37 +207,24 @@ class IndexerFactory:
             f"{indexer.__name__}::{json.dumps(indexer_kwargs, sort_keys=True)}"
         )
 
-        if instance_id not in cls._instances:
-            # Step 3.a: Check if class is currently loading
-            if instance_id in cls._loading:
-                raise ValueError(
-                    f"{indexer.__name__} is currently being loading. Please try again in a short while."
-                )
-
-            # Step 3.b: Add to loading
-            cls._loading.append(instance_id)
-
-            # Step 3.c: Initialize instance
+        # Step 3: Initialize and load instance, unless it is cached
+        def load():
             cls._logger.info(
                 "%s - initializing with arguments: %s", indexer.__name__, indexer_kwargs
             )
             try:
                 instance = indexer(**indexer_kwargs)
             except TypeError as err:
-                # Step 3.c.i: Log exception
+                # Step 3.a: Log exception
                 cls._logger.warning(
                     "Failed to intialize %s with arguments: %s",
                     indexer.__name__,
                     indexer_kwargs,
                 )
 
-                # Step 3.c.ii: Remove reader from loading
-                cls._loading.remove(instance_id)
-
-                # Step 3.c.iii: Raise exception
+                # Step 3.b: Raise exception
                 raise err
 
-            # Step 3.d: Load instance
             try:
                 start_t = time.time()
                 instance.load(load_args, load_kwargs)
@@ -280,28 +234,22 @@ class IndexerFactory:
                     time.time() - start_t,
                 )
             except OSError as err:
-                # Step 3.d.i: Log exception
+                # Step 3.c: Log exception
                 cls._logger.warning(
                     "Failed to load %s with arguments: %s",
                     indexer.__name__,
                     indexer_kwargs,
                 )
 
-                # Step 3.d.ii: Remove reader from loading
-                cls._loading.remove(instance_id)
-
-                # Step 3.d.iii: Raise exception
+                # Step 3.d: Raise exception
                 raise ValueError(err.args[0]) from err
+            return instance
 
-            # Step 3.d: Remove from loading and add to available instances
-            cls._instances[instance_id] = instance
-            cls._loading.remove(instance_id)
-
-        return cls._instances[instance_id]
+        return INSTANCE_MANAGER.get(
+            (cls.__name__, instance_id), load, name=indexer.__name__
+        )
     
 class RerankerFactory:
-    _instances = {}
-    _loading = []
     _logger = logging.getLogger("RerankerFactory")
 
     @classmethod
@@ -332,51 +280,33 @@ class RerankerFactory:
         # Step 3: Create hash based unique instance id
         instance_id = hash(instance)
 
-        # Step 4: Load and persist instance
-        if instance_id not in cls._instances:
-            # Step 4.a: Check if class is currently loading
-            if instance_id in cls._loading:
-                raise ValueError(
-                    f"{reranker.__name__} is currently being loading. Please try again in a short while."
-                )
-
-            # Step 4.b: Add to loading
-            cls._loading.append(instance_id)
-
-            # Step 4.d: Start loading
+        # Step 4: Load instance, unless it is cached. Concurrent requests for the same instance wait for a single load
+        def load():
             try:
                 cls._logger.info(
-                    "Loading '%s' retriever with parameters = %s",
+                    "Loading '%s' reranker with parameters = %s",
                     reranker.__name__,
                     reranker_kwargs,
                 )
                 start_t = time.time()
                 instance.load(load_args, load_kwargs)
                 cls._logger.info(
-                    "'%s' retriever - loading took %.2f seconds",
+                    "'%s' reranker - loading took %.2f seconds",
                     reranker.__name__,
                     time.time() - start_t,
                 )
             except OSError as err:
-                # Step 3.d.i: Log exception
+                # Step 4.a: Log exception
                 cls._logger.warning(
                     "Failed to load %s with arguments: %s",
                     reranker.__name__,
                     reranker_kwargs,
                 )
 
-                # Step 3.d.ii: Remove reader from loading
-                cls._loading.remove(instance_id)
-
-                # Step 3.d.iii: Raise exception
+                # Step 4.b: Raise exception
                 raise ValueError(err.args[0]) from err
+            return instance
 
-            # Step 4.e: Remove from loading and add to available instances
-            cls._instances[instance_id] = instance
-            cls._loading.remove(instance_id)
-
-        else:
-            # Step 4.a: Instance with same instance_id already exists, clean up newly created instance
-            del instance
-
-        return cls._instances[instance_id]
+        return INSTANCE_MANAGER.get(
+            (cls.__name__, instance_id), load, name=reranker.__name__
+        )
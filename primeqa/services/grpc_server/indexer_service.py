@@ -1,10 +1,11 @@
 import logging
+import time
 from typing import Union
 
 from grpc import ServicerContext, StatusCode
 from google.protobuf.json_format import MessageToDict
 
-from primeqa.services.exceptions import ErrorMessages
+from primeqa.services.exceptions import Error, ErrorMessages
 from primeqa.services.configurations import Settings
 from primeqa.services.constants import (
     ATTR_INDEX_ID,
@@ -14,16 +15,26 @@ from primeqa.services.constants import (
     ATTR_METADATA,
     ATTR_CONFIGURATION,
     ATTR_CHECKPOINT,
+    ATTR_PROGRESS,
+    ATTR_VERSION,
+    ATTR_INDEXER,
+    ATTR_INDEXER_ID,
+    ATTR_PARAMETERS,
 )
 from primeqa.services.store import DIR_NAME_INDEX, StoreFactory
+from primeqa.services.utils import generate_id
+from primeqa.services.result_cache import RESULT_CACHE
 from primeqa.services.grpc_server.utils import (
     parse_parameter_value,
     generate_parameters,
 )
 from primeqa.services.parameters import get_parameter_type
-from primeqa.services.factories import (
-    INDEXERS_REGISTRY,
-    IndexerFactory,
+from primeqa.services.factories import INDEXERS_REGISTRY
+from primeqa.services.indexing_jobs import (
+    INDEXING_JOB_MANAGER,
+    STAGE_UPLOADING,
+    STAGE_FAILED,
+    update_index_progress,
 )
 from primeqa.services.grpc_server.grpc_generated.indexer_pb2_grpc import (
     IndexingServiceServicer,
@@ -44,6 +55,8 @@ from primeqa.services.grpc_server.grpc_generated.indexer_pb2 import (
     DOES_NOT_EXISTS,
 )
 
+PROGRESS_INTERVAL_SECS = 5
+
 
 class IndexerService(IndexingServiceServicer):
     def __init__(self, config: Settings, logger: Union[logging.Logger, None] = None):
@@ -85,137 +98,191 @@ class IndexerService(IndexingServiceServicer):
             ATTR_INDEX_ID: self._store.generate_index_uuid(),
             ATTR_STATUS: IndexStatus.INDEXING.value,
             ATTR_CONFIGURATION: {},
+            ATTR_VERSION: generate_id(),
         }
 
-        # Step 2: Iterate over all index requests to collect documents
-        documents_to_index = list()
-        instance = None
-        for request_idx, request in enumerate(request_iterator):
-            if request_idx == 0:
-                # Step 2.a: Verify requested indexer
-                try:
-                    indexer = INDEXERS_REGISTRY[request.indexer.indexer_id]
-                except KeyError:
-                    context.set_code(StatusCode.INVALID_ARGUMENT)
-                    context.set_details(
-                        ErrorMessages.INVALID_INDEXER.value.format(
-                            request.indexer.indexer_id,
-                            ", ".join(INDEXERS_REGISTRY.keys()),
-                        )
-                    )
-                    return GenerateIndexResponse()
-
-                # Step 2.b: Remove existing index if index_id is provide in the request
-                if request.index_id:
-                    self._store.delete_index(request.index_id)
-                    index_information[ATTR_INDEX_ID] = request.index_id
-
-                # Step 2.c: Load default retriever keyword arguments
-                indexer_kwargs = {
-                    k: v.default
-                    for k, v in indexer.__dataclass_fields__.items()
-                    if v.init
-                }
-
-                # Step 2.d: If parameters are provided in request then update keyword arguments used to instantiate indexer instance
-                if request.indexer.parameters:
-                    for parameter in request.indexer.parameters:
-                        if parameter.parameter_id not in indexer_kwargs:
+        # The index is claimed once its id is known and released unless a job was
+        # submitted, an index left half uploaded is marked as failed
+        claimed = False
+        submitted = False
+        error = None
+        try:
+            # Step 2: Iterate over all index requests, streaming documents to the store as they arrive
+            writer = None
+            try:
+                for request_idx, request in enumerate(request_iterator):
+                    if request_idx == 0:
+                        # Step 2.a: Verify requested indexer
+                        try:
+                            indexer = INDEXERS_REGISTRY[request.indexer.indexer_id]
+                        except KeyError:
                             context.set_code(StatusCode.INVALID_ARGUMENT)
                             context.set_details(
-                                ErrorMessages.INVALID_PARAMETER.value.format(
-                                    "indexer", parameter.parameter_id
+                                ErrorMessages.INVALID_INDEXER.value.format(
+                                    request.indexer.indexer_id,
+                                    ", ".join(INDEXERS_REGISTRY.keys()),
                                 )
                             )
                             return GenerateIndexResponse()
 
-                        indexer_kwargs[parameter.parameter_id] = parse_parameter_value(
-                            parameter,
-                            get_parameter_type(
-                                component=indexer,
-                                parameter_id=parameter.parameter_id,
-                            ),
-                        )
-                        # Process `checkpoint` parameter
-                        if parameter.parameter_id == "checkpoint":
-                            # Add `checkpoint` parameter value to index information
-                            index_information[ATTR_CONFIGURATION][
-                                ATTR_CHECKPOINT
-                            ] = indexer_kwargs["checkpoint"]
-
-                            # Re-map checkpoint kwarg to point to checkpoint file path in the service's store
-                            indexer_kwargs[
-                                "checkpoint"
-                            ] = self._store.get_checkpoint_path(
-                                indexer_kwargs["checkpoint"]
+                        # Step 2.b: Claim the index, so that a concurrent request is refused before
+                        # any document is deleted or uploaded, and remove existing index if index_id
+                        # is provide in the request
+                        if request.index_id:
+                            index_information[ATTR_INDEX_ID] = request.index_id
+
+                        try:
+                            INDEXING_JOB_MANAGER.claim(
+                                index_information[ATTR_INDEX_ID]
                             )
+                        except Error as err:
+                            context.set_code(StatusCode.FAILED_PRECONDITION)
+                            context.set_details(err.args[0])
+                            return GenerateIndexResponse()
+                        claimed = True
 
-                # Step 2.e: Update index specific arguments
-                indexer_kwargs["index_root"] = self._store.get_index_directory_path(
-                    index_information[ATTR_INDEX_ID]
-                )
-                indexer_kwargs["index_name"] = DIR_NAME_INDEX
-
-                # Step 2.e: Create indexer instance
-                try:
-                    instance = IndexerFactory.get(indexer, indexer_kwargs)
-                except (ValueError, TypeError) as err:
-                    context.set_code(StatusCode.INVALID_ARGUMENT)
-                    context.set_details(err.args[0])
-                    return GenerateIndexResponse()
-
-            # Append documents from each index request
-            documents_to_index.extend(
-                MessageToDict(request, preserving_proto_field_name=True)["documents"]
-            )
+                        if request.index_id:
+                            self._store.delete_index(request.index_id)
+                            RESULT_CACHE.invalidate_index(request.index_id)
 
-        # Step 3: Save index information
-        index_information[ATTR_CONFIGURATION][
-            ATTR_ENGINE_TYPE
-        ] = instance.get_engine_type()
-        self._store.save_index_information(
-            index_id=index_information[ATTR_INDEX_ID],
-            information=index_information,
-        )
+                        # Step 2.c: Load default retriever keyword arguments
+                        indexer_kwargs = {
+                            k: v.default
+                            for k, v in indexer.__dataclass_fields__.items()
+                            if v.init
+                        }
 
-        # Step 4: Save documents used in index
-        self._store.save_index_documents(
-            index_id=index_information[ATTR_INDEX_ID], documents=documents_to_index
-        )
+                        # Step 2.d: If parameters are provided in request then update keyword arguments used to instantiate indexer instance
+                        if request.indexer.parameters:
+                            for parameter in request.indexer.parameters:
+                                if parameter.parameter_id not in indexer_kwargs:
+                                    context.set_code(StatusCode.INVALID_ARGUMENT)
+                                    context.set_details(
+                                        ErrorMessages.INVALID_PARAMETER.value.format(
+                                            "indexer", parameter.parameter_id
+                                        )
+                                    )
+                                    return GenerateIndexResponse()
 
-        # Step 5: Kick-off async index generation
-        try:
-            instance.index(
-                self._store.get_index_documents_file_path(
-                    index_id=index_information[ATTR_INDEX_ID]
-                ),
-            )
+                                indexer_kwargs[
+                                    parameter.parameter_id
+                                ] = parse_parameter_value(
+                                    parameter,
+                                    get_parameter_type(
+                                        component=indexer,
+                                        parameter_id=parameter.parameter_id,
+                                    ),
+                                )
+                                # Process `checkpoint` parameter
+                                if parameter.parameter_id == "checkpoint":
+                                    # Add `checkpoint` parameter value to index information
+                                    index_information[ATTR_CONFIGURATION][
+                                        ATTR_CHECKPOINT
+                                    ] = indexer_kwargs["checkpoint"]
+
+                                    # Re-map checkpoint kwarg to point to checkpoint file path in the service's store
+                                    indexer_kwargs[
+                                        "checkpoint"
+                                    ] = self._store.get_checkpoint_path(
+                                        indexer_kwargs["checkpoint"]
+                                    )
+
+                        # Step 2.e: Update index specific arguments
+                        indexer_kwargs["index_root"] = self._store.get_index_directory_path(
+                            index_information[ATTR_INDEX_ID]
+                        )
+                        indexer_kwargs["index_name"] = DIR_NAME_INDEX
+
+                        # Step 2.f: Validate indexer arguments, the indexer itself is loaded by the indexing job
+                        try:
+                            instance = indexer(**indexer_kwargs)
+                        except (ValueError, TypeError) as err:
+                            context.set_code(StatusCode.INVALID_ARGUMENT)
+                            context.set_details(err.args[0])
+                            return GenerateIndexResponse()
+
+                        # Step 2.g: Save index information
+                        index_information[ATTR_CONFIGURATION][
+                            ATTR_ENGINE_TYPE
+                        ] = instance.get_engine_type()
+                        index_information[ATTR_INDEXER] = {
+                            ATTR_INDEXER_ID: indexer.__name__,
+                            ATTR_PARAMETERS: indexer_kwargs,
+                        }
+                        index_information[ATTR_PROGRESS] = {
+                            "stage": STAGE_UPLOADING,
+                            "num_documents": 0,
+                        }
+                        self._store.save_index_information(
+                            index_id=index_information[ATTR_INDEX_ID],
+                            information=index_information,
+                        )
+
+                        # Step 2.h: Open documents writer
+                        writer = self._store.get_index_documents_writer(
+                            index_id=index_information[ATTR_INDEX_ID]
+                        )
+                        last_progress_t = time.time()
 
-            # Step 5.b: Set index status to "READY" once indexing is complete
-            index_information[ATTR_STATUS] = IndexStatus.READY.value
-        except (TypeError, RuntimeError) as err:
-            index_information[ATTR_STATUS] = IndexStatus.CORRUPT.value
-            logging.exception(
-                "Generation failed for index with id=%s. Resultant index may be corrupted.",
-                index_information[ATTR_INDEX_ID],
+                    # Step 2.i: Save documents from each index request
+                    writer.add(
+                        MessageToDict(request, preserving_proto_field_name=True).get(
+                            "documents", []
+                        )
+                    )
+
+                    # Step 2.j: Periodically record upload progress
+                    if time.time() - last_progress_t > PROGRESS_INTERVAL_SECS:
+                        update_index_progress(
+                            index_information[ATTR_INDEX_ID],
+                            stage=STAGE_UPLOADING,
+                            num_documents=writer.num_documents,
+                        )
+                        last_progress_t = time.time()
+            except Exception:
+                # Step 2.k: Mark index as corrupt if the upload failed part way, e.g. the client disconnected
+                if writer is not None:
+                    writer.close()
+                    writer = None
+                    update_index_progress(
+                        index_information[ATTR_INDEX_ID],
+                        status=IndexStatus.CORRUPT.value,
+                        stage=STAGE_FAILED,
+                    )
+                raise
+            finally:
+                if writer is not None:
+                    writer.close()
+
+            if writer is None:
+                context.set_code(StatusCode.INVALID_ARGUMENT)
+                context.set_details(
+                    ErrorMessages.INVALID_REQUEST.value.format("indexer")
+                )
+                return GenerateIndexResponse()
+
+            update_index_progress(
+                index_information[ATTR_INDEX_ID], num_documents=writer.num_documents
             )
-            logging.exception(err.args[0])
 
-        self._store.save_index_information(
-            index_information[ATTR_INDEX_ID], information=index_information
-        )
+            # Step 3: Kick-off async index generation, its status is tracked in the index information
+            INDEXING_JOB_MANAGER.submit(
+                index_information[ATTR_INDEX_ID], indexer.__name__, indexer_kwargs
+            )
+            submitted = True
 
-        # Step 6: Return
-        return GenerateIndexResponse(
-            index_id=index_information[ATTR_INDEX_ID],
-            status=READY
-            if index_information[ATTR_STATUS] == IndexStatus.READY.value
-            else (
-                INDEXING
-                if index_information[ATTR_STATUS] == IndexStatus.INDEXING.value
-                else CORRUPT
-            ),
-        )
+            # Step 4: Return
+            return GenerateIndexResponse(
+                index_id=index_information[ATTR_INDEX_ID], status=INDEXING
+            )
+        except BaseException as err:
+            error = str(err) or repr(err)
+            raise
+        finally:
+            if claimed and not submitted:
+                INDEXING_JOB_MANAGER.release(
+                    index_information[ATTR_INDEX_ID], error=error
+                )
 
     def GetIndexStatus(
         self, request: GetIndexStatusRequest, context: ServicerContext
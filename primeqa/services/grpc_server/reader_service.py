@@ -17,6 +17,8 @@ from primeqa.services.factories import (
     READERS_REGISTRY,
     ReaderFactory,
 )
+from primeqa.services import batching
+from primeqa.services.result_cache import RESULT_CACHE, normalize_query
 from primeqa.services.grpc_server.grpc_generated.reader_pb2_grpc import (
     ReadingServiceServicer,
 )
@@ -137,10 +139,28 @@ class ReaderService(ReadingServiceServicer):
             if not "exclude_from_hash" in v.metadata
             or not v.metadata["exclude_from_hash"]
         ]
+        cache_arguments = {
+            "endpoint": "grpc.answers",
+            "index_id": None,
+            "index_version": None,
+            "component": reader.__name__,
+            "parameters": reader_kwargs,
+        }
         answers_response = GetAnswersResponse()
         try:
             for idx, query in enumerate(request.queries):
-                # Step 5.a: Run "apply" per query
+                # Step 5.a: Reuse cached answers for the query and its contexts
+                cache_query = [normalize_query(query), list(request.contexts[idx].texts)]
+                cached_answers = RESULT_CACHE.get_many(
+                    queries=[cache_query], **cache_arguments
+                )[0]
+                if cached_answers is not None:
+                    answers_response.query_answers.append(
+                        AnswersForQuery.FromString(cached_answers)
+                    )
+                    continue
+
+                # Step 5.b: Run "apply" per query
                 self._logger.info(
                     "Applying '%s' reader with parameters = %s for query = '%s' and contexts = %s",
                     instance.__class__.__name__,
@@ -153,7 +173,8 @@ class ReaderService(ReadingServiceServicer):
                 )
                 try:
                     if isinstance(instance, ExtractiveReader):
-                        predictions = instance.predict(
+                        predictions = batching.extractive_read(
+                            instance,
                             questions=[query] * len(request.contexts[idx].texts),
                             contexts=[[text] for text in request.contexts[idx].texts],
                             example_ids=[
@@ -171,7 +192,7 @@ class ReaderService(ReadingServiceServicer):
                             predictions,
                         )
 
-                        # Step 5.b: Add answers for current query into response object
+                        # Step 5.c: Add answers for current query into response object
                         answers_response.query_answers.append(
                             AnswersForQuery(
                                 context_answers=[
@@ -220,7 +241,7 @@ class ReaderService(ReadingServiceServicer):
                             query,
                             predictions,
                         )
-                        # Step 5.b: Add answers for current query into response object
+                        # Step 5.c: Add answers for current query into response object
                         answers_response.query_answers.append(
                             AnswersForQuery(
                                 context_answers=[
@@ -251,6 +272,15 @@ class ReaderService(ReadingServiceServicer):
                                 ]
                             )
                         )
+
+                    # Step 5.d: Cache answers for current query
+                    RESULT_CACHE.set_many(
+                        queries=[cache_query],
+                        results=[
+                            answers_response.query_answers[-1].SerializeToString()
+                        ],
+                        **cache_arguments,
+                    )
                 except AssertionError:
                     context.set_code(StatusCode.INTERNAL)
                     context.set_details(ErrorMessages.INVALID_READER_INPUT.value)
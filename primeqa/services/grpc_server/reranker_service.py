@@ -8,6 +8,7 @@ from primeqa.services.configurations import Settings
 from primeqa.services.parameters import get_parameter_type
 
 from primeqa.services.factories import RERANKERS_REGISTRY, RerankerFactory
+from primeqa.services import batching
 from primeqa.services.grpc_server.utils import (
     parse_parameter_value,
     generate_parameters,
@@ -147,7 +148,9 @@ class RerankerService(RerankerServiceServicer):
             queries = request_dict["queries"]
             documentsperquery = [queryhits["hits"] for queryhits in request_dict["hitsperquery"]]
 
-            results = instance.predict(queries=queries, documents=documentsperquery, **reranker_kwargs)
+            results = batching.rerank(
+                instance, queries=queries, documents=documentsperquery, **reranker_kwargs
+            )
             
             self._logger.info(
                 "Applying '%s' reranker for queries = %s returns results = %s",
@@ -10,6 +10,8 @@ from primeqa.services.constants import (
     ATTR_CONFIGURATION,
     ATTR_ENGINE_TYPE,
     ATTR_CHECKPOINT,
+    ATTR_DENSE_INDEX_ID,
+    ATTR_VERSION,
     IndexStatus,
 )
 from primeqa.services.factories import RETRIEVERS_REGISTRY, RetrieverFactory
@@ -17,6 +19,8 @@ from primeqa.services.grpc_server.utils import (
     parse_parameter_value,
     generate_parameters,
 )
+from primeqa.services import batching
+from primeqa.services.result_cache import RESULT_CACHE
 from primeqa.services.store import DIR_NAME_INDEX, StoreFactory
 from primeqa.services.exceptions import ErrorMessages
 from primeqa.services.grpc_server.grpc_generated.retriever_pb2_grpc import (
@@ -170,77 +174,194 @@ class RetrieverService(RetrievingServiceServicer):
         retriever_kwargs["collection"] = self._store.get_index_documents_file_path(
             index_id=request.index_id
         )
-        if ATTR_CHECKPOINT in retriever_kwargs:
+        index_ids = [request.index_id]
+        index_version = [index_information.get(ATTR_VERSION)]
+        if ATTR_DENSE_INDEX_ID in retriever_kwargs:
+            # Step 5.a: Hybrid retrievers also search a dense index
+            dense_index_id = retriever_kwargs[ATTR_DENSE_INDEX_ID]
+            if not dense_index_id:
+                context.set_code(StatusCode.INVALID_ARGUMENT)
+                context.set_details(
+                    ErrorMessages.INVALID_REQUEST.value.format(ATTR_DENSE_INDEX_ID)
+                )
+                return RetrieveResponse()
+            if not self._store.exists(self._store.get_index_directory_path(dense_index_id)):
+                context.set_code(StatusCode.NOT_FOUND)
+                context.set_details(
+                    ErrorMessages.FAILED_TO_LOCATE_INDEX.value.format(dense_index_id)
+                )
+                return RetrieveResponse()
+            dense_index_information = self._store.get_index_information(
+                index_id=dense_index_id
+            )
+            if dense_index_information[ATTR_STATUS] != IndexStatus.READY.value:
+                context.set_code(StatusCode.INVALID_ARGUMENT)
+                context.set_details(
+                    ErrorMessages.INDEX_UNAVAILABLE_FOR_QUERYING.value.format(
+                        dense_index_information[ATTR_STATUS]
+                    )
+                )
+                return RetrieveResponse()
+
+            # Rankings are fused on document ids, which only match if both indexes have the same documents
+            if self._store.get_index_documents_checksum(
+                request.index_id
+            ) != self._store.get_index_documents_checksum(dense_index_id):
+                context.set_code(StatusCode.INVALID_ARGUMENT)
+                context.set_details(
+                    ErrorMessages.MISMATCHED_INDEX_DOCUMENTS.value.format(
+                        request.index_id, dense_index_id
+                    )
+                )
+                return RetrieveResponse()
+
+            retriever_kwargs["dense_index_root"] = self._store.get_index_directory_path(
+                dense_index_id
+            )
+            retriever_kwargs["dense_index_name"] = DIR_NAME_INDEX
+            retriever_kwargs["dense_engine_type"] = dense_index_information[
+                ATTR_CONFIGURATION
+            ][ATTR_ENGINE_TYPE]
+            index_ids.append(dense_index_id)
+            index_version.append(dense_index_information.get(ATTR_VERSION))
+            if ATTR_CHECKPOINT in dense_index_information[ATTR_CONFIGURATION]:
+                retriever_kwargs[ATTR_CHECKPOINT] = self._store.get_checkpoint_path(
+                    dense_index_information[ATTR_CONFIGURATION][ATTR_CHECKPOINT]
+                )
+        elif ATTR_CHECKPOINT in retriever_kwargs:
             retriever_kwargs[ATTR_CHECKPOINT] = self._store.get_checkpoint_path(
                 index_information[ATTR_CONFIGURATION][ATTR_CHECKPOINT]
             )
 
-        # Step 6: Create retriever instance
-        try:
-            instance = RetrieverFactory.get(retriever, retriever_kwargs)
-        except (ValueError, TypeError) as err:
-            context.set_code(StatusCode.INVALID_ARGUMENT)
-            context.set_details(err.args[0])
-            return RetrieveResponse()
-
-        # Step 7: Retrieve
-        instance_fields = [
-            k
-            for k, v in instance.__class__.__dataclass_fields__.items()
-            if not "exclude_from_hash" in v.metadata
-            or not v.metadata["exclude_from_hash"]
-        ]
-        self._logger.info(
-            "Applying '%s' retriever with parameters = %s for queries = %s",
-            instance.__class__.__name__,
-            {
-                k: getattr(instance, k) if k in instance_fields else v
-                for k, v in retriever_kwargs.items()
-            },
-            request.queries,
+        # Step 6: Look up cached hits, only queries without cached hits are retrieved
+        cache_arguments = {
+            "endpoint": "retrieve",
+            "index_id": request.index_id,
+            "index_version": index_version,
+            "component": retriever.__name__,
+            "parameters": retriever_kwargs,
+        }
+        cached_hits = RESULT_CACHE.get_many(
+            queries=list(request.queries), **cache_arguments
         )
-        try:
-            results = instance.predict(input_texts=request.queries, **retriever_kwargs)
+        queries = [
+            query
+            for query, hits_per_query in zip(request.queries, cached_hits)
+            if hits_per_query is None
+        ]
+
+        retrieved_hits = []
+        if queries:
+            # Step 7: Create retriever instance
+            try:
+                instance = RetrieverFactory.get(
+                    retriever,
+                    retriever_kwargs,
+                    index_ids=tuple(index_ids),
+                    index_version=tuple(index_version),
+                )
+            except (ValueError, TypeError) as err:
+                context.set_code(StatusCode.INVALID_ARGUMENT)
+                context.set_details(err.args[0])
+                return RetrieveResponse()
+
+            # Step 8: Retrieve
+            instance_fields = [
+                k
+                for k, v in instance.__class__.__dataclass_fields__.items()
+                if not "exclude_from_hash" in v.metadata
+                or not v.metadata["exclude_from_hash"]
+            ]
             self._logger.info(
-                "Applying '%s' retriever for queries = %s returns results = %s",
+                "Applying '%s' retriever with parameters = %s for queries = %s",
                 instance.__class__.__name__,
-                request.queries,
-                results,
+                {
+                    k: getattr(instance, k) if k in instance_fields else v
+                    for k, v in retriever_kwargs.items()
+                },
+                queries,
             )
-        except TypeError:
-            context.set_code(StatusCode.INTERNAL)
-            context.set_details(
-                ErrorMessages.FAILED_TO_INITIALIZE.value.format(
-                    f"{retriever.retriever_id} retriever"
+            try:
+                results = batching.retrieve(
+                    instance, input_texts=queries, **retriever_kwargs
                 )
-            )
-            return RetrieveResponse()
-
-        hits = []
-        for result_per_query in results:
-            hits_per_query = []
-            for hit in result_per_query:
-                try:
-                    document = self._store.get_index_document(
-                        index_id=request.index_id, document_idx=hit[0]
+                self._logger.info(
+                    "Applying '%s' retriever for queries = %s returns results = %s",
+                    instance.__class__.__name__,
+                    queries,
+                    results,
+                )
+            except TypeError:
+                context.set_code(StatusCode.INTERNAL)
+                context.set_details(
+                    ErrorMessages.FAILED_TO_INITIALIZE.value.format(
+                        f"{retriever.retriever_id} retriever"
                     )
+                )
+                return RetrieveResponse()
+
+            # Step 9: Fetch documents of all hits of all queries at once
+            try:
+                documents = self._store.get_index_documents(
+                    index_id=request.index_id,
+                    document_ids=[
+                        hit[0]
+                        for result_per_query in results
+                        for hit in result_per_query
+                    ],
+                )
+            except FileNotFoundError:
+                documents = [
+                    None for result_per_query in results for hit in result_per_query
+                ]
+
+            documents_iterator = iter(documents)
+            for result_per_query in results:
+                hits_per_query = []
+                for hit in result_per_query:
+                    document = next(documents_iterator)
+                    if document is None:
+                        continue
+
                     hits_per_query.append(
-                        Hit(
-                            document=Document(
-                                text=document["text"],
-                                document_id=document["document_id"]
+                        {
+                            "document": {
+                                "text": document["text"],
+                                "document_id": document["document_id"]
                                 if "document_id" in document
                                 else None,
-                                title=document["title"]
+                                "title": document["title"]
                                 if "title" in document
                                 else None,
-                            ),
-                            score=hit[1],
-                        )
+                            },
+                            "score": hit[1],
+                        }
                     )
-                except (FileNotFoundError, KeyError):
-                    continue
 
-            hits.append(HitPerQuery(hits=hits_per_query))
+                retrieved_hits.append(hits_per_query)
+
+            # Step 10: Cache retrieved hits
+            RESULT_CACHE.set_many(
+                queries=queries, results=retrieved_hits, **cache_arguments
+            )
+
+        # Step 11: Return
+        hits = []
+        retrieved_hits_iterator = iter(retrieved_hits)
+        for hits_per_query in cached_hits:
+            if hits_per_query is None:
+                hits_per_query = next(retrieved_hits_iterator)
+
+            hits.append(
+                HitPerQuery(
+                    hits=[
+                        Hit(
+                            document=Document(**hit["document"]),
+                            score=hit["score"],
+                        )
+                        for hit in hits_per_query
+                    ]
+                )
+            )
 
         return RetrieveResponse(hits=hits)
@@ -1,10 +1,16 @@
 import logging
+import signal
 import time
 from concurrent import futures
 
 import grpc
 
 from primeqa.services.configurations import Settings
+from primeqa.services.instance_manager import INSTANCE_MANAGER
+from primeqa.services.indexing_jobs import INDEXING_JOB_MANAGER
+from primeqa.services.batching import BATCHERS
+from primeqa.services.result_cache import RESULT_CACHE
+from primeqa.services.prefork import preload_indexes, run_workers
 from primeqa.services.cred_helpers import get_grpc_server_credentials
 from primeqa.services.grpc_server.grpc_generated import reader_pb2_grpc
 from primeqa.services.grpc_server.grpc_generated import retriever_pb2_grpc
@@ -30,11 +36,52 @@ class GrpcServer:
                 self._config = Settings()
             else:
                 self._config = config
+
+            # Bound the cache of loaded readers, retrievers, indexers and rerankers
+            INSTANCE_MANAGER.configure(
+                max_instances=self._config.max_cached_instances,
+                max_memory_bytes=self._config.max_cached_instances_memory_mb * 2**20,
+                max_rss_bytes=self._config.max_process_rss_mb * 2**20,
+            )
+
+            # Index generation runs in background worker processes
+            INDEXING_JOB_MANAGER.configure(
+                max_workers=self._config.num_indexing_workers
+            )
+
+            # Coalesce concurrent reader, retriever and reranker requests into batched predict calls
+            BATCHERS.configure(
+                max_batch_size=self._config.micro_batching_max_batch_size,
+                max_wait_ms=self._config.micro_batching_max_wait_ms,
+            )
+
+            # Cache retrieve and answer results per query
+            RESULT_CACHE.configure(
+                max_memory_bytes=self._config.result_cache_max_memory_mb * 2**20,
+                ttl_secs=self._config.result_cache_ttl_secs,
+                cache_dir=self._config.result_cache_dir,
+                max_disk_entries=self._config.result_cache_max_disk_entries,
+            )
         except Exception as ex:
             self._logger.exception("Error configuring server: %s", ex)
             raise
 
     def run(self) -> None:
+        # Load indexes before forking workers, so that workers share them copy-on-write
+        preload_index_ids = [
+            index_id for index_id in self._config.preload_index_ids if index_id
+        ]
+        if preload_index_ids:
+            self._logger.info(
+                "Preloaded %d indexes",
+                preload_indexes(preload_index_ids, logger=self._logger),
+            )
+
+        run_workers(
+            self._serve, self._config.num_grpc_server_workers, logger=self._logger
+        )
+
+    def _serve(self, worker_idx: int) -> None:
         start_t = time.time()
 
         # Set server options
@@ -46,9 +93,12 @@ class GrpcServer:
             "grpc.max_connection_age_grace_ms",
             self._config.grpc_max_connection_age_grace_secs * 1000,
         )
+        # Worker processes accept connections on the same port
+        so_reuseport_option = ("grpc.so_reuseport", 1)
         server_options = (
             max_conn_age_option,
             max_conn_age_grace_option,
+            so_reuseport_option,
         )
         # Start gRPC server instances
         try:
@@ -92,10 +142,19 @@ class GrpcServer:
             # Start server
             server.start()
             self._logger.info(
-                "Server instance started on port %s - initialization took %d seconds",
+                "Server instance %d started on port %s - initialization took %d seconds",
+                worker_idx,
                 self._config.grpc_port,
                 time.time() - start_t,
             )
+
+            # Finish in-flight requests on SIGTERM
+            signal.signal(
+                signal.SIGTERM,
+                lambda signum, frame: server.stop(
+                    self._config.grpc_max_connection_age_grace_secs
+                ),
+            )
             server.wait_for_termination()
         except Exception as ex:
             self._logger.exception("Error starting server: %s", ex)
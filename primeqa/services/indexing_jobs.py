@@ -0,0 +1,413 @@
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List
+
+from primeqa.services.constants import (
+    ATTR_STATUS,
+    ATTR_PROGRESS,
+    ATTR_VERSION,
+    IndexStatus,
+)
+from primeqa.services.exceptions import Error, ErrorMessages
+from primeqa.services.instance_manager import INSTANCE_MANAGER
+from primeqa.services.result_cache import RESULT_CACHE
+from primeqa.services.store import StoreFactory
+from primeqa.services.utils import generate_id
+
+STAGE_UPLOADING = "uploading"
+STAGE_QUEUED = "queued"
+STAGE_INDEXING = "indexing"
+STAGE_UPDATING = "updating"
+STAGE_COMPACTING = "compacting"
+STAGE_DONE = "done"
+STAGE_FAILED = "failed"
+
+
+def update_index_progress(
+    index_id: str, status: str = None, version: str = None, **progress
+) -> dict:
+    """
+    Update the status and progress recorded in an index's `information.json`. The server and the
+    indexing worker processes both update it, so it is read and saved under the index information lock.
+
+    Parameters
+    ----------
+    index_id: str
+        unique identifier for the index.
+    status: str
+        new index status, unchanged if None
+    version: str
+        new index version, unchanged if None
+    progress:
+        progress fields to set, e.g. stage and num_documents
+
+    Returns
+    -------
+    dict:
+        updated index information.
+
+    """
+    store = StoreFactory.get_store()
+    with store.get_index_information_lock(index_id):
+        index_information = store.get_index_information(index_id=index_id)
+        if status is not None:
+            index_information[ATTR_STATUS] = status
+        if version is not None:
+            index_information[ATTR_VERSION] = version
+        index_information.setdefault(ATTR_PROGRESS, {}).update(
+            progress, updated_at=time.time()
+        )
+        store.save_index_information(index_id=index_id, information=index_information)
+    return index_information
+
+
+def run_indexing_job(index_id: str, indexer_id: str, indexer_kwargs: dict) -> str:
+    """
+    Build an index from the documents already saved in the store. Runs in a worker process.
+
+    Parameters
+    ----------
+    index_id: str
+        unique identifier for the index.
+    indexer_id: str
+        name of the indexer in the indexers registry
+    indexer_kwargs: dict
+        keyword arguments to instantiate the indexer
+
+    Returns
+    -------
+    str:
+        final index status.
+
+    """
+    # Imported here, the parent process only needs the registry names
+    from primeqa.services.factories import INDEXERS_REGISTRY, IndexerFactory
+
+    store = StoreFactory.get_store()
+    start_t = time.time()
+    update_index_progress(index_id, stage=STAGE_INDEXING, started_at=start_t)
+
+    try:
+        instance = IndexerFactory.get(INDEXERS_REGISTRY[indexer_id], indexer_kwargs)
+        instance.index(store.get_index_documents_file_path(index_id=index_id))
+    except Exception as err:
+        logging.exception(
+            "Generation failed for index with id=%s. Resultant index may be corrupted.",
+            index_id,
+        )
+        update_index_progress(
+            index_id,
+            status=IndexStatus.CORRUPT.value,
+            stage=STAGE_FAILED,
+            error=str(err),
+            indexing_seconds=time.time() - start_t,
+        )
+        return IndexStatus.CORRUPT.value
+
+    update_index_progress(
+        index_id,
+        status=IndexStatus.READY.value,
+        stage=STAGE_DONE,
+        indexing_seconds=time.time() - start_t,
+    )
+    return IndexStatus.READY.value
+
+
+def run_index_update_job(
+    index_id: str,
+    indexer_id: str,
+    indexer_kwargs: dict,
+    deleted_document_ids: List[str],
+    compact: bool = False,
+) -> str:
+    """
+    Update an index in place: delete documents, index the documents appended to the store since
+    the last update and optionally compact the index. Runs in a worker process.
+
+    The index stays queryable while documents are deleted and added. It is not while it is compacted,
+    since chunks are then rewritten in place. Its version changes once the update is done, so that
+    retrievers are reloaded and cached results are not reused.
+
+    Parameters
+    ----------
+    index_id: str
+        unique identifier for the index.
+    indexer_id: str
+        name of the indexer in the indexers registry
+    indexer_kwargs: dict
+        keyword arguments the indexer was instantiated with to generate the index
+    deleted_document_ids: List[str]
+        ids of the documents to delete, as returned by the retrievers
+    compact: bool
+        reclaim the space of deleted documents
+
+    Returns
+    -------
+    str:
+        final index status.
+
+    """
+    # Imported here, the parent process only needs the registry names
+    from primeqa.services.factories import INDEXERS_REGISTRY, IndexerFactory
+
+    store = StoreFactory.get_store()
+    start_t = time.time()
+    update_index_progress(index_id, stage=STAGE_UPDATING, started_at=start_t)
+
+    try:
+        instance = IndexerFactory.get(INDEXERS_REGISTRY[indexer_id], indexer_kwargs)
+        if deleted_document_ids:
+            instance.delete(deleted_document_ids)
+        instance.add(store.get_index_documents_file_path(index_id=index_id))
+        if compact:
+            update_index_progress(
+                index_id, status=IndexStatus.INDEXING.value, stage=STAGE_COMPACTING
+            )
+            instance.compact()
+    except Exception as err:
+        logging.exception(
+            "Update failed for index with id=%s. Resultant index may be corrupted.",
+            index_id,
+        )
+        update_index_progress(
+            index_id,
+            status=IndexStatus.CORRUPT.value,
+            stage=STAGE_FAILED,
+            error=str(err),
+            indexing_seconds=time.time() - start_t,
+        )
+        return IndexStatus.CORRUPT.value
+
+    update_index_progress(
+        index_id,
+        status=IndexStatus.READY.value,
+        version=generate_id(),
+        stage=STAGE_DONE,
+        indexing_seconds=time.time() - start_t,
+    )
+    return IndexStatus.READY.value
+
+
+class IndexingJobManager:
+    """
+    Queue of index generation jobs, run by a pool of worker processes so that index builds neither
+    block the request handler threads nor compete with queries for the server process's GIL.
+
+    Job status and progress are recorded in the index's `information.json`, jobs are queued in
+    submission order once all worker processes are busy. A job marker in the store keeps server
+    processes sharing it from running jobs on the same index concurrently. Request handlers claim
+    the index with `claim` before they delete or upload its documents, so that a concurrent request
+    is refused before it touches them.
+    """
+
+    def __init__(self, max_workers: int = 1, logger: logging.Logger = None):
+        if logger is None:
+            self._logger = logging.getLogger(self.__class__.__name__)
+        else:
+            self._logger = logger
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._jobs = {}
+        self._claims = set()
+        self.max_workers = max_workers
+
+    def configure(self, max_workers: int = 1) -> None:
+        with self._lock:
+            self.max_workers = max_workers
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # must hold self._lock
+        if self._executor is None:
+            # Workers are spawned, forking a server process with running threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def claim(self, index_id: str) -> None:
+        """
+        Reserve an index for a job about to be submitted. Raises an `Error` if a job on the index is
+        already claimed, queued or running, in this or another server process.
+
+        Parameters
+        ----------
+        index_id: str
+            unique identifier for the index.
+
+        """
+        with self._lock:
+            if (
+                index_id in self._jobs
+                or index_id in self._claims
+                or not StoreFactory.get_store().claim_index_job(index_id)
+            ):
+                raise Error(
+                    ErrorMessages.INDEX_GENERATION_IN_PROGRESS.value.format(index_id)
+                )
+            self._claims.add(index_id)
+
+    def release(self, index_id: str, error: str = None) -> None:
+        """
+        Give up a claimed index without submitting a job, e.g. when its documents failed to upload.
+
+        Parameters
+        ----------
+        index_id: str
+            unique identifier for the index.
+        error: str
+            if set, the index is marked as failed with this error
+
+        """
+        if error is not None:
+            try:
+                update_index_progress(
+                    index_id,
+                    status=IndexStatus.CORRUPT.value,
+                    stage=STAGE_FAILED,
+                    error=error,
+                )
+            except FileNotFoundError:
+                pass
+
+        with self._lock:
+            self._claims.discard(index_id)
+        StoreFactory.get_store().release_index_job(index_id)
+
+    def submit(self, index_id: str, indexer_id: str, indexer_kwargs: dict) -> Future:
+        """
+        Queue index generation for an index whose documents are saved in the store. The index is
+        claimed first unless the caller already did, see `claim`.
+
+        Parameters
+        ----------
+        index_id: str
+            unique identifier for the index.
+        indexer_id: str
+            name of the indexer in the indexers registry
+        indexer_kwargs: dict
+            keyword arguments to instantiate the indexer
+
+        Returns
+        -------
+        Future:
+            resolves to the final index status.
+
+        """
+        return self._submit(index_id, run_indexing_job, indexer_id, indexer_kwargs)
+
+    def submit_update(
+        self,
+        index_id: str,
+        indexer_id: str,
+        indexer_kwargs: dict,
+        deleted_document_ids: List[str],
+        compact: bool = False,
+    ) -> Future:
+        """
+        Queue the update of a generated index, see `run_index_update_job`. Once it is done, the
+        retrievers and cached results of the index are dropped from this process.
+
+        Returns
+        -------
+        Future:
+            resolves to the final index status.
+
+        """
+        future = self._submit(
+            index_id,
+            run_index_update_job,
+            indexer_id,
+            indexer_kwargs,
+            deleted_document_ids,
+            compact,
+        )
+        future.add_done_callback(lambda f: self._invalidate(index_id))
+        return future
+
+    def _invalidate(self, index_id: str) -> None:
+        # Retrievers are cached under the ids of the indexes they search, see RetrieverFactory.get
+        INSTANCE_MANAGER.remove_where(
+            lambda key: key[0] == "RetrieverFactory" and index_id in key[2]
+        )
+        RESULT_CACHE.invalidate_index(index_id)
+
+    def _submit(self, index_id: str, fn: Callable[..., str], *args) -> Future:
+        with self._lock:
+            claimed = index_id in self._claims
+        if not claimed:
+            self.claim(index_id)
+
+        try:
+            update_index_progress(index_id, stage=STAGE_QUEUED, queued_at=time.time())
+
+            with self._lock:
+                try:
+                    future = self._get_executor().submit(fn, index_id, *args)
+                except BrokenProcessPool:
+                    # A worker died, e.g. killed for running out of memory, start a new pool
+                    self._executor = None
+                    future = self._get_executor().submit(fn, index_id, *args)
+                self._jobs[index_id] = future
+                self._claims.discard(index_id)
+        except BaseException:
+            # A claim of the caller is released by the caller
+            if not claimed:
+                self.release(index_id)
+            raise
+
+        self._logger.info("Queued %s for index with id=%s", fn.__name__, index_id)
+        future.add_done_callback(lambda f: self._on_done(index_id, f))
+        return future
+
+    def _on_done(self, index_id: str, future: Future) -> None:
+        with self._lock:
+            if self._jobs.get(index_id) is future:
+                del self._jobs[index_id]
+
+        if future.cancelled() or future.exception() is not None:
+            # The worker did not get to record the outcome
+            error = "cancelled" if future.cancelled() else str(future.exception())
+            self._logger.error(
+                "Generation failed for index with id=%s: %s", index_id, error
+            )
+            try:
+                update_index_progress(
+                    index_id,
+                    status=IndexStatus.CORRUPT.value,
+                    stage=STAGE_FAILED,
+                    error=error,
+                )
+            except FileNotFoundError:
+                pass
+        else:
+            self._logger.info(
+                "Index generation finished for index with id=%s with status %s",
+                index_id,
+                future.result(),
+            )
+
+        StoreFactory.get_store().release_index_job(index_id)
+
+    def is_running(self, index_id: str) -> bool:
+        """
+        Whether a job on the index is queued or running, in this or another server process.
+        """
+        with self._lock:
+            if index_id in self._jobs or index_id in self._claims:
+                return True
+        return StoreFactory.get_store().is_index_job_claimed(index_id)
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+
+INDEXING_JOB_MANAGER = IndexingJobManager()
@@ -0,0 +1,301 @@
+import gc
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+import numpy as np
+import psutil
+
+try:
+    import torch
+except ImportError:  # pragma: no cover
+    torch = None
+
+
+def get_process_rss() -> int:
+    """
+    Resident set size of the current process in bytes.
+    """
+    return psutil.Process().memory_info().rss
+
+
+def estimate_size(instance: Any, max_depth: int = 5) -> int:
+    """
+    Estimate the bytes held by an instance: the parameters and buffers of its torch modules,
+    and its in-memory tensors and arrays. Memory-mapped arrays are not counted, their pages
+    belong to the page cache.
+
+    Parameters
+    ----------
+    instance: Any
+        loaded component instance
+    max_depth: int
+        how deep to follow attributes, lists and dicts (default: 5)
+
+    Returns
+    -------
+    int:
+        estimated size in bytes
+    """
+    seen = set()
+    size = 0
+    pending = [(instance, 0)]
+    while pending:
+        obj, depth = pending.pop()
+        if id(obj) in seen or depth > max_depth:
+            continue
+        seen.add(id(obj))
+
+        if torch is not None and isinstance(obj, torch.nn.Module):
+            for tensor in list(obj.parameters()) + list(obj.buffers()):
+                if id(tensor) not in seen:
+                    seen.add(id(tensor))
+                    size += tensor.nelement() * tensor.element_size()
+        elif torch is not None and isinstance(obj, torch.Tensor):
+            size += obj.nelement() * obj.element_size()
+        elif isinstance(obj, np.ndarray):
+            if not isinstance(obj, np.memmap) and not isinstance(obj.base, np.memmap):
+                size += obj.nbytes
+        elif isinstance(obj, dict):
+            pending.extend((value, depth + 1) for value in obj.values())
+        elif isinstance(obj, (list, tuple, set)):
+            pending.extend((value, depth + 1) for value in obj)
+        elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+            pending.extend((value, depth + 1) for value in vars(obj).values())
+    return size
+
+
+class _Entry:
+    __slots__ = "instance", "name", "size", "load_seconds", "hits", "last_used"
+
+    def __init__(self, instance: Any, name: str, size: int, load_seconds: float):
+        self.instance = instance
+        self.name = name
+        self.size = size
+        self.load_seconds = load_seconds
+        self.hits = 0
+        self.last_used = time.time()
+
+
+class InstanceManager:
+    """
+    Cache of loaded component instances shared by the factories.
+
+    - Instances are evicted in least recently used order once more than `max_instances` are loaded,
+      their estimated sizes add up to more than `max_memory_bytes`, or the process RSS exceeds
+      `max_rss_bytes` (0 disables a limit). The most recently used instance is never evicted.
+      Evicted instances are collected without holding the lock of the cache.
+    - Each key has its own load lock, so concurrent requests for an instance that is being loaded wait
+      for that single load, while instances with other keys load in parallel.
+    - Hits, misses, loads, evictions and load times are available from `metrics()`.
+    """
+
+    def __init__(
+        self,
+        max_instances: int = 0,
+        max_memory_bytes: int = 0,
+        max_rss_bytes: int = 0,
+        logger: logging.Logger = None,
+    ):
+        if logger is None:
+            self._logger = logging.getLogger(self.__class__.__name__)
+        else:
+            self._logger = logger
+
+        self._lock = threading.RLock()
+        self._load_locks = {}
+        self._instances = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._loads = 0
+        self._load_failures = 0
+        self._evictions = 0
+        self._load_seconds = 0.0
+        self.configure(max_instances, max_memory_bytes, max_rss_bytes)
+
+    def configure(
+        self, max_instances: int = 0, max_memory_bytes: int = 0, max_rss_bytes: int = 0
+    ) -> None:
+        with self._lock:
+            self.max_instances = max_instances
+            self.max_memory_bytes = max_memory_bytes
+            self.max_rss_bytes = max_rss_bytes
+        self._evict()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._instances
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._instances)
+
+    def _lookup(self, key: Hashable):
+        # must hold self._lock
+        entry = self._instances.get(key)
+        if entry is not None:
+            self._instances.move_to_end(key)
+            entry.hits += 1
+            entry.last_used = time.time()
+            self._hits += 1
+        return entry
+
+    def get(self, key: Hashable, load: Callable[[], Any], name: str = "") -> Any:
+        """
+        Return the instance cached for key, calling `load` to create it if it is not cached.
+
+        Parameters
+        ----------
+        key: Hashable
+            unique key of the instance
+        load: Callable[[], Any]
+            creates and loads the instance, exceptions are propagated to all waiting callers
+        name: str
+            name used in logs and metrics
+
+        Returns
+        -------
+        Any:
+            the loaded instance
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                return entry.instance
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            # Another caller may have loaded the instance while this one was waiting
+            with self._lock:
+                entry = self._lookup(key)
+                if entry is not None:
+                    return entry.instance
+                self._misses += 1
+
+            start_t = time.time()
+            try:
+                instance = load()
+            except Exception:
+                with self._lock:
+                    self._load_failures += 1
+                    # Callers waiting on the lock try loading again, later ones start from a new lock
+                    if self._load_locks.get(key) is load_lock:
+                        del self._load_locks[key]
+                raise
+            load_seconds = time.time() - start_t
+
+            size = estimate_size(instance)
+            with self._lock:
+                self._loads += 1
+                self._load_seconds += load_seconds
+                self._instances[key] = _Entry(instance, name, size, load_seconds)
+
+        self._evict()
+
+        self._logger.info(
+            "Loaded '%s' in %.2f seconds, estimated size %.1f MB, %d instances cached",
+            name,
+            load_seconds,
+            size / 2**20,
+            len(self._instances),
+        )
+        return instance
+
+    def _over_limits(self) -> bool:
+        # must hold self._lock
+        if self.max_instances and len(self._instances) > self.max_instances:
+            return True
+        if (
+            self.max_memory_bytes
+            and sum(entry.size for entry in self._instances.values())
+            > self.max_memory_bytes
+        ):
+            return True
+        if self.max_rss_bytes and get_process_rss() > self.max_rss_bytes:
+            return True
+        return False
+
+    def _evict(self) -> None:
+        # must not hold self._lock, evicted instances are collected without blocking the other callers
+        evicted = False
+        while True:
+            with self._lock:
+                if len(self._instances) <= 1 or not self._over_limits():
+                    break
+                key, entry = self._instances.popitem(last=False)
+                self._load_locks.pop(key, None)
+                self._evictions += 1
+            evicted = True
+            self._logger.info(
+                "Evicted '%s' (estimated size %.1f MB, %d hits)",
+                entry.name,
+                entry.size / 2**20,
+                entry.hits,
+            )
+            del entry
+
+            # The RSS only drops once the evicted instance is collected, check again after collecting
+            if self.max_rss_bytes:
+                gc.collect()
+
+        if evicted:
+            # Release the memory of the evicted instances, requests still using them keep them alive
+            gc.collect()
+            if torch is not None and torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    def remove(self, key: Hashable) -> None:
+        with self._lock:
+            if self._instances.pop(key, None) is not None:
+                self._load_locks.pop(key, None)
+
+    def remove_where(self, predicate: Callable[[Hashable], bool]) -> None:
+        """
+        Remove the instances whose key matches predicate, e.g. those loaded from an index which was updated.
+        """
+        with self._lock:
+            for key in [key for key in self._instances if predicate(key)]:
+                del self._instances[key]
+                self._load_locks.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._instances.clear()
+            self._load_locks.clear()
+
+    def metrics(self) -> dict:
+        """
+        Cache metrics: hit and miss counts, load counts and times, and the cached instances.
+
+        Returns
+        -------
+        dict:
+            metrics, instances are listed from least to most recently used
+        """
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "loads": self._loads,
+                "load_failures": self._load_failures,
+                "evictions": self._evictions,
+                "total_load_seconds": self._load_seconds,
+                "cached_instances": len(self._instances),
+                "cached_bytes": sum(entry.size for entry in self._instances.values()),
+                "process_rss_bytes": get_process_rss(),
+                "instances": [
+                    {
+                        "name": entry.name,
+                        "size_bytes": entry.size,
+                        "load_seconds": entry.load_seconds,
+                        "hits": entry.hits,
+                        "last_used": entry.last_used,
+                    }
+                    for entry in self._instances.values()
+                ],
+            }
+
+
+INSTANCE_MANAGER = InstanceManager()
@@ -0,0 +1,233 @@
+import gc
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from typing import Callable, List
+
+from primeqa.services.constants import (
+    ATTR_STATUS,
+    ATTR_CONFIGURATION,
+    ATTR_ENGINE_TYPE,
+    ATTR_CHECKPOINT,
+    ATTR_DENSE_INDEX_ID,
+    ATTR_VERSION,
+    IndexStatus,
+)
+from primeqa.services.store import DIR_NAME_INDEX, StoreFactory
+from primeqa.services.factories import RETRIEVERS_REGISTRY, RetrieverFactory
+
+# Seconds to wait for workers to exit after they were asked to stop
+WORKER_SHUTDOWN_TIMEOUT_SECS = 30
+
+# Minimum seconds between restarts of a crashed worker
+WORKER_RESTART_DELAY_SECS = 1
+
+
+def _uses_jvm(engine_type: str, index_root: str) -> bool:
+    # Pyserini BM25 indexes are searched through a JVM, which does not survive a fork
+    if engine_type != "BM25":
+        return False
+
+    from primeqa.ir.sparse.native_bm25 import native_index_exists
+
+    return not native_index_exists(os.path.join(index_root, DIR_NAME_INDEX))
+
+
+def preload_indexes(index_ids: List[str], logger: logging.Logger = None) -> int:
+    """
+    Load the default retriever of each index, so that workers forked afterwards share the loaded
+    models and indexes copy-on-write instead of each loading their own copy. Only models loaded on
+    the CPU can be shared, see `run_workers`.
+
+    Parameters
+    ----------
+    index_ids: List[str]
+        ids of the indexes to preload, "*" preloads all READY indexes
+    logger: logging.Logger
+        logger
+
+    Returns
+    -------
+    int:
+        number of preloaded indexes.
+
+    """
+    if logger is None:
+        logger = logging.getLogger(__name__)
+
+    store = StoreFactory.get_store()
+    if "*" in index_ids:
+        index_ids = store.get_index_ids()
+
+    num_preloaded = 0
+    for index_id in index_ids:
+        try:
+            index_information = store.get_index_information(index_id=index_id)
+        except FileNotFoundError:
+            logger.warning("Skipping preload of unknown index with id=%s", index_id)
+            continue
+
+        if index_information.get(ATTR_STATUS) != IndexStatus.READY.value:
+            continue
+
+        engine_type = index_information[ATTR_CONFIGURATION][ATTR_ENGINE_TYPE]
+        index_root = store.get_index_directory_path(index_id)
+        if _uses_jvm(engine_type, index_root):
+            logger.info(
+                "Skipping preload of index with id=%s, its engine cannot be shared by forked workers",
+                index_id,
+            )
+            continue
+
+        # Build the same keyword arguments as a retrieve request with default parameters
+        retrievers = [
+            retriever
+            for retriever in RETRIEVERS_REGISTRY.values()
+            if retriever.get_engine_type() == engine_type
+            and ATTR_DENSE_INDEX_ID not in retriever.__dataclass_fields__
+        ]
+        if not retrievers:
+            continue
+        retriever = retrievers[0]
+        retriever_kwargs = {
+            k: v.default for k, v in retriever.__dataclass_fields__.items() if v.init
+        }
+        retriever_kwargs["index_root"] = index_root
+        retriever_kwargs["index_name"] = DIR_NAME_INDEX
+        retriever_kwargs["collection"] = store.get_index_documents_file_path(
+            index_id=index_id
+        )
+        if (
+            ATTR_CHECKPOINT in retriever_kwargs
+            and ATTR_CHECKPOINT in index_information[ATTR_CONFIGURATION]
+        ):
+            retriever_kwargs[ATTR_CHECKPOINT] = store.get_checkpoint_path(
+                index_information[ATTR_CONFIGURATION][ATTR_CHECKPOINT]
+            )
+
+        try:
+            RetrieverFactory.get(
+                retriever,
+                retriever_kwargs,
+                index_ids=(index_id,),
+                index_version=(index_information.get(ATTR_VERSION),),
+            )
+            num_preloaded += 1
+        except (ValueError, TypeError):
+            logger.exception("Failed to preload index with id=%s", index_id)
+
+    return num_preloaded
+
+
+def _run_worker(target: Callable[[int], None], worker_idx: int, num_workers: int):
+    # Restore the default signal handlers replaced by the supervisor
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    # Split the cores between the workers instead of each worker's intra-op threads using all of them
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(max(1, os.cpu_count() // num_workers))
+
+    target(worker_idx)
+
+
+def run_workers(
+    target: Callable[[int], None], num_workers: int, logger: logging.Logger = None
+) -> None:
+    """
+    Run target(worker_idx) in num_workers forked worker processes and supervise them: crashed workers
+    are restarted, SIGINT and SIGTERM stop all workers. With a single worker, target runs in the
+    current process.
+
+    Anything loaded before calling this function is shared copy-on-write by the workers, each worker
+    must create its own threads, sockets and gRPC servers after the fork. Module level state is
+    per-worker as well: each worker has its own INDEXING_JOB_MANAGER, whose jobs other workers only
+    see through the job markers in the store, and its own BATCHERS, so requests are only batched with
+    the requests of the same worker.
+
+    CUDA cannot be used in a forked process once it was initialized, so workers are not forked after
+    a model was loaded on the GPU, e.g. by `preload_indexes`.
+
+    Parameters
+    ----------
+    target: Callable[[int], None]
+        runs a worker until it is stopped
+    num_workers: int
+        number of worker processes
+    logger: logging.Logger
+        logger
+    """
+    if logger is None:
+        logger = logging.getLogger(__name__)
+
+    if num_workers <= 1:
+        target(0)
+        return
+
+    if "torch" in sys.modules and sys.modules["torch"].cuda.is_initialized():
+        raise RuntimeError(
+            "CUDA was initialized before forking the worker processes. "
+            "Run a single worker or do not preload indexes on GPUs."
+        )
+
+    # Step 1: Move preloaded objects out of the garbage collector's generations, so collections in the
+    # workers do not touch, and thereby copy, their pages
+    gc.collect()
+    gc.freeze()
+
+    context = multiprocessing.get_context("fork")
+    workers = {}
+    stopping = False
+
+    def start_worker(worker_idx: int):
+        worker = context.Process(
+            target=_run_worker,
+            args=(target, worker_idx, num_workers),
+            name=f"worker-{worker_idx}",
+        )
+        worker.start()
+        workers[worker_idx] = worker
+        logger.info("Started worker %d with pid %d", worker_idx, worker.pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    previous_handlers = {
+        signum: signal.signal(signum, stop) for signum in (signal.SIGINT, signal.SIGTERM)
+    }
+
+    try:
+        # Step 2: Fork workers
+        for worker_idx in range(num_workers):
+            start_worker(worker_idx)
+
+        # Step 3: Restart workers which exit while the server is running
+        while not stopping:
+            time.sleep(WORKER_RESTART_DELAY_SECS)
+            for worker_idx, worker in list(workers.items()):
+                if not stopping and not worker.is_alive():
+                    logger.warning(
+                        "Worker %d with pid %d exited with code %s, restarting it",
+                        worker_idx,
+                        worker.pid,
+                        worker.exitcode,
+                    )
+                    start_worker(worker_idx)
+    finally:
+        # Step 4: Stop workers
+        for worker in workers.values():
+            if worker.is_alive():
+                os.kill(worker.pid, signal.SIGTERM)
+        deadline = time.time() + WORKER_SHUTDOWN_TIMEOUT_SECS
+        for worker in workers.values():
+            worker.join(timeout=max(0.0, deadline - time.time()))
+            if worker.is_alive():
+                worker.kill()
+
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+        gc.unfreeze()
@@ -21,6 +21,8 @@ from fastapi import APIRouter, status, HTTPException
 
 from primeqa.services.exceptions import PATTERN_ERROR_MESSAGE, Error, ErrorMessages
 from primeqa.services.factories import READERS_REGISTRY, ReaderFactory
+from primeqa.services import batching
+from primeqa.services.result_cache import RESULT_CACHE, normalize_query
 from primeqa.components.reader.extractive import ExtractiveReader
 from primeqa.components.reader.generative import GenerativeFiDReader
 from primeqa.services.rest_server.data_models import GetAnswersRequest, Answer
@@ -83,10 +85,26 @@ def get_answers(request: GetAnswersRequest):
             if not "exclude_from_hash" in v.metadata
             or not v.metadata["exclude_from_hash"]
         ]
+        cache_arguments = {
+            "endpoint": "rest.answers",
+            "index_id": None,
+            "index_version": None,
+            "component": reader.__name__,
+            "parameters": reader_kwargs,
+        }
         answers_response = []
         try:
             for idx, query in enumerate(request.queries):
-                # Step 5.a: Run "apply" per query
+                # Step 5.a: Reuse cached answers for the query and its contexts
+                cache_query = [normalize_query(query), request.contexts[idx]]
+                cached_answers = RESULT_CACHE.get_many(
+                    queries=[cache_query], **cache_arguments
+                )[0]
+                if cached_answers is not None:
+                    answers_response.extend(cached_answers)
+                    continue
+
+                # Step 5.b: Run "apply" per query
                 logging.info(
                     "Applying '%s' reader with parameters = %s for query = '%s' and contexts = %s",
                     instance.__class__.__name__,
@@ -98,11 +116,16 @@ def get_answers(request: GetAnswersRequest):
                     request.contexts[idx],
                 )
                 try:
-                    # Step 5.a.i: Adjust "predict" request's arguments based on reader type
+                    # Step 5.b.i: Adjust "predict" request's arguments based on reader type
                     if isinstance(instance, ExtractiveReader):
-                        predictions = instance.predict(
+                        predictions = batching.extractive_read(
+                            instance,
                             questions=[query] * len(request.contexts[idx]),
                             contexts=[[text] for text in request.contexts[idx]],
+                            example_ids=[
+                                str(example_id)
+                                for example_id in range(len(request.contexts[idx]))
+                            ],
                             **reader_kwargs,
                         )
 
@@ -128,19 +151,20 @@ def get_answers(request: GetAnswersRequest):
                         predictions.values(),
                     )
 
-                    # Step 5.b: Add answers for current query into response object
+                    # Step 5.c: Add answers for current query into response object
                     # `predictions` is a dictionary with <question_id, list of answers per context>
+                    num_answers = len(answers_response)
                     for predictions_for_context in predictions.values():
                         answers_per_context = []
 
                         # Iterate over predictions for current query to formulate answer response object
                         for prediction in predictions_for_context:
-                            # Step 5.b.i: Populate mandatory fields
+                            # Step 5.c.i: Populate mandatory fields
                             answer = {
                                 "text": prediction["span_answer_text"],
                                 "confidence_score": prediction["confidence_score"],
                             }
-                            # Step 5.b.ii: Populate optional fields
+                            # Step 5.c.ii: Populate optional fields
                             if (
                                 "passage_index" in prediction
                                 and prediction["passage_index"]
@@ -160,11 +184,18 @@ def get_answers(request: GetAnswersRequest):
                                     "end_position"
                                 ]
 
-                            # Step 5.b.iii: Add answer to answers_for_question
+                            # Step 5.c.iii: Add answer to answers_for_question
                             answers_per_context.append(answer)
 
                         answers_response.append(answers_per_context)
 
+                    # Step 5.d: Cache answers for current query
+                    RESULT_CACHE.set_many(
+                        queries=[cache_query],
+                        results=[answers_response[num_answers:]],
+                        **cache_arguments,
+                    )
+
                 except TypeError as err:
                     raise Error(
                         ErrorMessages.FAILED_TO_INITIALIZE.value.format(
@@ -112,6 +112,15 @@ class GenerateIndexRequest(BaseModel):
     metadata: Union[str, Dict[str, Any]] = None
 
 
+#############################################################################################
+#                       UpdateIndexRequest
+#############################################################################################
+class UpdateIndexRequest(BaseModel):
+    documents: List[Document] = []
+    deleted_document_ids: List[str] = []
+    compact: bool = False
+
+
 #############################################################################################
 #                       Index
 #############################################################################################
@@ -125,3 +134,4 @@ class IndexInformation(BaseModel):
     ]
     configuration: Dict[str, Any]
     metadata: Union[Dict[str, Any], None] = None
+    progress: Union[Dict[str, Any], None] = None
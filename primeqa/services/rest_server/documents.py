@@ -25,8 +25,12 @@ from primeqa.services.constants import (
     ATTR_CONFIGURATION,
     ATTR_ENGINE_TYPE,
     ATTR_CHECKPOINT,
+    ATTR_DENSE_INDEX_ID,
+    ATTR_VERSION,
     IndexStatus,
 )
+from primeqa.services import batching
+from primeqa.services.result_cache import RESULT_CACHE
 from primeqa.services.store import DIR_NAME_INDEX, StoreFactory
 from primeqa.services.factories import RETRIEVERS_REGISTRY, RetrieverFactory
 from primeqa.services.rest_server.data_models import RetrieveRequest, Hit
@@ -114,57 +118,137 @@ def get_documents(request: RetrieveRequest):
         retriever_kwargs["collection"] = STORE.get_index_documents_file_path(
             index_id=request.index_id
         )
-        if ATTR_CHECKPOINT in retriever_kwargs:
+        index_ids = [request.index_id]
+        index_version = [index_information.get(ATTR_VERSION)]
+        if ATTR_DENSE_INDEX_ID in retriever_kwargs:
+            # Step 5.a: Hybrid retrievers also search a dense index
+            dense_index_id = retriever_kwargs[ATTR_DENSE_INDEX_ID]
+            if not dense_index_id:
+                raise Error(ErrorMessages.INVALID_REQUEST.value.format(ATTR_DENSE_INDEX_ID))
+            if not STORE.exists(STORE.get_index_directory_path(dense_index_id)):
+                raise Error(
+                    ErrorMessages.FAILED_TO_LOCATE_INDEX.value.format(dense_index_id)
+                )
+            dense_index_information = STORE.get_index_information(index_id=dense_index_id)
+            if dense_index_information[ATTR_STATUS] != IndexStatus.READY.value:
+                raise Error(
+                    ErrorMessages.INDEX_UNAVAILABLE_FOR_QUERYING.value.format(
+                        dense_index_information[ATTR_STATUS]
+                    )
+                )
+
+            # Rankings are fused on document ids, which only match if both indexes have the same documents
+            if STORE.get_index_documents_checksum(
+                request.index_id
+            ) != STORE.get_index_documents_checksum(dense_index_id):
+                raise Error(
+                    ErrorMessages.MISMATCHED_INDEX_DOCUMENTS.value.format(
+                        request.index_id, dense_index_id
+                    )
+                )
+
+            retriever_kwargs["dense_index_root"] = STORE.get_index_directory_path(
+                dense_index_id
+            )
+            retriever_kwargs["dense_index_name"] = DIR_NAME_INDEX
+            retriever_kwargs["dense_engine_type"] = dense_index_information[
+                ATTR_CONFIGURATION
+            ][ATTR_ENGINE_TYPE]
+            index_ids.append(dense_index_id)
+            index_version.append(dense_index_information.get(ATTR_VERSION))
+            if ATTR_CHECKPOINT in dense_index_information[ATTR_CONFIGURATION]:
+                retriever_kwargs[ATTR_CHECKPOINT] = STORE.get_checkpoint_path(
+                    dense_index_information[ATTR_CONFIGURATION][ATTR_CHECKPOINT]
+                )
+        elif ATTR_CHECKPOINT in retriever_kwargs:
             retriever_kwargs[ATTR_CHECKPOINT] = STORE.get_checkpoint_path(
                 index_information[ATTR_CONFIGURATION][ATTR_CHECKPOINT]
             )
 
-        # Step 6: Create retriever instance
-        try:
-            instance = RetrieverFactory.get(retriever, retriever_kwargs)
-        except (ValueError, TypeError) as err:
-            raise Error(err.args[0]) from err
-
-        # Step 7: Retrieve
-        instance_fields = [
-            k
-            for k, v in instance.__class__.__dataclass_fields__.items()
-            if not "exclude_from_hash" in v.metadata
-            or not v.metadata["exclude_from_hash"]
+        # Step 6: Look up cached hits, only queries without cached hits are retrieved
+        cache_arguments = {
+            "endpoint": "retrieve",
+            "index_id": request.index_id,
+            "index_version": index_version,
+            "component": retriever.__name__,
+            "parameters": retriever_kwargs,
+        }
+        cached_hits = RESULT_CACHE.get_many(queries=request.queries, **cache_arguments)
+        queries = [
+            query
+            for query, hits_per_query in zip(request.queries, cached_hits)
+            if hits_per_query is None
         ]
-        logging.info(
-            "Applying '%s' retriever with parameters = %s for queries = %s",
-            instance.__class__.__name__,
-            {
-                k: getattr(instance, k) if k in instance_fields else v
-                for k, v in retriever_kwargs.items()
-            },
-            request.queries,
-        )
-        try:
-            results = instance.predict(input_texts=request.queries, **retriever_kwargs)
+
+        retrieved_hits = []
+        if queries:
+            # Step 7: Create retriever instance
+            try:
+                instance = RetrieverFactory.get(
+                    retriever,
+                    retriever_kwargs,
+                    index_ids=tuple(index_ids),
+                    index_version=tuple(index_version),
+                )
+            except (ValueError, TypeError) as err:
+                raise Error(err.args[0]) from err
+
+            # Step 8: Retrieve
+            instance_fields = [
+                k
+                for k, v in instance.__class__.__dataclass_fields__.items()
+                if not "exclude_from_hash" in v.metadata
+                or not v.metadata["exclude_from_hash"]
+            ]
             logging.info(
-                "Applying '%s' retriever for queries = %s returns results = %s",
+                "Applying '%s' retriever with parameters = %s for queries = %s",
                 instance.__class__.__name__,
-                request.queries,
-                results,
+                {
+                    k: getattr(instance, k) if k in instance_fields else v
+                    for k, v in retriever_kwargs.items()
+                },
+                queries,
             )
-        except TypeError as err:
-            raise Error(
-                ErrorMessages.FAILED_TO_INITIALIZE.value.format(
-                    f"{retriever.retriever_id} retriever"
+            try:
+                results = batching.retrieve(
+                    instance, input_texts=queries, **retriever_kwargs
                 )
-            ) from err
-
-        # Step 8: Return
-        hits = []
-        for result_per_query in results:
-            hits_per_query = []
-            for hit in result_per_query:
-                try:
-                    document = STORE.get_index_document(
-                        index_id=request.index_id, document_idx=hit[0]
+                logging.info(
+                    "Applying '%s' retriever for queries = %s returns results = %s",
+                    instance.__class__.__name__,
+                    queries,
+                    results,
+                )
+            except TypeError as err:
+                raise Error(
+                    ErrorMessages.FAILED_TO_INITIALIZE.value.format(
+                        f"{retriever.retriever_id} retriever"
                     )
+                ) from err
+
+            # Step 9: Fetch documents of all hits of all queries at once
+            try:
+                documents = STORE.get_index_documents(
+                    index_id=request.index_id,
+                    document_ids=[
+                        hit[0]
+                        for result_per_query in results
+                        for hit in result_per_query
+                    ],
+                )
+            except FileNotFoundError:
+                documents = [
+                    None for result_per_query in results for hit in result_per_query
+                ]
+
+            documents_iterator = iter(documents)
+            for result_per_query in results:
+                hits_per_query = []
+                for hit in result_per_query:
+                    document = next(documents_iterator)
+                    if document is None:
+                        continue
+
                     hits_per_query.append(
                         {
                             "document": {
@@ -179,12 +263,22 @@ def get_documents(request: RetrieveRequest):
                             "score": hit[1],
                         }
                     )
-                except (FileNotFoundError, KeyError):
-                    continue
 
-            hits.append(hits_per_query)
+                retrieved_hits.append(hits_per_query)
+
+            # Step 10: Cache retrieved hits
+            RESULT_CACHE.set_many(
+                queries=queries, results=retrieved_hits, **cache_arguments
+            )
 
-        return hits
+        # Step 11: Return
+        retrieved_hits_iterator = iter(retrieved_hits)
+        return [
+            hits_per_query
+            if hits_per_query is not None
+            else next(retrieved_hits_iterator)
+            for hits_per_query in cached_hits
+        ]
 
     except Error as err:
         error_message = err.args[0]
@@ -27,13 +27,27 @@ from primeqa.services.constants import (
     ATTR_CONFIGURATION,
     ATTR_ENGINE_TYPE,
     ATTR_CHECKPOINT,
+    ATTR_PROGRESS,
+    ATTR_VERSION,
+    ATTR_INDEXER,
+    ATTR_INDEXER_ID,
+    ATTR_PARAMETERS,
     IndexStatus,
 )
 from primeqa.services.store import DIR_NAME_INDEX, StoreFactory
-from primeqa.services.factories import INDEXERS_REGISTRY, IndexerFactory
+from primeqa.services.utils import generate_id
+from primeqa.services.result_cache import RESULT_CACHE
+from primeqa.components.base import Indexer as BaseIndexer
+from primeqa.services.factories import INDEXERS_REGISTRY
+from primeqa.services.indexing_jobs import (
+    INDEXING_JOB_MANAGER,
+    STAGE_UPLOADING,
+    update_index_progress,
+)
 from primeqa.services.rest_server.data_models import (
     IndexInformation,
     GenerateIndexRequest,
+    UpdateIndexRequest,
 )
 
 router = APIRouter()
@@ -44,7 +58,7 @@ STORE = StoreFactory.get_store()
 
 @router.post(
     "/indexes",
-    status_code=status.HTTP_201_CREATED,
+    status_code=status.HTTP_202_ACCEPTED,
     response_model=IndexInformation,
     tags=["Indexer"],
 )
@@ -55,6 +69,7 @@ def generate_index(request: GenerateIndexRequest):
             ATTR_INDEX_ID: STORE.generate_index_uuid(),
             ATTR_STATUS: IndexStatus.INDEXING.value,
             ATTR_CONFIGURATION: {},
+            ATTR_VERSION: generate_id(),
         }
 
         # Step 2: Verify requested indexer
@@ -68,94 +83,104 @@ def generate_index(request: GenerateIndexRequest):
                 )
             ) from err
 
-        # Step 3: Remove existing index if index_id is provide in the request
+        # Step 3: Claim the index, so that a concurrent request is refused before any document is
+        # deleted or uploaded, and remove existing index if index_id is provide in the request
         if request.index_id:
-            STORE.delete_index(request.index_id)
             index_information[ATTR_INDEX_ID] = request.index_id
 
-        # Step 4: Load default retriever keyword arguments
-        indexer_kwargs = {
-            k: v.default for k, v in indexer.__dataclass_fields__.items() if v.init
-        }
-
-        # Step 5: If parameters are provided in request then update keyword arguments used to instantiate indexer instance
-        if request.indexer.parameters:
-            for parameter in request.indexer.parameters:
-                if parameter.parameter_id not in indexer_kwargs:
-                    raise Error(
-                        ErrorMessages.INVALID_PARAMETER.value.format(
-                            "indexer", parameter.parameter_id
+        INDEXING_JOB_MANAGER.claim(index_information[ATTR_INDEX_ID])
+        try:
+            if request.index_id:
+                STORE.delete_index(request.index_id)
+                RESULT_CACHE.invalidate_index(request.index_id)
+
+            # Step 4: Load default retriever keyword arguments
+            indexer_kwargs = {
+                k: v.default for k, v in indexer.__dataclass_fields__.items() if v.init
+            }
+
+            # Step 5: If parameters are provided in request then update keyword arguments used to instantiate indexer instance
+            if request.indexer.parameters:
+                for parameter in request.indexer.parameters:
+                    if parameter.parameter_id not in indexer_kwargs:
+                        raise Error(
+                            ErrorMessages.INVALID_PARAMETER.value.format(
+                                "indexer", parameter.parameter_id
+                            )
                         )
-                    )
 
-                indexer_kwargs[parameter.parameter_id] = parameter.value
+                    indexer_kwargs[parameter.parameter_id] = parameter.value
 
-                # Process `checkpoint` parameter
-                if parameter.parameter_id == "checkpoint":
-                    # Add `checkpoint` parameter value to index information
-                    index_information[ATTR_CONFIGURATION][
-                        ATTR_CHECKPOINT
-                    ] = indexer_kwargs["checkpoint"]
-
-                    # Re-map checkpoint kwarg to point to checkpoint file path in the service's store
-                    indexer_kwargs["checkpoint"] = STORE.get_checkpoint_path(
-                        indexer_kwargs["checkpoint"]
-                    )
+                    # Process `checkpoint` parameter
+                    if parameter.parameter_id == "checkpoint":
+                        # Add `checkpoint` parameter value to index information
+                        index_information[ATTR_CONFIGURATION][
+                            ATTR_CHECKPOINT
+                        ] = indexer_kwargs["checkpoint"]
 
-        # Step 6: Update index specific arguments
-        indexer_kwargs["index_root"] = STORE.get_index_directory_path(
-            index_information[ATTR_INDEX_ID]
-        )
-        indexer_kwargs["index_name"] = DIR_NAME_INDEX
+                        # Re-map checkpoint kwarg to point to checkpoint file path in the service's store
+                        indexer_kwargs["checkpoint"] = STORE.get_checkpoint_path(
+                            indexer_kwargs["checkpoint"]
+                        )
 
-        # Step 7: Create indexer instance
-        try:
-            instance = IndexerFactory.get(indexer, indexer_kwargs)
-        except (ValueError, TypeError) as err:
-            raise Error(err.args[0]) from err
-
-        # Step 8: Save index information
-        # Step 8.a: Add "engine_type"  to index information
-        index_information[ATTR_CONFIGURATION][
-            ATTR_ENGINE_TYPE
-        ] = instance.get_engine_type()
-
-        # Step 8.b: If "metadata" is provided, add to index information
-        if request.metadata:
-            index_information[ATTR_METADATA] = request.metadata
-
-        STORE.save_index_information(
-            index_id=index_information[ATTR_INDEX_ID],
-            information=index_information,
-        )
-
-        # Step 9: Save documents used in index
-        STORE.save_index_documents(
-            index_id=index_information[ATTR_INDEX_ID],
-            documents=request.documents,
-        )
-
-        # Step 10: Kick-off async index generation
-        try:
-            instance.index(
-                STORE.get_index_documents_file_path(
-                    index_id=index_information[ATTR_INDEX_ID]
-                ),
+            # Step 6: Update index specific arguments
+            indexer_kwargs["index_root"] = STORE.get_index_directory_path(
+                index_information[ATTR_INDEX_ID]
             )
+            indexer_kwargs["index_name"] = DIR_NAME_INDEX
 
-            # Step 10.b: Set index status to "READY" once indexing is complete
-            index_information[ATTR_STATUS] = IndexStatus.READY.value
-        except (TypeError, RuntimeError) as err:
-            index_information[ATTR_STATUS] = IndexStatus.CORRUPT.value
-            logging.exception(
-                "Generation failed for index with id=%s. Resultant index may be corrupted.",
-                index_information[ATTR_INDEX_ID],
+            # Step 7: Validate indexer arguments, the indexer itself is loaded by the indexing job
+            try:
+                instance = indexer(**indexer_kwargs)
+            except (ValueError, TypeError) as err:
+                raise Error(err.args[0]) from err
+
+            # Step 8: Save index information
+            # Step 8.a: Add "engine_type"  to index information
+            index_information[ATTR_CONFIGURATION][
+                ATTR_ENGINE_TYPE
+            ] = instance.get_engine_type()
+
+            # Step 8.b: If "metadata" is provided, add to index information
+            if request.metadata:
+                index_information[ATTR_METADATA] = request.metadata
+
+            # Step 8.c: Add the indexer and its arguments, the index is updated with the same indexer
+            index_information[ATTR_INDEXER] = {
+                ATTR_INDEXER_ID: indexer.__name__,
+                ATTR_PARAMETERS: indexer_kwargs,
+            }
+
+            index_information[ATTR_PROGRESS] = {
+                "stage": STAGE_UPLOADING,
+                "num_documents": 0,
+            }
+            STORE.save_index_information(
+                index_id=index_information[ATTR_INDEX_ID],
+                information=index_information,
             )
-            logging.exception(err.args[0])
 
-        STORE.save_index_information(
-            index_information[ATTR_INDEX_ID], information=index_information
-        )
+            # Step 9: Save documents used in index
+            with STORE.get_index_documents_writer(
+                index_id=index_information[ATTR_INDEX_ID]
+            ) as writer:
+                writer.add(
+                    document.dict(exclude_none=True) for document in request.documents
+                )
+
+            # Step 10: Kick-off async index generation, its status is tracked in the index information
+            index_information = update_index_progress(
+                index_information[ATTR_INDEX_ID], num_documents=writer.num_documents
+            )
+            INDEXING_JOB_MANAGER.submit(
+                index_information[ATTR_INDEX_ID], indexer.__name__, indexer_kwargs
+            )
+        except BaseException as err:
+            # Nothing was submitted, an index left half uploaded is marked as failed
+            INDEXING_JOB_MANAGER.release(
+                index_information[ATTR_INDEX_ID], error=str(err) or repr(err)
+            )
+            raise
 
         # Step 11: Return
         return index_information
@@ -177,6 +202,117 @@ def generate_index(request: GenerateIndexRequest):
         ) from None
 
 
+@router.patch(
+    "/indexes/{index_id}",
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=IndexInformation,
+    tags=["Indexer"],
+)
+def update_index(index_id: str, request: UpdateIndexRequest):
+    try:
+        # Step 1: Claim the index, so that a concurrent request is refused before any document
+        # is appended
+        INDEXING_JOB_MANAGER.claim(index_id)
+        documents_mark = None
+        submitted = False
+        try:
+            # Step 2: Load index information
+            try:
+                index_information = STORE.get_index_information(index_id=index_id)
+            except FileNotFoundError as err:
+                raise Error(
+                    ErrorMessages.FAILED_TO_LOCATE_INDEX.value.format(index_id)
+                ) from err
+
+            if index_information[ATTR_STATUS] != IndexStatus.READY.value:
+                raise Error(
+                    ErrorMessages.INDEX_UNAVAILABLE_FOR_QUERYING.value.format(
+                        index_information[ATTR_STATUS]
+                    )
+                )
+
+            # Step 3: Verify the index was generated by an indexer which supports updates
+            try:
+                indexer = INDEXERS_REGISTRY[
+                    index_information[ATTR_INDEXER][ATTR_INDEXER_ID]
+                ]
+            except KeyError as err:
+                # Indexes generated before the indexer was recorded in their information
+                raise Error(
+                    ErrorMessages.INDEX_UPDATE_NOT_SUPPORTED.value.format(index_id)
+                ) from err
+
+            if indexer.add is BaseIndexer.add:
+                raise Error(
+                    ErrorMessages.INDEX_UPDATE_NOT_SUPPORTED.value.format(index_id)
+                )
+
+            # Step 4: Verify deleted documents exist, a failed update would leave the index corrupt
+            num_documents = index_information.get(ATTR_PROGRESS, {}).get(
+                "num_documents"
+            )
+            for document_id in request.deleted_document_ids:
+                if not document_id.isdigit() or (
+                    num_documents is not None
+                    and not 1 <= int(document_id) <= num_documents
+                ):
+                    raise Error(
+                        ErrorMessages.FAILED_TO_LOCATE_DOCUMENT.value.format(
+                            document_id, index_id
+                        )
+                    )
+
+            # Step 5: Append new documents, numbered after the existing ones
+            if request.documents:
+                documents_mark = STORE.get_index_documents_mark(index_id)
+                with STORE.get_index_documents_writer(
+                    index_id=index_id, append=True
+                ) as writer:
+                    writer.add(
+                        document.dict(exclude_none=True)
+                        for document in request.documents
+                    )
+                update_index_progress(index_id, num_documents=writer.num_documents)
+
+            # Step 6: Kick-off async index update, the index remains queryable meanwhile unless it is compacted
+            INDEXING_JOB_MANAGER.submit_update(
+                index_id,
+                indexer.__name__,
+                index_information[ATTR_INDEXER][ATTR_PARAMETERS],
+                request.deleted_document_ids,
+                compact=request.compact,
+            )
+            submitted = True
+        finally:
+            # Roll back the appended documents and release the index if the update was not submitted
+            try:
+                if not submitted and documents_mark is not None:
+                    STORE.truncate_index_documents(index_id, documents_mark)
+                    update_index_progress(index_id, num_documents=documents_mark[0])
+            finally:
+                if not submitted:
+                    INDEXING_JOB_MANAGER.release(index_id)
+
+        # Step 7: Return
+        return STORE.get_index_information(index_id=index_id)
+
+    except Error as err:
+        error_message = err.args[0]
+
+        # Identify error code
+        mobj = PATTERN_ERROR_MESSAGE.match(error_message)
+        if mobj:
+            error_code = mobj.group(1).strip()
+            error_message = mobj.group(2).strip()
+        else:
+            error_code = 500
+
+        raise HTTPException(
+            status_code=500,
+            detail={"code": error_code, "message": error_message},
+        ) from None
+
+
 @router.get(
     "/indexes",
     status_code=status.HTTP_200_OK,
@@ -215,7 +351,13 @@ def get_indexes(engine_type: str = None):
                     ATTR_METADATA
                 ] = index_information_dict[ATTR_METADATA]
 
-            # Step 2.f: Add "status" information
+            # Step 2.f: Add "progress" information if exists
+            if ATTR_PROGRESS in index_information_dict:
+                index_information_rest_response_object[
+                    ATTR_PROGRESS
+                ] = index_information_dict[ATTR_PROGRESS]
+
+            # Step 2.g: Add "status" information
             try:
                 index_information_rest_response_object[
                     ATTR_STATUS
@@ -245,9 +387,13 @@ def get_indexes(engine_type: str = None):
 )
 def get_index_status(index_id: str):
     try:
-        return {
-            ATTR_STATUS: STORE.get_index_information(index_id=index_id)[ATTR_STATUS]
-        }
+        index_information = STORE.get_index_information(index_id=index_id)
+        if ATTR_PROGRESS in index_information:
+            return {
+                ATTR_STATUS: index_information[ATTR_STATUS],
+                ATTR_PROGRESS: index_information[ATTR_PROGRESS],
+            }
+        return {ATTR_STATUS: index_information[ATTR_STATUS]}
     except KeyError:
         return {ATTR_STATUS: IndexStatus.CORRUPT.value}
     except FileNotFoundError:
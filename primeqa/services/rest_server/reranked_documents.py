@@ -30,6 +30,7 @@ from primeqa.services.constants import (
 )
 from primeqa.services.store import DIR_NAME_INDEX, StoreFactory
 from primeqa.services.factories import RERANKERS_REGISTRY, RerankerFactory
+from primeqa.services import batching
 from primeqa.services.rest_server.data_models import RerankRequest, Hit
 
 router = APIRouter()
@@ -101,7 +102,9 @@ def rerank_documents(request: RerankRequest):
             request_dict = json.loads(request.json())
             queries = request_dict["queries"]
             documentsperquery = request_dict["hitsperquery"]
-            results = instance.predict(queries=queries, documents=documentsperquery, **reranker_kwargs)
+            results = batching.rerank(
+                instance, queries=queries, documents=documentsperquery, **reranker_kwargs
+            )
             logging.info(
                 "Applying '%s' reranker for queries = %s returns results = %s",
                 instance.__class__.__name__,
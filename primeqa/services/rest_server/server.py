@@ -24,6 +24,11 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from primeqa.services.configurations import Settings
+from primeqa.services.instance_manager import INSTANCE_MANAGER
+from primeqa.services.indexing_jobs import INDEXING_JOB_MANAGER
+from primeqa.services.batching import BATCHERS
+from primeqa.services.result_cache import RESULT_CACHE
+from primeqa.services.prefork import preload_indexes, run_workers
 from primeqa.services.rest_server import (
     documents,
     readers,
@@ -91,6 +96,32 @@ class RestServer:
             else:
                 self._config = config
 
+            # Bound the cache of loaded readers, retrievers, indexers and rerankers
+            INSTANCE_MANAGER.configure(
+                max_instances=self._config.max_cached_instances,
+                max_memory_bytes=self._config.max_cached_instances_memory_mb * 2**20,
+                max_rss_bytes=self._config.max_process_rss_mb * 2**20,
+            )
+
+            # Index generation runs in background worker processes
+            INDEXING_JOB_MANAGER.configure(
+                max_workers=self._config.num_indexing_workers
+            )
+
+            # Coalesce concurrent reader, retriever and reranker requests into batched predict calls
+            BATCHERS.configure(
+                max_batch_size=self._config.micro_batching_max_batch_size,
+                max_wait_ms=self._config.micro_batching_max_wait_ms,
+            )
+
+            # Cache retrieve and answer results per query
+            RESULT_CACHE.configure(
+                max_memory_bytes=self._config.result_cache_max_memory_mb * 2**20,
+                ttl_secs=self._config.result_cache_ttl_secs,
+                cache_dir=self._config.result_cache_dir,
+                max_disk_entries=self._config.result_cache_max_disk_entries,
+            )
+
         except Exception as ex:
             self._logger.exception("Error configuring server: %s", ex)
             raise
@@ -130,9 +161,36 @@ class RestServer:
                 workers=self._config.num_rest_server_workers,
             )
 
+        # Load indexes before forking workers, so that workers share them copy-on-write
+        preload_index_ids = [
+            index_id for index_id in self._config.preload_index_ids if index_id
+        ]
+        if preload_index_ids:
+            self._logger.info(
+                "Preloaded %d indexes",
+                preload_indexes(preload_index_ids, logger=self._logger),
+            )
+
         # Create and run server
         try:
-            uvicorn.Server(server_config).run()
+            if self._config.num_rest_server_workers > 1:
+                # Worker processes accept connections on a socket bound before forking them
+                socket = server_config.bind_socket()
+                self._logger.info(
+                    "Starting %d server instances on port %s - initialization took %s seconds",
+                    self._config.num_rest_server_workers,
+                    self._config.rest_port,
+                    time.time() - start_t,
+                )
+                run_workers(
+                    lambda worker_idx: uvicorn.Server(server_config).run(
+                        sockets=[socket]
+                    ),
+                    self._config.num_rest_server_workers,
+                    logger=self._logger,
+                )
+            else:
+                uvicorn.Server(server_config).run()
             self._logger.info(
                 "Server instance started on port %s - initialization took %s seconds",
                 self._config.rest_port,
@@ -0,0 +1,302 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, List, Union
+
+from cachetools import TTLCache
+
+from primeqa.services.store import SQLITE_MAX_VARIABLES
+
+FILENAME_RESULT_CACHE = "results.sqlite"
+
+# Minimum time between purges of expired and excess results from the on-disk tier, per process
+DISK_PURGE_INTERVAL_SECS = 60
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query for cache lookups: Unicode NFKC normalization and collapsed whitespace.
+    Case is kept, cased models may answer differently.
+    """
+    return " ".join(unicodedata.normalize("NFKC", query).split())
+
+
+class ResultCache:
+    """
+    Cache of per-query results of the retrieve and answer endpoints.
+
+    - Results are keyed on the endpoint, the index id and version, the component and all its
+      parameters, and the normalized query. A rebuilt index gets a new version, so results of the old
+      index are never served, also by processes which did not rebuild it.
+    - The in-memory tier holds pickled results up to `max_memory_bytes`, each for at most `ttl_secs`.
+    - The optional on-disk tier, a SQLite database in `cache_dir`, is shared by the server's worker
+      processes and survives restarts. Expired results are purged from it periodically, and so are
+      the results closest to expiring once it holds more than `max_disk_entries`.
+    """
+
+    def __init__(
+        self,
+        max_memory_bytes: int = 0,
+        ttl_secs: int = 3600,
+        cache_dir: str = None,
+        max_disk_entries: int = 100000,
+        logger: logging.Logger = None,
+    ):
+        if logger is None:
+            self._logger = logging.getLogger(self.__class__.__name__)
+        else:
+            self._logger = logger
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._hits = 0
+        self._misses = 0
+        self._last_purge_t = 0.0
+        self.configure(max_memory_bytes, ttl_secs, cache_dir, max_disk_entries)
+
+    def configure(
+        self,
+        max_memory_bytes: int = 0,
+        ttl_secs: int = 3600,
+        cache_dir: str = None,
+        max_disk_entries: int = 100000,
+    ) -> None:
+        with self._lock:
+            self.max_memory_bytes = max_memory_bytes
+            self.ttl_secs = ttl_secs
+            self.cache_dir = cache_dir or None
+            self.max_disk_entries = max_disk_entries
+            self._memory = (
+                TTLCache(maxsize=max_memory_bytes, ttl=ttl_secs, getsizeof=len)
+                if max_memory_bytes > 0
+                else None
+            )
+
+    @property
+    def enabled(self) -> bool:
+        return self._memory is not None or self.cache_dir is not None
+
+    #############################################################################################
+    #                       On-disk tier
+    #############################################################################################
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread and process, connections must not be shared with forked workers
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            os.makedirs(self.cache_dir, exist_ok=True)
+            connection = sqlite3.connect(
+                os.path.join(self.cache_dir, FILENAME_RESULT_CACHE),
+                timeout=30,
+                isolation_level=None,
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, index_id TEXT, expires_at REAL, value BLOB)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS results_index_id ON results (index_id)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS results_expires_at ON results (expires_at)"
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _purge_disk(self, connection: sqlite3.Connection) -> None:
+        connection.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),))
+        if self.max_disk_entries > 0:
+            # All results live for ttl_secs, the ones closest to expiring are the oldest
+            connection.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,),
+            )
+
+    #############################################################################################
+    #                       Cache
+    #############################################################################################
+    @staticmethod
+    def make_key(
+        endpoint: str,
+        index_id: Union[str, None],
+        index_version: Any,
+        component: str,
+        parameters: dict,
+        query: Any,
+    ) -> str:
+        # The components' __hash__ is salted per process, key on the values it is derived from instead
+        return hashlib.sha256(
+            json.dumps(
+                [endpoint, index_id, index_version, component, parameters, query],
+                sort_keys=True,
+                default=str,
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def get_many(
+        self,
+        endpoint: str,
+        index_id: Union[str, None],
+        index_version: Any,
+        component: str,
+        parameters: dict,
+        queries: List[Any],
+    ) -> List[Any]:
+        """
+        Look up cached results.
+
+        Parameters
+        ----------
+        endpoint: str
+            name of the endpoint the results belong to
+        index_id: Union[str, None]
+            unique identifier for the index, None for results which do not depend on an index
+        index_version: Any
+            version of the index, e.g. the versions of all indexes the results depend on
+        component: str
+            name of the reader or retriever
+        parameters: dict
+            all parameters the component was created and called with
+        queries: List[Any]
+            queries, strings are normalized; other values, e.g. a query and its contexts, are used as is
+
+        Returns
+        -------
+        List[Any]:
+            cached result per query, None for queries without a cached result.
+
+        """
+        if not self.enabled:
+            return [None] * len(queries)
+
+        keys = [
+            self.make_key(
+                endpoint,
+                index_id,
+                index_version,
+                component,
+                parameters,
+                normalize_query(query) if isinstance(query, str) else query,
+            )
+            for query in queries
+        ]
+
+        # Step 1: Look up in memory
+        values = {}
+        if self._memory is not None:
+            with self._lock:
+                for key in keys:
+                    value = self._memory.get((index_id, key))
+                    if value is not None:
+                        values[key] = value
+
+        # Step 2: Look up remaining keys on disk, and promote them to memory
+        missing_keys = [key for key in dict.fromkeys(keys) if key not in values]
+        if missing_keys and self.cache_dir is not None:
+            connection = self._connection()
+            # One query per SQLITE_MAX_VARIABLES parameters, including the expiry time
+            for start in range(0, len(missing_keys), SQLITE_MAX_VARIABLES - 1):
+                batch = missing_keys[start : start + SQLITE_MAX_VARIABLES - 1]
+                rows = connection.execute(
+                    "SELECT key, value FROM results WHERE expires_at > ? AND key IN (%s)"
+                    % ", ".join("?" * len(batch)),
+                    (time.time(), *batch),
+                )
+                for key, value in rows:
+                    values[key] = value
+                    self._set_in_memory(index_id, key, value)
+
+        with self._lock:
+            num_hits = sum(1 for key in keys if key in values)
+            self._hits += num_hits
+            self._misses += len(keys) - num_hits
+
+        return [
+            pickle.loads(values[key]) if key in values else None for key in keys
+        ]
+
+    def _set_in_memory(self, index_id: Union[str, None], key: str, value: bytes):
+        if self._memory is not None and len(value) <= self.max_memory_bytes:
+            with self._lock:
+                self._memory[(index_id, key)] = value
+
+    def set_many(
+        self,
+        endpoint: str,
+        index_id: Union[str, None],
+        index_version: Any,
+        component: str,
+        parameters: dict,
+        queries: List[Any],
+        results: List[Any],
+    ) -> None:
+        """
+        Cache results, see `get_many` for the parameters.
+        """
+        if not self.enabled:
+            return
+
+        entries = []
+        for query, result in zip(queries, results):
+            key = self.make_key(
+                endpoint,
+                index_id,
+                index_version,
+                component,
+                parameters,
+                normalize_query(query) if isinstance(query, str) else query,
+            )
+            value = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+            self._set_in_memory(index_id, key, value)
+            entries.append((key, index_id, time.time() + self.ttl_secs, value))
+
+        if self.cache_dir is not None and entries:
+            connection = self._connection()
+            connection.executemany(
+                "INSERT OR REPLACE INTO results (key, index_id, expires_at, value) VALUES (?, ?, ?, ?)",
+                entries,
+            )
+
+            with self._lock:
+                purge = time.time() - self._last_purge_t >= DISK_PURGE_INTERVAL_SECS
+                if purge:
+                    self._last_purge_t = time.time()
+            if purge:
+                self._purge_disk(connection)
+
+    def invalidate_index(self, index_id: str) -> None:
+        """
+        Drop all cached results of an index, e.g. when it is regenerated.
+
+        Parameters
+        ----------
+        index_id: str
+            unique identifier for the index.
+        """
+        if self._memory is not None:
+            with self._lock:
+                for key in [key for key in self._memory.keys() if key[0] == index_id]:
+                    self._memory.pop(key, None)
+
+        if self.cache_dir is not None:
+            connection = self._connection()
+            connection.execute("DELETE FROM results WHERE index_id = ?", (index_id,))
+            self._purge_disk(connection)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "memory_bytes": self._memory.currsize if self._memory is not None else 0,
+                "memory_entries": len(self._memory) if self._memory is not None else 0,
+            }
+
+
+RESULT_CACHE = ResultCache()
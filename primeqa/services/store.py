@@ -1,10 +1,17 @@
-from typing import List
+from typing import List, Iterable, Callable, Tuple, Union
+from array import array
 import os
+import json
+import hashlib
 import shutil
+import threading
 from pathlib import Path
 import glob
 
+import numpy as np
+from cachetools import LRUCache
 from cachetools.func import ttl_cache
+from filelock import FileLock
 from sqlitedict import SqliteDict
 
 from primeqa.services.utils import generate_id, load_json, save_json
@@ -15,6 +22,7 @@ DIR_NAME_INDEX = "index"
 DIR_NAME_MODELS = "models"
 DIR_NAME_CHECKPOINTS = "checkpoints"
 DIR_NAME_MODELS = "models"
+DIR_NAME_JOBS = "jobs"
 FILENAME_INFORMATION = "information"
 FILENAME_DOCUMENTS = "documents"
 FILENAME_DOCUMENT_IDS = "document_ids"
@@ -23,22 +31,37 @@ EXTN_JSON = ".json"
 EXTN_TSV = ".tsv"
 EXTN_TXT = ".txt"
 EXTN_SQL_LITE = ".sqlite"
+EXTN_JSONL = ".jsonl"
+EXTN_OFFSETS = ".offsets.npy"
+EXTN_LOCK = ".lock"
+EXTN_PID = ".pid"
+
+# Number of documents kept in the hot-document cache
+DOCUMENT_CACHE_SIZE = 10000
+
+# Maximum number of parameters in a single SQLite query
+SQLITE_MAX_VARIABLES = 900
 
 #############################################################################################
 # indexes/
 #        <index-id>/
 #                   details.json
+#                   information.json, information.json.lock
 #                   documents.json
 #                   documents.tsv
+#                   documents.sqlite
+#                   documents.jsonl, documents.offsets.npy
 # checkpoints/
 #            <checkpoint>/
 #                       <model-id>.dnn|<model-id>.model
 # models/
 #        <model-id>/
 #               *.dnn|*.model
+# jobs/
+#      <index-id>.pid, <index-id>.lock
 #############################################################################################
 class Store:
-    def __init__(self):
+    def __init__(self, document_cache_size: int = DOCUMENT_CACHE_SIZE):
         self.root_dir = os.getenv(
             "STORE_DIR", os.path.join(Path(__file__).parent.parent.parent, "store")
         )
@@ -57,6 +80,16 @@ class Store:
         if not os.path.exists(os.path.join(self.root_dir, DIR_NAME_MODELS)):
             os.makedirs(os.path.join(self.root_dir, DIR_NAME_MODELS))
 
+        # Check if jobs directory exist, if not create one
+        if not os.path.exists(os.path.join(self.root_dir, DIR_NAME_JOBS)):
+            os.makedirs(os.path.join(self.root_dir, DIR_NAME_JOBS))
+
+        # Hot-document cache, keyed by (index_id, document_idx), and opened compact document files
+        self._documents_lock = threading.Lock()
+        self._documents_cache = LRUCache(maxsize=document_cache_size)
+        self._compact_documents = {}
+        self._documents_checksums = {}
+
     def exists(self, path: str):
         return os.path.exists(path)
 
@@ -86,61 +119,241 @@ class Store:
             tablename="documents",
         )
 
+    def _get_compact_documents(self, index_id: str) -> Union["CompactDocuments", None]:
+        offsets_file_path = self.get_index_documents_file_path(
+            index_id, extension=EXTN_OFFSETS
+        )
+        try:
+            version = os.stat(offsets_file_path).st_mtime_ns
+        except FileNotFoundError:
+            # Indexes created before the compact document files existed only have `documents.sqlite`
+            version = None
+
+        with self._documents_lock:
+            cached_version, compact_documents = self._compact_documents.get(
+                index_id, (None, None)
+            )
+            if index_id in self._compact_documents and cached_version == version:
+                return compact_documents
+
+            # The documents were (re)written, possibly by another process, drop cached documents
+            for key in [key for key in self._documents_cache if key[0] == index_id]:
+                del self._documents_cache[key]
+            compact_documents = (
+                CompactDocuments(
+                    self.get_index_documents_file_path(index_id, extension=EXTN_JSONL),
+                    offsets_file_path,
+                )
+                if version is not None
+                else None
+            )
+            self._compact_documents[index_id] = (version, compact_documents)
+            return compact_documents
+
+    def _clear_documents_cache(self, index_id: str) -> None:
+        with self._documents_lock:
+            self._compact_documents.pop(index_id, None)
+            self._documents_checksums.pop(index_id, None)
+            for key in [key for key in self._documents_cache if key[0] == index_id]:
+                del self._documents_cache[key]
+        self.get_index_documents_database.cache_clear()
+
     def get_index_document(self, index_id: str, document_idx: int):
-        database = self.get_index_documents_database(index_id=index_id)
-        return database[str(document_idx)]
+        document = self.get_index_documents(index_id, [document_idx])[0]
+        if document is None:
+            raise KeyError(str(document_idx))
+        return document
+
+    def get_index_documents(
+        self, index_id: str, document_ids: List[Union[int, str]]
+    ) -> List[Union[dict, None]]:
+        """
+        Get documents of an index in a single pass: from the hot-document cache, then from the
+        memory-mapped compact document file or, for older indexes, in one SQLite query per
+        SQLITE_MAX_VARIABLES documents.
 
-    def save_index_documents(self, index_id: str, documents: List[dict]):
-        # Step 1: Create `documents.tsv` in index directory
-        documents_tsv_file_path = self.get_index_documents_file_path(
-            index_id, extension=EXTN_TSV
-        )
-        os.makedirs(os.path.dirname(documents_tsv_file_path), exist_ok=True)
+        Parameters
+        ----------
+        index_id: str
+            unique identifier for the index.
+        document_ids: List[Union[int, str]]
+            1-based positions of the documents in `documents.tsv`, as returned by the retrievers.
 
-        # Step 2: Create `documents.sqlite` in index directory
-        documents_sqlite_file_path = self.get_index_documents_file_path(
-            index_id, extension=EXTN_SQL_LITE
+        Returns
+        -------
+        List[Union[dict, None]]:
+            documents in the order of document_ids, None for ids that do not exist.
+
+        """
+        keys = [str(document_id) for document_id in document_ids]
+        compact_documents = self._get_compact_documents(index_id)
+
+        # Step 1: Look up hot documents
+        documents = {}
+        with self._documents_lock:
+            for key in keys:
+                document = self._documents_cache.get((index_id, key))
+                if document is not None:
+                    documents[key] = document
+        missing_keys = list(dict.fromkeys(key for key in keys if key not in documents))
+
+        # Step 2: Load the remaining documents
+        if missing_keys:
+            if compact_documents is not None:
+                loaded_documents = compact_documents.get(missing_keys)
+            else:
+                loaded_documents = get_sqlite_dict_items(
+                    self.get_index_documents_database(index_id=index_id), missing_keys
+                )
+
+            with self._documents_lock:
+                for key, document in loaded_documents.items():
+                    self._documents_cache[(index_id, key)] = document
+            documents.update(loaded_documents)
+
+        return [documents.get(key) for key in keys]
+
+    def get_index_documents_writer(
+        self, index_id: str, append: bool = False
+    ) -> "IndexDocumentsWriter":
+        """
+        Get a writer which streams documents to `documents.tsv`, `documents.sqlite` and the compact
+        document files of an index.
+
+        Parameters
+        ----------
+        index_id: str
+            unique identifier for the index.
+        append: bool
+            add documents after the existing ones, numbered from the number of existing documents + 1.
+
+        Returns
+        -------
+        IndexDocumentsWriter:
+            writer, documents are readable from the store once it is closed.
+
+        """
+        self._clear_documents_cache(index_id)
+        return IndexDocumentsWriter(
+            self.get_index_documents_file_path(index_id, extension=EXTN_TSV),
+            self.get_index_documents_file_path(index_id, extension=EXTN_SQL_LITE),
+            self.get_index_documents_file_path(index_id, extension=EXTN_JSONL),
+            self.get_index_documents_file_path(index_id, extension=EXTN_OFFSETS),
+            append=append,
+            on_close=lambda: self._clear_documents_cache(index_id),
         )
-        os.makedirs(os.path.dirname(documents_sqlite_file_path), exist_ok=True)
 
-    def get_index_document(self, index_id: str, document_idx: int):
-        database = self.get_index_documents_database(index_id=index_id)
-        return database[str(document_idx)]
+    def get_index_documents_mark(self, index_id: str) -> Tuple[int, int]:
+        """
+        Mark the documents of an index before documents are appended, see `truncate_index_documents`.
+
+        Parameters
+        ----------
+        index_id: str
+            unique identifier for the index.
 
-    def save_index_documents(self, index_id: str, documents: List[dict]):
-        # Step 1: Create `documents.tsv` in index directory
-        documents_tsv_file_path = self.get_index_documents_file_path(
-            index_id, extension=EXTN_TSV
+        Returns
+        -------
+        Tuple[int, int]:
+            number of documents and size of `documents.tsv` in bytes.
+
+        """
+        return (
+            len(self.get_index_documents_database(index_id=index_id)),
+            os.path.getsize(
+                self.get_index_documents_file_path(index_id, extension=EXTN_TSV)
+            ),
         )
-        os.makedirs(os.path.dirname(documents_tsv_file_path), exist_ok=True)
 
-        # Step 2: Create `documents.sqlite` in index directory
-        documents_sqlite_file_path = self.get_index_documents_file_path(
-            index_id, extension=EXTN_SQL_LITE
+    def truncate_index_documents(self, index_id: str, mark: Tuple[int, int]) -> None:
+        """
+        Remove the documents appended to an index after it was marked, e.g. when its update could not
+        be started.
+
+        Parameters
+        ----------
+        index_id: str
+            unique identifier for the index.
+        mark: Tuple[int, int]
+            returned by `get_index_documents_mark` before the documents were appended.
+
+        Returns
+        -------
+        """
+        num_documents, documents_file_size = mark
+        self._clear_documents_cache(index_id)
+
+        # Step 1: Truncate `documents.tsv`
+        os.truncate(
+            self.get_index_documents_file_path(index_id, extension=EXTN_TSV),
+            documents_file_size,
         )
-        os.makedirs(os.path.dirname(documents_sqlite_file_path), exist_ok=True)
 
-        # Step 3: Iterate over documents in the request to save to `documents.tsv` and `documents.sqlite`
-        with open(
-            documents_tsv_file_path, "w", encoding="utf-8"
-        ) as documents_file, SqliteDict(
-            documents_sqlite_file_path, tablename="documents"
+        # Step 2: Delete appended documents from `documents.sqlite`, numbered after the marked ones
+        with SqliteDict(
+            self.get_index_documents_file_path(index_id, extension=EXTN_SQL_LITE),
+            tablename="documents",
         ) as documents_db:
-            # Step 3.a: Add heading row to `documents.tsv`
-            documents_file.write("id\ttext\ttitle\n")
+            for document_idx in range(num_documents + 1, len(documents_db) + 1):
+                documents_db.pop(str(document_idx), None)
+            documents_db.commit()
 
-            # Step 3.b: Iterate over documents to add rows to `documents.tsv` and entries in documents_db
-            for document_idx, document in enumerate(documents):
-                documents_file.write(
-                    f"{str(document_idx + 1)}\t{document['text']}\t{document['title'] if 'title' in document else ''}\n"
+        # Step 3: Truncate compact document files, if the index has them
+        offsets_file_path = self.get_index_documents_file_path(
+            index_id, extension=EXTN_OFFSETS
+        )
+        if os.path.exists(offsets_file_path):
+            offsets = np.load(offsets_file_path)
+            if len(offsets) > num_documents + 1:
+                os.truncate(
+                    self.get_index_documents_file_path(index_id, extension=EXTN_JSONL),
+                    int(offsets[num_documents]),
                 )
-                documents_db[str(document_idx + 1)] = document
+                np.save(offsets_file_path, offsets[: num_documents + 1], allow_pickle=False)
 
-            # Step 3.c: Commit to save documents_db
-            documents_db.commit()
+        self._clear_documents_cache(index_id)
 
-        # Step 4: Clear cache
-        self.get_index_documents_database.cache_clear()
+    def get_index_documents_checksum(self, index_id: str) -> str:
+        """
+        Checksum of an index's `documents.tsv`, recomputed only once the file was rewritten. Indexes with
+        the same checksum were generated from the same documents in the same order, so their document
+        ids refer to the same documents.
+
+        Parameters
+        ----------
+        index_id: str
+            unique identifier for the index.
+
+        Returns
+        -------
+        str:
+            SHA-256 hex digest of the documents file.
+
+        """
+        documents_file_path = self.get_index_documents_file_path(index_id, extension=EXTN_TSV)
+        stat = os.stat(documents_file_path)
+        version = (stat.st_size, stat.st_mtime_ns)
+
+        with self._documents_lock:
+            cached_version, checksum = self._documents_checksums.get(
+                index_id, (None, None)
+            )
+        if cached_version == version:
+            return checksum
+
+        sha256 = hashlib.sha256()
+        with open(documents_file_path, "rb") as documents_file:
+            for block in iter(lambda: documents_file.read(1 << 20), b""):
+                sha256.update(block)
+        checksum = sha256.hexdigest()
+
+        with self._documents_lock:
+            self._documents_checksums[index_id] = (version, checksum)
+        return checksum
+
+    def save_index_documents(self, index_id: str, documents: Iterable[dict]):
+        with self.get_index_documents_writer(index_id) as writer:
+            writer.add(documents)
 
     #############################################################################################
     #                       Indexes
@@ -227,6 +440,7 @@ class Store:
         index_dir_to_be_deleted = self.get_index_directory_path(index_id)
         if os.path.exists(index_dir_to_be_deleted):
             shutil.rmtree(index_dir_to_be_deleted)
+        self._clear_documents_cache(index_id)
 
     def get_index_information(self, index_id: str) -> dict:
         """
@@ -252,6 +466,94 @@ class Store:
             )
         )
 
+    def get_index_information_lock(self, index_id: str) -> FileLock:
+        """
+        Get the lock held by processes updating index information, so that concurrent read-modify-write
+        cycles do not lose each other's updates.
+
+        Parameters
+        ----------
+        index_id: str
+            unique identifier for the index.
+
+        Returns
+        -------
+        FileLock:
+            inter-process lock on the index's `information.json`.
+
+        """
+        index_dir = self.get_index_directory_path(index_id)
+        if not os.path.isdir(index_dir):
+            raise FileNotFoundError(index_dir)
+
+        return FileLock(
+            os.path.join(index_dir, FILENAME_INFORMATION + EXTN_JSON + EXTN_LOCK)
+        )
+
+    def get_index_job_marker_path(self, index_id: str) -> str:
+        # Kept outside of the index directory, which is deleted while the job marker is held
+        return os.path.join(self.root_dir, DIR_NAME_JOBS, str(index_id) + EXTN_PID)
+
+    def _get_index_job_lock(self, index_id: str) -> FileLock:
+        return FileLock(
+            os.path.join(self.root_dir, DIR_NAME_JOBS, str(index_id) + EXTN_LOCK)
+        )
+
+    def _get_index_job_pid(self, index_id: str) -> Union[int, None]:
+        try:
+            with open(self.get_index_job_marker_path(index_id), "r") as file:
+                return int(file.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def claim_index_job(self, index_id: str) -> bool:
+        """
+        Record that a job generating or updating an index was started by this process, so that only one
+        of the server processes sharing the store runs a job on the index at a time. Markers left behind
+        by processes which died are claimed again. The index directory does not need to exist yet.
+
+        Parameters
+        ----------
+        index_id: str
+            unique identifier for the index.
+
+        Returns
+        -------
+        bool:
+            False if another live process holds the job marker.
+
+        """
+        with self._get_index_job_lock(index_id):
+            if self.is_index_job_claimed(index_id):
+                return False
+            with open(self.get_index_job_marker_path(index_id), "w") as file:
+                file.write(str(os.getpid()))
+            return True
+
+    def release_index_job(self, index_id: str) -> None:
+        """
+        Remove the job marker of an index, unless it was claimed again by another process.
+        """
+        with self._get_index_job_lock(index_id):
+            if self._get_index_job_pid(index_id) == os.getpid():
+                os.remove(self.get_index_job_marker_path(index_id))
+
+    def is_index_job_claimed(self, index_id: str) -> bool:
+        """
+        Whether a live process holds the job marker of an index, see `claim_index_job`.
+        """
+        pid = self._get_index_job_pid(index_id)
+        if pid is None:
+            return False
+
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
     def save_index_information(self, index_id: str, information: dict) -> None:
         """
         Save index information.
@@ -277,6 +579,162 @@ class Store:
         )
 
 
+def get_sqlite_dict_items(database: SqliteDict, keys: List[str]) -> dict:
+    """
+    Get the values of many keys of a SqliteDict with one `IN (...)` query per SQLITE_MAX_VARIABLES keys,
+    instead of one query per key. Keys which do not exist are left out.
+    """
+    items = {}
+    for start in range(0, len(keys), SQLITE_MAX_VARIABLES):
+        batch = keys[start : start + SQLITE_MAX_VARIABLES]
+        query = 'SELECT key, value FROM "%s" WHERE key IN (%s)' % (
+            database.tablename,
+            ", ".join("?" * len(batch)),
+        )
+        for key, value in database.conn.select(query, tuple(batch)):
+            items[key] = database.decode(value)
+    return items
+
+
+class CompactDocuments:
+    """
+    Read-only view of the compact document files of an index: one JSON document per line in
+    `documents.jsonl` and the int64 byte offsets of the lines in `documents.offsets.npy`,
+    both memory mapped so a document is looked up without any query.
+    """
+
+    def __init__(self, documents_jsonl_file_path: str, documents_offsets_file_path: str):
+        self.offsets = np.load(documents_offsets_file_path, mmap_mode="r")
+        # np.memmap cannot map an empty file
+        self.data = (
+            np.memmap(documents_jsonl_file_path, dtype=np.uint8, mode="r")
+            if self.offsets[-1] > 0
+            else np.zeros(0, dtype=np.uint8)
+        )
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def get(self, keys: List[str]) -> dict:
+        documents = {}
+        for key in keys:
+            try:
+                row = int(key) - 1
+            except ValueError:
+                continue
+            if 0 <= row < len(self):
+                documents[key] = json.loads(
+                    self.data[self.offsets[row] : self.offsets[row + 1]]
+                    .tobytes()
+                    .decode("utf-8")
+                )
+        return documents
+
+
+class IndexDocumentsWriter:
+    """
+    Writes documents to `documents.tsv` and `documents.sqlite` as they arrive, so they do not have
+    to be collected in memory first. Documents are numbered from 1 in the order they are added.
+
+    In append mode, documents are numbered after the existing ones. The compact document files are
+    only extended if they exist, otherwise the store keeps reading documents from `documents.sqlite`.
+    """
+
+    def __init__(
+        self,
+        documents_tsv_file_path: str,
+        documents_sqlite_file_path: str,
+        documents_jsonl_file_path: str,
+        documents_offsets_file_path: str,
+        append: bool = False,
+        commit_every: int = 10000,
+        on_close: Callable[[], None] = None,
+    ):
+        # Step 1: Create `documents.tsv`, `documents.sqlite` and compact document files in index directory
+        os.makedirs(os.path.dirname(documents_tsv_file_path), exist_ok=True)
+        os.makedirs(os.path.dirname(documents_sqlite_file_path), exist_ok=True)
+        self._documents_file = open(
+            documents_tsv_file_path, "a" if append else "w", encoding="utf-8"
+        )
+        self._documents_db = SqliteDict(
+            documents_sqlite_file_path, tablename="documents", flag="c" if append else "w"
+        )
+        self._offsets = array("q", [0])
+        if append and os.path.exists(documents_offsets_file_path):
+            self._offsets = array(
+                "q", np.load(documents_offsets_file_path).astype(np.int64).tobytes()
+            )
+        # The offsets are written last, a compact document file without offsets is ignored
+        has_compact_documents = not append or os.path.exists(documents_offsets_file_path)
+        if os.path.exists(documents_offsets_file_path):
+            os.remove(documents_offsets_file_path)
+        self._documents_jsonl_file = (
+            open(documents_jsonl_file_path, "ab" if append else "wb")
+            if has_compact_documents
+            else None
+        )
+        self._documents_offsets_file_path = documents_offsets_file_path
+        self._commit_every = commit_every
+        self._on_close = on_close
+        self.num_documents = len(self._documents_db) if append else 0
+
+        # Step 2: Add heading row to `documents.tsv`
+        if not append:
+            self._documents_file.write("id\ttext\ttitle\n")
+
+    def add(self, documents: Iterable[dict]) -> int:
+        """
+        Add documents.
+
+        Parameters
+        ----------
+        documents: Iterable[dict]
+            documents with "text" and optional "title" and "document_id".
+
+        Returns
+        -------
+        int:
+            number of documents written so far.
+
+        """
+        for document in documents:
+            self.num_documents += 1
+            self._documents_file.write(
+                f"{str(self.num_documents)}\t{document['text']}\t{document['title'] if 'title' in document else ''}\n"
+            )
+            self._documents_db[str(self.num_documents)] = document
+
+            if self._documents_jsonl_file is not None:
+                encoded = json.dumps(document, ensure_ascii=False).encode("utf-8")
+                self._documents_jsonl_file.write(encoded + b"\n")
+                self._offsets.append(self._offsets[-1] + len(encoded) + 1)
+
+            if self.num_documents % self._commit_every == 0:
+                self._documents_db.commit()
+
+        return self.num_documents
+
+    def close(self):
+        self._documents_file.close()
+        self._documents_db.commit()
+        self._documents_db.close()
+        if self._documents_jsonl_file is not None:
+            self._documents_jsonl_file.close()
+            np.save(
+                self._documents_offsets_file_path,
+                np.frombuffer(self._offsets, dtype=np.int64),
+                allow_pickle=False,
+            )
+        if self._on_close is not None:
+            self._on_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
 class StoreFactory:
     _instance = None
 
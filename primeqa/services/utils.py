@@ -1,5 +1,6 @@
 import os
 import json
+import threading
 import uuid
 
 
@@ -56,5 +57,9 @@ def save_json(item, file_path: str, encoding: str = "utf-8"):
 
     """
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    with open(file_path, "w", encoding=encoding) as file:
+
+    # Write to a temporary file and rename it, so concurrent readers never see a partially written file
+    tmp_file_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_file_path, "w", encoding=encoding) as file:
         json.dump(item, file, indent=4)
+    os.replace(tmp_file_path, file_path)
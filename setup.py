@@ -97,12 +97,15 @@ _deps = {
     "fastapi~=0.85.0": ["install", "gpu"],
     "uvicorn~=0.18.0": ["install", "gpu"],
     "cachetools~=5.2.0": ["install", "gpu"],
+    "filelock~=3.9.0": ["install", "gpu"],
     "sqlitedict~=2.0.0": ["install", "gpu"],
     "openai~=0.27.0": ["install", "gpu"],
-    "nltk~=3.8.1": ["install", "gpu"]
+    "nltk~=3.8.1": ["install", "gpu"],
+    "onnx~=1.12.0": ["onnx"],
+    "onnxruntime~=1.13.1": ["onnx"]
 }
 
-extras_names = ["docs", "dev", "install", "notebooks", "tests", "gpu"]
+extras_names = ["docs", "dev", "install", "notebooks", "tests", "gpu", "onnx"]
 extras = {extra_name: [] for extra_name in extras_names}
 for dep_package_name, dep_package_required_by in _deps.items():
     if not dep_package_required_by:
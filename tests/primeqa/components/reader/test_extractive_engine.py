@@ -0,0 +1,89 @@
+import json
+import tempfile
+
+import numpy as np
+import pytest
+from datasets import Dataset
+from transformers import DataCollatorWithPadding, TrainingArguments
+
+from primeqa.components.reader.extractive_engine import ExtractiveInferenceEngine
+from primeqa.mrc.processors.postprocessors.extractive import ExtractivePostProcessor
+from primeqa.mrc.processors.postprocessors.scorers import SupportedSpanScorers
+from primeqa.mrc.trainers.mrc import MRCTrainer
+from tests.primeqa.mrc.common.base import UnitTest
+
+
+class TestExtractiveInferenceEngine(UnitTest):
+    @pytest.fixture(scope='session')
+    def examples(self):
+        # The first context is split into several features, longer than those of the other examples
+        return dict(
+            question=["Where does Glenn live?", "Who walked the dog?", "What time is it?", "Who walked the dog?"],
+            context=[["Glenn the otter lives at the aquarium. " * 100],
+                     ["Alice walks the cat", "Bob walks the dog"],
+                     ["The quick brown fox jumps over the lazy dog", "Glenn the otter lives at the aquarium", "Go"],
+                     ["Bob walks the dog"]],
+            example_id=["long", "foo-abc", "bar-123", "short"],
+        )
+
+    @staticmethod
+    def _assert_predictions_equal(actual, expected):
+        if isinstance(expected, dict):
+            assert isinstance(actual, dict)
+            assert actual.keys() == expected.keys()
+            for key in expected:
+                TestExtractiveInferenceEngine._assert_predictions_equal(actual[key], expected[key])
+        elif isinstance(expected, list):
+            assert isinstance(actual, list)
+            assert len(actual) == len(expected)
+            for actual_item, expected_item in zip(actual, expected):
+                TestExtractiveInferenceEngine._assert_predictions_equal(actual_item, expected_item)
+        elif isinstance(expected, (float, np.floating)):
+            # Padding to the longest feature of a batch changes logits by rounding errors only
+            assert actual == pytest.approx(expected, rel=1e-4, abs=1e-4)
+        else:
+            assert actual == expected
+
+    def test_process_eval_batch(self, preprocessor, examples):
+        _, expected = preprocessor.process_eval(Dataset.from_dict(examples))
+        actual = preprocessor.process_eval_batch(examples)
+        for name in expected.column_names:
+            # Datasets store the offset tuples as lists
+            assert json.loads(json.dumps(actual[name])) == expected[name]
+
+        # Features are not in length order, so batches of the engine are reordered
+        lengths = [len(input_ids) for input_ids in actual['input_ids']]
+        assert lengths != sorted(lengths)
+
+    @pytest.mark.parametrize('batch_size', [1, 2, 8])
+    def test_predictions_match_trainer(self, config_and_model_with_extractive_head, tokenizer, preprocessor,
+                                       examples, batch_size):
+        _, model = config_and_model_with_extractive_head
+        scorer_type = SupportedSpanScorers.WEIGHTED_SUM_TARGET_TYPE_AND_SCORE_DIFF
+        postprocessor = ExtractivePostProcessor(k=3, n_best_size=5, max_answer_length=30, scorer_type=scorer_type)
+
+        with tempfile.TemporaryDirectory() as working_dir:
+            trainer = MRCTrainer(
+                model=model,
+                args=TrainingArguments(output_dir=working_dir, per_device_eval_batch_size=batch_size),
+                tokenizer=tokenizer,
+                data_collator=DataCollatorWithPadding(tokenizer),
+                post_process_function=postprocessor.process,
+            )
+            eval_examples, eval_features = preprocessor.process_eval(Dataset.from_dict(examples))
+            expected = trainer.predict(eval_dataset=eval_features, eval_examples=eval_examples)
+
+        engine = ExtractiveInferenceEngine(model, tokenizer, preprocessor, n_best_size=5, scorer_type=scorer_type,
+                                           batch_size=batch_size, device=str(trainer.args.device))
+        actual = engine.predict(examples['question'], examples['context'], examples['example_id'],
+                                max_num_answers=3, max_answer_length=30)
+
+        assert list(actual.keys()) == list(expected.keys())
+        assert all(expected[example_id] for example_id in examples['example_id'])
+        self._assert_predictions_equal(actual, expected)
+
+    def test_predict_without_questions(self, config_and_model_with_extractive_head, tokenizer, preprocessor):
+        _, model = config_and_model_with_extractive_head
+        engine = ExtractiveInferenceEngine(model, tokenizer, preprocessor, n_best_size=5,
+                                           scorer_type=SupportedSpanScorers.SCORE_DIFF_BASED)
+        assert engine.predict([], [], [], max_num_answers=3, max_answer_length=30) == {}
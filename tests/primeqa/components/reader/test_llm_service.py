@@ -0,0 +1,97 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from primeqa.components.reader.LLMService import LLMService, TokenBucket
+
+
+class StubBAMHandler(BaseHTTPRequestHandler):
+    # responses to send before answering normally, e.g. [429, 500]
+    failures = []
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests.append(body)
+        status = self.failures.pop(0) if self.failures else 200
+        if status == 200:
+            payload = {
+                "results": [
+                    {"generated_text": prompt.upper()} for prompt in body["inputs"]
+                ]
+            }
+        elif status == 429:
+            payload = {"extensions": {"state": {"expires_in_ms": 200}}}
+        else:
+            payload = {"error": "failed"}
+
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def service():
+    StubBAMHandler.failures = []
+    StubBAMHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubBAMHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield LLMService(
+        token="token",
+        base_url=f"http://127.0.0.1:{server.server_address[1]}/v0/generate",
+        max_retries=2,
+        backoff_factor=0.01,
+        batch_size=2,
+    )
+    server.shutdown()
+    server.server_close()
+
+
+def test_generate_many_batches_prompts(service):
+    prompts = ["a", "b", "c", "d", "e"]
+    results = service.generate_many(prompts, max_new_tokens=5)
+
+    assert [result["generated_text"] for result in results] == ["A", "B", "C", "D", "E"]
+    assert sorted(len(request["inputs"]) for request in StubBAMHandler.requests) == [1, 2, 2]
+    assert StubBAMHandler.requests[0]["parameters"]["max_new_tokens"] == 5
+
+
+def test_rate_limited_and_failed_requests_are_retried(service):
+    StubBAMHandler.failures = [429, 500]
+    start_t = time.monotonic()
+    response = service.generate(["a"])
+
+    assert response["results"] == [{"generated_text": "A"}]
+    assert len(StubBAMHandler.requests) == 3
+    # waited for the rate limit to expire
+    assert time.monotonic() - start_t >= 0.2
+
+
+def test_errors_are_returned_once_retries_are_exhausted(service):
+    StubBAMHandler.failures = [400]
+    assert service.generate_many(["a", "b"]) == [
+        {"error": "Bad Request", "status": 400},
+        {"error": "Bad Request", "status": 400},
+    ]
+
+    StubBAMHandler.failures = [500, 500, 500]
+    assert service.generate(["a"])["status"] == 500
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=20, capacity=2)
+    start_t = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # 2 requests in the initial burst, then 4 at 20 per second
+    assert time.monotonic() - start_t >= 0.18
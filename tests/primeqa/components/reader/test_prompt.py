@@ -0,0 +1,62 @@
+import pytest
+
+from primeqa.components.reader.prompt import PromptFLANT5Reader
+
+TINY_T5 = "hf-internal-testing/tiny-random-t5"
+
+
+@pytest.fixture(scope="module")
+def reader():
+    reader = PromptFLANT5Reader(
+        model_name=TINY_T5, max_new_tokens=8, min_new_tokens=1, max_batch_size=2
+    )
+    reader.load()
+    return reader
+
+
+@pytest.fixture
+def generated_batch_sizes(reader, monkeypatch):
+    batch_sizes = []
+    generate = reader._model.generate
+
+    def counting_generate(**kwargs):
+        batch_sizes.append(kwargs["input_ids"].shape[0])
+        return generate(**kwargs)
+
+    monkeypatch.setattr(reader._model, "generate", counting_generate)
+    return batch_sizes
+
+
+def test_batched_generation_matches_one_at_a_time(reader, generated_batch_sizes):
+    # Prompts of different lengths, so batches are padded and sorted by length
+    prompts = [
+        "Question: Who walked the dog?",
+        "Question: What time is it? Text: The quick brown fox jumps over the lazy dog, Go",
+        "Question: Where does Glenn live? Text: Glenn the otter lives at the aquarium",
+        "Question: Why?",
+        "Question: Who walks the cat? Text: Alice walks the cat",
+    ]
+
+    batched = reader._generate(prompts)
+    assert generated_batch_sizes == [2, 2, 1]
+
+    one_at_a_time = [reader._generate([prompt])[0] for prompt in prompts]
+    assert batched == one_at_a_time
+
+
+def test_duplicate_prompts_are_generated_once(reader, generated_batch_sizes):
+    prompts = ["Question: Who walked the dog?", "Question: Why?"]
+    span_answer_texts = reader._generate(prompts * 3)
+
+    assert sum(generated_batch_sizes) == 2
+    assert span_answer_texts == reader._generate(prompts) * 3
+
+    # Every question gets an answer, also when it was asked before
+    predictions = reader.predict(
+        ["Who walked the dog?", "Why?", "Who walked the dog?"],
+        contexts=[["Bob walks the dog"], [], ["Bob walks the dog"]],
+    )
+    assert sorted(predictions.keys()) == [0, 1, 2]
+    assert (
+        predictions[0][0]["span_answer_text"] == predictions[2][0]["span_answer_text"]
+    )
@@ -0,0 +1,98 @@
+from tests.primeqa.mrc.common.base import UnitTest
+import os
+import tempfile
+
+import pytest
+
+import torch
+import ujson
+
+from primeqa.ir.dense.colbert_top.colbert.infra.config import ColBERTConfig
+from primeqa.ir.dense.colbert_top.colbert.indexing.codecs.residual import ResidualCodec
+from primeqa.ir.dense.colbert_top.colbert.indexing.index_updater import IndexUpdater, TOMBSTONES_FILENAME
+from primeqa.ir.dense.colbert_top.colbert.search.index_storage import IndexScorer
+
+DIM = 16
+NUM_PARTITIONS = 4
+
+
+class _Encoder:
+    # A passage "c" is embedded as two copies of the c-th unit vector, i.e. of the c-th centroid
+    def encode_passages(self, passages):
+        embs = torch.cat([torch.eye(DIM)[int(passage)].repeat(2, 1) for passage in passages])
+        return embs, [2] * len(passages)
+
+
+def _create_empty_index(index_path):
+    config = ColBERTConfig(dim=DIM, nbits=2, index_path=index_path)
+    with open(os.path.join(index_path, 'metadata.json'), 'w') as f:
+        ujson.dump({'config': config.export(), 'num_chunks': 0, 'num_partitions': NUM_PARTITIONS,
+                    'num_embeddings': 0, 'avg_doclen': 0}, f)
+
+    codec = ResidualCodec(config, torch.eye(DIM)[:NUM_PARTITIONS], avg_residual=0.01,
+                          bucket_cutoffs=torch.tensor([-0.01, 0.0, 0.01]),
+                          bucket_weights=torch.tensor([-0.02, -0.005, 0.005, 0.02]))
+    codec.save(index_path)
+    torch.save((torch.zeros(0, dtype=torch.int32), torch.zeros(NUM_PARTITIONS, dtype=torch.int64)),
+               os.path.join(index_path, 'ivf.pid.pt'))
+
+
+def _search(index_path, centroid_idx):
+    config = ColBERTConfig(query_maxlen=2, ncells=1, centroid_score_threshold=0.5, ndocs=10)
+    scorer = IndexScorer(index_path, use_gpu=torch.cuda.is_available())
+    Q = torch.eye(DIM)[centroid_idx].repeat(1, 2, 1)
+    pids, scores = scorer.rank(config, Q, k=10)
+    return dict(zip(pids, scores))
+
+
+class TestIndexUpdater(UnitTest):
+
+    def test_add_delete_compact(self):
+        with tempfile.TemporaryDirectory() as index_path:
+            _create_empty_index(index_path)
+            updater = IndexUpdater(index_path)
+            updater.encoder = _Encoder()
+
+            # Added passages are numbered after the indexed ones, each add writes new chunks
+            assert updater.add(['0', '1', '2']) == [0, 1, 2]
+            assert updater.add(['3', '1'], chunksize=1) == [3, 4]
+            assert updater.num_passages == 5
+            assert updater.metadata['num_chunks'] == 3
+
+            results = _search(index_path, 1)
+            assert set(results) == {1, 4}
+            assert set(_search(index_path, 3)) == {3}
+
+            # Deleted passages are filtered out by IndexScorer.score_pids
+            assert updater.delete([1]) == 1
+            assert updater.delete([1]) == 0
+            assert set(_search(index_path, 1)) == {4}
+
+            # Compaction drops the deleted passages and merges the chunks, the other passages keep their ids
+            updater.compact()
+            assert not os.path.exists(os.path.join(index_path, TOMBSTONES_FILENAME))
+            assert updater.metadata['num_chunks'] == 1
+            assert updater.metadata['num_embeddings'] == 8
+            assert updater.num_passages == 5
+
+            with open(os.path.join(index_path, 'doclens.0.json')) as f:
+                assert ujson.load(f) == [2, 0, 2, 2, 2]
+
+            ivf, ivf_lengths = torch.load(os.path.join(index_path, 'ivf.pid.pt'))
+            assert ivf.tolist() == [0, 4, 2, 3]
+            assert ivf_lengths.tolist() == [1, 1, 1, 1]
+
+            compacted_results = _search(index_path, 1)
+            assert set(compacted_results) == {4}
+            assert abs(compacted_results[4] - results[4]) < 1e-4
+            assert set(_search(index_path, 2)) == {2}
+
+    def test_delete_unknown_passage(self):
+        with tempfile.TemporaryDirectory() as index_path:
+            _create_empty_index(index_path)
+            updater = IndexUpdater(index_path)
+            updater.encoder = _Encoder()
+            updater.add(['0'])
+
+            with pytest.raises(ValueError):
+                updater.delete([1])
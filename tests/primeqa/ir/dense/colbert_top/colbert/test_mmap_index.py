@@ -0,0 +1,35 @@
+from tests.primeqa.mrc.common.base import UnitTest
+import os
+import tempfile
+
+from primeqa.ir.dense.colbert_top.colbert.indexing.index_updater import IndexUpdater
+from primeqa.ir.dense.colbert_top.colbert.indexing.mmap_index import ensure_mmap_index, mmap_index_exists, \
+    load_mmap_metadata, load_mmap_doclens, MMAP_METADATA_FILENAME
+from tests.primeqa.ir.dense.colbert_top.colbert.test_index_updater import _create_empty_index, _Encoder
+
+
+class TestMmapIndex(UnitTest):
+
+    def test_ensure_mmap_index(self):
+        with tempfile.TemporaryDirectory() as index_path:
+            _create_empty_index(index_path)
+            updater = IndexUpdater(index_path)
+            updater.encoder = _Encoder()
+            updater.add(['0', '1', '2'])
+
+            assert not mmap_index_exists(index_path)
+            ensure_mmap_index(index_path)
+            assert mmap_index_exists(index_path)
+            assert load_mmap_doclens(index_path).tolist() == [2, 2, 2]
+            assert not any(filename.endswith('.tmp') for filename in os.listdir(index_path))
+
+            # the current version is not converted again
+            mtime = os.stat(os.path.join(index_path, MMAP_METADATA_FILENAME)).st_mtime_ns
+            ensure_mmap_index(index_path)
+            assert os.stat(os.path.join(index_path, MMAP_METADATA_FILENAME)).st_mtime_ns == mtime
+
+            # an update removes the files, they are converted from the new version
+            updater.add(['3'])
+            assert not mmap_index_exists(index_path)
+            ensure_mmap_index(index_path)
+            assert load_mmap_metadata(index_path)['num_passages'] == 4
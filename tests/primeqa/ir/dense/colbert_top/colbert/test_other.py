@@ -58,6 +58,50 @@ class TestOther(UnitTest):
 
         docs2passages_main(args)
 
+    def test_collection(self):
+        from primeqa.ir.dense.colbert_top.colbert.data.collection import Collection
+        from primeqa.ir.dense.colbert_top.colbert.evaluation.loaders import load_collection
+
+        collection_fn = os.path.join('tests/resources/ir_dense', "xorqa.train_ir_001pct_at_0_pct_collection_fornum.tsv")
+        passages = load_collection(collection_fn)
+        collection = Collection(path=collection_fn)
+
+        assert len(collection) == len(passages)
+        assert list(collection) == passages
+        assert [collection[pid] for pid in range(len(collection))] == passages
+        assert collection[2:5] == passages[2:5]
+        assert collection[-1] == passages[-1]
+
+    def test_build_pid_ivf(self):
+        import torch
+        import ujson
+        from primeqa.ir.dense.colbert_top.colbert.indexing.utils import build_pid_ivf, optimize_ivf
+
+        num_partitions = 8
+        chunks = [[3, 1, 4], [1, 5], [9, 2, 6, 5]]
+
+        with tempfile.TemporaryDirectory() as index_path:
+            all_codes, passage_offset = [], 0
+            for chunk_idx, doclens in enumerate(chunks):
+                codes = torch.randint(num_partitions, (sum(doclens),), dtype=torch.int32)
+                all_codes.append(codes)
+                torch.save(codes, os.path.join(index_path, f'{chunk_idx}.codes.pt'))
+                with open(os.path.join(index_path, f'doclens.{chunk_idx}.json'), 'w') as f:
+                    ujson.dump(doclens, f)
+                with open(os.path.join(index_path, f'{chunk_idx}.metadata.json'), 'w') as f:
+                    ujson.dump({'passage_offset': passage_offset, 'num_passages': len(doclens)}, f)
+                passage_offset += len(doclens)
+
+            ivf_lengths = build_pid_ivf(index_path, len(chunks), num_partitions)
+            ivf, _ = torch.load(os.path.join(index_path, 'ivf.pid.pt'))
+
+            codes = torch.cat(all_codes).sort()
+            expected_ivf, expected_ivf_lengths = optimize_ivf(
+                codes.indices, torch.bincount(codes.values.long(), minlength=num_partitions), index_path)
+
+        assert ivf_lengths.tolist() == expected_ivf_lengths.tolist()
+        assert ivf.tolist() == expected_ivf.tolist()
+
 if __name__ == '__main__':
     test = TestOther()
     test.test_utility()
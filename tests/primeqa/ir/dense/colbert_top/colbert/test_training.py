@@ -5,6 +5,8 @@ import tempfile
 import json
 from typing import Tuple
 
+import torch
+
 
 from primeqa.ir.dense.colbert_top.colbert.utils.utils import create_directory, print_message
 from primeqa.ir.dense.colbert_top.colbert.infra import Run, RunConfig
@@ -16,6 +18,8 @@ from primeqa.ir.dense.colbert_top.colbert.utils.parser import Arguments
 from primeqa.ir.dense.colbert_top.colbert.training.training import train
 from primeqa.ir.dense.colbert_top.colbert.indexing.collection_indexer import encode
 from primeqa.ir.dense.colbert_top.colbert.searcher import Searcher
+from primeqa.ir.dense.colbert_top.colbert.data import Queries
+from primeqa.ir.util.query_embedding_cache import QUERY_EMBEDDING_CACHE
 
 class TestTraining(UnitTest):
     @classmethod
@@ -138,6 +142,29 @@ class TestTraining(UnitTest):
                 out_fn = args_dict['ranks_fn']
                 rankings.save(out_fn)
 
+                # the batched search path must agree with single-query search
+                queries = Queries.cast(args_dict['queries'])
+                for qid, query in list(queries.items())[:4]:
+                    pids, _, _ = searcher.search(query, k=args_dict['topK'])
+                    assert [pid for pid, _, _ in rankings.data[qid]] == pids
+
+                # the memory-mapped index must produce the same rankings
+                colBERTConfig = ColBERTConfig(**args_dict, load_index_with_mmap=True)
+                mmap_searcher = Searcher(args_dict['index_name'], checkpoint=args_dict['checkpoint'], collection=args_dict['collection'], config=colBERTConfig)
+                mmap_rankings = mmap_searcher.search_all(args_dict['queries'], args_dict['topK'])
+                assert [[pid for pid, _, _ in ranking] for ranking in mmap_rankings.data.values()] == \
+                       [[pid for pid, _, _ in ranking] for ranking in rankings.data.values()]
+
+                # a reranker with the same checkpoint reuses the query embedding of the search
+                reranker = Searcher(None, checkpoint=args_dict['checkpoint'], config=colBERTConfig, rescore_only=True)
+                query = 'a query which was not searched before'
+                searcher.search(query, k=args_dict['topK'])
+                stats = QUERY_EMBEDDING_CACHE.stats()
+                reranker.rescore(query, ['a passage to rescore'])
+                assert QUERY_EMBEDDING_CACHE.stats()['hits'] == stats['hits'] + 1
+                assert QUERY_EMBEDDING_CACHE.stats()['misses'] == stats['misses']
+                assert torch.equal(reranker.encode(query), searcher.encode(query))
+
             print("SEARCH DONE")
 
         print("ALL DONE")
@@ -2,6 +2,7 @@ from tests.primeqa.mrc.common.base import UnitTest
 import pytest
 import os
 import argparse, sys
+import numpy as np
 
 from unittest.mock import patch
 import tempfile
@@ -10,8 +11,11 @@ from transformers import HfArgumentParser
 
 from primeqa.ir.dense.dpr_top.dpr.biencoder_trainer import BiEncoderTrainer
 from primeqa.ir.dense.dpr_top.dpr.index_simple_corpus import DPRIndexer
-from primeqa.ir.dense.dpr_top.dpr.searcher import DPRSearcher
+from primeqa.ir.dense.dpr_top.dpr.searcher import DPRSearcher, top_k_indices
+from primeqa.ir.dense.dpr_top.dpr.simple_mmap_dataset import Corpus
+from primeqa.ir.dense.dpr_top.dpr.columnar_corpus import ColumnarCorpus, convert_to_columnar
 from primeqa.ir.dense.dpr_top.dpr.config import DPRTrainingArguments, DPRIndexingArguments, DPRSearchArguments
+from primeqa.ir.util.query_embedding_cache import QUERY_EMBEDDING_CACHE
 
 
 class TestDprEngine(UnitTest):
@@ -22,6 +26,11 @@ class TestDprEngine(UnitTest):
             location = os.environ['DATA_FILES_FOR_DENSE_IR_TESTS_PATH']
         return location
 
+    def test_top_k_indices(self):
+        scores = np.array([[0.1, 0.9, 0.5, 0.7], [3.0, 1.0, 2.0, 0.0]], dtype=np.float32)
+        assert top_k_indices(scores, 2).tolist() == [[1, 3], [0, 2]]
+        assert top_k_indices(scores, 4).tolist() == [[1, 3, 2, 0], [0, 2, 1, 3]]
+
     def test_engine(self, test_files_location):
         with tempfile.TemporaryDirectory() as working_dir:
             output_dir=os.path.join(working_dir, 'output_dir')
@@ -132,6 +141,48 @@ class TestDprEngine(UnitTest):
             indexer = DPRIndexer(dpr_args)
             indexer.index()
 
+        records_file = os.path.join(output_dir, 'passages_1_of_1.json.gz.records')
+        records = Corpus(records_file)
+        assert records.pid_indexes is not None
+        columnar = ColumnarCorpus(convert_to_columnar(records_file))
+        assert len(columnar) == len(records)
+        for ndx in range(len(records)):
+            expected, actual = records[ndx], columnar[ndx]
+            assert all(actual[name] == expected[name] for name in ['pid', 'title', 'text'])
+            assert np.array_equal(actual['vector'], expected['vector'])
+            assert records.find_pid(expected['pid']) == ndx
+            assert columnar.find_pid(expected['pid']) == ndx
+        assert records.get_by_pid('no such pid') is None
+
+        # a completed shard is skipped when indexing is run again
+        assert os.path.exists(indexer.shard_done_file())
+        mtime = os.path.getmtime(records_file)
+        DPRIndexer(dpr_args).index()
+        assert os.path.getmtime(records_file) == mtime
+
+        print("===== DPR INDEXING, multiple workers")
+
+        parallel_dir = os.path.join(output_dir, "parallel")
+        test_args = [
+            "prog",
+            "--ctx_encoder_name_or_path", os.path.join(output_dir, "ctx_encoder"),
+            "--sharded_index",
+            "--bsize", "1",
+            "--num_workers", "2",
+            "--threads_per_worker", "1",
+            "--collection", os.path.join(test_files_location,"xorqa.train_ir_001pct_at_0_pct_collection_fornum.tsv"),
+            "--output_dir", parallel_dir]
+
+        with patch.object(sys, 'argv', test_args):
+            parser = HfArgumentParser([DPRIndexingArguments])
+            (parallel_args, remaining_args) = parser.parse_args_into_dataclasses(return_remaining_strings=True)
+            DPRIndexer(parallel_args).index()
+
+        parallel_records = Corpus(parallel_dir)
+        assert len(parallel_records) == len(records)
+        assert sorted(parallel_records[ndx]['pid'] for ndx in range(len(parallel_records))) == \
+               sorted(records[ndx]['pid'] for ndx in range(len(records)))
+
         print("===== DPR SEARCH")
 
         test_args = [
@@ -150,4 +201,18 @@ class TestDprEngine(UnitTest):
             searcher.search()
             searcher.search(query_batch = ['Who maintained the throne for the longest time in China?'], mode = 'query_list')
 
+        # the query was encoded by the search, encoding it again for rescoring is a cache hit
+        stats = QUERY_EMBEDDING_CACHE.stats()
+        query_vectors = searcher.encode(['Who maintained the throne for the longest time in China?']).cpu().numpy().astype(np.float32)
+        assert QUERY_EMBEDDING_CACHE.stats()['hits'] == stats['hits'] + 1
+        assert QUERY_EMBEDDING_CACHE.stats()['misses'] == stats['misses']
+
+        # asking for more passages than the shard holds, FAISS pads the results with index -1
+        k = len(records) + 2
+        docs, scores = searcher.merge_results(query_vectors, k)
+        assert len(docs[0]) == k
+        assert sorted(doc['pid'] for doc in docs[0][:len(records)]) == \
+               sorted(records[ndx]['pid'] for ndx in range(len(records)))
+        assert [doc['pid'] for doc in docs[0][len(records):]] == ['N/A', 'N/A']
+
         print("===== DPR ALL DONE")
\ No newline at end of file
@@ -0,0 +1,87 @@
+from tests.primeqa.mrc.common.base import UnitTest
+import pytest
+import os
+import tempfile
+import numpy as np
+from collections import Counter
+
+import primeqa.ir.sparse.native_bm25 as native_bm25
+from primeqa.ir.sparse.native_bm25 import NativeBM25Indexer, NativeBM25Retriever, analyze, varbyte_encode, varbyte_decode
+from primeqa.ir.util.corpus_reader import corpus_reader
+
+
+class TestNativeBM25(UnitTest):
+
+    @pytest.fixture(scope='session')
+    def collection(self):
+        # The current directory to handle running from IDE or command line
+        curdir = os.getcwd()
+        if curdir.endswith('tests'):
+            return '../tests/resources/ir_sparse/sample_wiki_psgs_w100_corpus'
+        return 'tests/resources/ir_sparse/sample_wiki_psgs_w100_corpus'
+
+    @pytest.fixture(scope='session')
+    def queries(self):
+        return [
+            'who designed the South African 1961 one-cent postage stamp',
+            'vitamin e deficiency',
+            'where is the Presanella located',
+        ]
+
+    @pytest.fixture(scope='session')
+    def expected_search_results(self):
+        # same documents as the Pyserini index of the corpus
+        return [
+            [(0, '20076582'), (1, '19750546')],
+            [(0, '15415536'), (1, '18680280')],
+            [(0, '8356488'), (1, '8237529')],
+        ]
+
+    def test_varbyte(self):
+        values = np.array([0, 1, 127, 128, 300, 2**31, 2**40])
+        assert varbyte_decode(varbyte_encode(values)).tolist() == values.tolist()
+
+    def test_retrieve(self, collection, queries, expected_search_results):
+        with tempfile.TemporaryDirectory() as index_path:
+            num_docs = NativeBM25Indexer().index_collection(collection, index_path, overwrite=True)
+            assert num_docs == 100
+            searcher = NativeBM25Retriever(index_path)
+            for i, query in enumerate(queries):
+                hits = searcher.retrieve(query, topK=2)
+                assert [(hit['rank'], hit['doc_id']) for hit in hits] == expected_search_results[i]
+                assert all('title' in hit and 'text' in hit for hit in hits)
+
+            qid_to_hits = searcher.batch_retrieve(queries, ['0', '1', '2'], topK=2, threads=2)
+            for i, qid in enumerate(['0', '1', '2']):
+                assert [(hit['rank'], hit['doc_id']) for hit in qid_to_hits[qid]] == expected_search_results[i]
+
+    def test_hydrate(self, collection, queries):
+        with tempfile.TemporaryDirectory() as index_path:
+            NativeBM25Indexer().index_collection(collection, index_path, overwrite=True)
+            searcher = NativeBM25Retriever(index_path)
+            hydrated = searcher.retrieve(queries[0], topK=5)
+            hits = searcher.retrieve(queries[0], topK=5, hydrate=False)
+            assert all(set(hit.keys()) == {'rank', 'score', 'doc_id'} for hit in hits)
+            assert searcher.hydrate(hits) == hydrated
+            assert searcher.docstore.rows(['no such docid', hits[0]['doc_id']]).tolist() == [-1, searcher.docstore.rows([hits[0]['doc_id']])[0]]
+
+    def test_block_max_pruning_is_exact(self, collection, queries, monkeypatch):
+        # small blocks, so that most posting lists have several blocks to skip
+        monkeypatch.setattr(native_bm25, 'BLOCK_SIZE', 4)
+        docs = [Counter(analyze(f'{p.title}\t{p.text}')) for p in corpus_reader(collection)]
+        df = Counter(term for doc in docs for term in doc)
+        avg_doclen = np.mean([sum(doc.values()) for doc in docs])
+        with tempfile.TemporaryDirectory() as index_path:
+            NativeBM25Indexer().index_collection(collection, index_path, overwrite=True)
+            searcher = NativeBM25Retriever(index_path, k1=1.2, b=0.75)
+            for query in queries + ['the history of england and france', 'new york city new york']:
+                expected = []
+                for doc in docs:
+                    doclen = sum(doc.values())
+                    expected.append(sum(
+                        count * np.log(1 + (len(docs) - df[term] + 0.5) / (df[term] + 0.5)) *
+                        doc[term] / (doc[term] + 1.2 * (1 - 0.75 + 0.75 * doclen / avg_doclen))
+                        for term, count in Counter(analyze(query)).items() if term in doc))
+                expected = sorted((score for score in expected if score > 0), reverse=True)[:5]
+                hits = searcher.retrieve(query, topK=5)
+                assert np.allclose([hit['score'] for hit in hits], expected)
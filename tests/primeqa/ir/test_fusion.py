@@ -0,0 +1,29 @@
+from tests.primeqa.mrc.common.base import UnitTest
+import pytest
+
+from primeqa.ir.util.fusion import reciprocal_rank_fusion, linear_fusion
+
+
+class TestFusion(UnitTest):
+
+    @pytest.fixture(scope='session')
+    def rankings(self):
+        sparse = [('1', 12.0), ('2', 8.0), ('3', 4.0)]
+        dense = [(3, 0.9), (1, 0.8), (4, 0.1), (3, 0.05)]
+        return [sparse, dense]
+
+    def test_reciprocal_rank_fusion(self, rankings):
+        fused = reciprocal_rank_fusion(rankings, k=60)
+        assert [doc_id for doc_id, _ in fused] == ['1', '3', '2', '4']
+        assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+        # the second occurrence of document 3 in the dense ranking is ignored
+        assert fused[1][1] == pytest.approx(1 / 63 + 1 / 61)
+        assert len(reciprocal_rank_fusion(rankings, max_num_documents=2)) == 2
+
+    def test_linear_fusion(self, rankings):
+        fused = dict(linear_fusion(rankings, weights=[0.5, 0.5]))
+        assert fused['1'] == pytest.approx(0.5 * 1.0 + 0.5 * 0.875)
+        assert fused['2'] == pytest.approx(0.5 * 0.5)
+        assert fused['3'] == pytest.approx(0.5 * 1.0)
+        assert fused['4'] == pytest.approx(0.0)
+        assert [doc_id for doc_id, _ in linear_fusion(rankings, weights=[1.0, 0.0])][:3] == ['1', '2', '3']
@@ -0,0 +1,61 @@
+from tests.primeqa.mrc.common.base import UnitTest
+import pytest
+import torch
+
+from primeqa.ir.util.query_embedding_cache import QueryEmbeddingCache, normalize_query
+
+
+class _Encoder:
+    def __init__(self):
+        self.encoded = []
+
+    def __call__(self, queries):
+        self.encoded.extend(queries)
+        return torch.stack([torch.full((2, 4), float(len(query))) for query in queries])
+
+
+class TestQueryEmbeddingCache(UnitTest):
+
+    def test_normalize_query(self):
+        assert normalize_query('  Who wrote\tthe\n declaration ') == 'Who wrote the declaration'
+
+    def test_encode(self):
+        cache = QueryEmbeddingCache(max_size=10)
+        encoder = _Encoder()
+
+        Q = cache.encode('model', ['a query', 'another query', 'a  query '], encoder)
+        assert Q.dtype == torch.float32
+        assert Q.shape == (3, 2, 4)
+        assert torch.equal(Q[0], Q[2])
+        assert encoder.encoded == ['a query', 'another query']
+        assert cache._entries[('model', 'a query')].dtype == torch.float16
+
+        Q = cache.encode('model', ['another query', 'new'], encoder)
+        assert torch.equal(Q[0], torch.full((2, 4), 13.0))
+        assert encoder.encoded == ['a query', 'another query', 'new']
+
+        # embeddings of another encoder are cached apart
+        cache.encode('other model', ['a query'], encoder)
+        assert encoder.encoded[-1] == 'a query'
+
+        assert (cache.hits, cache.misses) == (1, 5)
+        assert cache.hit_rate == pytest.approx(1 / 6)
+        assert cache.stats() == {'size': 4, 'max_size': 10, 'hits': 1, 'misses': 5, 'hit_rate': pytest.approx(1 / 6)}
+
+    def test_eviction(self):
+        cache = QueryEmbeddingCache(max_size=2)
+        encoder = _Encoder()
+
+        cache.encode('model', ['one', 'two'], encoder)
+        cache.encode('model', ['one'], encoder)
+        cache.encode('model', ['three'], encoder)
+        assert len(cache) == 2
+
+        # 'two' was the least recently used
+        cache.encode('model', ['one', 'two'], encoder)
+        assert encoder.encoded == ['one', 'two', 'three', 'two']
+
+        cache.reserve(1)
+        assert cache.max_size == 2
+        cache.clear()
+        assert len(cache) == 0 and cache.hit_rate == 0.0
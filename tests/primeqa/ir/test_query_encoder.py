@@ -0,0 +1,94 @@
+from tests.primeqa.mrc.common.base import UnitTest
+import os
+import pytest
+import torch
+
+from primeqa.ir.util.query_encoder import QueryEncoder, query_encoder_cache_path, min_cosine_similarity
+from primeqa.ir.util.query_encoder import checkpoint_mtime
+
+
+class _Encoder(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        torch.manual_seed(0)
+        self.embeddings = torch.nn.Embedding(100, 32)
+        self.linear = torch.nn.Linear(32, 16)
+
+    def forward(self, input_ids, attention_mask):
+        return self.linear(self.embeddings(input_ids)) * attention_mask.unsqueeze(-1)
+
+
+def _tokenize(queries):
+    input_ids = torch.tensor([[(len(word) * 7 + idx) % 100 for idx, word in enumerate(query.split()[:8])]
+                              + [0] * (8 - min(8, len(query.split()))) for query in queries])
+    return input_ids, (input_ids != 0).long()
+
+
+class TestQueryEncoder(UnitTest):
+
+    def test_cache_path(self, tmp_path):
+        assert query_encoder_cache_path(str(tmp_path), 'int8') == os.path.join(str(tmp_path), 'query_encoder.int8.pt')
+        assert query_encoder_cache_path('org/model', 'onnx', cache_dir=str(tmp_path)) == \
+            os.path.join(str(tmp_path), 'org_model', 'query_encoder.int8.onnx')
+
+    def test_min_cosine_similarity(self):
+        expected = torch.tensor([[1.0, 0.0], [0.0, 0.0]])
+        assert min_cosine_similarity(expected, expected) == pytest.approx(1.0)
+        assert min_cosine_similarity(torch.tensor([[0.0, 1.0], [5.0, 5.0]]), expected) == pytest.approx(0.0)
+
+    def test_torch_backend(self):
+        module = _Encoder().eval()
+        encoder = QueryEncoder(module, 'unused', backend='torch')
+        input_ids, attention_mask = _tokenize(['a short query'])
+        assert encoder.backend == 'torch'
+        assert torch.equal(encoder(input_ids, attention_mask), module(input_ids, attention_mask))
+
+    def test_int8_backend(self, tmp_path):
+        module = _Encoder().eval()
+        encoder = QueryEncoder(module, str(tmp_path), backend='int8', tokenize=_tokenize, tolerance=0.9)
+        assert encoder.backend == 'int8'
+        assert os.path.exists(os.path.join(str(tmp_path), 'query_encoder.int8.pt'))
+
+        input_ids, attention_mask = _tokenize(['another query of a few words'])
+        assert min_cosine_similarity(encoder(input_ids, attention_mask), module(input_ids, attention_mask)) > 0.9
+
+        # Falls back to the fp32 encoder when the exported one is not close enough
+        encoder = QueryEncoder(module, str(tmp_path), backend='int8', tokenize=_tokenize, tolerance=1.01)
+        assert encoder.backend == 'torch'
+
+    def test_checkpoint_mtime(self, tmp_path):
+        assert checkpoint_mtime('org/model') is None
+        assert checkpoint_mtime(str(tmp_path)) is None
+
+        weights_path = tmp_path / 'pytorch_model.bin'
+        weights_path.write_bytes(b'weights')
+        os.utime(weights_path, (1000, 1000))
+        (tmp_path / 'query_encoder.int8.pt').write_bytes(b'export')
+        assert checkpoint_mtime(str(tmp_path)) == 1000
+        assert checkpoint_mtime(str(weights_path)) == 1000
+
+    def test_cached_export_is_reused(self, tmp_path):
+        (tmp_path / 'pytorch_model.bin').write_bytes(b'weights')
+        module = _Encoder().eval()
+        QueryEncoder(module, str(tmp_path), backend='int8', tokenize=_tokenize, tolerance=0.9)
+        cache_path = os.path.join(str(tmp_path), 'query_encoder.int8.pt')
+        exported_at = os.path.getmtime(cache_path)
+
+        # Caching the export modified the checkpoint directory, which does not make the export stale
+        os.utime(str(tmp_path), (exported_at + 10, exported_at + 10))
+        encoder = QueryEncoder(module, str(tmp_path), backend='int8', tokenize=_tokenize, tolerance=0.9)
+        assert encoder.backend == 'int8'
+        assert os.path.getmtime(cache_path) == exported_at
+
+    def test_failed_export(self, tmp_path, monkeypatch):
+        def export(*args):
+            raise PermissionError('read-only checkpoint directory')
+
+        monkeypatch.setattr(QueryEncoder, '_export_int8', export)
+        encoder = QueryEncoder(_Encoder().eval(), str(tmp_path), backend='int8', tokenize=_tokenize)
+        assert encoder.backend == 'torch'
+        assert not os.listdir(str(tmp_path))
+
+    def test_invalid_backend(self):
+        with pytest.raises(ValueError):
+            QueryEncoder(_Encoder(), 'unused', backend='fp8')
@@ -0,0 +1,54 @@
+from primeqa.pipelines.passage_store import PassageStore, OFFSETS_SUFFIX
+from primeqa.pipelines.qa_pipeline import QAPipeline
+
+
+class FakeRetriever:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def predict(self, input_texts):
+        return [[(str(len(text) % 3 + 1), 1.0)] for text in input_texts]
+
+
+class FakeReader:
+    def predict(self, questions, contexts, **kwargs):
+        return {
+            question_idx: [{"span_answer_text": question.upper()}]
+            for question_idx, question in enumerate(questions)
+        }
+
+
+def write_collection(tmp_path):
+    collection = tmp_path / "collection.tsv"
+    collection.write_text(
+        "id\ttext\ttitle\n1\tfirst passage\tOne\n2\tsecond passage\tTwo\n3\tthird\tThree"
+    )
+    return str(collection)
+
+
+def test_passage_store(tmp_path):
+    collection = write_collection(tmp_path)
+    passages = PassageStore(collection)
+
+    assert len(passages) == 4
+    assert passages[1] == "One first passage"
+    assert passages[3] == "Three third"
+    assert (tmp_path / ("collection.tsv" + OFFSETS_SUFFIX)).exists()
+
+    # Cached offsets are reused
+    assert PassageStore(collection)[2] == "Two second passage"
+
+
+def test_run_batches_matches_run(tmp_path):
+    pipeline = QAPipeline(FakeRetriever(write_collection(tmp_path)), FakeReader())
+    questions = ["a", "bb", "ccc", "dddd", "eeeee"]
+
+    result = pipeline.run(questions)
+    batches = list(pipeline.run_batches(iter(questions), batch_size=2))
+
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert {k: v for batch in batches for k, v in batch.items()} == result
+    assert result[4] == {
+        "answers": [{"span_answer_text": "EEEEE"}],
+        "passages": ["Three third"],
+    }
@@ -22,7 +22,7 @@ def test_get_retrievers(mock_client):
     )
     assert response.status_code == 200
     retrievers = response.json()
-    assert len(retrievers) == 3
-    assert ["ColBERTRetriever", "DPRRetriever", "BM25Retriever"] == [
+    assert len(retrievers) == 4
+    assert ["ColBERTRetriever", "DPRRetriever", "BM25Retriever", "HybridRetriever"] == [
         retriever["retriever_id"] for retriever in retrievers
     ]
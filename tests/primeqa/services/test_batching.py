@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2022-2023 PrimeQA Team
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+import pytest
+
+from primeqa.services import batching
+from primeqa.services.batching import MicroBatcher
+
+
+def run_concurrently(target, num_threads):
+    threads = [threading.Thread(target=target, args=(idx,)) for idx in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_requests_are_batched():
+    batch_sizes = []
+
+    def predict(queries, **kwargs):
+        batch_sizes.append(len(queries))
+        time.sleep(0.05)
+        return [query.upper() for query in queries]
+
+    batcher = MicroBatcher(max_batch_size=8, max_wait_ms=100)
+    results = {}
+
+    def request(idx):
+        results[idx] = batcher.run(
+            "retrieve", predict, ([f"q{idx}a", f"q{idx}b"],), {"max_num_documents": 5}
+        )
+
+    run_concurrently(request, 10)
+
+    assert sum(batch_sizes) == 20
+    assert max(batch_sizes) <= 8 and len(batch_sizes) < 10
+    assert all(results[idx] == [f"Q{idx}A", f"Q{idx}B"] for idx in range(10))
+
+
+def test_requests_with_different_arguments_are_not_batched():
+    batches = []
+
+    def predict(queries, **kwargs):
+        batches.append((kwargs["max_num_documents"], len(queries)))
+        return [kwargs["max_num_documents"]] * len(queries)
+
+    batcher = MicroBatcher(max_batch_size=8, max_wait_ms=50)
+    results = {}
+
+    def request(idx):
+        results[idx] = batcher.run(
+            "retrieve", predict, (["query"],), {"max_num_documents": idx % 2}
+        )
+
+    run_concurrently(request, 6)
+
+    assert all(results[idx] == [idx % 2] for idx in range(6))
+    assert all(num_queries <= 3 for _, num_queries in batches)
+
+
+def test_errors_are_raised_in_all_batched_requests():
+    def predict(queries, **kwargs):
+        raise TypeError("bad input")
+
+    batcher = MicroBatcher(max_batch_size=4, max_wait_ms=50)
+    errors = []
+
+    def request(idx):
+        with pytest.raises(TypeError):
+            batcher.run("retrieve", predict, (["query"],), {})
+        errors.append(idx)
+
+    run_concurrently(request, 3)
+    assert len(errors) == 3
+
+
+class Reader:
+    def predict(self, questions, contexts, example_ids, **kwargs):
+        return {
+            example_id: [{"example_id": example_id, "span_answer_text": question}]
+            for question, example_id in zip(questions, example_ids)
+        }
+
+
+def test_extractive_read_restores_example_ids():
+    batching.BATCHERS.configure(max_batch_size=8, max_wait_ms=50)
+    try:
+        reader = Reader()
+        results = {}
+
+        def request(idx):
+            results[idx] = batching.extractive_read(
+                reader,
+                questions=[f"q{idx}"] * 2,
+                contexts=[["a"], ["b"]],
+                example_ids=["1", "2"],
+            )
+
+        run_concurrently(request, 3)
+
+        for idx in range(3):
+            assert list(results[idx].keys()) == ["1", "2"]
+            assert all(
+                prediction["example_id"] == example_id
+                and prediction["span_answer_text"] == f"q{idx}"
+                for example_id, predictions in results[idx].items()
+                for prediction in predictions
+            )
+    finally:
+        batching.BATCHERS.configure()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2022-2023 PrimeQA Team
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from primeqa.services.constants import (
+    ATTR_INDEX_ID,
+    ATTR_PROGRESS,
+    ATTR_STATUS,
+    IndexStatus,
+)
+from primeqa.services.exceptions import Error
+from primeqa.services.indexing_jobs import (
+    IndexingJobManager,
+    STAGE_FAILED,
+    STAGE_QUEUED,
+    run_indexing_job,
+    update_index_progress,
+)
+from primeqa.services.instance_manager import INSTANCE_MANAGER
+from primeqa.services.store import Store, StoreFactory
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setenv("STORE_DIR", str(tmp_path))
+    store = Store()
+    monkeypatch.setattr(StoreFactory, "_instance", store)
+    store.save_index_documents("index", [{"text": "First"}])
+    store.save_index_information(
+        "index",
+        {ATTR_INDEX_ID: "index", ATTR_STATUS: IndexStatus.INDEXING.value},
+    )
+    return store
+
+
+@pytest.fixture
+def manager():
+    manager = IndexingJobManager()
+    # Jobs run in a thread, the worker processes of the manager do not see the patched store
+    manager._executor = ThreadPoolExecutor(max_workers=1)
+    yield manager
+    manager.shutdown()
+
+
+def wait_for(index_id, event):
+    event.wait()
+    return IndexStatus.READY.value
+
+
+def test_submit(store, manager):
+    event = threading.Event()
+    future = manager._submit("index", wait_for, event)
+
+    assert manager.is_running("index")
+    assert store.is_index_job_claimed("index")
+    assert store.get_index_information("index")[ATTR_PROGRESS]["stage"] == STAGE_QUEUED
+
+    event.set()
+    assert future.result() == IndexStatus.READY.value
+    # Completion callbacks run in the worker thread once the job is done
+    manager.shutdown()
+    assert not manager.is_running("index")
+    assert not store.is_index_job_claimed("index")
+
+
+def test_double_submit(store, manager):
+    event = threading.Event()
+    manager._submit("index", wait_for, event)
+    try:
+        with pytest.raises(Error):
+            manager._submit("index", wait_for, event)
+        with pytest.raises(Error):
+            manager.claim("index")
+
+        # Another server process sharing the store only sees the job marker
+        other_manager = IndexingJobManager()
+        assert other_manager.is_running("index")
+        with pytest.raises(Error):
+            other_manager.claim("index")
+    finally:
+        event.set()
+
+
+def test_claim_and_release(store, manager):
+    manager.claim("index")
+    assert manager.is_running("index")
+
+    # A claimed index is submitted without claiming it again
+    event = threading.Event()
+    event.set()
+    manager._submit("index", wait_for, event).result()
+    manager.shutdown()
+    assert not manager.is_running("index")
+
+    # An index which was not submitted is marked as failed
+    manager.claim("index")
+    manager.release("index", error="upload failed")
+    assert not manager.is_running("index")
+    index_information = store.get_index_information("index")
+    assert index_information[ATTR_STATUS] == IndexStatus.CORRUPT.value
+    assert index_information[ATTR_PROGRESS]["stage"] == STAGE_FAILED
+    assert index_information[ATTR_PROGRESS]["error"] == "upload failed"
+
+    # Indexes are claimed before their directory exists
+    manager.claim("new-index")
+    manager.release("new-index", error="invalid indexer arguments")
+    assert not store.is_index_job_claimed("new-index")
+
+
+def test_stale_claim_recovery(store, manager):
+    # Job marker left behind by a server process which died
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    with open(store.get_index_job_marker_path("index"), "w") as file:
+        file.write(str(process.pid))
+
+    assert not manager.is_running("index")
+    manager.claim("index")
+    assert store.is_index_job_claimed("index")
+
+
+def test_update_index_progress(store):
+    threads = [
+        threading.Thread(
+            target=update_index_progress, args=("index",), kwargs={f"field_{i}": i}
+        )
+        for i in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    index_information = update_index_progress(
+        "index", status=IndexStatus.READY.value, num_documents=1
+    )
+    assert index_information == store.get_index_information("index")
+    assert index_information[ATTR_STATUS] == IndexStatus.READY.value
+    assert all(index_information[ATTR_PROGRESS][f"field_{i}"] == i for i in range(8))
+
+
+def test_run_indexing_job_with_unknown_indexer(store):
+    assert run_indexing_job("index", "NoSuchIndexer", {}) == IndexStatus.CORRUPT.value
+    index_information = store.get_index_information("index")
+    assert index_information[ATTR_STATUS] == IndexStatus.CORRUPT.value
+    assert index_information[ATTR_PROGRESS]["stage"] == STAGE_FAILED
+    assert "started_at" in index_information[ATTR_PROGRESS]
+
+
+def test_invalidate_removes_retrievers_of_the_index():
+    INSTANCE_MANAGER.clear()
+    try:
+        INSTANCE_MANAGER.get(("RetrieverFactory", 1, ("a",), (None,)), object)
+        INSTANCE_MANAGER.get(("RetrieverFactory", 2, ("b",), (None,)), object)
+        INSTANCE_MANAGER.get(("RetrieverFactory", 3, ("b", "a"), ("v1", "v2")), object)
+        INSTANCE_MANAGER.get(("ReaderFactory", 4), object)
+
+        # Indexes without a version only match on their id
+        IndexingJobManager()._invalidate("a")
+        assert len(INSTANCE_MANAGER) == 2
+        assert ("RetrieverFactory", 2, ("b",), (None,)) in INSTANCE_MANAGER
+        assert ("ReaderFactory", 4) in INSTANCE_MANAGER
+    finally:
+        INSTANCE_MANAGER.clear()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2022-2023 PrimeQA Team
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from primeqa.services.instance_manager import InstanceManager, estimate_size
+
+
+class Model:
+    def __init__(self, num_bytes):
+        self.weights = np.zeros(num_bytes, dtype=np.uint8)
+
+
+def test_lru_eviction_by_count():
+    manager = InstanceManager(max_instances=2)
+    manager.get("a", lambda: Model(1), name="a")
+    manager.get("b", lambda: Model(1), name="b")
+    manager.get("a", lambda: Model(1), name="a")
+    manager.get("c", lambda: Model(1), name="c")
+
+    assert "a" in manager and "c" in manager and "b" not in manager
+    metrics = manager.metrics()
+    assert metrics["hits"] == 1
+    assert metrics["misses"] == 3
+    assert metrics["evictions"] == 1
+    assert [instance["name"] for instance in metrics["instances"]] == ["a", "c"]
+
+
+def test_eviction_by_memory_keeps_latest():
+    manager = InstanceManager(max_memory_bytes=1500)
+    manager.get("a", lambda: Model(1000))
+    manager.get("b", lambda: Model(1000))
+    assert len(manager) == 1 and "b" in manager
+
+    # An instance larger than the budget is still served
+    manager.get("c", lambda: Model(2000))
+    assert len(manager) == 1 and "c" in manager
+
+
+def test_estimate_size_skips_memmaps(tmp_path):
+    path = tmp_path / "weights.npy"
+    np.save(path, np.zeros(1000, dtype=np.uint8))
+    model = Model(100)
+    model.mapped = np.load(path, mmap_mode="r")
+    assert estimate_size(model) == 100
+
+
+def test_concurrent_requests_load_once():
+    manager = InstanceManager()
+    num_loads = []
+
+    def load():
+        num_loads.append(1)
+        time.sleep(0.2)
+        return Model(1)
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(manager.get("a", load)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(num_loads) == 1
+    assert len(results) == 4 and all(result is results[0] for result in results)
+
+
+def test_failed_load_is_not_cached():
+    manager = InstanceManager()
+
+    def load():
+        raise ValueError("missing checkpoint")
+
+    with pytest.raises(ValueError):
+        manager.get("a", load)
+    assert "a" not in manager
+    assert manager.metrics()["load_failures"] == 1
+    assert "a" not in manager._load_locks
+    assert manager.get("a", lambda: Model(1)) is not None
+
+
+def test_remove_where():
+    manager = InstanceManager()
+    manager.get(("Retriever", 1, ("v1",)), lambda: Model(1))
+    manager.get(("Retriever", 1, ("v2", "v1")), lambda: Model(1))
+    manager.get(("Retriever", 1, ("v3",)), lambda: Model(1))
+
+    manager.remove_where(lambda key: "v1" in key[-1])
+    assert len(manager) == 1 and ("Retriever", 1, ("v3",)) in manager
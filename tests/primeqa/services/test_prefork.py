@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2022-2023 PrimeQA Team
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from primeqa.components.retriever.dense import ColBERTRetriever
+from primeqa.services.constants import (
+    ATTR_CHECKPOINT,
+    ATTR_CONFIGURATION,
+    ATTR_ENGINE_TYPE,
+    ATTR_STATUS,
+    ATTR_VERSION,
+    IndexStatus,
+)
+from primeqa.services.factories import RetrieverFactory
+from primeqa.services.prefork import preload_indexes, run_workers
+from primeqa.services.store import DIR_NAME_CHECKPOINTS, Store, StoreFactory
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setenv("STORE_DIR", str(tmp_path))
+    store = Store()
+    monkeypatch.setattr(StoreFactory, "_instance", store)
+
+    checkpoint_dir = os.path.join(str(tmp_path), DIR_NAME_CHECKPOINTS, "checkpoint")
+    os.makedirs(checkpoint_dir)
+    open(os.path.join(checkpoint_dir, "model.dnn"), "w").close()
+
+    for index_id, engine_type, status in [
+        ("colbert", "ColBERT", IndexStatus.READY.value),
+        ("indexing", "ColBERT", IndexStatus.INDEXING.value),
+        ("bm25", "BM25", IndexStatus.READY.value),
+    ]:
+        os.makedirs(store.get_index_directory_path(index_id))
+        store.save_index_information(
+            index_id,
+            {
+                ATTR_STATUS: status,
+                ATTR_VERSION: f"{index_id}-version",
+                ATTR_CONFIGURATION: {
+                    ATTR_ENGINE_TYPE: engine_type,
+                    ATTR_CHECKPOINT: "checkpoint",
+                },
+            },
+        )
+    return store
+
+
+@pytest.fixture
+def preloaded(monkeypatch):
+    preloaded = []
+    monkeypatch.setattr(
+        RetrieverFactory,
+        "get",
+        lambda retriever, retriever_kwargs, **kwargs: preloaded.append(
+            (retriever, retriever_kwargs, kwargs)
+        ),
+    )
+    return preloaded
+
+
+def test_preload_indexes(store, preloaded):
+    # Indexes which are not READY, unknown or searched through a JVM are skipped
+    assert preload_indexes(["colbert", "indexing", "bm25", "unknown"]) == 1
+
+    assert len(preloaded) == 1
+    retriever, retriever_kwargs, kwargs = preloaded[0]
+    assert retriever is ColBERTRetriever
+    assert retriever_kwargs["index_root"] == store.get_index_directory_path("colbert")
+    assert retriever_kwargs["collection"] == store.get_index_documents_file_path(
+        "colbert"
+    )
+    assert retriever_kwargs[ATTR_CHECKPOINT] == store.get_checkpoint_path("checkpoint")
+    # Keyed like the retrievers of retrieve requests, so that requests reuse them
+    assert kwargs == {"index_ids": ("colbert",), "index_version": ("colbert-version",)}
+
+
+def test_preload_all_indexes(store, preloaded):
+    assert preload_indexes(["*"]) == 1
+    assert [kwargs["index_ids"] for _, _, kwargs in preloaded] == [("colbert",)]
+
+
+def test_workers_are_not_forked_after_cuda_was_initialized(monkeypatch):
+    monkeypatch.setitem(
+        sys.modules,
+        "torch",
+        SimpleNamespace(cuda=SimpleNamespace(is_initialized=lambda: True)),
+    )
+    workers = []
+
+    with pytest.raises(RuntimeError):
+        run_workers(workers.append, num_workers=2)
+    assert workers == []
+
+    # A single worker runs in the current process
+    run_workers(workers.append, num_workers=1)
+    assert workers == [0]
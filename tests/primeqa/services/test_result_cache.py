@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2022-2023 PrimeQA Team
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sqlite3
+import time
+
+from primeqa.services import result_cache
+from primeqa.services.result_cache import FILENAME_RESULT_CACHE, ResultCache
+from primeqa.services.store import SQLITE_MAX_VARIABLES
+
+CACHE_ARGUMENTS = {
+    "endpoint": "retrieve",
+    "index_id": "index",
+    "index_version": ["v1"],
+    "component": "ColBERTRetriever",
+    "parameters": {"max_num_documents": 5},
+}
+
+
+def test_normalized_queries_hit():
+    cache = ResultCache(max_memory_bytes=2**20)
+    cache.set_many(queries=["what is  PrimeQA?"], results=[[1, 2]], **CACHE_ARGUMENTS)
+
+    assert cache.get_many(
+        queries=[" what is PrimeQA? ", "what is primeqa?"], **CACHE_ARGUMENTS
+    ) == [[1, 2], None]
+    assert cache.get_many(
+        queries=["what is PrimeQA?"],
+        **dict(CACHE_ARGUMENTS, parameters={"max_num_documents": 10}),
+    ) == [None]
+    assert cache.metrics()["hits"] == 1
+
+
+def test_index_version_and_invalidation(tmp_path):
+    cache = ResultCache(max_memory_bytes=2**20, cache_dir=str(tmp_path))
+    cache.set_many(queries=["query"], results=["hits"], **CACHE_ARGUMENTS)
+
+    assert cache.get_many(
+        queries=["query"], **dict(CACHE_ARGUMENTS, index_version=["v2"])
+    ) == [None]
+
+    cache.invalidate_index("index")
+    assert cache.get_many(queries=["query"], **CACHE_ARGUMENTS) == [None]
+
+
+def test_disk_tier_is_shared(tmp_path):
+    ResultCache(cache_dir=str(tmp_path)).set_many(
+        queries=["query"], results=["hits"], **CACHE_ARGUMENTS
+    )
+
+    cache = ResultCache(max_memory_bytes=2**20, cache_dir=str(tmp_path))
+    assert cache.get_many(queries=["query"], **CACHE_ARGUMENTS) == ["hits"]
+    assert cache.metrics()["memory_entries"] == 1
+
+
+def test_ttl_and_memory_bound():
+    cache = ResultCache(max_memory_bytes=2**10, ttl_secs=1)
+    cache.set_many(
+        queries=["small", "large"], results=["hits", "x" * 2**11], **CACHE_ARGUMENTS
+    )
+    assert cache.get_many(queries=["small", "large"], **CACHE_ARGUMENTS) == [
+        "hits",
+        None,
+    ]
+
+    time.sleep(1.1)
+    assert cache.get_many(queries=["small"], **CACHE_ARGUMENTS) == [None]
+
+
+def test_disabled():
+    cache = ResultCache()
+    cache.set_many(queries=["query"], results=["hits"], **CACHE_ARGUMENTS)
+    assert not cache.enabled
+    assert cache.get_many(queries=["query"], **CACHE_ARGUMENTS) == [None]
+
+
+def count_disk_entries(cache_dir):
+    with sqlite3.connect(os.path.join(cache_dir, FILENAME_RESULT_CACHE)) as connection:
+        return connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+
+def test_disk_lookup_of_many_queries(tmp_path):
+    queries = [f"query {i}" for i in range(2 * SQLITE_MAX_VARIABLES + 1)]
+    ResultCache(cache_dir=str(tmp_path), max_disk_entries=0).set_many(
+        queries=queries, results=queries, **CACHE_ARGUMENTS
+    )
+
+    cache = ResultCache(cache_dir=str(tmp_path))
+    results = cache.get_many(queries=queries + ["missing"], **CACHE_ARGUMENTS)
+    assert results == queries + [None]
+    assert cache.metrics()["hits"] == len(queries)
+
+
+def test_disk_tier_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "DISK_PURGE_INTERVAL_SECS", 0)
+    cache = ResultCache(cache_dir=str(tmp_path), ttl_secs=1, max_disk_entries=10)
+
+    queries = [f"query {i}" for i in range(25)]
+    for query in queries:
+        cache.set_many(queries=[query], results=[query], **CACHE_ARGUMENTS)
+    assert count_disk_entries(str(tmp_path)) == 10
+    # The oldest results are purged
+    assert cache.get_many(queries=queries[-10:], **CACHE_ARGUMENTS) == queries[-10:]
+
+    # Expired results are purged when results are added
+    time.sleep(1.1)
+    cache.set_many(
+        queries=["query"], results=["hits"], **dict(CACHE_ARGUMENTS, index_id="other")
+    )
+    assert count_disk_entries(str(tmp_path)) == 1
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2022-2023 PrimeQA Team
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from primeqa.services.store import Store, EXTN_OFFSETS
+
+DOCUMENTS = [
+    {"text": "Tab\tand newline\nfree? Not quite.", "title": "First"},
+    {"text": "Ünïcödé text", "document_id": "doc-2"},
+    {"text": "Third document", "title": "Third"},
+]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setenv("STORE_DIR", str(tmp_path))
+    store = Store(document_cache_size=2)
+    store.save_index_documents("index", DOCUMENTS)
+    return store
+
+
+def test_get_index_documents(store):
+    assert store.get_index_documents("index", [3, "1", 7, 2, 3]) == [
+        DOCUMENTS[2],
+        DOCUMENTS[0],
+        None,
+        DOCUMENTS[1],
+        DOCUMENTS[2],
+    ]
+    assert store.get_index_document("index", 2) == DOCUMENTS[1]
+    with pytest.raises(KeyError):
+        store.get_index_document("index", 4)
+
+
+def test_get_index_documents_from_sqlite(store):
+    # Indexes saved before the compact document files existed
+    os.remove(store.get_index_documents_file_path("index", extension=EXTN_OFFSETS))
+    assert store.get_index_documents("index", [2, 1, 4]) == [
+        DOCUMENTS[1],
+        DOCUMENTS[0],
+        None,
+    ]
+
+
+def test_get_index_documents_after_rewrite(store):
+    assert store.get_index_documents("index", [1]) == [DOCUMENTS[0]]
+    store.save_index_documents("index", DOCUMENTS[::-1])
+    assert store.get_index_documents("index", [1, 3]) == [DOCUMENTS[2], DOCUMENTS[0]]
+
+
+def test_append_index_documents(store):
+    assert store.get_index_documents("index", [1]) == [DOCUMENTS[0]]
+    with store.get_index_documents_writer("index", append=True) as writer:
+        writer.add(DOCUMENTS[:1])
+    assert writer.num_documents == 4
+    assert store.get_index_documents("index", [4, 1, 3]) == [
+        DOCUMENTS[0],
+        DOCUMENTS[0],
+        DOCUMENTS[2],
+    ]
+    with open(store.get_index_documents_file_path("index")) as f:
+        lines = f.read().split("\n")
+    assert lines[0] == "id\ttext\ttitle"
+    assert lines.count("id\ttext\ttitle") == 1
+    assert any(line.startswith("4\t") for line in lines)
+
+
+def test_truncate_index_documents(store):
+    checksum = store.get_index_documents_checksum("index")
+    mark = store.get_index_documents_mark("index")
+    assert mark[0] == 3
+
+    with store.get_index_documents_writer("index", append=True) as writer:
+        writer.add(DOCUMENTS)
+    assert store.get_index_documents("index", [6]) == [DOCUMENTS[2]]
+
+    store.truncate_index_documents("index", mark)
+    assert store.get_index_documents_mark("index") == mark
+    assert store.get_index_documents_checksum("index") == checksum
+    assert store.get_index_documents("index", [3, 4]) == [DOCUMENTS[2], None]
+    assert len(store.get_index_documents_database("index")) == 3
+
+    # Documents appended after the truncation are numbered after the marked ones
+    with store.get_index_documents_writer("index", append=True) as writer:
+        writer.add(DOCUMENTS[1:2])
+    assert writer.num_documents == 4
+    assert store.get_index_documents("index", [4, 1]) == [DOCUMENTS[1], DOCUMENTS[0]]
+
+
+def test_index_documents_checksum(store):
+    checksum = store.get_index_documents_checksum("index")
+    store.save_index_documents("other", DOCUMENTS)
+    assert store.get_index_documents_checksum("other") == checksum
+
+    store.save_index_documents("other", DOCUMENTS[::-1])
+    assert store.get_index_documents_checksum("other") != checksum
+
+
+def test_index_job_marker(store):
+    assert not store.is_index_job_claimed("index")
+    assert store.claim_index_job("index")
+    assert store.is_index_job_claimed("index")
+    assert not store.claim_index_job("index")
+
+    store.release_index_job("index")
+    assert not store.is_index_job_claimed("index")
+
+    # A marker left behind by a process which died is claimed again
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    with open(store.get_index_job_marker_path("index"), "w") as f:
+        f.write(str(process.pid))
+    assert not store.is_index_job_claimed("index")
+    assert store.claim_index_job("index")
+
+    # Indexes are claimed before their directory exists, markers are kept when it is deleted
+    assert store.claim_index_job("new index")
+    store.delete_index("new index")
+    assert store.is_index_job_claimed("new index")